@@ -3,10 +3,17 @@
 1. 创建 CookieManager，按配置文件 / 环境变量初始化账号任务
 2. 在后台线程启动 FastAPI (reply_server) 提供管理与自动回复接口
 3. 主协程保持运行
+
+配置 SHARDING.processes（或环境变量 SHARD_PROCESSES）大于1时为分片模式：账号任务分配到多个工作进程，
+本进程只运行 API 服务和分片管理器（见 utils/sharding.py）。
+
+配置 CLUSTER.enabled（或环境变量 NODE_ID）时为多节点部署：多个节点共用同一个数据库，
+每个节点只运行自己持有租约的账号（见 utils/account_lease.py）。
 """
 
 import os
 import sys
+import signal
 import asyncio
 import threading
 import uvicorn
@@ -89,38 +96,76 @@ async def main():
 
     loop = asyncio.get_running_loop()
 
+    # 启动事件循环延迟监控
+    from utils.loop_monitor import loop_monitor
+    loop_monitor.start(loop)
+
+    # 启动通知重试队列（继续发送上次运行未成功的通知）
+    from utils.notification_dispatcher import notification_dispatcher
+    notification_dispatcher.start(loop)
+
+    # 多节点部署时账号由租约分配，不在启动时直接启动全部账号
+    from utils import account_lease
+    lease_manager = account_lease.create_lease_manager()
+    account_lease.lease_manager = lease_manager
+
+    # 配置了多个分片进程时，本进程只运行API服务，账号任务由分片进程运行
+    from utils import sharding
+    supervisor = sharding.create_supervisor()
+    if supervisor is not None:
+        await _main_sharded(loop, supervisor, lease_manager)
+        return
+
     # 创建 CookieManager 并在全局暴露
     print("创建 CookieManager...")
     cm.manager = cm.CookieManager(loop)
     manager = cm.manager
     print("CookieManager 创建完成")
 
-    # 1) 从数据库加载的 Cookie 已经在 CookieManager 初始化时完成
-    # 为每个启用的 Cookie 启动任务
-    for cid, val in manager.cookies.items():
-        # 检查账号是否启用
-        if not manager.get_cookie_status(cid):
-            logger.info(f"跳过禁用的 Cookie: {cid}")
-            continue
+    # 启动商品详情缓存（从数据库预热，并定期把新获取的详情落库）
+    from utils.item_detail_cache import item_detail_cache
+    item_detail_cache.start(loop)
+
+    # 启动周期任务调度器（各账号的心跳、Token刷新、清理和Cookie刷新任务）
+    from utils.scheduler import scheduler
+    scheduler.start(loop)
+
+    if lease_manager is not None:
+        # 由租约续约任务获取并启动本节点的账号
+        lease_manager.start(manager)
+    else:
+        # 1) 从数据库加载的 Cookie 已经在 CookieManager 初始化时完成
+        # 为每个启用的 Cookie 启动任务
+        for cid, val in manager.cookies.items():
+            # 检查账号是否启用
+            if not manager.get_cookie_status(cid):
+                logger.info(f"跳过禁用的 Cookie: {cid}")
+                continue
 
-        try:
-            # 直接启动任务，不重新保存到数据库
-            from db_manager import db_manager
-            logger.info(f"正在获取Cookie详细信息: {cid}")
-            cookie_info = db_manager.get_cookie_details(cid)
-            user_id = cookie_info.get('user_id') if cookie_info else None
-            logger.info(f"Cookie详细信息获取成功: {cid}, user_id: {user_id}")
-
-            logger.info(f"正在创建异步任务: {cid}")
-            task = loop.create_task(manager._run_xianyu(cid, val, user_id))
-            manager.tasks[cid] = task
-            logger.info(f"启动数据库中的 Cookie 任务: {cid} (用户ID: {user_id})")
-            logger.info(f"任务已添加到管理器，当前任务数: {len(manager.tasks)}")
-        except Exception as e:
-            logger.error(f"启动 Cookie 任务失败: {cid}, {e}")
-            import traceback
-            logger.error(f"详细错误信息: {traceback.format_exc()}")
-    
+            try:
+                # 直接启动任务，不重新保存到数据库
+                from db_manager import db_manager
+                logger.info(f"正在获取Cookie详细信息: {cid}")
+                cookie_info = db_manager.get_cookie_details(cid)
+                user_id = cookie_info.get('user_id') if cookie_info else None
+                logger.info(f"Cookie详细信息获取成功: {cid}, user_id: {user_id}")
+
+                logger.info(f"正在创建异步任务: {cid}")
+                task = loop.create_task(manager._run_xianyu(cid, val, user_id))
+                manager.tasks[cid] = task
+                logger.info(f"启动数据库中的 Cookie 任务: {cid} (用户ID: {user_id})")
+                logger.info(f"任务已添加到管理器，当前任务数: {len(manager.tasks)}")
+            except Exception as e:
+                logger.error(f"启动 Cookie 任务失败: {cid}, {e}")
+                import traceback
+                logger.error(f"详细错误信息: {traceback.format_exc()}")
+
+    _load_extra_cookies(manager)
+    await _serve_forever(lease_manager)
+
+
+def _load_extra_cookies(manager):
+    """加载配置文件和环境变量中数据库里还没有的 Cookie"""
     # 2) 如果配置文件中有新的 Cookie，也加载它们
     for entry in COOKIES_LIST:
         cid = entry.get('id')
@@ -139,6 +184,12 @@ async def main():
         manager.add_cookie('default', env_cookie)
         logger.info("从环境变量加载 default Cookie")
 
+
+async def _serve_forever(lease_manager=None):
+    """启动API服务线程并保持主协程运行
+
+    多节点部署时收到 SIGTERM / SIGINT 后先停止账号、释放租约再退出，其他节点在下一次续约时立即接管。
+    """
     # 启动 API 服务线程
     print("启动 API 服务线程...")
     threading.Thread(target=_start_api_server, daemon=True).start()
@@ -150,9 +201,45 @@ async def main():
     except Exception as e:
         logger.debug(f"上报用户统计失败: {e}")
 
+    stop_event = asyncio.Event()
+    if lease_manager is not None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
     # 阻塞保持运行
     print("主程序启动完成，保持运行...")
-    await asyncio.Event().wait()
+    await stop_event.wait()
+
+    logger.info("收到退出信号，释放账号租约...")
+    await lease_manager.stop()
+
+
+async def _main_sharded(loop, supervisor, lease_manager=None):
+    """分片模式：账号按一致性哈希分配到多个工作进程，本进程运行API服务并管理分片"""
+    from utils import sharding
+
+    print(f"分片模式：启动 {supervisor.processes} 个账号分片进程...")
+    sharding.supervisor = supervisor
+    cm.manager = sharding.ShardedCookieManager(loop, supervisor)
+    manager = cm.manager
+
+    if lease_manager is not None:
+        # 多节点部署：分片进程先空载启动，账号由租约续约任务获取后分配到分片
+        supervisor.start([])
+        lease_manager.start(manager)
+    else:
+        # 启用的账号分配到各分片，由分片进程从数据库读取Cookie并启动任务
+        supervisor.start(manager.get_enabled_cookies())
+    _load_extra_cookies(manager)
+
+    try:
+        await _serve_forever(lease_manager)
+    finally:
+        supervisor.stop()
 
 
 if __name__ == '__main__':
@@ -5,12 +5,14 @@ import time
 import base64
 import os
 import random
+import socket
 from enum import Enum
+from functools import partial
 from loguru import logger
 import websockets
 from utils.xianyu_utils import (
-    decrypt, generate_mid, generate_uuid, trans_cookies,
-    generate_device_id, generate_sign
+    decrypt_to_dict, generate_mid, generate_uuid, trans_cookies,
+    generate_device_id
 )
 from config import (
     WEBSOCKET_URL, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT,
@@ -20,8 +22,16 @@ from config import (
 )
 import sys
 import aiohttp
-from collections import defaultdict
-from db_manager import db_manager
+from collections import defaultdict, deque
+from db_manager import db_manager, async_db_manager
+from utils.notification_dispatcher import notification_dispatcher
+from utils.item_detail_cache import item_detail_cache
+from utils.mtop_client import MtopClient, MtopError, is_success as is_mtop_success
+from utils.single_flight import single_flight
+from utils import frame_codec, metrics
+from utils.inbound_queue import InboundQueue
+from utils.reply_debouncer import ReplyDebouncer
+from utils.scheduler import scheduler
 
 
 class ConnectionState(Enum):
@@ -34,18 +44,22 @@ class ConnectionState(Enum):
     CLOSED = "closed"  # 已关闭
 
 
+# 回复来源 -> 指标中的 source 标签
+REPLY_SOURCE_LABELS = {'API': 'api', '关键词': 'keyword', 'AI': 'ai', '默认': 'default'}
+
+
 class AutoReplyPauseManager:
     """自动回复暂停管理器"""
     def __init__(self):
         # 存储每个chat_id的暂停信息 {chat_id: pause_until_timestamp}
         self.paused_chats = {}
 
-    def pause_chat(self, chat_id: str, cookie_id: str):
+    async def pause_chat(self, chat_id: str, cookie_id: str):
         """暂停指定chat_id的自动回复，使用账号特定的暂停时间"""
         # 获取账号特定的暂停时间
         try:
-            from db_manager import db_manager
-            pause_minutes = db_manager.get_cookie_pause_duration(cookie_id)
+            from db_manager import async_db_manager
+            pause_minutes = await async_db_manager.get_cookie_pause_duration(cookie_id)
         except Exception as e:
             logger.error(f"获取账号 {cookie_id} 暂停时间失败: {e}，使用默认10分钟")
             pause_minutes = 10
@@ -167,15 +181,11 @@ class XianyuLive:
     _order_detail_lock_times = {}
 
     # 商品详情缓存（24小时有效）
-    _item_detail_cache = {}  # {item_id: {'detail': str, 'timestamp': float, 'access_time': float}}
-    _item_detail_cache_lock = asyncio.Lock()
-    _item_detail_cache_max_size = 1000  # 最大缓存1000个商品
-    _item_detail_cache_ttl = 24 * 60 * 60  # 24小时TTL
 
     # 类级别的实例管理字典，用于API调用
     _instances = {}  # {cookie_id: XianyuLive实例}
     _instances_lock = asyncio.Lock()
-    
+
     def _safe_str(self, e):
         """安全地将异常转换为字符串"""
         try:
@@ -192,6 +202,7 @@ class XianyuLive:
             old_state = self.connection_state
             self.connection_state = new_state
             self.last_state_change_time = time.time()
+            metrics.connection_transitions.inc(self.cookie_id, new_state.value)
             
             # 记录状态转换
             state_msg = f"【{self.cookie_id}】连接状态: {old_state.value} → {new_state.value}"
@@ -209,35 +220,13 @@ class XianyuLive:
                 logger.info(state_msg)
 
     async def _cancel_background_tasks(self):
-        """取消并清理所有后台任务"""
-        tasks_to_cancel = []
-        
-        # 收集所有需要取消的任务
-        if self.heartbeat_task:
-            tasks_to_cancel.append(("心跳任务", self.heartbeat_task))
-        if self.token_refresh_task:
-            tasks_to_cancel.append(("Token刷新任务", self.token_refresh_task))
-        if self.cleanup_task:
-            tasks_to_cancel.append(("清理任务", self.cleanup_task))
-        if self.cookie_refresh_task:
-            tasks_to_cancel.append(("Cookie刷新任务", self.cookie_refresh_task))
-        
-        if not tasks_to_cancel:
-            logger.debug(f"【{self.cookie_id}】没有后台任务需要取消")
+        """从调度器中删除本账号的所有周期任务，并等待执行中的任务结束"""
+        tasks = scheduler.remove(self.cookie_id)
+        if not tasks:
+            logger.debug(f"【{self.cookie_id}】周期任务已删除，没有执行中的任务需要取消")
             return
-        
-        logger.info(f"【{self.cookie_id}】开始取消 {len(tasks_to_cancel)} 个后台任务...")
-        
-        # 取消所有任务
-        for task_name, task in tasks_to_cancel:
-            try:
-                task.cancel()
-                logger.debug(f"【{self.cookie_id}】已发送取消信号: {task_name}")
-            except Exception as e:
-                logger.warning(f"【{self.cookie_id}】取消任务失败 {task_name}: {e}")
-        
-        # 等待所有任务完成取消
-        tasks = [task for _, task in tasks_to_cancel]
+
+        logger.info(f"【{self.cookie_id}】周期任务已删除，等待 {len(tasks)} 个执行中的任务取消...")
         try:
             await asyncio.wait_for(
                 asyncio.gather(*tasks, return_exceptions=True),
@@ -248,12 +237,30 @@ class XianyuLive:
             logger.warning(f"【{self.cookie_id}】等待任务取消超时，强制继续")
         except Exception as e:
             logger.warning(f"【{self.cookie_id}】等待任务取消时出错: {e}")
-        
-        # 重置任务引用
-        self.heartbeat_task = None
-        self.token_refresh_task = None
-        self.cleanup_task = None
-        self.cookie_refresh_task = None
+
+    def _start_background_jobs(self, ws):
+        """在调度器中注册本账号的周期任务（连接初始化完成后调用）
+
+        心跳立即开始；Token刷新在到期时执行；清理和Cookie刷新的首次执行时间在一个周期内随机分散，
+        避免批量重启后所有账号同时执行。
+        """
+        self._start_heartbeat(ws)
+
+        token_due = self.last_token_refresh_time + self.token_refresh_interval - time.time()
+        scheduler.add(self.cookie_id, 'token_refresh', self._token_refresh_job,
+                      self.token_refresh_interval, first_delay=max(0, token_due))
+        scheduler.add(self.cookie_id, 'cleanup', self._cleanup_job, 300, replace=False)
+        # Cookie刷新需要打开浏览器，作为重型任务受全局并发上限限制
+        scheduler.add(self.cookie_id, 'cookie_refresh', self._cookie_refresh_job,
+                      self.cookie_refresh_interval, heavy=True, replace=False)
+        # 暂停记录、商品详情缓存、浏览器临时文件等进程级清理只需要一个任务
+        scheduler.add(None, 'global_cleanup', XianyuLive._global_cleanup_job, 300, replace=False)
+
+    def _start_heartbeat(self, ws):
+        """（重新）开始发送心跳"""
+        self._heartbeat_failures = 0
+        scheduler.add(self.cookie_id, 'heartbeat', partial(self._heartbeat_job, ws),
+                      self.heartbeat_interval, first_delay=0, jitter=0)
 
     def _calculate_retry_delay(self, error_msg: str) -> int:
         """根据错误类型和失败次数计算重试延迟"""
@@ -319,7 +326,8 @@ class XianyuLive:
         except Exception as e:
             logger.error(f"【{self.cookie_id}】清理实例缓存时出错: {self._safe_str(e)}")
     
-    async def _cleanup_playwright_cache(self):
+    @staticmethod
+    async def _cleanup_playwright_cache():
         """清理Playwright浏览器临时文件和缓存（Docker环境专用）"""
         try:
             import shutil
@@ -363,12 +371,30 @@ class XianyuLive:
                     logger.debug(f"匹配路径 {pattern} 时出错: {e}")
             
             if total_cleaned > 0:
-                logger.info(f"【{self.cookie_id}】Playwright缓存清理完成: 删除了 {total_cleaned} 个文件/目录，释放 {total_size_mb:.2f} MB")
+                logger.info(f"Playwright缓存清理完成: 删除了 {total_cleaned} 个文件/目录，释放 {total_size_mb:.2f} MB")
             else:
-                logger.debug(f"【{self.cookie_id}】Playwright缓存清理: 没有需要清理的临时文件")
+                logger.debug(f"Playwright缓存清理: 没有需要清理的临时文件")
                 
         except Exception as e:
-            logger.debug(f"【{self.cookie_id}】清理Playwright缓存时出错: {self._safe_str(e)}")
+            logger.debug(f"清理Playwright缓存时出错: {e}")
+
+    @property
+    def cookies(self) -> dict:
+        """解析后的Cookie字典（由mtop客户端持有）"""
+        return self.mtop.cookies
+
+    @cookies.setter
+    def cookies(self, value: dict):
+        self.mtop.set_cookies(value)
+
+    @property
+    def cookies_str(self) -> str:
+        """Cookie字符串（由mtop客户端持有）"""
+        return self.mtop.cookies_str
+
+    @cookies_str.setter
+    def cookies_str(self, value: str):
+        self.mtop.set_cookies_str(value)
 
     def __init__(self, cookies_str=None, cookie_id: str = "default", user_id: int = None):
         """初始化闲鱼直播类"""
@@ -380,11 +406,11 @@ class XianyuLive:
             raise ValueError("未提供cookies，请在global_config.yml中配置COOKIES_STR或通过参数传入")
 
         logger.info(f"【{cookie_id}】解析cookies...")
-        self.cookies = trans_cookies(cookies_str)
+        # mtop客户端持有解析后的Cookie，self.cookies / self.cookies_str 均读写客户端中的Cookie
+        self.mtop = MtopClient(cookie_id, cookies_str, on_cookies_changed=lambda _: self.update_config_cookies())
         logger.info(f"【{cookie_id}】cookies解析完成，包含字段: {list(self.cookies.keys())}")
 
         self.cookie_id = cookie_id  # 唯一账号标识
-        self.cookies_str = cookies_str  # 保存原始cookie字符串
         self.user_id = user_id  # 保存用户ID，用于token刷新时保持正确的所有者关系
         self.base_url = WEBSOCKET_URL
 
@@ -400,7 +426,7 @@ class XianyuLive:
         self.heartbeat_timeout = HEARTBEAT_TIMEOUT
         self.last_heartbeat_time = 0
         self.last_heartbeat_response = 0
-        self.heartbeat_task = None
+        self._heartbeat_failures = 0  # 心跳连续失败次数
         self.ws = None
 
         # Token刷新相关配置
@@ -408,7 +434,6 @@ class XianyuLive:
         self.token_retry_interval = TOKEN_RETRY_INTERVAL
         self.last_token_refresh_time = 0
         self.current_token = None
-        self.token_refresh_task = None
         self.connection_restart_flag = False  # 连接重启标志
 
         # 通知防重复机制
@@ -429,11 +454,7 @@ class XianyuLive:
 
         self.session = None  # 用于API调用的aiohttp session
 
-        # 启动定期清理过期暂停记录的任务
-        self.cleanup_task = None
-
-        # Cookie刷新定时任务
-        self.cookie_refresh_task = None
+        # Cookie刷新定时任务（心跳、Token刷新、清理和Cookie刷新都在调度器中执行，见 _start_background_jobs）
         self.cookie_refresh_interval = 1200  # 1小时 = 3600秒
         self.last_cookie_refresh_time = 0
         self.cookie_refresh_lock = asyncio.Lock()  # 使用Lock防止重复执行Cookie刷新
@@ -466,9 +487,29 @@ class XianyuLive:
         # 后台任务追踪（用于清理未等待的任务）
         self.background_tasks = set()  # 追踪所有后台任务
         
-        # 消息处理并发控制（防止内存泄漏）
-        self.message_semaphore = asyncio.Semaphore(100)  # 最多100个并发消息处理任务
-        self.active_message_tasks = 0  # 当前活跃的消息处理任务数
+        # 入站消息队列：有界排队，固定数量的工作任务处理，同一会话的消息按顺序串行处理
+        from config import config
+        inbound_config = config.get('INBOUND_QUEUE', {}) or {}
+        # 队列中的每一项为 (处理函数, 参数...)
+        self.inbound_queue = InboundQueue(
+            self.cookie_id,
+            lambda item: item[0](*item[1:]),
+            max_size=max(1, int(inbound_config.get('max_size', 1000))),
+            workers=max(1, int(inbound_config.get('workers', 50))),
+            shed_policy=inbound_config.get('shed_policy', 'drop_oldest'),
+        )
+
+        # 连续消息合并回复（账号设置 reply_debounce 大于0时生效）
+        debounce_config = AUTO_REPLY.get('debounce', {}) or {}
+        self.reply_debouncer = ReplyDebouncer(
+            self._on_reply_burst,
+            max_wait=float(debounce_config.get('max_wait', 10)),
+            max_messages=max(1, int(debounce_config.get('max_messages', 5))),
+        )
+
+        # 确认帧（ack）发送队列：接收循环只负责入队，由单独的任务连续发送，不等待消息处理
+        self._ack_queue = deque()  # (websocket, ack帧)
+        self._ack_task = None
 
         # 初始化订单状态处理器
         self._init_order_status_handler()
@@ -818,8 +859,7 @@ class XianyuLive:
             # 检查商品是否属于当前cookies
             if item_id and item_id != "未知商品":
                 try:
-                    from db_manager import db_manager
-                    item_info = db_manager.get_item_info(self.cookie_id, item_id)
+                    item_info = await async_db_manager.get_item_info(self.cookie_id, item_id)
                     if not item_info:
                         logger.warning(f'[{msg_time}] 【{self.cookie_id}】❌ 商品 {item_id} 不属于当前账号，跳过自动发货')
                         return
@@ -1072,7 +1112,7 @@ class XianyuLive:
                 notification_sent = True
                 return None
 
-            # 【消息接收检查】检查是否在消息接收后的冷却时间内，与 cookie_refresh_loop 保持一致
+            # 【消息接收检查】检查是否在消息接收后的冷却时间内，与 _cookie_refresh_job 保持一致
             current_time = time.time()
             time_since_last_message = current_time - self.last_message_received_time
             if self.last_message_received_time > 0 and time_since_last_message < self.message_cookie_refresh_cooldown:
@@ -1084,21 +1124,7 @@ class XianyuLive:
                 self.last_token_refresh_status = "skipped_cooldown"
                 return None
 
-            # 生成更精确的时间戳
-            timestamp = str(int(time.time() * 1000))
-
             params = {
-                'jsv': '2.7.2',
-                'appKey': '34839810',
-                't': timestamp,
-                'sign': '',
-                'v': '1.0',
-                'type': 'originaljson',
-                'accountSite': 'xianyu',
-                'dataType': 'json',
-                'timeout': '20000',
-                'api': 'mtop.taobao.idlemessage.pc.login.token',
-                'sessionOption': 'AutoLoginOnly',
                 'dangerouslySetWindvaneParams': '%5Bobject%20Object%5D',
                 'smToken': 'token',
                 'queryToken': 'sm',
@@ -1108,255 +1134,223 @@ class XianyuLive:
                 'log_id': '4c053da6vYwnmf'
             }
             data_val = '{"appKey":"444e9908a51d1cb236a27862abc769c9","deviceId":"' + self.device_id + '"}'
-            data = {
-                'data': data_val,
-            }
 
-            # 获取token
-            token = None
-            token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
+            # 发送请求（签名、set-cookie合并和令牌失效重试由mtop客户端处理）
+            res_json = await self.mtop.call(
+                'mtop.taobao.idlemessage.pc.login.token',
+                data_val,
+                params=params,
+                url=API_ENDPOINTS.get('token'),
+                timeout=30
+            )
+
+            if isinstance(res_json, dict):
+                ret_value = res_json.get('ret', [])
+                # 检查ret是否包含成功信息
+                if any('SUCCESS::调用成功' in ret for ret in ret_value):
+                    if 'data' in res_json and 'accessToken' in res_json['data']:
+                        new_token = res_json['data']['accessToken']
+                        self.current_token = new_token
+                        self.last_token_refresh_time = time.time()
+
+                        # 【消息接收时间重置】Token刷新成功后重置消息接收标志，与 _cookie_refresh_job 保持一致
+                        self.last_message_received_time = 0
+                        logger.debug(f"【{self.cookie_id}】Token刷新成功，已重置消息接收时间标识")
+
+                        logger.info(f"【{self.cookie_id}】Token刷新成功")
+                        # 标记为成功
+                        self.last_token_refresh_status = "success"
+                        return new_token
+
+            # 检查是否需要滑块验证
+            if self._need_captcha_verification(res_json):
+                logger.warning(f"【{self.cookie_id}】检测到需要滑块验证，开始处理...")
+
+                # 记录滑块验证检测到日志文件
+                verification_url = res_json.get('data', {}).get('url', 'Token刷新时检测')
+                log_captcha_event(self.cookie_id, "检测到滑块验证", None, f"触发场景: Token刷新, URL: {verification_url}")
+
+                # 添加风控日志记录
+                log_id = None
+                try:
+                    from db_manager import db_manager
+                    success = db_manager.add_risk_control_log(
+                        cookie_id=self.cookie_id,
+                        event_type='slider_captcha',
+                        event_description=f"检测到需要滑块验证，触发场景: Token刷新, URL: {verification_url}",
+                        processing_status='processing'
+                    )
+                    if success:
+                        # 获取刚插入的记录ID（简单方式，实际应该返回ID）
+                        logs = db_manager.get_risk_control_logs(cookie_id=self.cookie_id, limit=1)
+                        if logs:
+                            log_id = logs[0].get('id')
+                        logger.info(f"【{self.cookie_id}】风控日志记录成功，ID: {log_id}")
+                except Exception as log_e:
+                    logger.error(f"【{self.cookie_id}】记录风控日志失败: {log_e}")
 
-            sign = generate_sign(params['t'], token, data_val)
-            params['sign'] = sign
+                try:
+                    # 尝试通过滑块验证获取新的cookies
+                    captcha_start_time = time.time()
+                    new_cookies_str = await self._handle_captcha_verification(res_json)
+                    captcha_duration = time.time() - captcha_start_time
 
-            # 发送请求
-            headers = DEFAULT_HEADERS.copy()
-            headers['cookie'] = self.cookies_str
+                    if new_cookies_str:
+                        logger.info(f"【{self.cookie_id}】滑块验证成功，准备重启实例...")
+
+                        # 更新风控日志为成功状态
+                        if 'log_id' in locals() and log_id:
+                            try:
+                                from db_manager import db_manager
+                                db_manager.update_risk_control_log(
+                                    log_id=log_id,
+                                    processing_result=f"滑块验证成功，耗时: {captcha_duration:.2f}秒, cookies长度: {len(new_cookies_str)}",
+                                    processing_status='success'
+                                )
+                            except Exception as update_e:
+                                logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
+
+                        # 重启实例（cookies已在_handle_captcha_verification中更新到数据库）
+                        # await self._restart_instance()
+                        
+                        # 重新尝试刷新token（递归调用，但有深度限制）
+                        return await self.refresh_token(captcha_retry_count + 1)
+                    else:
+                        logger.error(f"【{self.cookie_id}】滑块验证失败")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    API_ENDPOINTS.get('token'),
-                    params=params,
-                    data=data,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    res_json = await response.json()
-
-                    # 检查并更新Cookie
-                    if 'set-cookie' in response.headers:
-                        new_cookies = {}
-                        for cookie in response.headers.getall('set-cookie', []):
-                            if '=' in cookie:
-                                name, value = cookie.split(';')[0].split('=', 1)
-                                new_cookies[name.strip()] = value.strip()
-
-                        # 更新cookies
-                        if new_cookies:
-                            self.cookies.update(new_cookies)
-                            # 生成新的cookie字符串
-                            self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                            # 更新数据库中的Cookie
-                            await self.update_config_cookies()
-                            logger.debug("已更新Cookie到数据库")
-
-                    if isinstance(res_json, dict):
-                        ret_value = res_json.get('ret', [])
-                        # 检查ret是否包含成功信息
-                        if any('SUCCESS::调用成功' in ret for ret in ret_value):
-                            if 'data' in res_json and 'accessToken' in res_json['data']:
-                                new_token = res_json['data']['accessToken']
-                                self.current_token = new_token
-                                self.last_token_refresh_time = time.time()
-
-                                # 【消息接收时间重置】Token刷新成功后重置消息接收标志，与 cookie_refresh_loop 保持一致
-                                self.last_message_received_time = 0
-                                logger.debug(f"【{self.cookie_id}】Token刷新成功，已重置消息接收时间标识")
-
-                                logger.info(f"【{self.cookie_id}】Token刷新成功")
-                                # 标记为成功
-                                self.last_token_refresh_status = "success"
-                                return new_token
-
-                    # 检查是否需要滑块验证
-                    if self._need_captcha_verification(res_json):
-                        logger.warning(f"【{self.cookie_id}】检测到需要滑块验证，开始处理...")
-
-                        # 记录滑块验证检测到日志文件
-                        verification_url = res_json.get('data', {}).get('url', 'Token刷新时检测')
-                        log_captcha_event(self.cookie_id, "检测到滑块验证", None, f"触发场景: Token刷新, URL: {verification_url}")
-
-                        # 添加风控日志记录
-                        log_id = None
+                        # 更新风控日志为失败状态
+                        if 'log_id' in locals() and log_id:
+                            try:
+                                from db_manager import db_manager
+                                db_manager.update_risk_control_log(
+                                    log_id=log_id,
+                                    processing_result=f"滑块验证失败，耗时: {captcha_duration:.2f}秒, 原因: 未获取到新cookies",
+                                    processing_status='failed'
+                                )
+                            except Exception as update_e:
+                                logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
+                        
+                        # 标记已发送通知（通知已在_handle_captcha_verification中发送）
+                        notification_sent = True
+                except Exception as captcha_e:
+                    logger.error(f"【{self.cookie_id}】滑块验证处理异常: {self._safe_str(captcha_e)}")
+
+                    # 更新风控日志为异常状态
+                    captcha_duration = time.time() - captcha_start_time if 'captcha_start_time' in locals() else 0
+                    if 'log_id' in locals() and log_id:
                         try:
                             from db_manager import db_manager
-                            success = db_manager.add_risk_control_log(
-                                cookie_id=self.cookie_id,
-                                event_type='slider_captcha',
-                                event_description=f"检测到需要滑块验证，触发场景: Token刷新, URL: {verification_url}",
-                                processing_status='processing'
+                            db_manager.update_risk_control_log(
+                                log_id=log_id,
+                                processing_result=f"滑块验证处理异常，耗时: {captcha_duration:.2f}秒",
+                                processing_status='failed',
+                                error_message=str(captcha_e)
                             )
-                            if success:
-                                # 获取刚插入的记录ID（简单方式，实际应该返回ID）
-                                logs = db_manager.get_risk_control_logs(cookie_id=self.cookie_id, limit=1)
-                                if logs:
-                                    log_id = logs[0].get('id')
-                                logger.info(f"【{self.cookie_id}】风控日志记录成功，ID: {log_id}")
-                        except Exception as log_e:
-                            logger.error(f"【{self.cookie_id}】记录风控日志失败: {log_e}")
-
-                        try:
-                            # 尝试通过滑块验证获取新的cookies
-                            captcha_start_time = time.time()
-                            new_cookies_str = await self._handle_captcha_verification(res_json)
-                            captcha_duration = time.time() - captcha_start_time
-
-                            if new_cookies_str:
-                                logger.info(f"【{self.cookie_id}】滑块验证成功，准备重启实例...")
+                        except Exception as update_e:
+                            logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
+                    
+                    # 标记已发送通知（通知已在_handle_captcha_verification中发送）
+                    notification_sent = True
 
-                                # 更新风控日志为成功状态
-                                if 'log_id' in locals() and log_id:
-                                    try:
-                                        from db_manager import db_manager
-                                        db_manager.update_risk_control_log(
-                                            log_id=log_id,
-                                            processing_result=f"滑块验证成功，耗时: {captcha_duration:.2f}秒, cookies长度: {len(new_cookies_str)}",
-                                            processing_status='success'
-                                        )
-                                    except Exception as update_e:
-                                        logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
+            # 检查是否包含"令牌过期"或"Session过期"
+            if isinstance(res_json, dict):
+                res_json_str = json.dumps(res_json, ensure_ascii=False, separators=(',', ':'))
+                if '令牌过期' in res_json_str or 'Session过期' in res_json_str:
+                    logger.warning(f"【{self.cookie_id}】检测到令牌/Session过期，准备刷新Cookie并重启实例...")
 
-                                # 重启实例（cookies已在_handle_captcha_verification中更新到数据库）
-                                # await self._restart_instance()
-                                
-                                # 重新尝试刷新token（递归调用，但有深度限制）
-                                return await self.refresh_token(captcha_retry_count + 1)
-                            else:
-                                logger.error(f"【{self.cookie_id}】滑块验证失败")
+                    # 记录到日志文件
+                    log_captcha_event(self.cookie_id, "令牌/Session过期触发Cookie刷新和实例重启", None,
+                        f"检测到令牌/Session过期，准备刷新Cookie并重启实例")
 
-                                # 更新风控日志为失败状态
-                                if 'log_id' in locals() and log_id:
-                                    try:
-                                        from db_manager import db_manager
-                                        db_manager.update_risk_control_log(
-                                            log_id=log_id,
-                                            processing_result=f"滑块验证失败，耗时: {captcha_duration:.2f}秒, 原因: 未获取到新cookies",
-                                            processing_status='failed'
-                                        )
-                                    except Exception as update_e:
-                                        logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
-                                
-                                # 标记已发送通知（通知已在_handle_captcha_verification中发送）
-                                notification_sent = True
-                        except Exception as captcha_e:
-                            logger.error(f"【{self.cookie_id}】滑块验证处理异常: {self._safe_str(captcha_e)}")
-
-                            # 更新风控日志为异常状态
-                            captcha_duration = time.time() - captcha_start_time if 'captcha_start_time' in locals() else 0
-                            if 'log_id' in locals() and log_id:
-                                try:
-                                    from db_manager import db_manager
-                                    db_manager.update_risk_control_log(
-                                        log_id=log_id,
-                                        processing_result=f"滑块验证处理异常，耗时: {captcha_duration:.2f}秒",
-                                        processing_status='failed',
-                                        error_message=str(captcha_e)
-                                    )
-                                except Exception as update_e:
-                                    logger.error(f"【{self.cookie_id}】更新风控日志失败: {update_e}")
+                    try:
+                        # 从数据库获取账号登录信息
+                        from db_manager import db_manager
+                        account_info = db_manager.get_cookie_details(self.cookie_id)
+                        
+                        if not account_info:
+                            logger.error(f"【{self.cookie_id}】无法获取账号信息")
+                            raise Exception("无法获取账号信息")
+                        
+                        username = account_info.get('username', '')
+                        password = account_info.get('password', '')
+                        show_browser = account_info.get('show_browser', False)
+                        
+                        # 检查是否配置了用户名和密码
+                        if not username or not password:
+                            logger.warning(f"【{self.cookie_id}】未配置用户名或密码，跳过密码登录刷新")
+                            raise Exception("未配置用户名或密码")
+                        
+                        # 使用浏览器进行密码登录刷新Cookie
+                        from utils.xianyu_slider_stealth import XianyuSliderStealth
+                        browser_mode = "有头" if show_browser else "无头"
+                        logger.info(f"【{self.cookie_id}】开始使用{browser_mode}浏览器进行密码登录刷新Cookie...")
+                        logger.info(f"【{self.cookie_id}】使用账号: {username}")
+                        
+                        # 在单独的线程中运行同步的登录方法
+                        import asyncio
+                        slider = XianyuSliderStealth(user_id=self.cookie_id, enable_learning=False)
+                        result = await asyncio.to_thread(
+                            slider.login_with_password_headful,
+                            account=username,
+                            password=password,
+                            show_browser=show_browser
+                        )
+                        
+                        if result:
+                            logger.info(f"【{self.cookie_id}】密码登录成功，获取到Cookie")
+                            logger.info(f"【{self.cookie_id}】Cookie内容: {result}")
                             
-                            # 标记已发送通知（通知已在_handle_captcha_verification中发送）
-                            notification_sent = True
-
-                    # 检查是否包含"令牌过期"或"Session过期"
-                    if isinstance(res_json, dict):
-                        res_json_str = json.dumps(res_json, ensure_ascii=False, separators=(',', ':'))
-                        if '令牌过期' in res_json_str or 'Session过期' in res_json_str:
-                            logger.warning(f"【{self.cookie_id}】检测到令牌/Session过期，准备刷新Cookie并重启实例...")
-
-                            # 记录到日志文件
-                            log_captcha_event(self.cookie_id, "令牌/Session过期触发Cookie刷新和实例重启", None,
-                                f"检测到令牌/Session过期，准备刷新Cookie并重启实例")
-
-                            try:
-                                # 从数据库获取账号登录信息
-                                from db_manager import db_manager
-                                account_info = db_manager.get_cookie_details(self.cookie_id)
-                                
-                                if not account_info:
-                                    logger.error(f"【{self.cookie_id}】无法获取账号信息")
-                                    raise Exception("无法获取账号信息")
-                                
-                                username = account_info.get('username', '')
-                                password = account_info.get('password', '')
-                                show_browser = account_info.get('show_browser', False)
-                                
-                                # 检查是否配置了用户名和密码
-                                if not username or not password:
-                                    logger.warning(f"【{self.cookie_id}】未配置用户名或密码，跳过密码登录刷新")
-                                    raise Exception("未配置用户名或密码")
-                                
-                                # 使用浏览器进行密码登录刷新Cookie
-                                from utils.xianyu_slider_stealth import XianyuSliderStealth
-                                browser_mode = "有头" if show_browser else "无头"
-                                logger.info(f"【{self.cookie_id}】开始使用{browser_mode}浏览器进行密码登录刷新Cookie...")
-                                logger.info(f"【{self.cookie_id}】使用账号: {username}")
+                            # 将cookie字典转换为字符串格式
+                            new_cookies_str = '; '.join([f"{k}={v}" for k, v in result.items()])
+                            logger.info(f"【{self.cookie_id}】Cookie字符串格式: {new_cookies_str[:200]}..." if len(new_cookies_str) > 200 else f"【{self.cookie_id}】Cookie字符串格式: {new_cookies_str}")
+                            
+                            # 更新Cookie并重启任务
+                            logger.info(f"【{self.cookie_id}】开始更新Cookie并重启任务...")
+                            update_success = await self._update_cookies_and_restart(new_cookies_str)
+                            
+                            if update_success:
+                                logger.info(f"【{self.cookie_id}】Cookie更新并重启任务成功")
                                 
-                                # 在单独的线程中运行同步的登录方法
-                                import asyncio
-                                slider = XianyuSliderStealth(user_id=self.cookie_id, enable_learning=False)
-                                result = await asyncio.to_thread(
-                                    slider.login_with_password_headful,
-                                    account=username,
-                                    password=password,
-                                    show_browser=show_browser
+                                # 发送账号密码登录成功通知
+                                await self.send_token_refresh_notification(
+                                    f"账号密码登录成功，Cookie已更新，任务已重启",
+                                    "password_login_success"
                                 )
+                            else:
+                                logger.warning(f"【{self.cookie_id}】Cookie更新或重启任务失败")
                                 
-                                if result:
-                                    logger.info(f"【{self.cookie_id}】密码登录成功，获取到Cookie")
-                                    logger.info(f"【{self.cookie_id}】Cookie内容: {result}")
-                                    
-                                    # 将cookie字典转换为字符串格式
-                                    new_cookies_str = '; '.join([f"{k}={v}" for k, v in result.items()])
-                                    logger.info(f"【{self.cookie_id}】Cookie字符串格式: {new_cookies_str[:200]}..." if len(new_cookies_str) > 200 else f"【{self.cookie_id}】Cookie字符串格式: {new_cookies_str}")
-                                    
-                                    # 更新Cookie并重启任务
-                                    logger.info(f"【{self.cookie_id}】开始更新Cookie并重启任务...")
-                                    update_success = await self._update_cookies_and_restart(new_cookies_str)
-                                    
-                                    if update_success:
-                                        logger.info(f"【{self.cookie_id}】Cookie更新并重启任务成功")
-                                        
-                                        # 发送账号密码登录成功通知
-                                        await self.send_token_refresh_notification(
-                                            f"账号密码登录成功，Cookie已更新，任务已重启",
-                                            "password_login_success"
-                                        )
-                                    else:
-                                        logger.warning(f"【{self.cookie_id}】Cookie更新或重启任务失败")
-                                        
-                                else:
-                                    logger.warning(f"【{self.cookie_id}】密码登录失败，未获取到Cookie")
-                                    
+                        else:
+                            logger.warning(f"【{self.cookie_id}】密码登录失败，未获取到Cookie")
+                            
 
-                            except Exception as refresh_e:
-                                logger.error(f"【{self.cookie_id}】Cookie刷新或实例重启失败: {self._safe_str(refresh_e)}")
-                                
-                                # 刷新失败时继续执行原有的失败处理逻辑
+                    except Exception as refresh_e:
+                        logger.error(f"【{self.cookie_id}】Cookie刷新或实例重启失败: {self._safe_str(refresh_e)}")
+                        
+                        # 刷新失败时继续执行原有的失败处理逻辑
 
-                    logger.error(f"【{self.cookie_id}】Token刷新失败: {res_json}")
+            logger.error(f"【{self.cookie_id}】Token刷新失败: {res_json}")
 
-                    # 清空当前token，确保下次重试时重新获取
-                    self.current_token = None
+            # 清空当前token，确保下次重试时重新获取
+            self.current_token = None
 
-                    # 只有在没有发送过通知的情况下才发送Token刷新失败通知
-                    # 并且WebSocket未连接时才发送（已连接说明只是暂时失败）
-                    if not notification_sent:
-                        # 检查WebSocket连接状态
-                        is_ws_connected = (
-                            self.connection_state == ConnectionState.CONNECTED and 
-                            self.ws and 
-                            not self.ws.closed
-                        )
-                        
-                        if is_ws_connected:
-                            logger.info(f"【{self.cookie_id}】WebSocket连接正常，Token刷新失败可能是暂时的，跳过失败通知")
-                        else:
-                            logger.warning(f"【{self.cookie_id}】WebSocket未连接，发送Token刷新失败通知")
-                            await self.send_token_refresh_notification(f"Token刷新失败: {res_json}", "token_refresh_failed")
-                    else:
-                        logger.info(f"【{self.cookie_id}】已发送滑块验证相关通知，跳过Token刷新失败通知")
-                    return None
+            # 只有在没有发送过通知的情况下才发送Token刷新失败通知
+            # 并且WebSocket未连接时才发送（已连接说明只是暂时失败）
+            if not notification_sent:
+                # 检查WebSocket连接状态
+                is_ws_connected = (
+                    self.connection_state == ConnectionState.CONNECTED and 
+                    self.ws and 
+                    not self.ws.closed
+                )
+                
+                if is_ws_connected:
+                    logger.info(f"【{self.cookie_id}】WebSocket连接正常，Token刷新失败可能是暂时的，跳过失败通知")
+                else:
+                    logger.warning(f"【{self.cookie_id}】WebSocket未连接，发送Token刷新失败通知")
+                    await self.send_token_refresh_notification(f"Token刷新失败: {res_json}", "token_refresh_failed")
+            else:
+                logger.info(f"【{self.cookie_id}】已发送滑块验证相关通知，跳过Token刷新失败通知")
+            return None
 
         except Exception as e:
             logger.error(f"Token刷新异常: {self._safe_str(e)}")
@@ -1655,7 +1649,7 @@ class XianyuLive:
             # 合并cookies：保留原有cookies，只更新新获取到的字段
             try:
                 # 获取当前的cookies字典
-                current_cookies_dict = trans_cookies(self.cookies_str)
+                current_cookies_dict = dict(self.cookies)
                 logger.info(f"【{self.cookie_id}】当前cookies包含 {len(current_cookies_dict)} 个字段")
 
                 # 合并cookies：新cookies覆盖旧cookies中的相同字段
@@ -1854,7 +1848,7 @@ class XianyuLive:
             return False
 
     async def fetch_item_detail_from_api(self, item_id: str) -> str:
-        """获取商品详情（优先使用浏览器，备用外部API，支持24小时缓存）
+        """获取商品详情（优先使用浏览器，备用外部API，支持内存+数据库两级缓存）
 
         Args:
             item_id: 商品ID
@@ -1871,230 +1865,81 @@ class XianyuLive:
                 logger.debug(f"自动获取商品详情功能已禁用: {item_id}")
                 return ""
 
-            # 1. 首先检查缓存（24小时有效）
-            async with self._item_detail_cache_lock:
-                if item_id in self._item_detail_cache:
-                    cache_data = self._item_detail_cache[item_id]
-                    cache_time = cache_data['timestamp']
-                    current_time = time.time()
+            # 1. 首先检查缓存（内存LRU + 数据库二级缓存）
+            cached_detail = await item_detail_cache.get(item_id)
+            if cached_detail:
+                logger.info(f"从缓存获取商品详情: {item_id}")
+                return cached_detail
 
-                    # 检查缓存是否在24小时内
-                    if current_time - cache_time < self._item_detail_cache_ttl:
-                        # 更新访问时间（用于LRU）
-                        cache_data['access_time'] = current_time
-                        logger.info(f"从缓存获取商品详情: {item_id}")
-                        return cache_data['detail']
-                    else:
-                        # 缓存过期，删除
-                        del self._item_detail_cache[item_id]
-                        logger.debug(f"缓存已过期，删除: {item_id}")
-
-            # 2. 尝试使用浏览器获取商品详情
-            detail_from_browser = await self._fetch_item_detail_from_browser(item_id)
-            if detail_from_browser:
-                # 保存到缓存（带大小限制）
-                await self._add_to_item_cache(item_id, detail_from_browser)
-                logger.info(f"成功通过浏览器获取商品详情: {item_id}, 长度: {len(detail_from_browser)}")
-                return detail_from_browser
-
-            # 3. 浏览器获取失败，使用外部API作为备用
-            logger.warning(f"浏览器获取商品详情失败，尝试外部API: {item_id}")
-            detail_from_api = await self._fetch_item_detail_from_external_api(item_id)
-            if detail_from_api:
-                # 保存到缓存（带大小限制）
-                await self._add_to_item_cache(item_id, detail_from_api)
-                logger.info(f"成功通过外部API获取商品详情: {item_id}, 长度: {len(detail_from_api)}")
-                return detail_from_api
-
-            logger.warning(f"所有方式都无法获取商品详情: {item_id}")
-            return ""
+            # 2. 缓存未命中，同一商品的并发请求只获取一次
+            return await single_flight.do('item_detail', item_id, lambda: self._fetch_item_detail_uncached(item_id))
 
         except Exception as e:
             logger.error(f"获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
             return ""
 
-    async def _add_to_item_cache(self, item_id: str, detail: str):
-        """添加商品详情到缓存，实现LRU策略和大小限制
-        
-        Args:
-            item_id: 商品ID
-            detail: 商品详情
-        """
-        async with self._item_detail_cache_lock:
-            current_time = time.time()
-            
-            # 检查缓存大小，如果超过限制则清理
-            if len(self._item_detail_cache) >= self._item_detail_cache_max_size:
-                # 使用LRU策略删除最久未访问的项
-                if self._item_detail_cache:
-                    # 找到最久未访问的项
-                    oldest_item = min(
-                        self._item_detail_cache.items(),
-                        key=lambda x: x[1].get('access_time', x[1]['timestamp'])
-                    )
-                    oldest_item_id = oldest_item[0]
-                    del self._item_detail_cache[oldest_item_id]
-                    logger.debug(f"缓存已满，删除最旧项: {oldest_item_id}")
-            
-            # 添加新项到缓存
-            self._item_detail_cache[item_id] = {
-                'detail': detail,
-                'timestamp': current_time,
-                'access_time': current_time
-            }
-            logger.debug(f"添加商品详情到缓存: {item_id}, 当前缓存大小: {len(self._item_detail_cache)}")
-
-    @classmethod
-    async def _cleanup_item_cache(cls):
-        """清理过期的商品详情缓存"""
-        async with cls._item_detail_cache_lock:
-            current_time = time.time()
-            expired_items = []
-            
-            # 找出所有过期的项
-            for item_id, cache_data in cls._item_detail_cache.items():
-                if current_time - cache_data['timestamp'] >= cls._item_detail_cache_ttl:
-                    expired_items.append(item_id)
-            
-            # 删除过期项
-            for item_id in expired_items:
-                del cls._item_detail_cache[item_id]
-            
-            if expired_items:
-                logger.info(f"清理了 {len(expired_items)} 个过期的商品详情缓存")
-            
-            return len(expired_items)
+    async def _fetch_item_detail_uncached(self, item_id: str) -> str:
+        """通过浏览器或外部API获取商品详情并写入缓存"""
+        # 1. 尝试使用浏览器获取商品详情
+        detail_from_browser = await self._fetch_item_detail_from_browser(item_id)
+        if detail_from_browser:
+            item_detail_cache.put(item_id, detail_from_browser)
+            logger.info(f"成功通过浏览器获取商品详情: {item_id}, 长度: {len(detail_from_browser)}")
+            return detail_from_browser
+
+        # 2. 浏览器获取失败，使用外部API作为备用
+        logger.warning(f"浏览器获取商品详情失败，尝试外部API: {item_id}")
+        detail_from_api = await self._fetch_item_detail_from_external_api(item_id)
+        if detail_from_api:
+            item_detail_cache.put(item_id, detail_from_api)
+            logger.info(f"成功通过外部API获取商品详情: {item_id}, 长度: {len(detail_from_api)}")
+            return detail_from_api
+
+        logger.warning(f"所有方式都无法获取商品详情: {item_id}")
+        return ""
 
     async def _fetch_item_detail_from_browser(self, item_id: str) -> str:
-        """使用浏览器获取商品详情"""
-        playwright = None
-        browser = None
+        """使用共享浏览器池获取商品详情"""
         try:
-            from playwright.async_api import async_playwright
+            from utils.browser_pool import browser_pool
 
             logger.info(f"开始使用浏览器获取商品详情: {item_id}")
 
-            playwright = await async_playwright().start()
-
-            # 启动浏览器（参照order_detail_fetcher的配置）
-            browser_args = [
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-accelerated-2d-canvas',
-                '--no-first-run',
-                '--no-zygote',
-                '--disable-gpu',
-                '--disable-background-timer-throttling',
-                '--disable-backgrounding-occluded-windows',
-                '--disable-renderer-backgrounding',
-                '--disable-features=TranslateUI',
-                '--disable-ipc-flooding-protection',
-                '--disable-extensions',
-                '--disable-default-apps',
-                '--disable-sync',
-                '--disable-translate',
-                '--hide-scrollbars',
-                '--mute-audio',
-                '--no-default-browser-check',
-                '--no-pings'
-            ]
-
-            # 在Docker环境中添加额外参数
-            if os.getenv('DOCKER_ENV'):
-                browser_args.extend([
-                    # '--single-process',  # 注释掉，避免多用户并发时的进程冲突和资源泄漏
-                    '--disable-background-networking',
-                    '--disable-client-side-phishing-detection',
-                    '--disable-hang-monitor',
-                    '--disable-popup-blocking',
-                    '--disable-prompt-on-repost',
-                    '--disable-web-resources',
-                    '--metrics-recording-only',
-                    '--safebrowsing-disable-auto-update',
-                    '--enable-automation',
-                    '--password-store=basic',
-                    '--use-mock-keychain'
-                ])
-
-            browser = await playwright.chromium.launch(
-                headless=True,
-                args=browser_args
-            )
-
             headers = DEFAULT_HEADERS.copy()
-            # 创建浏览器上下文
-            context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent= headers['user-agent'] or 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
-            )
-
-            # 设置Cookie
-            cookies = []
-            for cookie_pair in self.cookies_str.split('; '):
-                if '=' in cookie_pair:
-                    name, value = cookie_pair.split('=', 1)
-                    cookies.append({
-                        'name': name.strip(),
-                        'value': value.strip(),
-                        'domain': '.goofish.com',
-                        'path': '/'
-                    })
-
-            await context.add_cookies(cookies)
-            logger.debug(f"已设置 {len(cookies)} 个Cookie")
-
-            # 创建页面
-            page = await context.new_page()
+            async with browser_pool.page(self.cookie_id, self.cookies_str, headers.get('user-agent')) as page:
+                # 构造商品详情页面URL
+                item_url = f"https://www.goofish.com/item?id={item_id}"
+                logger.info(f"访问商品页面: {item_url}")
 
-            # 构造商品详情页面URL
-            item_url = f"https://www.goofish.com/item?id={item_id}"
-            logger.info(f"访问商品页面: {item_url}")
+                # 访问页面
+                await page.goto(item_url, wait_until='networkidle', timeout=30000)
 
-            # 访问页面
-            await page.goto(item_url, wait_until='networkidle', timeout=30000)
+                # 等待页面完全加载
+                await asyncio.sleep(3)
 
-            # 等待页面完全加载
-            await asyncio.sleep(3)
-
-            # 获取商品详情内容
-            detail_text = ""
-            try:
-                # 等待目标元素出现
-                await page.wait_for_selector('.desc--GaIUKUQY', timeout=10000)
-
-                # 获取商品详情文本
-                detail_element = await page.query_selector('.desc--GaIUKUQY')
-                if detail_element:
-                    detail_text = await detail_element.inner_text()
-                    logger.info(f"成功获取商品详情: {item_id}, 长度: {len(detail_text)}")
-                    return detail_text.strip()
-                else:
-                    logger.warning(f"未找到商品详情元素: {item_id}")
+                # 获取商品详情内容
+                detail_text = ""
+                try:
+                    # 等待目标元素出现
+                    await page.wait_for_selector('.desc--GaIUKUQY', timeout=10000)
+
+                    # 获取商品详情文本
+                    detail_element = await page.query_selector('.desc--GaIUKUQY')
+                    if detail_element:
+                        detail_text = await detail_element.inner_text()
+                        logger.info(f"成功获取商品详情: {item_id}, 长度: {len(detail_text)}")
+                        return detail_text.strip()
+                    else:
+                        logger.warning(f"未找到商品详情元素: {item_id}")
 
-            except Exception as e:
-                logger.warning(f"获取商品详情元素失败: {item_id}, 错误: {self._safe_str(e)}")
+                except Exception as e:
+                    logger.warning(f"获取商品详情元素失败: {item_id}, 错误: {self._safe_str(e)}")
 
-            return ""
+                return ""
 
         except Exception as e:
             logger.error(f"浏览器获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
             return ""
-        finally:
-            # 确保资源被正确清理
-            try:
-                if browser:
-                    await browser.close()
-                    logger.debug(f"Browser已关闭: {item_id}")
-            except Exception as e:
-                logger.warning(f"关闭browser时出错: {self._safe_str(e)}")
-            
-            try:
-                if playwright:
-                    await playwright.stop()
-                    logger.debug(f"Playwright已停止: {item_id}")
-            except Exception as e:
-                logger.warning(f"停止playwright时出错: {self._safe_str(e)}")
 
     async def _fetch_item_detail_from_external_api(self, item_id: str) -> str:
         """从外部API获取商品详情（备用方案）"""
@@ -2232,7 +2077,6 @@ class XianyuLive:
         success_count = 0
 
         try:
-            from db_manager import db_manager
             from config import config
 
             # 从配置获取并发数量和延迟时间
@@ -2289,93 +2133,29 @@ class XianyuLive:
             return success_count
 
     async def get_item_info(self, item_id, retry_count=0):
-        """获取商品信息，自动处理token失效的情况"""
-        if retry_count >= 4:  # 最多重试3次
-            logger.error("获取商品信息失败，重试次数过多")
-            return {"error": "获取商品信息失败，重试次数过多"}
-
-        # 确保session已创建
-        if not self.session:
-            await self.create_session()
-
-        params = {
-            'jsv': '2.7.2',
-            'appKey': '34839810',
-            't': str(int(time.time()) * 1000),
-            'sign': '',
-            'v': '1.0',
-            'type': 'originaljson',
-            'accountSite': 'xianyu',
-            'dataType': 'json',
-            'timeout': '20000',
-            'api': 'mtop.taobao.idle.pc.detail',
-            'sessionOption': 'AutoLoginOnly',
-            'spm_cnt': 'a21ybx.im.0.0',
-        }
-
-        data_val = '{"itemId":"' + item_id + '"}'
-        data = {
-            'data': data_val,
-        }
-
-        # 始终从最新的cookies中获取_m_h5_tk token（刷新后cookies会被更新）
-        token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
-
-        if token:
-            logger.debug(f"使用cookies中的_m_h5_tk token: {token}")
-        else:
-            logger.warning("cookies中没有找到_m_h5_tk token")
-
-        from utils.xianyu_utils import generate_sign
-        sign = generate_sign(params['t'], token, data_val)
-        params['sign'] = sign
-
+        """获取商品信息，自动处理token失效的情况（重试由mtop客户端处理，retry_count仅为兼容保留）"""
         try:
-            async with self.session.post(
-                'https://h5api.m.goofish.com/h5/mtop.taobao.idle.pc.detail/1.0/',
-                params=params,
-                data=data
-            ) as response:
-                res_json = await response.json()
-
-                # 检查并更新Cookie
-                if 'set-cookie' in response.headers:
-                    new_cookies = {}
-                    for cookie in response.headers.getall('set-cookie', []):
-                        if '=' in cookie:
-                            name, value = cookie.split(';')[0].split('=', 1)
-                            new_cookies[name.strip()] = value.strip()
-
-                    # 更新cookies
-                    if new_cookies:
-                        self.cookies.update(new_cookies)
-                        # 生成新的cookie字符串
-                        self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                        # 更新数据库中的Cookie
-                        await self.update_config_cookies()
-                        logger.debug("已更新Cookie到数据库")
-
-                logger.debug(f"商品信息获取成功: {res_json}")
-                # 检查返回状态
-                if isinstance(res_json, dict):
-                    ret_value = res_json.get('ret', [])
-                    # 检查ret是否包含成功信息
-                    if not any('SUCCESS::调用成功' in ret for ret in ret_value):
-                        logger.warning(f"商品信息API调用失败，错误信息: {ret_value}")
-
-                        await asyncio.sleep(0.5)
-                        return await self.get_item_info(item_id, retry_count + 1)
-                    else:
-                        logger.debug(f"商品信息获取成功: {item_id}")
-                        return res_json
-                else:
-                    logger.error(f"商品信息API返回格式异常: {res_json}")
-                    return await self.get_item_info(item_id, retry_count + 1)
-
-        except Exception as e:
+            res_json = await self.mtop.call(
+                'mtop.taobao.idle.pc.detail',
+                {'itemId': item_id},
+                params={'spm_cnt': 'a21ybx.im.0.0'}
+            )
+        except MtopError as e:
             logger.error(f"商品信息API请求异常: {self._safe_str(e)}")
-            await asyncio.sleep(0.5)
-            return await self.get_item_info(item_id, retry_count + 1)
+            return {"error": f"获取商品信息失败: {self._safe_str(e)}"}
+
+        logger.debug(f"商品信息获取成功: {res_json}")
+        # 检查返回状态
+        if not isinstance(res_json, dict):
+            logger.error(f"商品信息API返回格式异常: {res_json}")
+            return {"error": "商品信息API返回格式异常"}
+        if not is_mtop_success(res_json):
+            ret_value = res_json.get('ret', [])
+            logger.warning(f"商品信息API调用失败，错误信息: {ret_value}")
+            return {"error": f"获取商品信息失败: {ret_value}"}
+
+        logger.debug(f"商品信息获取成功: {item_id}")
+        return res_json
 
     def extract_item_id_from_message(self, message):
         """从消息中提取商品ID的辅助方法"""
@@ -2488,11 +2268,9 @@ class XianyuLive:
     async def get_default_reply(self, send_user_name: str, send_user_id: str, send_message: str, chat_id: str, item_id: str = None) -> str:
         """获取默认回复内容，支持指定商品回复、变量替换和只回复一次功能"""
         try:
-            from db_manager import db_manager
-
             # 1. 优先检查指定商品回复
             if item_id:
-                item_reply = db_manager.get_item_reply(self.cookie_id, item_id)
+                item_reply = await async_db_manager.get_item_reply(self.cookie_id, item_id)
                 if item_reply and item_reply.get('reply_content'):
                     reply_content = item_reply['reply_content']
                     logger.info(f"【{self.cookie_id}】使用指定商品回复: 商品ID={item_id}")
@@ -2515,7 +2293,7 @@ class XianyuLive:
                     logger.debug(f"【{self.cookie_id}】商品ID {item_id} 没有配置指定回复，使用默认回复")
 
             # 2. 获取当前账号的默认回复设置
-            default_reply_settings = db_manager.get_default_reply(self.cookie_id)
+            default_reply_settings = await async_db_manager.get_default_reply(self.cookie_id)
 
             if not default_reply_settings or not default_reply_settings.get('enabled', False):
                 logger.debug(f"账号 {self.cookie_id} 未启用默认回复")
@@ -2524,7 +2302,7 @@ class XianyuLive:
             # 检查"只回复一次"功能
             if default_reply_settings.get('reply_once', False) and chat_id:
                 # 检查是否已经回复过这个chat_id
-                if db_manager.has_default_reply_record(self.cookie_id, chat_id):
+                if await async_db_manager.has_default_reply_record(self.cookie_id, chat_id):
                     logger.info(f"【{self.cookie_id}】chat_id {chat_id} 已使用过默认回复，跳过（只回复一次）")
                     return None
 
@@ -2536,7 +2314,7 @@ class XianyuLive:
             # 进行变量替换
             try:
                 # 获取当前商品是否有设置自动回复
-                item_replay = db_manager.get_item_replay(item_id)
+                item_replay = await async_db_manager.get_item_replay(item_id)
 
                 formatted_reply = reply_content.format(
                     send_user_name=send_user_name,
@@ -2549,7 +2327,7 @@ class XianyuLive:
 
                 # 如果开启了"只回复一次"功能，记录这次回复
                 if default_reply_settings.get('reply_once', False) and chat_id:
-                    db_manager.add_default_reply_record(self.cookie_id, chat_id)
+                    await async_db_manager.add_default_reply_record(self.cookie_id, chat_id)
                     logger.info(f"【{self.cookie_id}】记录默认回复: chat_id={chat_id}")
 
                 logger.info(f"【{self.cookie_id}】使用默认回复: {formatted_reply}")
@@ -2566,88 +2344,55 @@ class XianyuLive:
     async def get_keyword_reply(self, send_user_name: str, send_user_id: str, send_message: str, item_id: str = None) -> str:
         """获取关键词匹配回复（支持商品ID优先匹配和图片类型）"""
         try:
-            from db_manager import db_manager
+            from utils.keyword_matcher import keyword_matcher_cache
 
-            # 获取当前账号的关键词列表（包含类型信息）
-            keywords = db_manager.get_keywords_with_type(self.cookie_id)
+            # 获取当前账号预编译的关键词匹配器（关键词修改后自动重建）
+            matcher = keyword_matcher_cache.get(self.cookie_id)
 
-            if not keywords:
+            if not len(matcher):
                 logger.debug(f"账号 {self.cookie_id} 没有配置关键词")
                 return None
 
-            # 1. 如果有商品ID，优先匹配该商品ID对应的关键词
-            if item_id:
-                for keyword_data in keywords:
-                    keyword = keyword_data['keyword']
-                    reply = keyword_data['reply']
-                    keyword_item_id = keyword_data['item_id']
-                    keyword_type = keyword_data.get('type', 'text')
-                    image_url = keyword_data.get('image_url')
-
-                    if keyword_item_id == item_id and keyword.lower() in send_message.lower():
-                        logger.info(f"商品ID关键词匹配成功: 商品{item_id} '{keyword}' (类型: {keyword_type})")
-
-                        # 根据关键词类型处理
-                        if keyword_type == 'image' and image_url:
-                            # 图片类型关键词，发送图片
-                            return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                        else:
-                            # 文本类型关键词，检查回复内容是否为空
-                            if not reply or (reply and reply.strip() == ''):
-                                logger.info(f"商品ID关键词 '{keyword}' 回复内容为空，不进行回复")
-                                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+            # 商品ID关键词优先，其次是没有商品ID的通用关键词
+            keyword_data = matcher.match(send_message, item_id)
+            if not keyword_data:
+                logger.debug(f"未找到匹配的关键词: {send_message}")
+                return None
 
-                            # 进行变量替换
-                            try:
-                                formatted_reply = reply.format(
-                                    send_user_name=send_user_name,
-                                    send_user_id=send_user_id,
-                                    send_message=send_message
-                                )
-                                logger.info(f"商品ID文本关键词回复: {formatted_reply}")
-                                return formatted_reply
-                            except Exception as format_error:
-                                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                                # 如果变量替换失败，返回原始内容
-                                return reply
-
-            # 2. 如果商品ID匹配失败或没有商品ID，匹配没有商品ID的通用关键词
-            for keyword_data in keywords:
-                keyword = keyword_data['keyword']
-                reply = keyword_data['reply']
-                keyword_item_id = keyword_data['item_id']
-                keyword_type = keyword_data.get('type', 'text')
-                image_url = keyword_data.get('image_url')
-
-                if not keyword_item_id and keyword.lower() in send_message.lower():
-                    logger.info(f"通用关键词匹配成功: '{keyword}' (类型: {keyword_type})")
-
-                    # 根据关键词类型处理
-                    if keyword_type == 'image' and image_url:
-                        # 图片类型关键词，发送图片
-                        return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                    else:
-                        # 文本类型关键词，检查回复内容是否为空
-                        if not reply or (reply and reply.strip() == ''):
-                            logger.info(f"通用关键词 '{keyword}' 回复内容为空，不进行回复")
-                            return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+            keyword = keyword_data['keyword']
+            reply = keyword_data['reply']
+            keyword_type = keyword_data.get('type', 'text')
+            image_url = keyword_data.get('image_url')
+            match_desc = "商品ID" if keyword_data['item_id'] else "通用"
 
-                        # 进行变量替换
-                        try:
-                            formatted_reply = reply.format(
-                                send_user_name=send_user_name,
-                                send_user_id=send_user_id,
-                                send_message=send_message
-                            )
-                            logger.info(f"通用文本关键词回复: {formatted_reply}")
-                            return formatted_reply
-                        except Exception as format_error:
-                            logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                            # 如果变量替换失败，返回原始内容
-                            return reply
-
-            logger.debug(f"未找到匹配的关键词: {send_message}")
-            return None
+            if keyword_data['item_id']:
+                logger.info(f"商品ID关键词匹配成功: 商品{item_id} '{keyword}' (类型: {keyword_type})")
+            else:
+                logger.info(f"通用关键词匹配成功: '{keyword}' (类型: {keyword_type})")
+
+            # 根据关键词类型处理
+            if keyword_type == 'image' and image_url:
+                # 图片类型关键词，发送图片
+                return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
+
+            # 文本类型关键词，检查回复内容是否为空
+            if not reply or (reply and reply.strip() == ''):
+                logger.info(f"{match_desc}关键词 '{keyword}' 回复内容为空，不进行回复")
+                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+
+            # 进行变量替换
+            try:
+                formatted_reply = reply.format(
+                    send_user_name=send_user_name,
+                    send_user_id=send_user_id,
+                    send_message=send_message
+                )
+                logger.info(f"{match_desc}文本关键词回复: {formatted_reply}")
+                return formatted_reply
+            except Exception as format_error:
+                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
+                # 如果变量替换失败，返回原始内容
+                return reply
 
         except Exception as e:
             logger.error(f"获取关键词回复失败: {self._safe_str(e)}")
@@ -2731,6 +2476,8 @@ class XianyuLive:
             from db_manager import db_manager
             success = db_manager.update_keyword_image_url(self.cookie_id, keyword, new_image_url)
             if success:
+                from utils.keyword_matcher import keyword_matcher_cache
+                keyword_matcher_cache.invalidate(self.cookie_id)
                 logger.info(f"图片URL已更新: {keyword} -> {new_image_url}")
             else:
                 logger.warning(f"图片URL更新失败: {keyword}")
@@ -2743,6 +2490,9 @@ class XianyuLive:
             from db_manager import db_manager
             success = db_manager.update_card_image_url(card_id, new_image_url)
             if success:
+                # 发货规则索引包含卡券数据，其他分片中的索引也要失效
+                from utils import cache_invalidation
+                cache_invalidation.invalidate('delivery_rules')
                 logger.info(f"卡券图片URL已更新: 卡券ID={card_id} -> {new_image_url}")
             else:
                 logger.warning(f"卡券图片URL更新失败: 卡券ID={card_id}")
@@ -2755,13 +2505,12 @@ class XianyuLive:
             from ai_reply_engine import ai_reply_engine
 
             # 检查是否启用AI回复
-            if not ai_reply_engine.is_ai_enabled(self.cookie_id):
+            if not await ai_reply_engine.is_ai_enabled_async(self.cookie_id):
                 logger.debug(f"账号 {self.cookie_id} 未启用AI回复")
                 return None
 
             # 从数据库获取商品信息
-            from db_manager import db_manager
-            item_info_raw = db_manager.get_item_info(self.cookie_id, item_id)
+            item_info_raw = await async_db_manager.get_item_info(self.cookie_id, item_id)
 
             if not item_info_raw:
                 logger.debug(f"数据库中无商品信息: {item_id}")
@@ -2780,7 +2529,7 @@ class XianyuLive:
                 }
 
             # 生成AI回复
-            reply = ai_reply_engine.generate_reply(
+            reply = await ai_reply_engine.generate_reply_async(
                 message=send_message,
                 item_info=item_info,
                 chat_id=chat_id,
@@ -2814,7 +2563,6 @@ class XianyuLive:
     async def send_notification(self, send_user_name: str, send_user_id: str, send_message: str, item_id: str = None, chat_id: str = None, scheme: str = None, other: dict = None):
         """发送消息通知"""
         try:
-            from db_manager import db_manager
             import aiohttp
 
             # 过滤系统默认消息，不发送通知
@@ -2824,533 +2572,83 @@ class XianyuLive:
                 '设置不砍价回复'
             ]
 
-            if send_message in system_messages:
-                logger.debug(f"📱 系统消息不发送通知: {send_message}")
-                return
-
-            logger.info(f"📱 开始发送消息通知 - 账号: {self.cookie_id}, 买家: {send_user_name}")
-
-            # 获取当前账号的通知配置
-            notifications = db_manager.get_account_notifications(self.cookie_id)
-
-            if not notifications:
-                logger.warning(f"📱 账号 {self.cookie_id} 未配置消息通知，跳过通知发送")
-                return
-
-            logger.info(f"📱 找到 {len(notifications)} 个通知渠道配置")
-
-            # 构建通知消息
-            notification_msg = f"🚨 接收消息通知\n\n" \
-                             f"账号: {self.cookie_id}\n" \
-                             f"买家: {send_user_name} (ID: {send_user_id})\n" \
-                             f"商品ID: {item_id or '未知'}\n" \
-                             f"聊天ID: {chat_id or '未知'}\n" \
-                             f"消息内容: {send_message}\n" \
-                             f"时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-            
-            notification_msg_json = {
-                "account": self.cookie_id,
-                "buyer": {
-                    "name": send_user_name,
-                    "id": send_user_id
-                },
-                "item_id": item_id,
-                "chat_id": chat_id,
-                "message": send_message,
-                "time": time.strftime('%Y-%m-%d %H:%M:%S'),
-                "scheme": scheme or "fleamarket://"
-            }
-
-            # 如果有other参数，尝试提取图片URL和金额信息
-            first_image_url = None
-            transfer_amount = None
-            if other and isinstance(other, dict):
-                # 提取图片URL
-                first_image_url = other.get('first_image_url')
-
-                # 提取金额信息
-                transfer_amount = other.get('transfer_amount')
-
-            if first_image_url:
-                notification_msg_json["image"] = first_image_url
-
-            if transfer_amount:
-                notification_msg_json["money"] = transfer_amount
-
-            # 发送通知到各个渠道
-            await self.send_notifications(notifications, notification_msg, notification_msg_json)
-
-        except Exception as e:
-            logger.error(f"📱 处理消息通知失败: {self._safe_str(e)}")
-            import traceback
-            logger.error(f"📱 详细错误信息: {traceback.format_exc()}")
-
-    async def send_notifications(self, notifications, notification_msg, notification_msg_json):
-        """发送通知到各个渠道
-        
-        Args:
-            notifications: 要发送的通知渠道列表
-            notification_msg: 普通文本格式的通知内容
-            notification_msg_json: JSON格式的通知内容(用于部分通知渠道)
-        
-        Returns:
-            int: 成功发送的通知数量
-        """
-        success_count = 0
-        
-        for i, notification in enumerate(notifications, 1):
-            logger.info(f"📱 处理第 {i} 个通知渠道: {notification.get('channel_name', 'Unknown')}")
-
-            if not notification.get('enabled', True):
-                logger.warning(f"📱 通知渠道 {notification.get('channel_name')} 已禁用，跳过")
-                continue
-
-            channel_type = notification.get('channel_type')
-            channel_config = notification.get('channel_config')
-
-            logger.info(f"📱 渠道类型: {channel_type}, 配置: {channel_config}")
-
-            try:
-                # 解析配置数据
-                config_data = self._parse_notification_config(channel_config)
-                logger.info(f"📱 解析后的配置数据: {config_data}")
-
-                match channel_type:
-                    case 'qq':
-                        logger.info(f"📱 开始发送QQ通知...")
-                        await self._send_qq_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'ding_talk' | 'dingtalk':
-                        logger.info(f"📱 开始发送钉钉通知...")
-                        await self._send_dingtalk_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'feishu' | 'lark':
-                        logger.info(f"📱 开始发送飞书通知...")
-                        await self._send_feishu_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'email':
-                        logger.info(f"📱 开始发送邮件通知...")
-                        await self._send_email_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'webhook':
-                        logger.info(f"📱 开始发送Webhook通知...")
-                        await self._send_webhook_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'wechat':
-                        logger.info(f"📱 开始发送微信通知...")
-                        await self._send_wechat_notification(config_data, notification_msg)
-                        success_count += 1
-                    case 'bark':
-                        logger.info(f"📱 开始发送Bark通知...")
-                        await self._send_bark_notification(config_data, notification_msg_json)
-                        success_count += 1
-                    case 'telegram':
-                        logger.info(f"📱 开始发送Telegram通知...")
-                        await self._send_telegram_notification(config_data, notification_msg)
-                        success_count += 1
-                    case _:
-                        logger.warning(f"📱 不支持的通知渠道类型: {channel_type}")
-
-            except Exception as notify_error:
-                logger.error(f"📱 发送通知失败 ({notification.get('channel_name', 'Unknown')}): {self._safe_str(notify_error)}")
-                import traceback
-                logger.error(f"📱 详细错误信息: {traceback.format_exc()}")
-        
-        return success_count
-
-    def _parse_notification_config(self, config: str) -> dict:
-        """解析通知配置数据"""
-        try:
-            import json
-            # 尝试解析JSON格式的配置
-            return json.loads(config)
-        except (json.JSONDecodeError, TypeError):
-            # 兼容旧格式（直接字符串）
-            return {"config": config}
-
-    async def _send_qq_notification(self, config_data: dict, message: str):
-        """发送QQ通知"""
-        try:
-            import aiohttp
-
-            logger.info(f"📱 QQ通知 - 开始处理配置数据: {config_data}")
-
-            # 解析配置（QQ号码）
-            qq_number = config_data.get('qq_number') or config_data.get('config', '')
-            qq_number = qq_number.strip() if qq_number else ''
-
-            logger.info(f"📱 QQ通知 - 解析到QQ号码: {qq_number}")
-
-            if not qq_number:
-                logger.warning("📱 QQ通知 - QQ号码配置为空，无法发送通知")
-                return
-
-            # 构建请求URL
-            api_url = "http://notice.zhinianblog.cn/sendPrivateMsg"
-            params = {
-                'qq': qq_number,
-                'msg': message
-            }
-
-            logger.info(f"📱 QQ通知 - 请求URL: {api_url}")
-            logger.info(f"📱 QQ通知 - 请求参数: qq={qq_number}, msg长度={len(message)}")
-
-            # 发送GET请求
-            async with aiohttp.ClientSession() as session:
-                async with session.get(api_url, params=params, timeout=10) as response:
-                    response_text = await response.text()
-                    logger.info(f"📱 QQ通知 - 响应状态: {response.status}")
-
-                    # 需求：502 视为成功，且不打印返回内容
-                    if response.status == 502:
-                        logger.info(f"📱 QQ通知发送成功: {qq_number} (状态码: {response.status})")
-                    elif response.status == 200:
-                        logger.info(f"📱 QQ通知发送成功: {qq_number} (状态码: {response.status})")
-                        logger.debug(f"📱 QQ通知 - 响应内容: {response_text}")
-                    else:
-                        logger.warning(f"📱 QQ通知发送失败: HTTP {response.status}")
-                        logger.debug(f"📱 QQ通知 - 响应内容: {response_text}")
-
-        except Exception as e:
-            logger.error(f"📱 发送QQ通知异常: {self._safe_str(e)}")
-            import traceback
-            logger.error(f"📱 QQ通知异常详情: {traceback.format_exc()}")
-
-    async def _send_dingtalk_notification(self, config_data: dict, message: str):
-        """发送钉钉通知"""
-        try:
-            import aiohttp
-            import json
-            import hmac
-            import hashlib
-            import base64
-            import time
-
-            # 解析配置
-            webhook_url = config_data.get('webhook_url') or config_data.get('config', '')
-            secret = config_data.get('secret', '')
-
-            webhook_url = webhook_url.strip() if webhook_url else ''
-            if not webhook_url:
-                logger.warning("钉钉通知配置为空")
-                return
-
-            # 如果有加签密钥，生成签名
-            if secret:
-                timestamp = str(round(time.time() * 1000))
-                secret_enc = secret.encode('utf-8')
-                string_to_sign = f'{timestamp}\n{secret}'
-                string_to_sign_enc = string_to_sign.encode('utf-8')
-                hmac_code = hmac.new(secret_enc, string_to_sign_enc, digestmod=hashlib.sha256).digest()
-                sign = base64.b64encode(hmac_code).decode('utf-8')
-                webhook_url += f'&timestamp={timestamp}&sign={sign}'
-
-            data = {
-                "msgtype": "markdown",
-                "markdown": {
-                    "title": "闲鱼自动回复通知",
-                    "text": message
-                }
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info(f"钉钉通知发送成功")
-                    else:
-                        logger.warning(f"钉钉通知发送失败: {response.status}")
-
-        except Exception as e:
-            logger.error(f"发送钉钉通知异常: {self._safe_str(e)}")
-
-    async def _send_feishu_notification(self, config_data: dict, message: str):
-        """发送飞书通知"""
-        try:
-            import aiohttp
-            import json
-            import hmac
-            import hashlib
-            import base64
-
-            logger.info(f"📱 飞书通知 - 开始处理配置数据: {config_data}")
-
-            # 解析配置
-            webhook_url = config_data.get('webhook_url', '')
-            secret = config_data.get('secret', '')
-
-            logger.info(f"📱 飞书通知 - Webhook URL: {webhook_url[:50]}...")
-            logger.info(f"📱 飞书通知 - 是否有签名密钥: {'是' if secret else '否'}")
-
-            if not webhook_url:
-                logger.warning("📱 飞书通知 - Webhook URL配置为空，无法发送通知")
-                return
-
-            # 如果有加签密钥，生成签名
-            timestamp = str(int(time.time()))
-            sign = ""
-
-            if secret:
-                string_to_sign = f'{timestamp}\n{secret}'
-                hmac_code = hmac.new(
-                    secret.encode('utf-8'),
-                    string_to_sign.encode('utf-8'),
-                    digestmod=hashlib.sha256
-                ).digest()
-                sign = base64.b64encode(hmac_code).decode('utf-8')
-                logger.info(f"📱 飞书通知 - 已生成签名")
-
-            # 构建请求数据
-            data = {
-                "msg_type": "text",
-                "content": {
-                    "text": message
-                },
-                "timestamp": timestamp
-            }
-
-            # 如果有签名，添加到请求数据中
-            if sign:
-                data["sign"] = sign
-
-            logger.info(f"📱 飞书通知 - 请求数据构建完成")
-
-            # 发送POST请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data, timeout=10) as response:
-                    response_text = await response.text()
-                    logger.info(f"📱 飞书通知 - 响应状态: {response.status}")
-                    logger.info(f"📱 飞书通知 - 响应内容: {response_text}")
-
-                    if response.status == 200:
-                        try:
-                            response_json = json.loads(response_text)
-                            if response_json.get('code') == 0:
-                                logger.info(f"📱 飞书通知发送成功")
-                            else:
-                                logger.warning(f"📱 飞书通知发送失败: {response_json.get('msg', '未知错误')}")
-                        except json.JSONDecodeError:
-                            logger.info(f"📱 飞书通知发送成功（响应格式异常）")
-                    else:
-                        logger.warning(f"📱 飞书通知发送失败: HTTP {response.status}, 响应: {response_text}")
-
-        except Exception as e:
-            logger.error(f"📱 发送飞书通知异常: {self._safe_str(e)}")
-            import traceback
-            logger.error(f"📱 飞书通知异常详情: {traceback.format_exc()}")
-
-    async def _send_email_notification(self, config_data: dict, message: str):
-        """发送邮件通知"""
-        try:
-            import smtplib
-            from email.mime.text import MIMEText
-            from email.mime.multipart import MIMEMultipart
-
-            # 解析配置
-            smtp_server = config_data.get('smtp_server', '')
-            smtp_port = int(config_data.get('smtp_port', 587))
-            email_user = config_data.get('email_user', '')
-            email_password = config_data.get('email_password', '')
-            recipient_email = config_data.get('recipient_email', '')
-
-            if not all([smtp_server, email_user, email_password, recipient_email]):
-                logger.warning("邮件通知配置不完整")
-                return
-
-            # 创建邮件
-            msg = MIMEMultipart()
-            msg['From'] = email_user
-            msg['To'] = recipient_email
-            msg['Subject'] = "闲鱼自动回复通知"
-
-            # 添加邮件正文
-            msg.attach(MIMEText(message, 'plain', 'utf-8'))
-
-            # 发送邮件
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(email_user, email_password)
-            server.send_message(msg)
-            server.quit()
-
-            logger.info(f"邮件通知发送成功: {recipient_email}")
-
-        except Exception as e:
-            logger.error(f"发送邮件通知异常: {self._safe_str(e)}")
-
-    async def _send_webhook_notification(self, config_data: dict, message: str):
-        """发送Webhook通知"""
-        try:
-            import aiohttp
-            import json
-
-            # 解析配置
-            webhook_url = config_data.get('webhook_url', '')
-            http_method = config_data.get('http_method', 'POST').upper()
-            headers_str = config_data.get('headers', '{}')
-
-            if not webhook_url:
-                logger.warning("Webhook通知配置为空")
-                return
-
-            # 解析自定义请求头
-            try:
-                custom_headers = json.loads(headers_str) if headers_str else {}
-            except json.JSONDecodeError:
-                custom_headers = {}
-
-            # 设置默认请求头
-            headers = {'Content-Type': 'application/json'}
-            headers.update(custom_headers)
-
-            # 构建请求数据
-            data = {
-                'message': message,
-                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-                'source': 'xianyu-auto-reply'
-            }
-
-            async with aiohttp.ClientSession() as session:
-                if http_method == 'POST':
-                    async with session.post(webhook_url, json=data, headers=headers, timeout=10) as response:
-                        if response.status == 200:
-                            logger.info(f"Webhook通知发送成功")
-                        else:
-                            logger.warning(f"Webhook通知发送失败: {response.status}")
-                elif http_method == 'PUT':
-                    async with session.put(webhook_url, json=data, headers=headers, timeout=10) as response:
-                        if response.status == 200:
-                            logger.info(f"Webhook通知发送成功")
-                        else:
-                            logger.warning(f"Webhook通知发送失败: {response.status}")
-                else:
-                    logger.warning(f"不支持的HTTP方法: {http_method}")
-
-        except Exception as e:
-            logger.error(f"发送Webhook通知异常: {self._safe_str(e)}")
-
-    async def _send_wechat_notification(self, config_data: dict, message: str):
-        """发送微信通知"""
-        try:
-            import aiohttp
-            import json
-
-            # 解析配置
-            webhook_url = config_data.get('webhook_url', '')
-
-            if not webhook_url:
-                logger.warning("微信通知配置为空")
+            if send_message in system_messages:
+                logger.debug(f"📱 系统消息不发送通知: {send_message}")
                 return
 
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info(f"微信通知发送成功")
-                    else:
-                        logger.warning(f"微信通知发送失败: {response.status}")
-
-        except Exception as e:
-            logger.error(f"发送微信通知异常: {self._safe_str(e)}")
-
-    async def _send_bark_notification(self, config_data: dict, message_json: dict):
-        """发送Bark通知"""
-        try:
-            import aiohttp
-            import json
+            logger.info(f"📱 开始发送消息通知 - 账号: {self.cookie_id}, 买家: {send_user_name}")
 
-            # 解析配置
-            webhook_url = config_data.get('webhook_url', '')
+            # 获取当前账号的通知配置
+            notifications = await async_db_manager.get_account_notifications(self.cookie_id)
 
-            if not webhook_url:
-                logger.warning("Bark通知配置为空")
+            if not notifications:
+                logger.warning(f"📱 账号 {self.cookie_id} 未配置消息通知，跳过通知发送")
                 return
 
-            account = message_json.get('account', '')
-            buyer = message_json.get('buyer', {})
-            buyer_name = buyer.get('name', '')
-            buyer_id = buyer.get('id', '')
-            item_id = message_json.get('item_id', '')
-            message = message_json.get('message', '')
-            result = message_json.get('result', '')
-            error = message_json.get('error', '')
-            time = message_json.get('time', '')
-            scheme = message_json.get('scheme', '')
-            image = message_json.get('image', '')
-            money = message_json.get('money', '')
-
-            # 检查是否是空消息或系统消息
-            if ((error == '' and message == '') or
-                    message == '发来一条新消息'):
-                return {'status': 'empty', 'message': '空消息'}
-            
-            if re.search(r'快给ta一个评价吧', buyer_name):
-                return {'status': 'system', 'message': '系统消息'}
+            logger.info(f"📱 找到 {len(notifications)} 个通知渠道配置")
+
+            # 构建通知消息
+            notification_msg = f"🚨 接收消息通知\n\n" \
+                             f"账号: {self.cookie_id}\n" \
+                             f"买家: {send_user_name} (ID: {send_user_id})\n" \
+                             f"商品ID: {item_id or '未知'}\n" \
+                             f"聊天ID: {chat_id or '未知'}\n" \
+                             f"消息内容: {send_message}\n" \
+                             f"时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
             
-            # 构造 bark API 所需的格式
-            data = {
-                'body': f"💬{buyer_name or '程序消息'}：{message or result or error} {money}\n📆时间：{time}",
-                'title': f"闲鱼推送 账号：{account}",
-                'badge': 1,
-                'sound': 'shake',
-                'group': '闲鱼',
-                'icon': 'https://img.alicdn.com/tfs/TB19WObTNv1gK0jSZFFXXb0sXXa-144-144.png',
-                'url': scheme,
+            notification_msg_json = {
+                "account": self.cookie_id,
+                "buyer": {
+                    "name": send_user_name,
+                    "id": send_user_id
+                },
+                "item_id": item_id,
+                "chat_id": chat_id,
+                "message": send_message,
+                "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+                "scheme": scheme or "fleamarket://"
             }
 
-            if image:
-                data['image'] = image
-
-            if error and re.search(r'Token刷新失败', error):
-                data['level'] = 'critical'
-                data['volume'] = 5
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(webhook_url, json=data, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info(f"Bark通知发送成功")
-                    else:
-                        logger.warning(f"Bark通知发送失败: {response.status}")
+            # 如果有other参数，尝试提取图片URL和金额信息
+            first_image_url = None
+            transfer_amount = None
+            if other and isinstance(other, dict):
+                # 提取图片URL
+                first_image_url = other.get('first_image_url')
 
-        except Exception as e:
-            logger.error(f"发送Bark通知异常: {self._safe_str(e)}")
+                # 提取金额信息
+                transfer_amount = other.get('transfer_amount')
 
-    async def _send_telegram_notification(self, config_data: dict, message: str):
-        """发送Telegram通知"""
-        try:
-            import aiohttp
+            if first_image_url:
+                notification_msg_json["image"] = first_image_url
 
-            # 解析配置
-            bot_token = config_data.get('bot_token', '')
-            chat_id = config_data.get('chat_id', '')
+            if transfer_amount:
+                notification_msg_json["money"] = transfer_amount
 
-            if not all([bot_token, chat_id]):
-                logger.warning("Telegram通知配置不完整")
-                return
+            # 发送通知到各个渠道（同一会话短时间内的消息合并为一条）
+            await self.send_notifications(notifications, notification_msg, notification_msg_json,
+                                          coalesce_key=f"{self.cookie_id}:{chat_id}" if chat_id else None)
 
-            # 构建API URL
-            api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        except Exception as e:
+            logger.error(f"📱 处理消息通知失败: {self._safe_str(e)}")
+            import traceback
+            logger.error(f"📱 详细错误信息: {traceback.format_exc()}")
 
-            data = {
-                'chat_id': chat_id,
-                'text': message,
-                'parse_mode': 'HTML'
-            }
+    async def send_notifications(self, notifications, notification_msg, notification_msg_json, coalesce_key: str = None):
+        """把通知交给通知分发器，各渠道在后台并发发送，失败的进入重试队列
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(api_url, json=data, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info(f"Telegram通知发送成功")
-                    else:
-                        logger.warning(f"Telegram通知发送失败: {response.status}")
+        Args:
+            notifications: 要发送的通知渠道列表
+            notification_msg: 普通文本格式的通知内容
+            notification_msg_json: JSON格式的通知内容(用于部分通知渠道)
+            coalesce_key: 合并键，相同合并键的通知在短时间内合并为一条
 
-        except Exception as e:
-            logger.error(f"发送Telegram通知异常: {self._safe_str(e)}")
+        Returns:
+            int: 提交发送的通知渠道数量
+        """
+        logger.info(f"📱 提交 {len(notifications)} 个通知渠道到通知分发器")
+        return notification_dispatcher.dispatch(self.cookie_id, notifications, notification_msg,
+                                                notification_msg_json, coalesce_key=coalesce_key)
 
     async def send_token_refresh_notification(self, error_message: str, notification_type: str = "token_refresh", chat_id: str = None):
         """发送Token刷新异常通知（带防重复机制）"""
@@ -3389,10 +2687,9 @@ class XianyuLive:
                 logger.debug(f"Token刷新通知在冷却期内，跳过发送: {notification_type} (还需等待 {time_desc})")
                 return
 
-            from db_manager import db_manager
 
             # 获取当前账号的通知配置
-            notifications = db_manager.get_account_notifications(self.cookie_id)
+            notifications = await async_db_manager.get_account_notifications(self.cookie_id)
 
             if not notifications:
                 logger.debug("未配置消息通知，跳过Token刷新通知")
@@ -3417,12 +2714,12 @@ class XianyuLive:
 
             logger.info(f"准备发送Token刷新异常通知: {self.cookie_id}")
 
-            # 发送通知到各个渠道
+            # 发送通知到各个渠道（失败的由通知分发器重试）
             notification_sent = False
             notification_success_count = await self.send_notifications(notifications, notification_msg, notification_msg_json)
             notification_sent = notification_success_count > 0
 
-            # 如果成功发送了通知，更新最后发送时间
+            # 如果已提交发送，更新最后发送时间
             if notification_sent:
                 self.last_notification_time[notification_type] = current_time
 
@@ -3515,10 +2812,8 @@ class XianyuLive:
     async def send_delivery_failure_notification(self, send_user_name: str, send_user_id: str, item_id: str, error_message: str, chat_id: str = None):
         """发送自动发货失败通知"""
         try:
-            from db_manager import db_manager
-
             # 获取当前账号的通知配置
-            notifications = db_manager.get_account_notifications(self.cookie_id)
+            notifications = await async_db_manager.get_account_notifications(self.cookie_id)
 
             if not notifications:
                 logger.debug("未配置消息通知，跳过自动发货通知")
@@ -3555,8 +2850,6 @@ class XianyuLive:
     async def _send_order_error_notification(self, order_id: str, error_message: str, error_type: str):
         """发送订单信息获取错误通知"""
         try:
-            from db_manager import db_manager
-
             # 防重复通知：同一订单同一错误类型5分钟内不重复发送
             notification_key = f"{order_id}_{error_type}"
             current_time = time.time()
@@ -3568,7 +2861,7 @@ class XianyuLive:
                     return
 
             # 获取当前账号的通知配置
-            notifications = db_manager.get_account_notifications(self.cookie_id)
+            notifications = await async_db_manager.get_account_notifications(self.cookie_id)
 
             if not notifications:
                 logger.debug("未配置消息通知，跳过订单错误通知")
@@ -3620,29 +2913,11 @@ class XianyuLive:
             # 导入解密后的确认发货模块
             from secure_confirm_decrypted import SecureConfirm
 
-            # 创建确认实例，传入主界面类实例
-            secure_confirm = SecureConfirm(self.session, self.cookies_str, self.cookie_id, self)
-
-            # 传递必要的属性
-            secure_confirm.current_token = self.current_token
-            secure_confirm.last_token_refresh_time = self.last_token_refresh_time
-            secure_confirm.token_refresh_interval = self.token_refresh_interval
+            # 创建确认实例，共享当前账号的mtop客户端（Cookie更新会直接反映到当前实例）
+            secure_confirm = SecureConfirm(self.mtop, self.cookie_id, self)
 
             # 调用确认方法，传入item_id用于token刷新
-            result = await secure_confirm.auto_confirm(order_id, item_id, retry_count)
-
-            # 同步更新后的cookies和token
-            if secure_confirm.cookies_str != self.cookies_str:
-                self.cookies_str = secure_confirm.cookies_str
-                self.cookies = secure_confirm.cookies
-                logger.debug(f"【{self.cookie_id}】已同步确认发货模块更新的cookies")
-
-            if secure_confirm.current_token != self.current_token:
-                self.current_token = secure_confirm.current_token
-                self.last_token_refresh_time = secure_confirm.last_token_refresh_time
-                logger.debug(f"【{self.cookie_id}】已同步确认发货模块更新的token")
-
-            return result
+            return await secure_confirm.auto_confirm(order_id, item_id, retry_count)
 
         except Exception as e:
             logger.error(f"【{self.cookie_id}】加密确认模块调用失败: {self._safe_str(e)}")
@@ -3656,13 +2931,8 @@ class XianyuLive:
             # 导入解密后的免拼发货模块
             from secure_freeshipping_decrypted import SecureFreeshipping
 
-            # 创建免拼发货实例
-            secure_freeshipping = SecureFreeshipping(self.session, self.cookies_str, self.cookie_id)
-
-            # 传递必要的属性
-            secure_freeshipping.current_token = self.current_token
-            secure_freeshipping.last_token_refresh_time = self.last_token_refresh_time
-            secure_freeshipping.token_refresh_interval = self.token_refresh_interval
+            # 创建免拼发货实例，共享当前账号的mtop客户端
+            secure_freeshipping = SecureFreeshipping(self.mtop, self.cookie_id)
 
             # 调用免拼发货方法
             return await secure_freeshipping.auto_freeshipping(order_id, item_id, buyer_id, retry_count)
@@ -3673,6 +2943,10 @@ class XianyuLive:
 
     async def fetch_order_detail_info(self, order_id: str, item_id: str = None, buyer_id: str = None, debug_headless: bool = None, use_cache: bool = True):
         """获取订单详情信息（使用独立的锁机制，不受延迟锁影响）
+
+        同一订单的并发请求（如红色提醒、系统卡片、付款消息同时到达）只获取一次，共享结果。
+        合并键包含 item_id 和 buyer_id，带这些参数的调用不会加入未带参数的请求而丢失字段。
+        获取失败时所有合并的调用方收到同一个异常实例。
         
         Args:
             order_id: 订单ID
@@ -3681,6 +2955,14 @@ class XianyuLive:
             debug_headless: 无头模式调试（已废弃）
             use_cache: 是否使用缓存，False时强制重新获取（默认True）
         """
+        kind = 'order_detail' if use_cache else 'order_detail_fresh'
+        return await single_flight.do(
+            kind, f"{self.cookie_id}:{order_id}:{item_id or ''}:{buyer_id or ''}",
+            lambda: self._fetch_order_detail_info(order_id, item_id, buyer_id, debug_headless, use_cache)
+        )
+
+    async def _fetch_order_detail_info(self, order_id: str, item_id: str = None, buyer_id: str = None, debug_headless: bool = None, use_cache: bool = True):
+        """获取订单详情并保存到数据库（由 fetch_order_detail_info 合并并发调用）"""
         # 使用独立的订单详情锁，不与自动发货锁冲突
         order_detail_lock = self._order_detail_locks[order_id]
 
@@ -3694,13 +2976,9 @@ class XianyuLive:
                 logger.info(f"【{self.cookie_id}】开始获取订单详情: {order_id}")
 
                 # 导入订单详情获取器
-                from utils.order_detail_fetcher import fetch_order_detail_api_sync
+                from utils.order_detail_fetcher import fetch_order_detail_api
                 from db_manager import db_manager
 
-                # 获取当前账号的cookie字符串
-                cookie_string = self.cookies_str
-                logger.debug(f"【{self.cookie_id}】使用Cookie长度: {len(cookie_string) if cookie_string else 0}")
-
                 # API版本不需要headless参数，直接调用
                 logger.info(f"【{self.cookie_id}】使用API方式获取订单详情")
                 # 确定是否使用有头模式（调试用）
@@ -3708,8 +2986,8 @@ class XianyuLive:
                 if not headless_mode:
                     logger.info(f"【{self.cookie_id}】🖥️ 启用有头模式进行调试")
 
-                # 获取订单详情（使用当前账号的cookie，传递缓存控制参数）
-                result = fetch_order_detail_api_sync(order_id, cookie_string, use_cache=use_cache)
+                # 获取订单详情（使用当前账号的cookie和连接池，传递缓存控制参数）
+                result = await fetch_order_detail_api(order_id, use_cache=use_cache, mtop_client=self.mtop)
 
                 if result:
                     logger.info(f"【{self.cookie_id}】订单详情获取成功: {order_id}")
@@ -3850,7 +3128,7 @@ class XianyuLive:
 
                     # API失败时，从数据库获取商品信息
                     try:
-                        db_item_info = db_manager.get_item_info(self.cookie_id, item_id)
+                        db_item_info = await async_db_manager.get_item_info(self.cookie_id, item_id)
                         if db_item_info:
                             # 拼接商品标题和详情作为搜索文本
                             item_title_db = db_item_info.get('item_title', '') or ''
@@ -3935,10 +3213,14 @@ class XianyuLive:
             # 智能匹配发货规则：优先精确匹配，然后兜底匹配
             delivery_rules = []
 
+            # 发货规则索引常驻内存，仅在未构建或失效后到数据库线程中加载
+            from utils.delivery_rule_index import delivery_rule_index
+            rule_index = delivery_rule_index.get_cached() or await async_db_manager.run(delivery_rule_index.get)
+
             # 第一步：如果有规格信息，尝试精确匹配多规格发货规则
             if spec_name and spec_value:
                 logger.info(f"尝试精确匹配多规格发货规则: {search_text[:50]}... [{spec_name}:{spec_value}]")
-                delivery_rules = db_manager.get_delivery_rules_by_keyword_and_spec(search_text, spec_name, spec_value)
+                delivery_rules = rule_index.match_by_keyword_and_spec(search_text, spec_name, spec_value)
 
                 if delivery_rules:
                     logger.info(f"✅ 找到精确匹配的多规格发货规则: {len(delivery_rules)}个")
@@ -3948,7 +3230,7 @@ class XianyuLive:
             # 第二步：如果精确匹配失败，尝试兜底匹配（普通发货规则）
             if not delivery_rules:
                 logger.info(f"尝试兜底匹配普通发货规则: {search_text[:50]}...")
-                delivery_rules = db_manager.get_delivery_rules_by_keyword(search_text)
+                delivery_rules = rule_index.match_by_keyword(search_text)
 
                 if delivery_rules:
                     logger.info(f"✅ 找到兜底匹配的普通发货规则: {len(delivery_rules)}个")
@@ -3967,7 +3249,7 @@ class XianyuLive:
             item_title_for_save = None
             try:
                 from db_manager import db_manager
-                db_item_info = db_manager.get_item_info(self.cookie_id, item_id)
+                db_item_info = await async_db_manager.get_item_info(self.cookie_id, item_id)
                 if db_item_info:
                     item_title_for_save = db_item_info.get('item_title', '').strip()
             except:
@@ -4081,7 +3363,7 @@ class XianyuLive:
 
                 elif rule['card_type'] == 'data':
                     # 批量数据类型：获取并消费第一条数据
-                    delivery_content = db_manager.consume_batch_data(rule['card_id'])
+                    delivery_content = await async_db_manager.consume_batch_data(rule['card_id'])
 
                 elif rule['card_type'] == 'image':
                     # 图片类型：返回图片发送标记，包含卡券ID
@@ -4098,7 +3380,8 @@ class XianyuLive:
                     final_content = self._process_delivery_content_with_description(delivery_content, rule.get('card_description', ''))
 
                     # 增加发货次数统计
-                    db_manager.increment_delivery_times(rule['id'])
+                    await async_db_manager.increment_delivery_times(rule['id'])
+                    delivery_rule_index.record_delivery(rule['id'])
                     logger.info(f"自动发货成功: 规则ID={rule['id']}, 内容长度={len(final_content)}")
                     return final_content
                 else:
@@ -4276,7 +3559,7 @@ class XianyuLive:
             if item_id:
                 try:
                     from db_manager import db_manager
-                    item_info = db_manager.get_item_info(self.cookie_id, item_id)
+                    item_info = await async_db_manager.get_item_info(self.cookie_id, item_id)
                     if item_info:
                         logger.debug(f"从数据库获取到商品信息: {item_id}")
                     else:
@@ -4359,45 +3642,47 @@ class XianyuLive:
         else:
             return obj
 
-    async def token_refresh_loop(self):
-        """Token刷新循环"""
-        while True:
-            try:
-                # 检查账号是否启用
-                from cookie_manager import manager as cookie_manager
-                if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
-                    logger.info(f"【{self.cookie_id}】账号已禁用，停止Token刷新循环")
-                    break
-
-                current_time = time.time()
-                if current_time - self.last_token_refresh_time >= self.token_refresh_interval:
-                    logger.info("Token即将过期，准备刷新...")
-                    new_token = await self.refresh_token()
-                    if new_token:
-                        logger.info(f"【{self.cookie_id}】Token刷新成功，准备重启实例...")
-                        # 注意：refresh_token方法中已经调用了_restart_instance()
-                        # 这里只需要关闭当前连接，让main循环重新开始
-                        self.connection_restart_flag = True
-                        await self._restart_instance()
-                        break
-                    else:
-                        # 根据上一次刷新状态决定日志级别（冷却/已重启为正常情况）
-                        if getattr(self, 'last_token_refresh_status', None) in ("skipped_cooldown", "restarted_after_cookie_refresh"):
-                            logger.info(f"【{self.cookie_id}】Token刷新未执行或已重启（正常），将在{self.token_retry_interval // 60}分钟后重试")
-                        else:
-                            logger.error(f"【{self.cookie_id}】Token刷新失败，将在{self.token_retry_interval // 60}分钟后重试")
+    async def _token_refresh_job(self):
+        """Token刷新（调度器任务），返回下次检查的延迟（秒）"""
+        try:
+            # 检查账号是否启用
+            from cookie_manager import manager as cookie_manager
+            if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
+                logger.info(f"【{self.cookie_id}】账号已禁用，停止Token刷新任务")
+                scheduler.remove(self.cookie_id, 'token_refresh', cancel=False)
+                return None
 
-                        # 清空当前token，确保下次重试时重新获取
-                        self.current_token = None
+            # 连接初始化或其他地方刷新过Token后，推迟到新的到期时间
+            remaining = self.last_token_refresh_time + self.token_refresh_interval - time.time()
+            if remaining > 0:
+                return remaining
+
+            logger.info("Token即将过期，准备刷新...")
+            new_token = await self.refresh_token()
+            if new_token:
+                logger.info(f"【{self.cookie_id}】Token刷新成功，准备重启实例...")
+                # 注意：refresh_token方法中已经调用了_restart_instance()
+                # 这里只需要关闭当前连接，让main循环重新开始
+                self.connection_restart_flag = True
+                scheduler.remove(self.cookie_id, 'token_refresh', cancel=False)
+                await self._restart_instance()
+                return None
 
-                        # 发送Token刷新失败通知
-                        await self.send_token_refresh_notification("Token定时刷新失败，将自动重试", "token_scheduled_refresh_failed")
-                        await asyncio.sleep(self.token_retry_interval)
-                        continue
-                await asyncio.sleep(60)
-            except Exception as e:
-                logger.error(f"Token刷新循环出错: {self._safe_str(e)}")
-                await asyncio.sleep(60)
+            # 根据上一次刷新状态决定日志级别（冷却/已重启为正常情况）
+            if getattr(self, 'last_token_refresh_status', None) in ("skipped_cooldown", "restarted_after_cookie_refresh"):
+                logger.info(f"【{self.cookie_id}】Token刷新未执行或已重启（正常），将在{self.token_retry_interval // 60}分钟后重试")
+            else:
+                logger.error(f"【{self.cookie_id}】Token刷新失败，将在{self.token_retry_interval // 60}分钟后重试")
+
+            # 清空当前token，确保下次重试时重新获取
+            self.current_token = None
+
+            # 发送Token刷新失败通知
+            await self.send_token_refresh_notification("Token定时刷新失败，将自动重试", "token_scheduled_refresh_failed")
+            return self.token_retry_interval
+        except Exception as e:
+            logger.error(f"Token刷新任务出错: {self._safe_str(e)}")
+            return 60
 
     async def create_chat(self, ws, toid, item_id='891198795482'):
         msg = {
@@ -4420,16 +3705,10 @@ class XianyuLive:
                 }
             ]
         }
-        await ws.send(json.dumps(msg))
+        await ws.send(frame_codec.dumps(msg))
 
     async def send_msg(self, ws, cid, toid, text):
-        text = {
-            "contentType": 1,
-            "text": {
-                "text": text
-            }
-        }
-        text_base64 = str(base64.b64encode(json.dumps(text).encode('utf-8')), 'utf-8')
+        text_base64 = frame_codec.encode_text_content(text)
         msg = {
             "lwp": "/r/MessageSend/sendByReceiverScope",
             "headers": {
@@ -4466,7 +3745,7 @@ class XianyuLive:
                 }
             ]
         }
-        await ws.send(json.dumps(msg))
+        await ws.send(frame_codec.dumps(msg))
 
     async def init(self, ws):
         # 如果没有token或者token过期，获取新token
@@ -4500,7 +3779,7 @@ class XianyuLive:
                 "mid": generate_mid()
             }
         }
-        await ws.send(json.dumps(msg))
+        await ws.send(frame_codec.dumps(msg))
         await asyncio.sleep(1)
         current_time = int(time.time() * 1000)
         msg = {
@@ -4519,54 +3798,47 @@ class XianyuLive:
                 }
             ]
         }
-        await ws.send(json.dumps(msg))
+        await ws.send(frame_codec.dumps(msg))
         logger.info(f'【{self.cookie_id}】连接注册完成')
 
     async def send_heartbeat(self, ws):
         """发送心跳包"""
-        msg = {
-            "lwp": "/!",
-            "headers": {
-                "mid": generate_mid()
-            }
-        }
-        await ws.send(json.dumps(msg))
+        await ws.send(frame_codec.encode_heartbeat())
         self.last_heartbeat_time = time.time()
         logger.debug(f"【{self.cookie_id}】心跳包已发送")
 
-    async def heartbeat_loop(self, ws):
-        """心跳循环"""
-        consecutive_failures = 0
+    async def _heartbeat_job(self, ws):
+        """发送一次心跳（调度器任务），失败后5秒重试，连续失败3次后停止"""
         max_failures = 3  # 连续失败3次后停止心跳
 
-        while True:
-            try:
-                # 检查账号是否启用
-                from cookie_manager import manager as cookie_manager
-                if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
-                    logger.info(f"【{self.cookie_id}】账号已禁用，停止心跳循环")
-                    break
-
-                # 检查WebSocket连接状态
-                if ws.closed:
-                    logger.warning(f"【{self.cookie_id}】WebSocket连接已关闭，停止心跳循环")
-                    break
-
-                await self.send_heartbeat(ws)
-                consecutive_failures = 0  # 重置失败计数
+        # 检查账号是否启用
+        from cookie_manager import manager as cookie_manager
+        if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
+            logger.info(f"【{self.cookie_id}】账号已禁用，停止心跳")
+            scheduler.remove(self.cookie_id, 'heartbeat', cancel=False)
+            return None
 
-                await asyncio.sleep(self.heartbeat_interval)
+        # 检查WebSocket连接状态
+        if ws.closed:
+            logger.warning(f"【{self.cookie_id}】WebSocket连接已关闭，停止心跳")
+            scheduler.remove(self.cookie_id, 'heartbeat', cancel=False)
+            return None
 
-            except Exception as e:
-                consecutive_failures += 1
-                logger.error(f"心跳发送失败 ({consecutive_failures}/{max_failures}): {self._safe_str(e)}")
+        try:
+            await self.send_heartbeat(ws)
+            self._heartbeat_failures = 0  # 重置失败计数
+            return None
+        except Exception as e:
+            self._heartbeat_failures += 1
+            logger.error(f"心跳发送失败 ({self._heartbeat_failures}/{max_failures}): {self._safe_str(e)}")
 
-                if consecutive_failures >= max_failures:
-                    logger.error(f"【{self.cookie_id}】心跳连续失败{max_failures}次，停止心跳循环")
-                    break
+            if self._heartbeat_failures >= max_failures:
+                logger.error(f"【{self.cookie_id}】心跳连续失败{max_failures}次，停止心跳")
+                scheduler.remove(self.cookie_id, 'heartbeat', cancel=False)
+                return None
 
-                # 失败后短暂等待再重试
-                await asyncio.sleep(5)
+            # 失败后短暂等待再重试
+            return 5
 
     async def handle_heartbeat_response(self, message_data):
         """处理心跳响应"""
@@ -4579,117 +3851,113 @@ class XianyuLive:
             logger.error(f"处理心跳响应出错: {self._safe_str(e)}")
         return False
 
-    async def pause_cleanup_loop(self):
-        """定期清理过期的暂停记录、锁和缓存"""
-        while True:
-            try:
-                # 检查账号是否启用
-                from cookie_manager import manager as cookie_manager
-                if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
-                    logger.info(f"【{self.cookie_id}】账号已禁用，停止清理循环")
-                    break
+    async def _cleanup_job(self):
+        """定期清理本账号过期的锁和实例缓存（调度器任务）"""
+        # 检查账号是否启用
+        from cookie_manager import manager as cookie_manager
+        if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
+            logger.info(f"【{self.cookie_id}】账号已禁用，停止清理任务")
+            scheduler.remove(self.cookie_id, 'cleanup', cancel=False)
+            return
 
-                # 清理过期的暂停记录
-                pause_manager.cleanup_expired_pauses()
+        # 清理过期的锁（每5分钟清理一次，保留24小时内的锁）
+        self.cleanup_expired_locks(max_age_hours=24)
 
-                # 清理过期的锁（每5分钟清理一次，保留24小时内的锁）
-                self.cleanup_expired_locks(max_age_hours=24)
+        # 清理过期的通知、发货和订单确认记录（防止内存泄漏）
+        self._cleanup_instance_caches()
 
-                # 清理过期的商品详情缓存
-                cleaned_count = await self._cleanup_item_cache()
-                if cleaned_count > 0:
-                    logger.info(f"【{self.cookie_id}】清理了 {cleaned_count} 个过期的商品详情缓存")
+    @classmethod
+    async def _global_cleanup_job(cls):
+        """定期清理进程级的过期暂停记录、缓存和临时文件（调度器任务，所有账号共用一个）
 
-                # 清理过期的通知、发货和订单确认记录（防止内存泄漏）
-                self._cleanup_instance_caches()
+        内存中的记录和缓存每个进程各自清理；浏览器临时文件每台主机、数据库历史数据所有节点只需要一个进程清理，
+        通过数据库认领（claim_periodic_run），分片模式和多节点部署时不会重复执行。
+        """
+        # 清理过期的暂停记录
+        pause_manager.cleanup_expired_pauses()
 
-                # 清理AI回复引擎未使用的客户端（每5分钟检查一次）
-                try:
-                    from ai_reply_engine import ai_reply_engine
-                    ai_reply_engine.cleanup_unused_clients(max_idle_hours=24)
-                except Exception as ai_clean_e:
-                    logger.debug(f"【{self.cookie_id}】清理AI客户端时出错: {ai_clean_e}")
+        # 清理过期的商品详情缓存
+        cleaned_count = item_detail_cache.cleanup_expired()
+        if cleaned_count > 0:
+            logger.info(f"清理了 {cleaned_count} 个过期的商品详情缓存")
 
-                # 清理QR登录过期会话（每5分钟检查一次）
-                try:
-                    from utils.qr_login import qr_login_manager
-                    qr_login_manager.cleanup_expired_sessions()
-                except Exception as qr_clean_e:
-                    logger.debug(f"【{self.cookie_id}】清理QR登录会话时出错: {qr_clean_e}")
-                
-                # 清理Playwright浏览器临时文件和缓存（每5分钟检查一次）
-                try:
-                    await self._cleanup_playwright_cache()
-                except Exception as pw_clean_e:
-                    logger.debug(f"【{self.cookie_id}】清理Playwright缓存时出错: {pw_clean_e}")
-                
-                # 清理数据库历史数据（每天一次，保留90天数据）
-                # 为避免所有实例同时执行，只让第一个实例执行
-                try:
-                    if hasattr(self.__class__, '_last_db_cleanup_time'):
-                        last_cleanup = self.__class__._last_db_cleanup_time
-                    else:
-                        self.__class__._last_db_cleanup_time = 0
-                        last_cleanup = 0
-                    
-                    current_time = time.time()
-                    # 每24小时清理一次
-                    if current_time - last_cleanup > 86400:
-                        logger.info(f"【{self.cookie_id}】开始执行数据库历史数据清理...")
-                        stats = db_manager.cleanup_old_data(days=90)
-                        if 'error' not in stats:
-                            logger.info(f"【{self.cookie_id}】数据库清理完成: {stats}")
-                            self.__class__._last_db_cleanup_time = current_time
-                        else:
-                            logger.error(f"【{self.cookie_id}】数据库清理失败: {stats['error']}")
-                except Exception as db_clean_e:
-                    logger.debug(f"【{self.cookie_id}】清理数据库历史数据时出错: {db_clean_e}")
+        # 清理AI回复引擎未使用的客户端（每5分钟检查一次）
+        try:
+            from ai_reply_engine import ai_reply_engine
+            ai_reply_engine.cleanup_unused_clients(max_idle_hours=24)
+        except Exception as ai_clean_e:
+            logger.debug(f"清理AI客户端时出错: {ai_clean_e}")
 
-                # 每5分钟清理一次
-                await asyncio.sleep(300)
-            except Exception as e:
-                logger.error(f"【{self.cookie_id}】清理任务失败: {self._safe_str(e)}")
-                await asyncio.sleep(300)  # 出错后也等待5分钟再重试
+        # 清理QR登录过期会话（每5分钟检查一次）
+        try:
+            from utils.qr_login import qr_login_manager
+            qr_login_manager.cleanup_expired_sessions()
+        except Exception as qr_clean_e:
+            logger.debug(f"清理QR登录会话时出错: {qr_clean_e}")
 
+        # 清理Playwright浏览器临时文件和缓存（每5分钟检查一次，每台主机一个进程）
+        try:
+            if await async_db_manager.run(db_manager.claim_periodic_run,
+                                          f"playwright_cache_cleanup:{socket.gethostname()}", 290):
+                await cls._cleanup_playwright_cache()
+        except Exception as pw_clean_e:
+            logger.debug(f"清理Playwright缓存时出错: {pw_clean_e}")
 
-    async def cookie_refresh_loop(self):
-        """Cookie刷新定时任务 - 每小时执行一次"""
-        while True:
-            try:
-                # 检查账号是否启用
-                from cookie_manager import manager as cookie_manager
-                if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
-                    logger.info(f"【{self.cookie_id}】账号已禁用，停止Cookie刷新循环")
-                    break
-
-                # 检查Cookie刷新功能是否启用
-                if not self.cookie_refresh_enabled:
-                    logger.debug(f"【{self.cookie_id}】Cookie刷新功能已禁用，跳过执行")
-                    await asyncio.sleep(300)  # 5分钟后再检查
-                    continue
+        # 清理数据库历史数据（每天一次，保留90天数据，所有进程和节点中只有一个执行）
+        try:
+            if await async_db_manager.run(db_manager.claim_periodic_run, 'db_cleanup', 86400):
+                logger.info("开始执行数据库历史数据清理...")
+                stats = await async_db_manager.run(db_manager.cleanup_old_data, days=90)
+                if 'error' not in stats:
+                    if stats.get('ai_conversations'):
+                        from utils import cache_invalidation
+                        cache_invalidation.invalidate('conversations')
+                    logger.info(f"数据库清理完成: {stats}")
+                else:
+                    logger.error(f"数据库清理失败: {stats['error']}")
+        except Exception as db_clean_e:
+            logger.debug(f"清理数据库历史数据时出错: {db_clean_e}")
 
-                current_time = time.time()
-                if current_time - self.last_cookie_refresh_time >= self.cookie_refresh_interval:
-                    # 检查是否在消息接收后的冷却时间内
-                    time_since_last_message = current_time - self.last_message_received_time
-                    if time_since_last_message < self.message_cookie_refresh_cooldown:
-                        remaining_time = self.message_cookie_refresh_cooldown - time_since_last_message
-                        remaining_minutes = int(remaining_time // 60)
-                        remaining_seconds = int(remaining_time % 60)
-                        logger.debug(f"【{self.cookie_id}】收到消息后冷却中，还需等待 {remaining_minutes}分{remaining_seconds}秒 才能执行Cookie刷新")
-                    # 检查是否已有Cookie刷新任务在执行
-                    elif self.cookie_refresh_lock.locked():
-                        logger.debug(f"【{self.cookie_id}】Cookie刷新任务已在执行中，跳过本次触发")
-                    else:
-                        logger.info(f"【{self.cookie_id}】开始执行Cookie刷新任务...")
-                        # 在独立的任务中执行Cookie刷新，避免阻塞主循环
-                        asyncio.create_task(self._execute_cookie_refresh(current_time))
+    async def _cookie_refresh_job(self):
+        """Cookie刷新（调度器中的重型任务），返回下次检查的延迟（秒）"""
+        try:
+            # 检查账号是否启用
+            from cookie_manager import manager as cookie_manager
+            if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
+                logger.info(f"【{self.cookie_id}】账号已禁用，停止Cookie刷新任务")
+                scheduler.remove(self.cookie_id, 'cookie_refresh', cancel=False)
+                return None
 
-                # 每分钟检查一次是否需要执行
-                await asyncio.sleep(60)
-            except Exception as e:
-                logger.error(f"【{self.cookie_id}】Cookie刷新循环失败: {self._safe_str(e)}")
-                await asyncio.sleep(60)  # 出错后也等待1分钟再重试
+            # 检查Cookie刷新功能是否启用
+            if not self.cookie_refresh_enabled:
+                logger.debug(f"【{self.cookie_id}】Cookie刷新功能已禁用，跳过执行")
+                return 300  # 5分钟后再检查
+
+            current_time = time.time()
+            remaining = self.last_cookie_refresh_time + self.cookie_refresh_interval - current_time
+            if remaining > 0:
+                return remaining
+
+            # 检查是否在消息接收后的冷却时间内
+            time_since_last_message = current_time - self.last_message_received_time
+            if time_since_last_message < self.message_cookie_refresh_cooldown:
+                remaining_time = self.message_cookie_refresh_cooldown - time_since_last_message
+                remaining_minutes = int(remaining_time // 60)
+                remaining_seconds = int(remaining_time % 60)
+                logger.debug(f"【{self.cookie_id}】收到消息后冷却中，还需等待 {remaining_minutes}分{remaining_seconds}秒 才能执行Cookie刷新")
+                return remaining_time
+
+            # 检查是否已有Cookie刷新任务在执行（如扫码登录触发的刷新）
+            if self.cookie_refresh_lock.locked():
+                logger.debug(f"【{self.cookie_id}】Cookie刷新任务已在执行中，跳过本次触发")
+                return 60
+
+            logger.info(f"【{self.cookie_id}】开始执行Cookie刷新任务...")
+            await self._execute_cookie_refresh(current_time)
+            return None
+        except Exception as e:
+            logger.error(f"【{self.cookie_id}】Cookie刷新任务失败: {self._safe_str(e)}")
+            return 60  # 出错后等待1分钟再重试
 
     async def _execute_cookie_refresh(self, current_time):
         """独立执行Cookie刷新任务，避免阻塞主循环"""
@@ -4700,10 +3968,9 @@ class XianyuLive:
                 logger.info(f"【{self.cookie_id}】开始Cookie刷新任务，暂时暂停心跳以避免连接冲突...")
 
                 # 暂时暂停心跳任务，避免与浏览器操作冲突
-                heartbeat_was_running = False
-                if self.heartbeat_task and not self.heartbeat_task.done():
-                    heartbeat_was_running = True
-                    self.heartbeat_task.cancel()
+                heartbeat_was_running = scheduler.has(self.cookie_id, 'heartbeat')
+                if heartbeat_was_running:
+                    scheduler.remove(self.cookie_id, 'heartbeat')
                     logger.debug(f"【{self.cookie_id}】已暂停心跳任务")
 
                 # 为整个Cookie刷新任务添加超时保护（3分钟，缩短时间减少影响）
@@ -4715,7 +3982,7 @@ class XianyuLive:
                 # 重新启动心跳任务
                 if heartbeat_was_running and self.ws and not self.ws.closed:
                     logger.debug(f"【{self.cookie_id}】重新启动心跳任务")
-                    self.heartbeat_task = asyncio.create_task(self.heartbeat_loop(self.ws))
+                    self._start_heartbeat(self.ws)
 
                 if success:
                     self.last_cookie_refresh_time = current_time
@@ -4733,11 +4000,12 @@ class XianyuLive:
                 # 异常也要更新时间，避免频繁重试
                 self.last_cookie_refresh_time = current_time
             finally:
-                # 确保心跳任务恢复（如果WebSocket仍然连接）
+                # 确保心跳任务恢复（如果WebSocket仍然连接，且账号的周期任务没有被整体删除）
                 if (self.ws and not self.ws.closed and
-                    (not self.heartbeat_task or self.heartbeat_task.done())):
+                        scheduler.has(self.cookie_id, 'cookie_refresh') and
+                        not scheduler.has(self.cookie_id, 'heartbeat')):
                     logger.info(f"【{self.cookie_id}】Cookie刷新完成，心跳任务正常运行")
-                    self.heartbeat_task = asyncio.create_task(self.heartbeat_loop(self.ws))
+                    self._start_heartbeat(self.ws)
 
                 # 清空消息接收标志，允许下次正常执行Cookie刷新
                 self.last_message_received_time = 0
@@ -5572,7 +4840,7 @@ class XianyuLive:
         async for message in websocket:
             try:
                 logger.info(f"【{self.cookie_id}】message: {message}")
-                message = json.loads(message)
+                message = frame_codec.loads(message)
                 cid = message["body"]["singleChatConversation"]["cid"]
                 cid = cid.split('@')[0]
                 await self.send_msg(websocket, cid, toid, text)
@@ -5626,6 +4894,9 @@ class XianyuLive:
             await self.session.close()
             self.session = None
 
+        # 关闭mtop连接池（并写入尚未持久化的Cookie）
+        await self.mtop.close()
+
     async def get_api_reply(self, msg_time, user_url, send_user_id, send_user_name, item_id, send_message, chat_id):
         """调用API获取回复消息"""
         try:
@@ -5677,66 +4948,47 @@ class XianyuLive:
             logger.error(f"调用API出错: {self._safe_str(e)}")
             return None
 
-    async def _handle_message_with_semaphore(self, message_data, websocket):
-        """带信号量的消息处理包装器，防止并发任务过多"""
-        async with self.message_semaphore:
-            self.active_message_tasks += 1
-            try:
-                await self.handle_message(message_data, websocket)
-            finally:
-                self.active_message_tasks -= 1
-                # 定期记录活跃任务数（每100个任务记录一次）
-                if self.active_message_tasks % 100 == 0 and self.active_message_tasks > 0:
-                    logger.info(f"【{self.cookie_id}】当前活跃消息处理任务数: {self.active_message_tasks}")
-
-    async def handle_message(self, message_data, websocket):
-        """处理所有类型的消息"""
+    def _queue_ack(self, websocket, message_data):
+        """在接收循环中立即确认服务端推送（入队后由发送任务连续发送）"""
         try:
-            # 检查账号是否启用
-            from cookie_manager import manager as cookie_manager
-            if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
-                logger.debug(f"【{self.cookie_id}】账号已禁用，跳过消息处理")
-                return
+            self._ack_queue.append((websocket, frame_codec.encode_ack(message_data["headers"])))
+        except Exception as e:
+            logger.debug(f"【{self.cookie_id}】构造确认消息失败: {self._safe_str(e)}")
+            return
+        if self._ack_task is None or self._ack_task.done():
+            self._ack_task = self._create_tracked_task(self._ack_sender())
 
-            # 发送确认消息
+    async def _ack_sender(self):
+        """按接收顺序发送队列中的确认帧，队列为空时退出"""
+        while self._ack_queue:
+            websocket, ack = self._ack_queue.popleft()
             try:
-                message = message_data
-                ack = {
-                    "code": 200,
-                    "headers": {
-                        "mid": message["headers"]["mid"] if "mid" in message["headers"] else generate_mid(),
-                        "sid": message["headers"]["sid"] if "sid" in message["headers"] else '',
-                    }
-                }
-                if 'app-key' in message["headers"]:
-                    ack["headers"]["app-key"] = message["headers"]["app-key"]
-                if 'ua' in message["headers"]:
-                    ack["headers"]["ua"] = message["headers"]["ua"]
-                if 'dt' in message["headers"]:
-                    ack["headers"]["dt"] = message["headers"]["dt"]
-                await websocket.send(json.dumps(ack))
+                await websocket.send(ack)
+                metrics.ws_acks_sent.inc(self.cookie_id)
             except Exception as e:
-                pass
+                logger.debug(f"【{self.cookie_id}】发送确认消息失败: {self._safe_str(e)}")
 
-            # 如果不是同步包消息，直接返回
-            if not self.is_sync_package(message_data):
-                return
+    def _decode_sync_message(self, message_data):
+        """解密同步包中的消息（在接收循环中调用），非同步包、系统提示或解密失败时返回None"""
+        # 如果不是同步包消息，直接返回
+        if not self.is_sync_package(message_data):
+            return None
 
+        try:
             # 获取并解密数据
             sync_data = message_data["body"]["syncPushPackage"]["data"][0]
 
             # 检查是否有必要的字段
             if "data" not in sync_data:
                 logger.debug("同步包中无data字段")
-                return
+                return None
 
             # 解密数据
             message = None
             try:
                 data = sync_data["data"]
                 try:
-                    data = base64.b64decode(data).decode("utf-8")
-                    parsed_data = json.loads(data)
+                    parsed_data = frame_codec.loads(base64.b64decode(data))
                     # 处理未加密的消息（如系统提示等）
                     msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                     if isinstance(parsed_data, dict) and 'chatType' in parsed_data:
@@ -5751,32 +5003,54 @@ class XianyuLive:
                             elif 'contentType' in content:
                                 # 其他类型的未加密消息
                                 logger.debug(f"[{msg_time}] 【{self.cookie_id}】【系统】其他类型消息: {content}")
-                        return
+                        return None
                     else:
                         # 如果不是系统消息，将解析的数据作为message
                         message = parsed_data
                 except Exception as e:
-                    # 如果JSON解析失败，尝试解密
-                    decrypted_data = decrypt(data)
-                    message = json.loads(decrypted_data)
+                    # 如果JSON解析失败，尝试解密（直接解码为字典，不经过JSON字符串）
+                    message = decrypt_to_dict(data)
             except Exception as e:
                 logger.error(f"消息解密失败: {self._safe_str(e)}")
-                return
+                return None
 
             # 确保message不为空
             if message is None:
                 logger.error("消息解析后为空")
-                return
+                return None
 
             # 确保message是字典类型
             if not isinstance(message, dict):
                 logger.error(f"消息格式错误，期望字典但得到: {type(message)}")
                 logger.debug(f"消息内容: {message}")
-                return
+                return None
 
             # 【消息接收标识】记录收到消息的时间，用于控制Cookie刷新
             self.last_message_received_time = time.time()
             logger.debug(f"【{self.cookie_id}】收到消息，更新消息接收时间标识")
+            return message
+        except Exception as e:
+            logger.error(f"处理同步包出错: {self._safe_str(e)}")
+            return None
+
+    @staticmethod
+    def _get_chat_key(message):
+        """消息所属的会话（用于入站队列中同一会话串行处理），无法确定时返回None"""
+        message_1 = message.get("1")
+        if isinstance(message_1, dict):
+            chat_id = message_1.get("2")
+            if isinstance(chat_id, str) and chat_id:
+                return chat_id
+        return None
+
+    async def handle_message(self, message, websocket):
+        """处理解密后的同步包消息（由入站队列的工作任务调用）"""
+        try:
+            # 检查账号是否启用
+            from cookie_manager import manager as cookie_manager
+            if cookie_manager and not cookie_manager.get_cookie_status(self.cookie_id):
+                logger.debug(f"【{self.cookie_id}】账号已禁用，跳过消息处理")
+                return
 
             # 【优先处理】尝试获取订单ID并获取订单详情
             order_id = None
@@ -5988,16 +5262,21 @@ class XianyuLive:
             if send_user_id == self.myid:
                 logger.info(f"[{msg_time}] 【手动发出】 商品({item_id}): {send_message}")
 
+                # 卖家已手动回复，丢弃合并窗口中尚未回复的买家消息
+                self.reply_debouncer.cancel(self._get_chat_key(message) or chat_id)
+
                 # 暂停该chat_id的自动回复10分钟
-                pause_manager.pause_chat(chat_id, self.cookie_id)
+                await pause_manager.pause_chat(chat_id, self.cookie_id)
 
                 return
             else:
                 logger.info(f"[{msg_time}] 【收到】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {send_message}")
 
-                # 🔔 立即发送消息通知（独立于自动回复功能）
+                # 🔔 发送消息通知（独立于自动回复功能，在后台进行，不影响回复耗时）
                 try:
-                    await self.send_notification(send_user_name, send_user_id, send_message, item_id, chat_id, scheme, other)
+                    self._create_tracked_task(
+                        self.send_notification(send_user_name, send_user_id, send_message, item_id, chat_id, scheme, other)
+                    )
                 except Exception as notify_error:
                     logger.error(f"📱 发送消息通知失败: {self._safe_str(notify_error)}")
 
@@ -6109,8 +5388,7 @@ class XianyuLive:
                         # 检查商品是否属于当前cookies
                         if item_id and item_id != "未知商品":
                             try:
-                                from db_manager import db_manager
-                                item_info = db_manager.get_item_info(self.cookie_id, item_id)
+                                item_info = await async_db_manager.get_item_info(self.cookie_id, item_id)
                                 if not item_info:
                                     logger.warning(f'[{msg_time}] 【{self.cookie_id}】❌ 商品 {item_id} 不属于当前账号，跳过免拼发货')
                                     return
@@ -6158,6 +5436,52 @@ class XianyuLive:
                 logger.info(f"[{msg_time}] 【{self.cookie_id}】【系统】chat_id {chat_id} 自动回复已暂停，剩余时间: {remaining_minutes}分{remaining_seconds}秒")
                 return
 
+            # 连续消息合并回复：窗口内同一会话的买家消息合并后只回复一次
+            reply_debounce = await async_db_manager.get_cookie_reply_debounce(self.cookie_id)
+            if reply_debounce > 0:
+                # 不保存 websocket：窗口结束时连接可能已经重建，回复时使用当前连接
+                self.reply_debouncer.add(
+                    self._get_chat_key(message) or chat_id,
+                    (send_user_name, send_user_id, send_message, item_id, chat_id, msg_time),
+                    reply_debounce
+                )
+                logger.debug(f"[{msg_time}] 【{self.cookie_id}】消息进入合并窗口（{reply_debounce}秒）: {send_message}")
+                return
+
+            await self._auto_reply(websocket, send_user_name, send_user_id, send_message, item_id, chat_id, msg_time)
+
+        except Exception as e:
+            logger.error(f"处理消息时发生错误: {self._safe_str(e)}")
+            logger.debug(f"原始消息: {message}")
+
+    def _on_reply_burst(self, chat_key, entries):
+        """合并窗口结束：放回入站队列，与该会话的其他消息保持顺序"""
+        self.inbound_queue.put((self._reply_burst, entries), chat_key)
+
+    async def _reply_burst(self, entries):
+        """对合并窗口内的多条买家消息只回复一次"""
+        send_user_name, send_user_id, _, item_id, chat_id, msg_time = entries[-1]
+        send_message = '\n'.join(entry[2] for entry in entries)
+        if len(entries) > 1:
+            logger.info(f"[{msg_time}] 【{self.cookie_id}】合并 {len(entries)} 条连续消息后回复: {send_message!r}")
+
+        # 等待期间可能关闭了自动回复或卖家已手动接入
+        if not AUTO_REPLY.get('enabled', True):
+            return
+        if pause_manager.is_chat_paused(chat_id):
+            logger.info(f"[{msg_time}] 【{self.cookie_id}】【系统】chat_id {chat_id} 自动回复已暂停，放弃合并回复")
+            return
+
+        await self._auto_reply(self.ws, send_user_name, send_user_id, send_message, item_id, chat_id, msg_time)
+
+    async def _handle_queued_message(self, message):
+        """处理入站队列中的消息，使用处理时的当前连接（排队期间连接可能已经重建）"""
+        await self.handle_message(message, self.ws)
+
+    async def _auto_reply(self, websocket, send_user_name, send_user_id, send_message, item_id, chat_id, msg_time):
+        """按 API、关键词、AI、默认回复的顺序生成回复并发送"""
+        started = time.perf_counter()
+        try:
             # 构造用户URL
             user_url = f'https://www.goofish.com/personal?userId={send_user_id}'
 
@@ -6212,6 +5536,7 @@ class XianyuLive:
                     # 发送图片消息
                     try:
                         await self.send_image_msg(websocket, chat_id, send_user_id, image_url)
+                        self._record_reply(reply_source, started)
                         # 记录发出的图片消息
                         msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                         logger.info(f"[{msg_time}] 【{reply_source}图片发出】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): 图片 {image_url}")
@@ -6224,6 +5549,7 @@ class XianyuLive:
                 else:
                     # 普通文本消息
                     await self.send_msg(websocket, chat_id, send_user_id, reply)
+                    self._record_reply(reply_source, started)
                     # 记录发出的消息
                     msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                     logger.info(f"[{msg_time}] 【{reply_source}发出】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {reply}")
@@ -6232,8 +5558,13 @@ class XianyuLive:
                 logger.info(f"[{msg_time}] 【{self.cookie_id}】【系统】未找到匹配的回复规则，不回复")
 
         except Exception as e:
-            logger.error(f"处理消息时发生错误: {self._safe_str(e)}")
-            logger.debug(f"原始消息: {message_data}")
+            logger.error(f"自动回复时发生错误: {self._safe_str(e)}")
+
+    def _record_reply(self, reply_source: str, started: float):
+        """记录一条已发出的自动回复：按来源计数，以及从开始生成到发送完成的耗时"""
+        source = REPLY_SOURCE_LABELS.get(reply_source, reply_source)
+        metrics.replies.inc(self.cookie_id, source)
+        metrics.reply_latency.observe(time.perf_counter() - started, source)
 
     async def main(self):
         """主程序入口"""
@@ -6271,41 +5602,32 @@ class XianyuLive:
                         self.connection_failures = 0
                         self.last_successful_connection = time.time()
 
-                        # 启动心跳任务
-                        logger.info(f"【{self.cookie_id}】启动心跳任务...")
-                        self.heartbeat_task = asyncio.create_task(self.heartbeat_loop(websocket))
-
-                        # 启动token刷新任务
-                        logger.info(f"【{self.cookie_id}】启动token刷新任务...")
-                        self.token_refresh_task = asyncio.create_task(self.token_refresh_loop())
-
-                        # 启动暂停记录清理任务
-                        if not self.cleanup_task:
-                            logger.info(f"【{self.cookie_id}】启动暂停记录清理任务...")
-                            self.cleanup_task = asyncio.create_task(self.pause_cleanup_loop())
-
-                        # 启动Cookie刷新任务
-                        if not self.cookie_refresh_task:
-                            logger.info(f"【{self.cookie_id}】启动Cookie刷新任务...")
-                            self.cookie_refresh_task = asyncio.create_task(self.cookie_refresh_loop())
+                        # 在调度器中注册心跳、Token刷新、清理和Cookie刷新任务
+                        self._start_background_jobs(websocket)
 
                         logger.info(f"【{self.cookie_id}】开始监听WebSocket消息...")
                         logger.info(f"【{self.cookie_id}】WebSocket连接状态正常，等待服务器消息...")
                         logger.info(f"【{self.cookie_id}】准备进入消息循环...")
 
+                        frames_received = metrics.ws_frames_received
                         async for message in websocket:
+                            frames_received.inc(self.cookie_id)
                             logger.info(f"【{self.cookie_id}】收到WebSocket消息: {len(message) if message else 0} 字节")
                             try:
-                                message_data = json.loads(message)
+                                message_data = frame_codec.loads(message)
 
                                 # 处理心跳响应
                                 if await self.handle_heartbeat_response(message_data):
                                     continue
 
-                                # 处理其他消息
-                                # 使用追踪的异步任务处理消息，防止阻塞后续消息接收
-                                # 并通过信号量控制并发数量，防止内存泄漏
-                                self._create_tracked_task(self._handle_message_with_semaphore(message_data, websocket))
+                                # 先确认再调度：确认帧不排在信号量和耗时的消息处理之后
+                                self._queue_ack(websocket, message_data)
+
+                                # 解密同步包后放入入站队列，由工作任务处理，不阻塞后续消息接收
+                                sync_message = self._decode_sync_message(message_data)
+                                if sync_message is not None:
+                                    self.inbound_queue.put((self._handle_queued_message, sync_message),
+                                                           self._get_chat_key(sync_message))
 
                             except Exception as e:
                                 logger.error(f"处理消息出错: {self._safe_str(e)}")
@@ -6317,6 +5639,7 @@ class XianyuLive:
 
                     # 更新连接状态为重连中
                     self._set_connection_state(ConnectionState.RECONNECTING, f"第{self.connection_failures}次失败")
+                    metrics.reconnects.inc(self.cookie_id)
 
                     # 打印详细的错误信息
                     import traceback
@@ -6372,6 +5695,17 @@ class XianyuLive:
                 except asyncio.TimeoutError:
                     logger.warning(f"【{self.cookie_id}】后台任务清理超时，强制继续")
             
+            # 停止入站队列的工作任务，丢弃尚未回复的合并消息
+            self.reply_debouncer.close()
+            await self.inbound_queue.close()
+
+            # 丢弃浏览器池中本账号的上下文：账号可能已删除、更新了Cookie或迁移到其他分片、节点
+            try:
+                from utils.browser_pool import browser_pool
+                await asyncio.wait_for(browser_pool.invalidate_context(self.cookie_id), timeout=5)
+            except Exception as e:
+                logger.debug(f"【{self.cookie_id}】释放浏览器上下文失败: {self._safe_str(e)}")
+
             # 确保关闭session
             await self.close_session()
 
@@ -6385,32 +5719,8 @@ class XianyuLive:
         Args:
             page_number (int): 页码，从1开始
             page_size (int): 每页数量，默认20
-            retry_count (int): 重试次数，内部使用
+            retry_count (int): 兼容保留，重试由mtop客户端处理
         """
-        if retry_count >= 4:  # 最多重试3次
-            logger.error("获取商品信息失败，重试次数过多")
-            return {"error": "获取商品信息失败，重试次数过多"}
-
-        # 确保session已创建
-        if not self.session:
-            await self.create_session()
-
-        params = {
-            'jsv': '2.7.2',
-            'appKey': '34839810',
-            't': str(int(time.time()) * 1000),
-            'sign': '',
-            'v': '1.0',
-            'type': 'originaljson',
-            'accountSite': 'xianyu',
-            'dataType': 'json',
-            'timeout': '20000',
-            'api': 'mtop.idle.web.xyh.item.list',
-            'sessionOption': 'AutoLoginOnly',
-            'spm_cnt': 'a21ybx.im.0.0',
-            'spm_pre': 'a21ybx.collection.menu.1.272b5141NafCNK'
-        }
-
         data = {
             'needGroupInfo': False,
             'pageNumber': page_number,
@@ -6421,131 +5731,94 @@ class XianyuLive:
             "userId": self.myid
         }
 
-        # 始终从最新的cookies中获取_m_h5_tk token（刷新后cookies会被更新）
-        token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
-
-        logger.warning(f"准备获取商品列表，token: {token}")
-        if token:
-            logger.debug(f"使用cookies中的_m_h5_tk token: {token}")
-        else:
-            logger.warning("cookies中没有找到_m_h5_tk token")
-
-        # 生成签名
-        data_val = json.dumps(data, separators=(',', ':'))
-        sign = generate_sign(params['t'], token, data_val)
-        params['sign'] = sign
-
         try:
-            async with self.session.post(
-                'https://h5api.m.goofish.com/h5/mtop.idle.web.xyh.item.list/1.0/',
-                params=params,
-                data={'data': data_val}
-            ) as response:
-                res_json = await response.json()
-
-                # 检查并更新Cookie
-                if 'set-cookie' in response.headers:
-                    new_cookies = {}
-                    for cookie in response.headers.getall('set-cookie', []):
-                        if '=' in cookie:
-                            name, value = cookie.split(';')[0].split('=', 1)
-                            new_cookies[name.strip()] = value.strip()
-
-                    # 更新cookies
-                    if new_cookies:
-                        self.cookies.update(new_cookies)
-                        # 生成新的cookie字符串
-                        self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                        # 更新数据库中的Cookie
-                        await self.update_config_cookies()
-                        logger.debug("已更新Cookie到数据库")
-
-                logger.info(f"商品信息获取响应: {res_json}")
-
-                # 检查响应是否成功
-                if res_json.get('ret') and res_json['ret'][0] == 'SUCCESS::调用成功':
-                    items_data = res_json.get('data', {})
-                    # 从cardList中提取商品信息
-                    card_list = items_data.get('cardList', [])
-
-                    # 解析cardList中的商品信息
-                    items_list = []
-                    for card in card_list:
-                        card_data = card.get('cardData', {})
-                        if card_data:
-                            # 提取商品基本信息
-                            item_info = {
-                                'id': card_data.get('id', ''),
-                                'title': card_data.get('title', ''),
-                                'price': card_data.get('priceInfo', {}).get('price', ''),
-                                'price_text': card_data.get('priceInfo', {}).get('preText', '') + card_data.get('priceInfo', {}).get('price', ''),
-                                'category_id': card_data.get('categoryId', ''),
-                                'auction_type': card_data.get('auctionType', ''),
-                                'item_status': card_data.get('itemStatus', 0),
-                                'detail_url': card_data.get('detailUrl', ''),
-                                'pic_info': card_data.get('picInfo', {}),
-                                'detail_params': card_data.get('detailParams', {}),
-                                'track_params': card_data.get('trackParams', {}),
-                                'item_label_data': card_data.get('itemLabelDataVO', {}),
-                                'card_type': card.get('cardType', 0)
-                            }
-                            items_list.append(item_info)
-
-                    logger.info(f"成功获取到 {len(items_list)} 个商品")
-
-                    # 打印商品详细信息到控制台
-                    print("\n" + "="*80)
-                    print(f"📦 账号 {self.myid} 的商品列表 (第{page_number}页，{len(items_list)} 个商品)")
-                    print("="*80)
-
-                    for i, item in enumerate(items_list, 1):
-                        print(f"\n🔸 商品 {i}:")
-                        print(f"   商品ID: {item.get('id', 'N/A')}")
-                        print(f"   商品标题: {item.get('title', 'N/A')}")
-                        print(f"   价格: {item.get('price_text', 'N/A')}")
-                        print(f"   分类ID: {item.get('category_id', 'N/A')}")
-                        print(f"   商品状态: {item.get('item_status', 'N/A')}")
-                        print(f"   拍卖类型: {item.get('auction_type', 'N/A')}")
-                        print(f"   详情链接: {item.get('detail_url', 'N/A')}")
-                        if item.get('pic_info'):
-                            pic_info = item['pic_info']
-                            print(f"   图片信息: {pic_info.get('width', 'N/A')}x{pic_info.get('height', 'N/A')}")
-                            print(f"   图片链接: {pic_info.get('picUrl', 'N/A')}")
-                        print(f"   完整信息: {json.dumps(item, ensure_ascii=False, indent=2)}")
-
-                    print("\n" + "="*80)
-                    print("✅ 商品列表获取完成")
-                    print("="*80)
-
-                    # 自动保存商品信息到数据库
-                    if items_list:
-                        saved_count = await self.save_items_list_to_db(items_list)
-                        logger.info(f"已将 {saved_count} 个商品信息保存到数据库")
-
-                    return {
-                        "success": True,
-                        "page_number": page_number,
-                        "page_size": page_size,
-                        "current_count": len(items_list),
-                        "items": items_list,
-                        "saved_count": saved_count if items_list else 0,
-                        "raw_data": items_data  # 保留原始数据以备调试
-                    }
-                else:
-                    # 检查是否是token失效
-                    error_msg = res_json.get('ret', [''])[0] if res_json.get('ret') else ''
-                    if 'FAIL_SYS_TOKEN_EXOIRED' in error_msg or 'token' in error_msg.lower():
-                        logger.warning(f"Token失效，准备重试: {error_msg}")
-                        await asyncio.sleep(0.5)
-                        return await self.get_item_list_info(page_number, page_size, retry_count + 1)
-                    else:
-                        logger.error(f"获取商品信息失败: {res_json}")
-                        return {"error": f"获取商品信息失败: {error_msg}"}
-
-        except Exception as e:
+            res_json = await self.mtop.call(
+                'mtop.idle.web.xyh.item.list',
+                data,
+                params={
+                    'spm_cnt': 'a21ybx.im.0.0',
+                    'spm_pre': 'a21ybx.collection.menu.1.272b5141NafCNK'
+                }
+            )
+        except MtopError as e:
             logger.error(f"商品信息API请求异常: {self._safe_str(e)}")
-            await asyncio.sleep(0.5)
-            return await self.get_item_list_info(page_number, page_size, retry_count + 1)
+            return {"error": f"获取商品信息失败: {self._safe_str(e)}"}
+
+        logger.info(f"商品信息获取响应: {res_json}")
+
+        # 检查响应是否成功
+        if res_json.get('ret') and res_json['ret'][0] == 'SUCCESS::调用成功':
+            items_data = res_json.get('data', {})
+            # 从cardList中提取商品信息
+            card_list = items_data.get('cardList', [])
+
+            # 解析cardList中的商品信息
+            items_list = []
+            for card in card_list:
+                card_data = card.get('cardData', {})
+                if card_data:
+                    # 提取商品基本信息
+                    item_info = {
+                        'id': card_data.get('id', ''),
+                        'title': card_data.get('title', ''),
+                        'price': card_data.get('priceInfo', {}).get('price', ''),
+                        'price_text': card_data.get('priceInfo', {}).get('preText', '') + card_data.get('priceInfo', {}).get('price', ''),
+                        'category_id': card_data.get('categoryId', ''),
+                        'auction_type': card_data.get('auctionType', ''),
+                        'item_status': card_data.get('itemStatus', 0),
+                        'detail_url': card_data.get('detailUrl', ''),
+                        'pic_info': card_data.get('picInfo', {}),
+                        'detail_params': card_data.get('detailParams', {}),
+                        'track_params': card_data.get('trackParams', {}),
+                        'item_label_data': card_data.get('itemLabelDataVO', {}),
+                        'card_type': card.get('cardType', 0)
+                    }
+                    items_list.append(item_info)
+
+            logger.info(f"成功获取到 {len(items_list)} 个商品")
+
+            # 打印商品详细信息到控制台
+            print("\n" + "="*80)
+            print(f"📦 账号 {self.myid} 的商品列表 (第{page_number}页，{len(items_list)} 个商品)")
+            print("="*80)
+
+            for i, item in enumerate(items_list, 1):
+                print(f"\n🔸 商品 {i}:")
+                print(f"   商品ID: {item.get('id', 'N/A')}")
+                print(f"   商品标题: {item.get('title', 'N/A')}")
+                print(f"   价格: {item.get('price_text', 'N/A')}")
+                print(f"   分类ID: {item.get('category_id', 'N/A')}")
+                print(f"   商品状态: {item.get('item_status', 'N/A')}")
+                print(f"   拍卖类型: {item.get('auction_type', 'N/A')}")
+                print(f"   详情链接: {item.get('detail_url', 'N/A')}")
+                if item.get('pic_info'):
+                    pic_info = item['pic_info']
+                    print(f"   图片信息: {pic_info.get('width', 'N/A')}x{pic_info.get('height', 'N/A')}")
+                    print(f"   图片链接: {pic_info.get('picUrl', 'N/A')}")
+                print(f"   完整信息: {json.dumps(item, ensure_ascii=False, indent=2)}")
+
+            print("\n" + "="*80)
+            print("✅ 商品列表获取完成")
+            print("="*80)
+
+            # 自动保存商品信息到数据库
+            if items_list:
+                saved_count = await self.save_items_list_to_db(items_list)
+                logger.info(f"已将 {saved_count} 个商品信息保存到数据库")
+
+            return {
+                "success": True,
+                "page_number": page_number,
+                "page_size": page_size,
+                "current_count": len(items_list),
+                "items": items_list,
+                "saved_count": saved_count if items_list else 0,
+                "raw_data": items_data  # 保留原始数据以备调试
+            }
+        else:
+            error_msg = res_json.get('ret', [''])[0] if res_json.get('ret') else ''
+            logger.error(f"获取商品信息失败: {res_json}")
+            return {"error": f"获取商品信息失败: {error_msg}"}
 
     async def get_all_items(self, page_size=20, max_pages=None):
         """获取所有商品信息（自动分页）
@@ -6676,10 +5949,9 @@ class XianyuLive:
             }
 
             # Base64编码
-            content_json = json.dumps(image_content, ensure_ascii=False)
-            content_base64 = str(base64.b64encode(content_json.encode('utf-8')), 'utf-8')
+            content_base64 = frame_codec.encode_content(image_content)
 
-            logger.info(f"【{self.cookie_id}】图片内容JSON: {content_json}")
+            logger.info(f"【{self.cookie_id}】图片内容: {image_content}")
             logger.info(f"【{self.cookie_id}】Base64编码长度: {len(content_base64)}")
 
             # 构造WebSocket消息（完全参考send_msg的格式）
@@ -6720,7 +5992,7 @@ class XianyuLive:
                 ]
             }
 
-            await ws.send(json.dumps(msg))
+            await ws.send(frame_codec.dumps(msg))
             logger.info(f"【{self.cookie_id}】图片消息发送成功: {image_url}")
 
         except Exception as e:
@@ -4,23 +4,53 @@ AI回复引擎模块
 """
 
 import os
+import re
 import json
 import time
+import asyncio
 import sqlite3
 import requests
+import httpx
 from typing import List, Dict, Optional
 from loguru import logger
-from openai import OpenAI
-from db_manager import db_manager
+from openai import OpenAI, AsyncOpenAI
+from db_manager import db_manager, async_db_manager
+from utils.conversation_cache import conversation_cache
+from utils.ai_reply_cache import ai_reply_cache
 
 
 class AIReplyEngine:
     """AI回复引擎"""
+
+    # 议价次数达到上限时的固定回复
+    REFUSE_BARGAIN_REPLY = "抱歉，这个价格已经是最优惠的了，不能再便宜了哦！"
+
+    # 本地意图快速判定：短消息中出现明确的议价词时直接判定为price
+    FAST_PRICE_PATTERN = re.compile(
+        r'便宜|优惠|降价|砍价|议价|讲价|打折|折扣|少点|少一点|少些|能少|最低|'
+        r'小刀|可刀|能刀|刀吗|刀一下|刀点|来一刀|砍一刀|再刀'
+    )
+    FAST_INTENT_MAX_LENGTH = 40
     
     def __init__(self):
         self.clients = {}  # 存储不同账号的OpenAI客户端
         self.agents = {}   # 存储不同账号的Agent实例
         self.client_last_used = {}  # 记录客户端最后使用时间 {cookie_id: timestamp}
+
+        # 异步链路：同一base_url共享一个httpx连接池，不同api_key只是轻量的AsyncOpenAI包装
+        self.request_timeout = float(os.getenv('AI_REQUEST_TIMEOUT', '30'))
+        self.max_concurrent_per_account = max(1, int(os.getenv('AI_MAX_CONCURRENT_PER_ACCOUNT', '2')))
+        self.http_clients = {}        # {base_url: httpx.AsyncClient}
+        self.async_clients = {}       # {(base_url, api_key): AsyncOpenAI}
+        self.async_client_last_used = {}  # {(base_url, api_key): timestamp}
+        self.account_semaphores = {}  # {cookie_id: asyncio.Semaphore}
+
+        # 意图识别优化：本地快速判定 / 意图与回复合并为一次请求
+        from config import config
+        ai_config = config.get('AUTO_REPLY', {}).get('ai', {}) or {}
+        self.fast_intent_enabled = bool(ai_config.get('fast_intent', True))
+        self.fused_mode = bool(ai_config.get('fused_mode', False))
+        self.stats = {'llm_calls': 0, 'fast_intent_hits': 0, 'fused_calls': 0, 'fused_fallbacks': 0}
         self._init_default_prompts()
     
     def _init_default_prompts(self):
@@ -90,8 +120,8 @@ class AIReplyEngine:
 
         return is_custom_model and is_dashscope_url
 
-    def _call_dashscope_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
-        """调用DashScope API"""
+    def _build_dashscope_request(self, settings: dict, messages: list, max_tokens: int, temperature: float):
+        """构建DashScope API请求，返回 (url, headers, data)"""
         # 提取app_id从base_url
         base_url = settings['base_url']
         if '/apps/' in base_url:
@@ -140,15 +170,20 @@ class AIReplyEngine:
         logger.info(f"DashScope API请求: {url}")
         logger.info(f"发送的prompt: {prompt}")
         logger.debug(f"请求数据: {json.dumps(data, ensure_ascii=False)}")
+        return url, headers, data
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-
-        if response.status_code != 200:
-            logger.error(f"DashScope API请求失败: {response.status_code} - {response.text}")
-            raise Exception(f"DashScope API请求失败: {response.status_code} - {response.text}")
+    def _parse_dashscope_response(self, status_code: int, text: str, result_loader, usage: dict = None) -> str:
+        """解析DashScope API响应"""
+        if status_code != 200:
+            logger.error(f"DashScope API请求失败: {status_code} - {text}")
+            raise Exception(f"DashScope API请求失败: {status_code} - {text}")
 
-        result = response.json()
+        result = result_loader()
         logger.debug(f"DashScope API响应: {json.dumps(result, ensure_ascii=False)}")
+        if usage is not None:
+            tokens = result.get('usage') or {}
+            usage['total_tokens'] += int(tokens.get('total_tokens') or
+                                         (tokens.get('input_tokens') or 0) + (tokens.get('output_tokens') or 0))
 
         # 提取回复内容
         if 'output' in result and 'text' in result['output']:
@@ -156,8 +191,16 @@ class AIReplyEngine:
         else:
             raise Exception(f"DashScope API响应格式错误: {result}")
 
+    def _call_dashscope_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        """调用DashScope API"""
+        self.stats['llm_calls'] += 1
+        url, headers, data = self._build_dashscope_request(settings, messages, max_tokens, temperature)
+        response = requests.post(url, headers=headers, json=data, timeout=30)
+        return self._parse_dashscope_response(response.status_code, response.text, response.json)
+
     def _call_openai_api(self, client: OpenAI, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
         """调用OpenAI兼容API"""
+        self.stats['llm_calls'] += 1
         response = client.chat.completions.create(
             model=settings['model_name'],
             messages=messages,
@@ -171,6 +214,137 @@ class AIReplyEngine:
         settings = db_manager.get_ai_reply_settings(cookie_id)
         return settings['ai_enabled']
     
+    def _build_classify_messages(self, settings: dict, message: str) -> list:
+        """构建意图分类请求消息"""
+        custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
+        classify_prompt = custom_prompts.get('classify', self.default_prompts['classify'])
+        return [
+            {"role": "system", "content": classify_prompt},
+            {"role": "user", "content": message}
+        ]
+
+    def _parse_intent(self, response_text: str) -> str:
+        intent = response_text.lower()
+        if intent in ['price', 'tech', 'default']:
+            return intent
+        else:
+            return 'default'
+
+    def _log_request_error(self, e: Exception):
+        """打印更详细的错误信息"""
+        if hasattr(e, 'response') and hasattr(e.response, 'url'):
+            logger.error(f"请求URL: {e.response.url}")
+        if hasattr(e, 'request') and hasattr(e.request, 'url'):
+            logger.error(f"请求URL: {e.request.url}")
+
+    def _build_reply_messages(self, settings: dict, intent: str, message: str, item_info: dict,
+                              context: List[Dict], bargain_count: int) -> list:
+        """构建回复生成请求消息"""
+        # 构建提示词
+        custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
+        system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
+
+        # 构建商品信息
+        item_desc = f"商品标题: {item_info.get('title', '未知')}\n"
+        item_desc += f"商品价格: {item_info.get('price', '未知')}元\n"
+        item_desc += f"商品描述: {item_info.get('desc', '无')}"
+
+        # 构建对话历史
+        context_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in context[-10:]])  # 最近10条
+
+        # 构建用户消息
+        max_bargain_rounds = settings.get('max_bargain_rounds', 3)
+        max_discount_percent = settings.get('max_discount_percent', 10)
+        max_discount_amount = settings.get('max_discount_amount', 100)
+
+        user_prompt = f"""商品信息：
+{item_desc}
+
+对话历史：
+{context_str}
+
+议价设置：
+- 当前议价次数：{bargain_count}
+- 最大议价轮数：{max_bargain_rounds}
+- 最大优惠百分比：{max_discount_percent}%
+- 最大优惠金额：{max_discount_amount}元
+
+用户消息：{message}
+
+请根据以上信息生成回复："""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _bargain_limit_reached(self, settings: dict, intent: str, bargain_count: int) -> bool:
+        """检查议价轮数限制"""
+        if intent != "price":
+            return False
+        max_bargain_rounds = settings.get('max_bargain_rounds', 3)
+        if bargain_count >= max_bargain_rounds:
+            logger.info(f"议价次数已达上限 ({bargain_count}/{max_bargain_rounds})，拒绝继续议价")
+            return True
+        return False
+
+    def _fast_intent(self, message: str, settings: dict) -> Optional[str]:
+        """本地快速意图判定，有把握时返回意图，否则返回None
+
+        账号自定义了分类提示词时不做本地判定，以免与自定义规则冲突。
+        """
+        if not self.fast_intent_enabled or not message:
+            return None
+        custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
+        if custom_prompts.get('classify'):
+            return None
+        if len(message) <= self.FAST_INTENT_MAX_LENGTH and self.FAST_PRICE_PATTERN.search(message):
+            self.stats['fast_intent_hits'] += 1
+            return 'price'
+        return None
+
+    def _build_fused_messages(self, settings: dict, message: str, item_info: dict,
+                              context: List[Dict], bargain_count: int) -> list:
+        """构建意图识别+回复合并请求的消息，要求模型返回JSON"""
+        custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
+        classify_prompt = custom_prompts.get('classify', self.default_prompts['classify'])
+        intent_prompts = "\n\n".join(
+            f"【{intent}】\n{custom_prompts.get(intent, self.default_prompts[intent])}"
+            for intent in ('price', 'tech', 'default')
+        )
+        system_prompt = f"""请完成两件事：先判断用户消息的意图，再按该意图对应的要求回复用户。
+
+意图判断标准：
+{classify_prompt}
+
+各意图的回复要求：
+{intent_prompts}
+
+输出格式（优先于以上所有格式要求）：只输出一个JSON对象，不要输出其他内容。
+{{"intent": "price/tech/default之一", "reply": "给用户的回复"}}"""
+
+        # 用户消息部分与普通回复完全一致
+        messages = self._build_reply_messages(settings, 'default', message, item_info, context, bargain_count)
+        messages[0] = {"role": "system", "content": system_prompt}
+        return messages
+
+    def _parse_fused_response(self, response_text: str) -> Optional[tuple]:
+        """解析合并请求的响应，返回 (intent, reply)，格式不符时返回None"""
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(response_text[start:end + 1])
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        reply = str(data.get('reply') or '').strip()
+        if not reply:
+            return None
+        return self._parse_intent(str(data.get('intent') or '').strip()), reply
+
     def detect_intent(self, message: str, cookie_id: str) -> str:
         """检测用户消息意图"""
         try:
@@ -178,16 +352,10 @@ class AIReplyEngine:
             if not settings['ai_enabled'] or not settings['api_key']:
                 return 'default'
 
-            custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
-            classify_prompt = custom_prompts.get('classify', self.default_prompts['classify'])
-
             # 打印调试信息
             logger.info(f"AI设置调试 {cookie_id}: base_url={settings['base_url']}, model={settings['model_name']}")
 
-            messages = [
-                {"role": "system", "content": classify_prompt},
-                {"role": "user", "content": message}
-            ]
+            messages = self._build_classify_messages(settings, message)
 
             # 根据API类型选择调用方式
             if self._is_dashscope_api(settings):
@@ -201,19 +369,11 @@ class AIReplyEngine:
                 logger.info(f"OpenAI客户端base_url: {client.base_url}")
                 response_text = self._call_openai_api(client, settings, messages, max_tokens=10, temperature=0.1)
 
-            intent = response_text.lower()
-            if intent in ['price', 'tech', 'default']:
-                return intent
-            else:
-                return 'default'
+            return self._parse_intent(response_text)
 
         except Exception as e:
             logger.error(f"意图检测失败 {cookie_id}: {e}")
-            # 打印更详细的错误信息
-            if hasattr(e, 'response') and hasattr(e.response, 'url'):
-                logger.error(f"请求URL: {e.response.url}")
-            if hasattr(e, 'request') and hasattr(e.request, 'url'):
-                logger.error(f"请求URL: {e.request.url}")
+            self._log_request_error(e)
             return 'default'
     
     def generate_reply(self, message: str, item_info: dict, chat_id: str,
@@ -226,113 +386,280 @@ class AIReplyEngine:
             # 1. 获取AI回复设置
             settings = db_manager.get_ai_reply_settings(cookie_id)
 
-            # 2. 检测意图
-            intent = self.detect_intent(message, cookie_id)
+            # 2. 获取对话历史和议价次数
+            context, bargain_count = self._load_chat_state(chat_id, cookie_id)
+
+            # 3. 检测意图：本地快速判定 -> 合并请求 -> 意图识别请求
+            reply = None
+            intent = self._fast_intent(message, settings)
+            if intent is None and self.fused_mode:
+                messages = self._build_fused_messages(settings, message, item_info, context, bargain_count)
+                fused = self._call_llm(settings, cookie_id, messages, max_tokens=150, temperature=0.7)
+                intent, reply = self._handle_fused_response(fused, cookie_id)
+            if intent is None:
+                intent = self.detect_intent(message, cookie_id)
             logger.info(f"检测到意图: {intent} (账号: {cookie_id})")
 
-            # 3. 获取对话历史
-            context = self.get_conversation_context(chat_id, cookie_id)
-
-            # 4. 获取议价次数
-            bargain_count = self.get_bargain_count(chat_id, cookie_id)
-
-            # 5. 检查议价轮数限制
-            if intent == "price":
-                max_bargain_rounds = settings.get('max_bargain_rounds', 3)
-                if bargain_count >= max_bargain_rounds:
-                    logger.info(f"议价次数已达上限 ({bargain_count}/{max_bargain_rounds})，拒绝继续议价")
-                    # 返回拒绝议价的回复
-                    refuse_reply = f"抱歉，这个价格已经是最优惠的了，不能再便宜了哦！"
-                    # 保存对话记录
-                    self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
-                    self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", refuse_reply, intent)
-                    return refuse_reply
+            # 4. 检查议价轮数限制
+            if self._bargain_limit_reached(settings, intent, bargain_count):
+                # 返回拒绝议价的回复并保存对话记录
+                refuse_reply = self.REFUSE_BARGAIN_REPLY
+                self._save_exchange(chat_id, cookie_id, user_id, item_id, message, refuse_reply, intent)
+                return refuse_reply
+
+            # 5. 合并请求未得到回复时，按意图生成回复
+            if reply is None:
+                messages = self._build_reply_messages(settings, intent, message, item_info, context, bargain_count)
+                reply = self._call_llm(settings, cookie_id, messages, max_tokens=100, temperature=0.7)
+                if reply is None:
+                    return None
+
+            # 6. 保存对话记录（议价次数随记录一起更新）
+            self._save_exchange(chat_id, cookie_id, user_id, item_id, message, reply, intent)
+            
+            logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
+            return reply
+            
+        except Exception as e:
+            logger.error(f"AI回复生成失败 {cookie_id}: {e}")
+            self._log_request_error(e)
+            return None
 
-            # 6. 构建提示词
-            custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
-            system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
+    def _call_llm(self, settings: dict, cookie_id: str, messages: list, max_tokens: int, temperature: float) -> Optional[str]:
+        """根据API类型同步调用大模型，无可用客户端时返回None"""
+        if self._is_dashscope_api(settings):
+            logger.info(f"使用DashScope API生成回复")
+            return self._call_dashscope_api(settings, messages, max_tokens=max_tokens, temperature=temperature)
+        logger.info(f"使用OpenAI兼容API生成回复")
+        client = self.get_client(cookie_id)
+        if not client:
+            return None
+        return self._call_openai_api(client, settings, messages, max_tokens=max_tokens, temperature=temperature)
+
+    def _handle_fused_response(self, response_text: Optional[str], cookie_id: str) -> tuple:
+        """处理合并请求的结果，返回 (intent, reply)，解析失败时返回 (None, None) 以回退到两次请求"""
+        self.stats['fused_calls'] += 1
+        parsed = self._parse_fused_response(response_text) if response_text else None
+        if parsed is None:
+            self.stats['fused_fallbacks'] += 1
+            logger.warning(f"合并请求响应格式无效，回退到意图识别+回复 (账号: {cookie_id}): {response_text}")
+            return None, None
+        return parsed
+
+    # ==================== 异步链路（事件循环中使用） ====================
+
+    def _get_http_client(self, base_url: str) -> httpx.AsyncClient:
+        """获取base_url对应的共享httpx连接池"""
+        http_client = self.http_clients.get(base_url)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60),
+            )
+            self.http_clients[base_url] = http_client
+        return http_client
+
+    def get_async_client(self, settings: dict) -> AsyncOpenAI:
+        """获取AsyncOpenAI客户端（按 base_url + api_key 复用）"""
+        key = (settings['base_url'], settings['api_key'])
+        client = self.async_clients.get(key)
+        if client is None or client.is_closed():
+            client = AsyncOpenAI(
+                api_key=settings['api_key'],
+                base_url=settings['base_url'],
+                http_client=self._get_http_client(settings['base_url']),
+                max_retries=0
+            )
+            self.async_clients[key] = client
+            logger.info(f"创建AsyncOpenAI客户端: base_url={settings['base_url']}, api_key={'***' + settings['api_key'][-4:]}")
+        self.async_client_last_used[key] = time.time()
+        return client
+
+    def _get_account_semaphore(self, cookie_id: str) -> asyncio.Semaphore:
+        semaphore = self.account_semaphores.get(cookie_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrent_per_account)
+            self.account_semaphores[cookie_id] = semaphore
+        return semaphore
+
+    async def _call_dashscope_api_async(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7,
+                                        usage: dict = None) -> str:
+        """异步调用DashScope API"""
+        url, headers, data = self._build_dashscope_request(settings, messages, max_tokens, temperature)
+        response = await self._get_http_client('https://dashscope.aliyuncs.com').post(url, headers=headers, json=data)
+        return self._parse_dashscope_response(response.status_code, response.text, response.json, usage)
+
+    async def _call_openai_api_async(self, client: AsyncOpenAI, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7,
+                                     usage: dict = None) -> str:
+        """异步调用OpenAI兼容API"""
+        response = await client.chat.completions.create(
+            model=settings['model_name'],
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        if usage is not None and getattr(response, 'usage', None) is not None:
+            usage['total_tokens'] += int(response.usage.total_tokens or 0)
+        return response.choices[0].message.content.strip()
 
-            # 7. 构建商品信息
-            item_desc = f"商品标题: {item_info.get('title', '未知')}\n"
-            item_desc += f"商品价格: {item_info.get('price', '未知')}元\n"
-            item_desc += f"商品描述: {item_info.get('desc', '无')}"
+    async def _call_llm_async(self, settings: dict, messages: list, max_tokens: int, temperature: float,
+                              usage: dict = None) -> str:
+        """根据API类型异步调用大模型，超时后取消请求
 
-            # 8. 构建对话历史
-            context_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in context[-10:]])  # 最近10条
+        传入 usage 时，把接口返回的token用量累加到 usage['total_tokens']。
+        """
+        self.stats['llm_calls'] += 1
+        if self._is_dashscope_api(settings):
+            call = self._call_dashscope_api_async(settings, messages, max_tokens, temperature, usage)
+        else:
+            call = self._call_openai_api_async(self.get_async_client(settings), settings, messages, max_tokens, temperature,
+                                               usage)
+        return await asyncio.wait_for(call, timeout=self.request_timeout)
 
-            # 9. 构建用户消息
-            max_bargain_rounds = settings.get('max_bargain_rounds', 3)
-            max_discount_percent = settings.get('max_discount_percent', 10)
-            max_discount_amount = settings.get('max_discount_amount', 100)
+    async def is_ai_enabled_async(self, cookie_id: str) -> bool:
+        """检查指定账号是否启用AI回复（不阻塞事件循环）"""
+        settings = await async_db_manager.get_ai_reply_settings(cookie_id)
+        return settings['ai_enabled']
 
-            user_prompt = f"""商品信息：
-{item_desc}
+    async def detect_intent_async(self, message: str, cookie_id: str, settings: dict = None, usage: dict = None) -> str:
+        """异步检测用户消息意图"""
+        try:
+            if settings is None:
+                settings = await async_db_manager.get_ai_reply_settings(cookie_id)
+            if not settings['ai_enabled'] or not settings['api_key']:
+                return 'default'
 
-对话历史：
-{context_str}
+            messages = self._build_classify_messages(settings, message)
+            response_text = await self._call_llm_async(settings, messages, max_tokens=10, temperature=0.1, usage=usage)
+            return self._parse_intent(response_text)
 
-议价设置：
-- 当前议价次数：{bargain_count}
-- 最大议价轮数：{max_bargain_rounds}
-- 最大优惠百分比：{max_discount_percent}%
-- 最大优惠金额：{max_discount_amount}元
+        except asyncio.TimeoutError:
+            logger.error(f"意图检测超时 {cookie_id}: 超过 {self.request_timeout} 秒")
+            return 'default'
+        except Exception as e:
+            logger.error(f"意图检测失败 {cookie_id}: {e}")
+            self._log_request_error(e)
+            return 'default'
 
-用户消息：{message}
+    async def generate_reply_async(self, message: str, item_info: dict, chat_id: str,
+                                   cookie_id: str, user_id: str, item_id: str) -> Optional[str]:
+        """异步生成AI回复，与 generate_reply 行为一致，但不阻塞事件循环
 
-请根据以上信息生成回复："""
+        同一账号同时进行的生成请求数受 AI_MAX_CONCURRENT_PER_ACCOUNT 限制。
+        对同一商品的相同问题优先使用缓存的回复（见 utils/ai_reply_cache.py）。
+        """
+        try:
+            settings = await async_db_manager.get_ai_reply_settings(cookie_id)
+            if not settings['ai_enabled']:
+                return None
 
-            # 10. 调用AI生成回复
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+            if not self._is_dashscope_api(settings) and not settings['api_key']:
+                return None
 
-            # 根据API类型选择调用方式
-            if self._is_dashscope_api(settings):
-                logger.info(f"使用DashScope API生成回复")
-                reply = self._call_dashscope_api(settings, messages, max_tokens=100, temperature=0.7)
-            else:
-                logger.info(f"使用OpenAI兼容API生成回复")
-                client = self.get_client(cookie_id)
-                if not client:
-                    return None
-                reply = self._call_openai_api(client, settings, messages, max_tokens=100, temperature=0.7)
+            async with self._get_account_semaphore(cookie_id):
+                reply = None
+                generated = False
+                usage = {'total_tokens': 0}
+                cache_version = ai_reply_cache.version(settings, item_info)
+
+                # 非议价意图的回复与议价次数无关，命中时不需要意图识别和对话状态
+                cached = ai_reply_cache.get(cookie_id, item_id, message, cache_version)
+                if cached is not None:
+                    intent, reply = cached
+                    bargain_count = 0
+                else:
+                    intent = self._fast_intent(message, settings)
+
+                    if intent is None and not self.fused_mode:
+                        # 意图检测与对话历史、议价次数查询并行
+                        intent, (context, bargain_count) = await asyncio.gather(
+                            self.detect_intent_async(message, cookie_id, settings, usage),
+                            async_db_manager.run(self._load_chat_state, chat_id, cookie_id)
+                        )
+                    else:
+                        context, bargain_count = await async_db_manager.run(self._load_chat_state, chat_id, cookie_id)
+                        if intent is None:
+                            cached = ai_reply_cache.get(cookie_id, item_id, message, cache_version, bargain_count)
+                            if cached is not None:
+                                intent, reply = cached
+                            else:
+                                # 合并模式：一次请求同时得到意图和回复
+                                messages = self._build_fused_messages(settings, message, item_info, context, bargain_count)
+                                fused = await self._call_llm_async(settings, messages, max_tokens=150, temperature=0.7,
+                                                                   usage=usage)
+                                intent, reply = self._handle_fused_response(fused, cookie_id)
+                                generated = reply is not None
+                                if intent is None:
+                                    intent = await self.detect_intent_async(message, cookie_id, settings, usage)
+
+                    # 议价意图的回复按当前议价次数查找
+                    if reply is None and intent == 'price':
+                        cached = ai_reply_cache.get(cookie_id, item_id, message, cache_version, bargain_count)
+                        if cached is not None:
+                            reply = cached[1]
+                logger.info(f"检测到意图: {intent} (账号: {cookie_id})")
+
+                if self._bargain_limit_reached(settings, intent, bargain_count):
+                    refuse_reply = self.REFUSE_BARGAIN_REPLY
+                    await async_db_manager.run(self._save_exchange, chat_id, cookie_id, user_id, item_id,
+                                               message, refuse_reply, intent)
+                    return refuse_reply
 
-            # 11. 保存对话记录
-            self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
-            self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", reply, intent)
+                if reply is None:
+                    messages = self._build_reply_messages(settings, intent, message, item_info, context, bargain_count)
+                    reply = await self._call_llm_async(settings, messages, max_tokens=100, temperature=0.7, usage=usage)
+                    generated = True
+
+                if generated:
+                    ai_reply_cache.put(cookie_id, item_id, message, cache_version, intent, bargain_count,
+                                       reply, usage['total_tokens'])
+
+            await async_db_manager.run(self._save_exchange, chat_id, cookie_id, user_id, item_id,
+                                       message, reply, intent)
 
-            # 12. 更新议价次数
-            if intent == "price":
-                self.increment_bargain_count(chat_id, cookie_id)
-            
             logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
             return reply
-            
+
+        except asyncio.TimeoutError:
+            logger.error(f"AI回复生成超时 {cookie_id}: 超过 {self.request_timeout} 秒")
+            return None
         except Exception as e:
             logger.error(f"AI回复生成失败 {cookie_id}: {e}")
-            # 打印更详细的错误信息
-            if hasattr(e, 'response') and hasattr(e.response, 'url'):
-                logger.error(f"请求URL: {e.response.url}")
-            if hasattr(e, 'request') and hasattr(e.request, 'url'):
-                logger.error(f"请求URL: {e.request.url}")
+            self._log_request_error(e)
             return None
-    
+
+    def _load_chat_state(self, chat_id: str, cookie_id: str):
+        """读取对话历史和议价次数（优先使用内存缓存，未命中时查询数据库）"""
+        try:
+            return conversation_cache.load(
+                cookie_id, chat_id,
+                lambda: db_manager.get_ai_conversation_state(chat_id, cookie_id, conversation_cache.history_size)
+            )
+        except Exception as e:
+            logger.error(f"获取对话上下文失败: {e}")
+            return [], 0
+
+    def _save_exchange(self, chat_id: str, cookie_id: str, user_id: str, item_id: str,
+                       message: str, reply: str, intent: str):
+        """在一个事务中保存一问一答，并同步到缓存"""
+        records = [
+            (cookie_id, chat_id, user_id, item_id, "user", message, intent),
+            (cookie_id, chat_id, user_id, item_id, "assistant", reply, intent),
+        ]
+        if db_manager.add_ai_conversations(records):
+            conversation_cache.append(cookie_id, chat_id, [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": reply},
+            ], bargain_delta=1 if intent == "price" else 0)
+
     def get_conversation_context(self, chat_id: str, cookie_id: str, limit: int = 20) -> List[Dict]:
         """获取对话上下文"""
+        if limit <= conversation_cache.history_size:
+            context, _ = self._load_chat_state(chat_id, cookie_id)
+            return context[-limit:] if limit > 0 else []
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                SELECT role, content FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? 
-                ORDER BY created_at DESC LIMIT ?
-                ''', (chat_id, cookie_id, limit))
-                
-                results = cursor.fetchall()
-                # 反转顺序，使其按时间正序
-                context = [{"role": row[0], "content": row[1]} for row in reversed(results)]
-                return context
+            context, _ = db_manager.get_ai_conversation_state(chat_id, cookie_id, limit)
+            return context
         except Exception as e:
             logger.error(f"获取对话上下文失败: {e}")
             return []
@@ -340,37 +667,18 @@ class AIReplyEngine:
     def save_conversation(self, chat_id: str, cookie_id: str, user_id: str, 
                          item_id: str, role: str, content: str, intent: str = None):
         """保存对话记录"""
-        try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                INSERT INTO ai_conversations 
-                (cookie_id, chat_id, user_id, item_id, role, content, intent)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (cookie_id, chat_id, user_id, item_id, role, content, intent))
-                db_manager.conn.commit()
-        except Exception as e:
-            logger.error(f"保存对话记录失败: {e}")
+        if db_manager.add_ai_conversations([(cookie_id, chat_id, user_id, item_id, role, content, intent)]):
+            conversation_cache.append(cookie_id, chat_id, [{"role": role, "content": content}],
+                                      bargain_delta=1 if intent == "price" and role == "user" else 0)
     
     def get_bargain_count(self, chat_id: str, cookie_id: str) -> int:
         """获取议价次数"""
-        try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                SELECT COUNT(*) FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? AND intent = 'price' AND role = 'user'
-                ''', (chat_id, cookie_id))
-                
-                result = cursor.fetchone()
-                return result[0] if result else 0
-        except Exception as e:
-            logger.error(f"获取议价次数失败: {e}")
-            return 0
+        _, bargain_count = self._load_chat_state(chat_id, cookie_id)
+        return bargain_count
     
     def increment_bargain_count(self, chat_id: str, cookie_id: str):
         """增加议价次数（通过保存记录自动增加）"""
-        # 议价次数通过查询price意图的用户消息数量来计算，无需单独操作
+        # 议价次数随price意图的用户消息一起写入，缓存中的计数在保存记录时同步增加，无需单独操作
         pass
     
     def clear_client_cache(self, cookie_id: str = None):
@@ -405,6 +713,15 @@ class AIReplyEngine:
                 self.clients.pop(cookie_id, None)
                 self.client_last_used.pop(cookie_id, None)
                 self.agents.pop(cookie_id, None)
+
+            # 清理过期的AsyncOpenAI包装（共享的httpx连接池保留）
+            expired_async = [
+                key for key, last_used in self.async_client_last_used.items()
+                if current_time - last_used > max_idle_seconds
+            ]
+            for key in expired_async:
+                self.async_clients.pop(key, None)
+                self.async_client_last_used.pop(key, None)
             
             if expired_clients:
                 logger.info(f"AI回复引擎：清理了 {len(expired_clients)} 个长时间未使用的客户端")
@@ -0,0 +1,84 @@
+"""性能基准脚本
+
+在项目根目录运行，例如：
+
+    python -m benchmarks.keyword_matcher
+
+每个脚本对比优化前后的实现（优化前的逻辑在脚本中按原实现重写），并校验两者结果一致。
+需要数据库的脚本使用临时目录中的数据库，不会修改项目目录下的数据。
+"""
+
+import os
+import sys
+import tempfile
+
+
+def use_temp_db(name: str = 'bench.db') -> str:
+    """把 DB_PATH 指向新建的临时目录并关闭SQL日志，返回数据库路径（需要在导入 db_manager 之前调用）"""
+    path = os.path.join(tempfile.mkdtemp(prefix='xianyu-bench-'), name)
+    os.environ['DB_PATH'] = path
+    os.environ['SQL_LOG_ENABLED'] = 'false'
+    return path
+
+
+def quiet_logs(level: str = 'WARNING'):
+    """只输出 level 及以上的日志，避免日志影响计时"""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=level)
+
+
+async def run_with_loop_lag(coro, interval: float = 0.005):
+    """运行 coro，同时测量事件循环被阻塞的程度，返回 (结果, 最大调度延迟秒数)
+
+    后台任务每隔 interval 秒醒来一次，实际醒来时间与预期之差即为调度延迟。
+    """
+    import asyncio
+    import time
+
+    max_lag = 0.0
+    expected = time.perf_counter() + interval
+
+    async def monitor():
+        nonlocal max_lag, expected
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+
+    task = asyncio.create_task(monitor())
+    await asyncio.sleep(0)
+    try:
+        result = await coro
+    finally:
+        task.cancel()
+    # coro 结束时监测任务可能还没来得及醒来（例如一直被同步调用阻塞到最后）
+    return result, max(max_lag, time.perf_counter() - expected)
+
+
+def start_mock_server(app) -> str:
+    """在后台线程的独立事件循环中运行 aiohttp 应用，返回 http://127.0.0.1:端口
+
+    模拟服务不受被测事件循环阻塞的影响（同步调用阻塞事件循环时服务仍能响应）。
+    """
+    import asyncio
+    import threading
+    from aiohttp import web
+
+    started = threading.Event()
+    address = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        address['url'] = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+    return address['url']
@@ -0,0 +1,94 @@
+"""推送确认延迟：在消息处理任务中确认（原实现） vs 在接收循环中确认
+
+    python -m benchmarks.ack_latency [--frames 3000] [--rate 600] [--concurrency 100]
+
+按 rate 帧/秒回放推送帧，每帧的处理耗时服从对数正态分布（中位数约0.3秒），处理任务受 Semaphore(concurrency) 限制。
+原实现在获得信号量后的处理任务中发送确认，之后改为在接收循环中调用 XianyuLive._queue_ack，
+由 _ack_sender 按接收顺序发送。统计从收到帧到确认帧写出的延迟。
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+
+from benchmarks import quiet_logs, use_temp_db
+
+
+class RecordingWebSocket:
+    """记录每个确认帧相对于对应推送帧接收时间的延迟"""
+
+    def __init__(self, frame_codec):
+        self.frame_codec = frame_codec
+        self.received_at = {}
+        self.latencies = []
+
+    async def send(self, frame):
+        await asyncio.sleep(0)
+        mid = self.frame_codec.loads(frame)['headers']['mid']
+        self.latencies.append(time.perf_counter() - self.received_at[mid])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=3000, help="回放的推送帧数")
+    parser.add_argument('--rate', type=float, default=600, help="每秒到达的帧数")
+    parser.add_argument('--concurrency', type=int, default=100, help="同时处理的消息数（信号量大小）")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    use_temp_db()
+    quiet_logs()
+    from XianyuAutoAsync import XianyuLive
+    from utils import frame_codec
+    # XianyuAutoAsync 导入时会重新配置日志（并创建 logs 目录）
+    quiet_logs()
+
+    rng = random.Random(args.seed)
+    work = [rng.lognormvariate(-1.2, 0.9) for _ in range(args.frames)]
+    frames = [frame_codec.dumps({"headers": {"mid": f"{i} 0", "sid": "s", "app-key": "k", "dt": "j"},
+                                 "lwp": "/s/para", "body": {}}) for i in range(args.frames)]
+
+    async def replay(websocket, ack_in_loop: bool):
+        live = XianyuLive.__new__(XianyuLive)
+        live.cookie_id = 'bench'
+        live.background_tasks = set()
+        live._ack_queue = deque()
+        live._ack_task = None
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def handle(message_data, i):
+            async with semaphore:
+                if not ack_in_loop:
+                    await websocket.send(frame_codec.encode_ack(message_data["headers"]))
+                await asyncio.sleep(work[i])
+
+        tasks = []
+        for i, frame in enumerate(frames):
+            message_data = frame_codec.loads(frame)
+            websocket.received_at[message_data['headers']['mid']] = time.perf_counter()
+            if ack_in_loop:
+                live._queue_ack(websocket, message_data)
+            tasks.append(asyncio.create_task(handle(message_data, i)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks, *live.background_tasks)
+
+    print(f"{args.frames} 帧，{args.rate:.0f} 帧/秒，Semaphore({args.concurrency})，"
+          f"处理耗时中位数 {percentile(work, 50) * 1000:.0f} ms")
+    for name, ack_in_loop in (("处理任务中确认（原实现）", False), ("接收循环中确认", True)):
+        websocket = RecordingWebSocket(frame_codec)
+        asyncio.run(replay(websocket, ack_in_loop))
+        latencies = [value * 1000 for value in websocket.latencies]
+        print(f"{name:<14} 确认 {len(latencies)} 帧  p50 {percentile(latencies, 50):8.2f} ms  "
+              f"p90 {percentile(latencies, 90):8.2f} ms  p99 {percentile(latencies, 99):8.2f} ms  "
+              f"max {max(latencies):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""AI回复：在事件循环中调用同步的 generate_reply（原实现） vs generate_reply_async
+
+    python -m benchmarks.ai_reply [--requests 40] [--accounts 10] [--latency 0.2]
+
+本地模拟 OpenAI 兼容接口，每次补全耗时 latency 秒。多个账号同时收到需要AI回复的消息，
+统计全部回复完成的耗时，以及期间事件循环的最大调度延迟（其他账号的心跳、收发消息都会被推迟这么久）。
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import quiet_logs, run_with_loop_lag, start_mock_server, use_temp_db
+
+
+def create_app(latency: float):
+    from aiohttp import web
+
+    async def completions(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        # 意图识别请求 max_tokens=10，其余为回复
+        content = 'tech' if body.get('max_tokens') == 10 else "可以正常使用的，拍下后按说明操作即可"
+        return web.json_response({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": body['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        })
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', completions)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=40, help="同时需要AI回复的消息数")
+    parser.add_argument('--accounts', type=int, default=10, help="账号数")
+    parser.add_argument('--latency', type=float, default=0.2, help="模拟接口每次补全的耗时（秒）")
+    args = parser.parse_args()
+
+    use_temp_db()
+    quiet_logs('ERROR')
+    from ai_reply_engine import AIReplyEngine
+    from db_manager import db_manager
+
+    base_url = start_mock_server(create_app(args.latency)) + '/v1'
+    accounts = [f"bench{i}" for i in range(args.accounts)]
+    for cookie_id in accounts:
+        db_manager.save_cookie(cookie_id, 'unb=1; cookie2=x', 1)
+        db_manager.save_ai_reply_settings(cookie_id, {
+            'ai_enabled': True, 'model_name': 'bench-model', 'api_key': 'sk-bench', 'base_url': base_url,
+        })
+    item_info = {'title': "测试商品", 'price': 10, 'desc': "测试商品描述"}
+
+    def request_args(i):
+        # 每条消息的问题和商品都不同，不命中AI回复缓存
+        cookie_id = accounts[i % len(accounts)]
+        return (f"这个怎么安装？第{i}个问题", item_info, f"chat{i}", cookie_id, f"user{i}", f"item{i}")
+
+    async def sync_on_loop():
+        engine = AIReplyEngine()
+        engine.fast_intent_enabled = False
+
+        async def one(i):
+            # 原 get_ai_reply 直接在协程中调用同步方法
+            return engine.generate_reply(*request_args(i))
+
+        return await asyncio.gather(*(one(i) for i in range(args.requests)))
+
+    async def pooled_async():
+        engine = AIReplyEngine()
+        engine.fast_intent_enabled = False
+        try:
+            return await asyncio.gather(*(engine.generate_reply_async(*request_args(i))
+                                          for i in range(args.requests)))
+        finally:
+            for client in engine.http_clients.values():
+                await client.aclose()
+
+    print(f"{args.requests} 条消息，{args.accounts} 个账号，模拟接口每次补全 {args.latency * 1000:.0f} ms"
+          f"（每条回复两次请求：意图识别 + 生成回复）")
+    for name, run in (("同步调用（原实现）", sync_on_loop), ("generate_reply_async", pooled_async)):
+        start = time.perf_counter()
+        replies, max_lag = asyncio.run(run_with_loop_lag(run()))
+        wall = time.perf_counter() - start
+        ok = sum(1 for reply in replies if reply)
+        print(f"{name:<20} 总耗时 {wall:6.2f} s  最大事件循环延迟 {max_lag * 1000:8.0f} ms  成功 {ok}/{len(replies)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""数据库读写争用：读操作经过写锁和写连接（原实现） vs WAL读连接池
+
+    python -m benchmarks.db_reads [--reads 2000] [--hold-ms 20]
+
+写线程不断执行持有写锁 hold-ms 毫秒的写事务（模拟API线程的批量写入），
+读线程交替调用 get_keywords_with_type（500条）和 get_cookie_details，统计读延迟。
+关闭 wal_enabled 后 _read_cursor 沿用写连接并等待写锁，与原实现的读路径相同。
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks import quiet_logs, use_temp_db
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(db, reads: int, hold: float):
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            with db.lock:
+                cursor = db.conn.cursor()
+                cursor.execute("UPDATE cookies SET remark = ? WHERE id = 'bench'", (str(time.time()),))
+                time.sleep(hold)
+                db.conn.commit()
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    latencies = []
+    try:
+        for i in range(reads):
+            start = time.perf_counter()
+            if i % 2:
+                db.get_cookie_details('bench')
+            else:
+                db.get_keywords_with_type('bench')
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        stop.set()
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reads', type=int, default=2000, help="读操作次数")
+    parser.add_argument('--hold-ms', type=float, default=20, help="每个写事务持有写锁的时间（毫秒）")
+    parser.add_argument('--keywords', type=int, default=500, help="账号的关键词数量")
+    args = parser.parse_args()
+
+    use_temp_db()
+    quiet_logs()
+    from db_manager import db_manager
+
+    db_manager.save_cookie('bench', 'unb=1; cookie2=x', 1)
+    db_manager.save_keywords('bench', [(f"关键词{i}", f"回复{i}") for i in range(args.keywords)])
+    assert len(db_manager.get_keywords_with_type('bench')) == args.keywords
+
+    wal_enabled = db_manager.wal_enabled
+    print(f"WAL: {wal_enabled}，读连接池: {db_manager.read_pool_size}，写事务持锁 {args.hold_ms} ms")
+    results = {}
+    try:
+        db_manager.wal_enabled = False
+        results['写锁+写连接（原实现）'] = run(db_manager, args.reads, args.hold_ms / 1000)
+    finally:
+        db_manager.wal_enabled = wal_enabled
+    if wal_enabled:
+        results['WAL读连接池'] = run(db_manager, args.reads, args.hold_ms / 1000)
+
+    for name, latencies in results.items():
+        print(f"{name:<16} p50 {statistics.median(latencies):7.2f} ms  p99 {percentile(latencies, 99):7.2f} ms  "
+              f"max {max(latencies):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
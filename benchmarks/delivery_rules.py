@@ -0,0 +1,113 @@
+"""发货规则匹配：双向 LIKE 的SQL查询（原实现） vs DeliveryRuleIndex
+
+    python -m benchmarks.delivery_rules [--rules 5000] [--texts 200]
+
+每条商品文本依次执行按规格匹配和按关键词匹配（_auto_delivery 的两步），
+分别用原来的SQL查询和内存索引计时，并比较返回的规则ID顺序。
+分两组关键词：3-12个字的常见商品词，以及1-2个字的短关键词（每条文本命中上千条规则）。
+"""
+
+import argparse
+import random
+import string
+import time
+
+from benchmarks import quiet_logs, use_temp_db
+
+WORDS = ["会员", "月卡", "年卡", "激活码", "教程", "资料", "课程", "模板", "素材", "账号", "兑换码", "网盘",
+         "VIP", "Pro", "Office", "Windows", "Steam", "Netflix", "ChatGPT", "Adobe", "视频", "音乐", "字体",
+         "合集", "全套", "永久", "高清", "无水印", "电子版", "PDF", "源码", "插件", "主题", "壁纸"]
+CHARS = string.ascii_letters + "的一是在不了有和人这中大为上个我以要他时来用们生到作地出就分对成会可也你"
+SPECS = [("版本", "标准版"), ("版本", "专业版"), ("时长", "1个月"), ("时长", "12个月")]
+
+
+def realistic_keyword(rng):
+    while True:
+        keyword = ''.join(rng.sample(WORDS, rng.randint(1, 3)))
+        if 3 <= len(keyword) <= 12:
+            return keyword
+
+
+def setup(db, rng, rules: int, short: bool):
+    cursor = db.conn.cursor()
+    cursor.execute("DELETE FROM delivery_rules")
+    cursor.execute("DELETE FROM cards")
+    db.conn.commit()
+    card_ids = []
+    for i in range(50):
+        spec = SPECS[i % len(SPECS)] if i % 3 == 0 else (None, None)
+        card_ids.append(db.create_card(f"卡券{i}", 'text', text_content=f"卡密{i}", is_multi_spec=spec[0] is not None,
+                                       spec_name=spec[0], spec_value=spec[1], user_id=1))
+    keywords = [''.join(rng.choice(CHARS) for _ in range(rng.randint(1, 2))) if short else realistic_keyword(rng)
+                for _ in range(rules)]
+    cursor.executemany('''
+    INSERT INTO delivery_rules (keyword, card_id, delivery_count, enabled, delivery_times, user_id)
+    VALUES (?, ?, 1, 1, ?, 1)
+    ''', [(keyword, rng.choice(card_ids), rng.randint(0, 20)) for keyword in keywords])
+    db.conn.commit()
+
+
+def search_texts(rng, count: int, short: bool):
+    texts = []
+    for _ in range(count):
+        if short:
+            texts.append(''.join(rng.choice(CHARS) for _ in range(rng.randint(20, 60))))
+        else:
+            words = rng.sample(WORDS, rng.randint(2, 6))
+            if rng.random() < 0.2:
+                words = [w.upper() for w in words]
+            texts.append(' '.join(words))
+    return texts
+
+
+def run(db, texts, specs, lookup_spec, lookup_keyword):
+    results = []
+    start = time.perf_counter()
+    for text, (spec_name, spec_value) in zip(texts, specs):
+        by_spec = lookup_spec(text, spec_name, spec_value)
+        by_keyword = lookup_keyword(text)
+        results.append(([r['id'] for r in by_spec], [r['id'] for r in by_keyword]))
+    return (time.perf_counter() - start) / len(texts) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=5000, help="发货规则数量")
+    parser.add_argument('--texts', type=int, default=200, help="商品文本数量")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    use_temp_db()
+    quiet_logs()
+    from db_manager import db_manager
+    from utils.delivery_rule_index import DeliveryRuleIndex
+
+    rng = random.Random(args.seed)
+    failed = False
+    print(f"发货规则 {args.rules} 条，商品文本 {args.texts} 条（每条含按规格匹配和按关键词匹配）")
+    for label, short in (("常见商品词（3-12字）", False), ("短关键词（1-2字）", True)):
+        setup(db_manager, rng, args.rules, short)
+        texts = search_texts(rng, args.texts, short)
+        specs = [rng.choice(SPECS) for _ in texts]
+
+        sql_ms, sql_results = run(db_manager, texts, specs, db_manager.get_delivery_rules_by_keyword_and_spec,
+                                  db_manager.get_delivery_rules_by_keyword)
+        start = time.perf_counter()
+        index = DeliveryRuleIndex(db_manager.get_enabled_delivery_rules_with_cards())
+        build_ms = (time.perf_counter() - start) * 1000
+        index_ms, index_results = run(db_manager, texts, specs, index.match_by_keyword_and_spec,
+                                      index.match_by_keyword)
+
+        mismatches = sum(1 for a, b in zip(sql_results, index_results) if a != b)
+        hits = sum(len(r[1]) for r in index_results) / len(texts)
+        failed = failed or bool(mismatches)
+        print(f"{label}: 平均每条命中 {hits:.0f} 条规则")
+        print(f"  SQL查询  {sql_ms:8.2f} ms/条")
+        print(f"  内存索引 {index_ms:8.2f} ms/条（构建 {build_ms:.0f} ms）")
+        print(f"  结果不一致: {mismatches} 条")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""WebSocket 帧编解码：标准库 json（原实现） vs utils.frame_codec
+
+    python -m benchmarks.frame_codec [--number 20000]
+
+对心跳、确认(ack)、文本内容Base64、发送消息帧和解析推送帧分别计时，并校验两种方式的结果解析后一致。
+设置环境变量 FRAME_JSON_BACKEND=json 可以测试未安装 orjson 时的模板编码。
+"""
+
+import argparse
+import base64
+import json
+import timeit
+
+from benchmarks import quiet_logs
+
+TEXT = "您好，宝贝还在的，拍下后自动发货，有问题随时联系~"
+ACK_HEADERS = {
+    "sid": "a1b2c3d4e5f6",
+    "app-key": "444e9908a51d1cb236a27862abc769c9",
+    "ua": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) DingTalk(2.1.5) DingWeb/2.1.5 IMPaaS",
+    "dt": "j",
+}
+
+
+def build_cases(frame_codec, mid: str):
+    """返回 [(帧类型, 原实现, 当前实现, 比较前的还原函数)]"""
+    heartbeat = {"lwp": "/!", "headers": {"mid": mid}}
+    ack_headers = {"mid": mid, **ACK_HEADERS}
+    send_frame = {
+        "lwp": "/r/MessageSend/sendByReceiverScope",
+        "headers": {"mid": mid},
+        "body": [
+            {
+                "uuid": "-17290000000001", "cid": "47983389096@goofish", "conversationType": 1,
+                "content": {"contentType": 101, "custom": {"type": 1, "data": frame_codec.encode_text_content(TEXT)}},
+                "redPointPolicy": 0, "extension": {"extJson": "{}"},
+                "ctx": {"appVersion": "1.0", "platform": "web"}, "mtags": {}, "msgReadStatusSetting": 1,
+            },
+            {"actualReceivers": ["3149637063@goofish", "2202640918079@goofish"]},
+        ],
+    }
+    push_frame = json.dumps({
+        "headers": {"mid": mid, "sid": "a1b2c3d4e5f6", "app-key": ack_headers["app-key"], "dt": "j"},
+        "lwp": "/s/para",
+        "body": {"syncPushPackage": {"data": [{
+            "bizType": 370, "data": "ggGLAYEBsjMxNDk2MzcwNjNAZ29vZmlzaAKzNDc5ODMzODkwOTZAZ29vZmlzaA" * 30,
+            "objectType": 40000, "streamId": "1", "pts": 1729000000000000, "seq": 12,
+        }]}},
+    })
+
+    def old_ack():
+        ack = {"code": 200, "headers": {"mid": ack_headers["mid"], "sid": ack_headers["sid"]}}
+        for key in ("app-key", "ua", "dt"):
+            if key in ack_headers:
+                ack["headers"][key] = ack_headers[key]
+        return json.dumps(ack)
+
+    def decode_base64(data):
+        return json.loads(base64.b64decode(data))
+
+    return [
+        ('心跳', lambda: json.dumps(heartbeat), lambda: frame_codec.encode_heartbeat(mid), json.loads),
+        ('确认(ack)', old_ack, lambda: frame_codec.encode_ack(ack_headers), json.loads),
+        ('文本内容Base64',
+         lambda: str(base64.b64encode(json.dumps({"contentType": 1, "text": {"text": TEXT}}).encode('utf-8')), 'utf-8'),
+         lambda: frame_codec.encode_text_content(TEXT), decode_base64),
+        ('发送消息帧', lambda: json.dumps(send_frame), lambda: frame_codec.dumps(send_frame), json.loads),
+        ('解析推送帧', lambda: json.loads(push_frame), lambda: frame_codec.loads(push_frame), None),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help="每项的执行次数")
+    args = parser.parse_args()
+
+    quiet_logs()
+    from utils import frame_codec
+    from utils.xianyu_utils import generate_mid
+
+    cases = build_cases(frame_codec, generate_mid())
+    print(f"JSON后端: {frame_codec.JSON_BACKEND}，每项 {args.number} 次")
+    print(f"{'帧类型':<14} {'标准库json':>12} {frame_codec.JSON_BACKEND:>12}  结果一致")
+    failed = False
+    for name, old, new, restore in cases:
+        same = (restore(old()) == restore(new())) if restore else old() == new()
+        failed = failed or not same
+        old_us = timeit.timeit(old, number=args.number) / args.number * 1e6
+        new_us = timeit.timeit(new, number=args.number) / args.number * 1e6
+        print(f"{name:<14} {old_us:10.2f}us {new_us:10.2f}us  {same}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""关键词匹配：逐条扫描（原 get_keyword_reply） vs 预编译的 KeywordMatcher
+
+    python -m benchmarks.keyword_matcher [--keywords 10000] [--messages 2000]
+
+原实现每条消息都从数据库读取关键词并扫描两遍，这里只比较扫描部分（不含数据库读取）。
+"""
+
+import argparse
+import random
+import string
+import time
+
+from utils.keyword_matcher import KeywordMatcher
+
+CHARS = string.ascii_letters + "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可也你"
+
+
+def legacy_match(keywords, send_message, item_id=None):
+    """原 get_keyword_reply 的匹配顺序：先商品专属关键词，再通用关键词，取最靠前的一条"""
+    if item_id:
+        for keyword_data in keywords:
+            if keyword_data['item_id'] == item_id and keyword_data['keyword'].lower() in send_message.lower():
+                return keyword_data
+    for keyword_data in keywords:
+        if not keyword_data['item_id'] and keyword_data['keyword'].lower() in send_message.lower():
+            return keyword_data
+    return None
+
+
+def random_text(rng, min_len, max_len):
+    return ''.join(rng.choice(CHARS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keywords', type=int, default=10000, help="关键词数量")
+    parser.add_argument('--item-ratio', type=float, default=0.4, help="绑定商品的关键词比例")
+    parser.add_argument('--messages', type=int, default=2000, help="消息数量")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    item_ids = [str(600000000000 + i) for i in range(200)]
+    keywords = [{
+        'keyword': random_text(rng, 2, 6),
+        'reply': f"回复{i}",
+        'item_id': rng.choice(item_ids) if rng.random() < args.item_ratio else None,
+        'type': 'text',
+        'image_url': None,
+    } for i in range(args.keywords)]
+
+    messages = []
+    for _ in range(args.messages):
+        text = random_text(rng, 5, 40)
+        if rng.random() < 0.5:
+            # 一半消息包含某个关键词（大小写随机），另一半多数不命中
+            keyword = rng.choice(keywords)['keyword']
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + (keyword.upper() if rng.random() < 0.3 else keyword) + text[pos:]
+        messages.append((text, rng.choice(item_ids) if rng.random() < 0.7 else None))
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    legacy = [legacy_match(keywords, text, item_id) for text, item_id in messages]
+    legacy_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    compiled = [matcher.match(text, item_id) for text, item_id in messages]
+    compiled_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    mismatches = sum(1 for a, b in zip(legacy, compiled) if a is not b)
+    hits = sum(1 for r in compiled if r is not None)
+    print(f"关键词 {args.keywords} 条（{args.item_ratio:.0%} 绑定商品），消息 {len(messages)} 条，命中 {hits} 条")
+    print(f"构建自动机: {build_ms:.1f} ms")
+    print(f"逐条扫描:   {legacy_us:8.1f} us/条")
+    print(f"自动机匹配: {compiled_us:8.1f} us/条")
+    print(f"结果不一致: {mismatches} 条")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
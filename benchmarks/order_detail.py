@@ -0,0 +1,118 @@
+"""订单详情获取：在事件循环中同步请求（原实现） vs 账号共享的 MtopClient 连接池
+
+    python -m benchmarks.order_detail [--orders 20] [--latency 0.2] [--fail-every 7]
+
+本地模拟 mtop 接口，每次请求耗时 latency 秒，每 fail-every 个请求返回一次 503。
+同一账号同时查询多个订单，统计总耗时、事件循环的最大调度延迟、成功数和使用的连接数，
+并检查两种方式解析出的订单数据一致（时间戳除外）。
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import quiet_logs, run_with_loop_lag, start_mock_server, use_temp_db
+
+COOKIES = "unb=2200000000001; _m_h5_tk=0123456789abcdef0123456789abcdef_1729000000000; cookie2=bench"
+RESPONSE = {"ret": ["SUCCESS::调用成功"], "data": {"components": [
+    {"render": "addressInfoVO", "data": {"name": "张三", "phoneNumber": "138****0000", "address": "北京市朝阳区"}},
+    {"render": "orderInfoVO", "data": {
+        "itemInfo": {"title": "颜色", "skuInfo": "红色", "buyAmount": 2, "price": "9.90"},
+        "priceInfo": {"amount": {"value": "19.80"}},
+        "orderInfoList": [{"title": "买家昵称", "value": "bench_buyer"}],
+    }},
+]}}
+
+
+def create_app(latency: float, fail_every: int, counters: dict):
+    from aiohttp import web
+
+    async def mtop(request):
+        counters['requests'] += 1
+        seq = counters['requests']
+        counters['connections'].add(request.transport.get_extra_info('peername'))
+        await asyncio.sleep(latency)
+        if fail_every and seq % fail_every == 0:
+            return web.Response(status=503, text="service unavailable")
+        return web.json_response(RESPONSE)
+
+    app = web.Application()
+    app.router.add_post('/h5/{api:.*}', mtop)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=20, help="同时查询的订单数")
+    parser.add_argument('--latency', type=float, default=0.2, help="模拟接口每次请求的耗时（秒）")
+    parser.add_argument('--fail-every', type=int, default=7, help="每多少个请求返回一次503，0表示不失败")
+    args = parser.parse_args()
+
+    use_temp_db()
+    # 模拟的503会产生预期内的错误日志
+    quiet_logs('CRITICAL')
+    from utils import mtop_client
+    from utils.mtop_client import MtopClient
+    from utils.order_detail_fetcher import OrderDetailAPIFetcher, fetch_order_detail_api
+
+    counters = {'requests': 0, 'connections': set()}
+    base_url = start_mock_server(create_app(args.latency, args.fail_every, counters)) + '/h5'
+    mtop_client.MTOP_BASE_URL = base_url
+    order_ids = [f"25036881263566{i:05d}" for i in range(args.orders)]
+
+    async def sync_on_loop():
+        async def one(order_id):
+            # 原 fetch_order_detail：每个订单新建 requests 会话，在事件循环中同步请求
+            fetcher = OrderDetailAPIFetcher(COOKIES)
+            fetcher.base_url = base_url
+            try:
+                return fetcher.fetch_order_detail_sync(order_id)
+            except Exception:
+                return None
+            finally:
+                if fetcher._session is not None:
+                    fetcher._session.close()
+
+        return await asyncio.gather(*(one(order_id) for order_id in order_ids))
+
+    async def pooled_async():
+        client = MtopClient(None, COOKIES)
+        try:
+            results = await asyncio.gather(*(fetch_order_detail_api(order_id, use_cache=False, mtop_client=client)
+                                             for order_id in order_ids))
+            return results, client.get_stats()
+        finally:
+            await client.close()
+
+    print(f"{args.orders} 个订单，模拟接口每次请求 {args.latency * 1000:.0f} ms，"
+          f"每 {args.fail_every} 个请求返回一次503")
+    outputs = {}
+    for name, run in (("同步请求（原实现）", sync_on_loop), ("MtopClient连接池", pooled_async)):
+        counters['requests'] = 0
+        counters['connections'] = set()
+        start = time.perf_counter()
+        results, max_lag = asyncio.run(run_with_loop_lag(run()))
+        wall = time.perf_counter() - start
+        stats = None
+        if isinstance(results, tuple):
+            results, stats = results
+        outputs[name] = results
+        ok = sum(1 for result in results if result)
+        line = (f"{name:<14} 总耗时 {wall:5.2f} s  最大事件循环延迟 {max_lag * 1000:6.0f} ms  成功 {ok}/{len(results)}  "
+                f"请求 {counters['requests']} 次  连接 {len(counters['connections'])} 个")
+        if stats:
+            line += f"  重试 {stats['retries']} 次"
+        print(line)
+
+    def by_order(results):
+        return {r['order_id']: {key: value for key, value in r.items() if key != 'timestamp'} for r in results if r}
+
+    sync_ok, async_ok = (by_order(results) for results in outputs.values())
+    same = all(sync_ok[order_id] == async_ok[order_id] for order_id in sync_ok.keys() & async_ok.keys())
+    print(f"解析结果一致（时间戳除外）: {same}")
+    if not same:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""多进程账号分片：一致性哈希的账号迁移量，以及分片数对处理吞吐的影响
+
+    python -m benchmarks.sharding [--accounts 10000] [--shards 4] [--processes 1,2,4]
+
+第一部分：增加或删除一个分片时需要迁移的账号比例，与按 hash % N 取模分配对比，
+并校验一致性哈希只迁移必要的账号（增加时只迁入新分片，删除时只迁出被删除的分片）。
+第二部分：按 HashRing 把账号分给 N 个进程，每个账号处理 frames 个同步包
+（frame_codec.loads + decrypt_to_dict + 关键词匹配），统计每秒处理的帧数。
+1 个进程对应单进程模式下所有账号共用一个核心的情况。
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from benchmarks import quiet_logs, use_temp_db
+
+KEYWORDS = ["包邮", "还在吗", "便宜", "发货", "链接", "尺寸", "优惠", "拍下", "付款", "退款"]
+
+
+def movement(before, after, cookie_ids):
+    return [cookie_id for cookie_id in cookie_ids if before(cookie_id) != after(cookie_id)]
+
+
+def report_movement(accounts: int, shards: int, vnodes: int) -> bool:
+    from utils.sharding import HashRing
+
+    cookie_ids = [f"cookie{i}" for i in range(accounts)]
+    ring = HashRing(range(shards), vnodes=vnodes)
+    counts = [0] * shards
+    for cookie_id in cookie_ids:
+        counts[ring.get(cookie_id)] += 1
+    print(f"{accounts} 个账号，{shards} 个分片（每个 {vnodes} 个虚拟节点），"
+          f"每个分片 {min(counts)}~{max(counts)} 个账号（平均 {accounts // shards}）")
+
+    def modulo(n):
+        return lambda cookie_id: HashRing._hash(cookie_id) % n
+
+    grown = HashRing(range(shards + 1), vnodes=vnodes)
+    shrunk = HashRing(range(1, shards), vnodes=vnodes)
+    moved_add = movement(ring.get, grown.get, cookie_ids)
+    moved_remove = movement(ring.get, shrunk.get, cookie_ids)
+    ok = (all(grown.get(cookie_id) == shards for cookie_id in moved_add)
+          and all(ring.get(cookie_id) == 0 for cookie_id in moved_remove))
+
+    print(f"{'':<8} {'一致性哈希':>10} {'取模':>8} {'理想':>8}")
+    for name, moved, naive, ideal in (
+        (f"增加分片{shards}", moved_add, movement(modulo(shards), modulo(shards + 1), cookie_ids), 1 / (shards + 1)),
+        ("删除分片0", moved_remove, movement(modulo(shards), modulo(shards - 1), cookie_ids), 1 / shards),
+    ):
+        print(f"{name:<8} {len(moved) / accounts:10.1%} {len(naive) / accounts:8.1%} {ideal:8.1%}")
+    print(f"只迁移了必要的账号: {ok}")
+    return ok
+
+
+def process_accounts(args):
+    """工作进程：依次处理分到本进程的账号的同步包，返回处理的帧数"""
+    cookie_ids, frames = args
+    quiet_logs()
+    from benchmarks.sync_decode import SAMPLE
+    from utils import frame_codec
+    from utils.keyword_matcher import KeywordMatcher
+    from utils.xianyu_utils import decrypt_to_dict
+
+    frame = frame_codec.dumps({"headers": {"mid": "1 0", "sid": "s"}, "lwp": "/s/para",
+                               "body": {"syncPushPackage": {"data": [{"data": SAMPLE}]}}})
+    matcher = KeywordMatcher([{'keyword': keyword, 'reply': keyword, 'item_id': None, 'type': 'text', 'image_url': None}
+                              for keyword in KEYWORDS])
+    count = 0
+    for _ in cookie_ids:
+        for _ in range(frames):
+            message_data = frame_codec.loads(frame)
+            message = decrypt_to_dict(message_data["body"]["syncPushPackage"]["data"][0]["data"])
+            content = message["1"]["6"]["3"]["5"]
+            matcher.match(content)
+            count += 1
+    return count
+
+
+def report_throughput(accounts: int, frames: int, process_counts):
+    from utils.sharding import HashRing
+
+    cookie_ids = [f"cookie{i}" for i in range(accounts)]
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f"\n{accounts} 个账号，每个账号 {frames} 个同步包，可用CPU核心 {cores} 个")
+    ctx = multiprocessing.get_context('spawn')
+    for processes in process_counts:
+        ring = HashRing(range(processes))
+        groups = [[cookie_id for cookie_id in cookie_ids if ring.get(cookie_id) == shard] for shard in range(processes)]
+        with ctx.Pool(processes) as pool:
+            # 预热：工作进程完成导入后再计时
+            pool.map(process_accounts, [([], 0)] * processes)
+            start = time.perf_counter()
+            total = sum(pool.map(process_accounts, [(group, frames) for group in groups]))
+            elapsed = time.perf_counter() - start
+        print(f"{processes} 个分片: {total / elapsed:8.0f} 帧/秒（{elapsed:.2f} s），"
+              f"每个分片的账号数 {[len(group) for group in groups]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=10000, help="一致性哈希测试的账号数")
+    parser.add_argument('--shards', type=int, default=4, help="一致性哈希测试的分片数")
+    parser.add_argument('--vnodes', type=int, default=64, help="每个分片的虚拟节点数")
+    parser.add_argument('--busy-accounts', type=int, default=64, help="吞吐测试的账号数")
+    parser.add_argument('--frames', type=int, default=150, help="吞吐测试中每个账号处理的同步包数")
+    parser.add_argument('--processes', default='1,2,4', help="吞吐测试的分片数，逗号分隔，0表示跳过")
+    args = parser.parse_args()
+
+    # utils.sharding 经 cookie_manager 导入 db_manager
+    use_temp_db()
+    quiet_logs()
+    ok = report_movement(args.accounts, args.shards, args.vnodes)
+    process_counts = [int(value) for value in args.processes.split(',') if int(value) > 0]
+    if process_counts:
+        report_throughput(args.busy_accounts, args.frames, process_counts)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""同步包解码：json.loads(decrypt(msg))（原实现） vs decrypt_to_dict(msg)
+
+    python -m benchmarks.sync_decode [--number 3000]
+
+分别在纯Python解码器和 msgpack C扩展两种后端下计时。原实现的解码路径是纯Python后端下的
+json.loads(decrypt(msg))，但这里的 MessagePackDecoder 已是改为 memoryview 读取后的版本。
+同时校验 decrypt_to_dict 与 json.loads(decrypt(...)) 的结果一致，以及两种后端的解码结果一致。
+"""
+
+import argparse
+import base64
+import json
+import timeit
+
+from benchmarks import quiet_logs
+
+# 一条真实的"买家已拍下，待付款"同步消息
+SAMPLE = "ggGLAYEBsjMxNDk2MzcwNjNAZ29vZmlzaAKzNDc5ODMzODkwOTZAZ29vZmlzaAOxMzQxNjU2NTI3NDU0Mi5QTk0EAAXPAAABlbKji20GggFlA4UBoAK6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl0DoAQaBdoEKnsiY29udGVudFR5cGUiOjI2LCJkeENhcmQiOnsiaXRlbSI6eyJtYWluIjp7ImNsaWNrUGFyYW0iOnsiYXJnMSI6Ik1zZ0NhcmQiLCJhcmdzIjp7InNvdXJjZSI6ImltIiwidGFza19pZCI6IjNleFFKSE9UbVBVMSIsIm1zZ19pZCI6ImNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczIn19LCJleENvbnRlbnQiOnsiYmdDb2xvciI6IiNGRkZGRkYiLCJidXR0b24iOnsiYmdDb2xvciI6IiNGRkU2MEYiLCJib3JkZXJDb2xvciI6IiNGRkU2MEYiLCJjbGlja1BhcmFtIjp7ImFyZzEiOiJNc2dDYXJkQWN0aW9uIiwiYXJncyI6eyJzb3VyY2UiOiJpbSIsInRhc2tfaWQiOiIzZXhRSkhPVG1QVTEiLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9fSwiZm9udENvbG9yIjoiIzMzMzMzMyIsInRhcmdldFVybCI6ImZsZWFtYXJrZXQ6Ly9hZGp1c3RfcHJpY2U/Zmx1dHRlcj10cnVlJmJpek9yZGVySWQ9MjUwMzY4ODEyNjM1NjYzNjM3MCIsInRleHQiOiLkv67mlLnku7fmoLwifSwiZGVzYyI6Iuivt+WPjOaWueayn+mAmuWPiuaXtuehruiupOS7t+agvCIsImRlc2NDb2xvciI6IiNBM0EzQTMiLCJ0aXRsZSI6IuaIkeW3suaLjeS4i++8jOW+heS7mOasviIsInVwZ3JhZGUiOnsidGFyZ2V0VXJsIjoiaHR0cHM6Ly9oNS5tLmdvb2Zpc2guY29tL2FwcC9pZGxlRmlzaC1GMmUvZm0tZG93bmxhb2QvaG9tZS5odG1sP25vUmVkcmllY3Q9dHJ1ZSZjYW5CYWNrPXRydWUmY2hlY2tWZXJzaW9uPXRydWUiLCJ2ZXJzaW9uIjoiNy43LjkwIn19LCJ0YXJnZXRVcmwiOiJmbGVhbWFya2V0Oi8vb3JkZXJfZGV0YWlsP2lkPTI1MDM2ODgxMjYzNTY2MzYzNzAmcm9sZT1zZWxsZXIifX0sInRlbXBsYXRlIjp7Im5hbWUiOiJpZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZCIsInVybCI6Imh0dHBzOi8vZGluYW1pY3guYWxpYmFiYXVzZXJjb250ZW50LmNvbS9wdWIvaWRsZWZpc2hfbWVzc2FnZV90cmFkZV9jaGF0X2NhcmQvMTY2NzIyMjA1Mjc2Ny9pZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZC56aXAiLCJ2ZXJzaW9uIjoiMTY2NzIyMjA1Mjc2NyJ9fX0HAQgBCQAK3gAQpmJpelRhZ9oAe3sic291cmNlSWQiOiJDMkM6M2V4UUpIT1RtUFUxIiwidGFza05hbWUiOiLlt7Lmi43kuItf5pyq5LuY5qy+X+WNluWutiIsIm1hdGVyaWFsSWQiOiIzZXhRSkhPVG1QVTEiLCJ0YXNrSWQiOiIzZXhRSkhPVG1QVTEifbFjbG9zZVB1c2hSZWNlaXZlcqVmYWxzZbFjbG9zZVVucmVhZE51bWJlcqVmYWxzZaxkZXRhaWxOb3RpY2W6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2nZXh0SnNvbtoBr3sibXNnQXJncyI6eyJ0YXNrX2lkIjoiM2V4UUpIT1RtUFUxIiwic291cmNlIjoiaW0iLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9LCJxdWlja1JlcGx5IjoiMSIsIm1zZ0FyZzEiOiJNc2dDYXJkIiwidXBkYXRlS2V5IjoiNDc5ODMzODkwOTY6MjUwMzY4ODEyNjM1NjYzNjM3MDoxX25vdF9wYXlfc2VsbGVyIiwibWVzc2FnZUlkIjoiY2M4YmMyZGY3YzkzNGRmMDg2ZTA1NjdjYjY5ZjE1NzMiLCJtdWx0aUNoYW5uZWwiOnsiaHVhd2VpIjoiRVhQUkVTUyIsInhpYW9taSI6IjEwODAwMCIsIm9wcG8iOiJFWFBSRVNTIiwiaG9ub3IiOiJOT1JNQUwiLCJhZ29vIjoicHJvZHVjdCIsInZpdm8iOiJPUkRFUiJ9LCJjb250ZW50VHlwZSI6IjI2IiwiY29ycmVsYXRpb25Hcm91cElkIjoiM2V4UUpIT1RtUFUxX0ZGcjRHT1NuOE9RbyJ9qHJlY2VpdmVyrTIyMDI2NDA5MTgwNzmrcmVkUmVtaW5kZXKy562J5b6F5Lmw5a625LuY5qy+sHJlZFJlbWluZGVyU3R5bGWhMa9yZW1pbmRlckNvbnRlbnS6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2ucmVtaW5kZXJOb3RpY2W75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+rXJlbWluZGVyVGl0bGW75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+q3JlbWluZGVyVXJs2gCaZmxlYW1hcmtldDovL21lc3NhZ2VfY2hhdD9pdGVtSWQ9OTAwMDUyNjQ0Mjc3JnBlZXJVc2VySWQ9MzE0OTYzNzA2MyZwZWVyVXNlck5pY2s955S3KioqeSZzaWQ9NDc5ODMzODkwOTYmbWVzc2FnZUlkPWNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczJmFkdj1ub6xzZW5kZXJVc2VySWSqMzE0OTYzNzA2M65zZW5kZXJVc2VyVHlwZaEwq3Nlc3Npb25UeXBloTGqdXBkYXRlSGVhZKR0cnVlDAEDgahuZWVkUHVzaKR0cnVl"
+
+
+def parity_samples(msgpack):
+    """校验用的消息：真实消息，以及（安装了 msgpack 时）覆盖整数键、bin、浮点数、嵌套等类型的构造数据"""
+    samples = [SAMPLE]
+    if msgpack is not None:
+        for value in (
+            {1: "text", 2: {3: [1, 2.5, True, None]}, "bin": b"\xe4\xbd\xa0\xe5\xa5\xbd"},
+            {"nested": [{"a": -1, "b": 2 ** 40}, [b"raw", "中文"]], True: False, None: 0.1},
+            {10: {"extJson": json.dumps({"quickReply": "1"})}, "empty": {}, "list": []},
+        ):
+            samples.append(base64.b64encode(msgpack.packb(value, use_bin_type=True)).decode())
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=3000, help="每项的执行次数")
+    args = parser.parse_args()
+
+    quiet_logs()
+    from utils import xianyu_utils
+
+    msgpack = xianyu_utils.msgpack
+    backends = [('纯Python', None)]
+    if msgpack is not None:
+        backends.append(('msgpack', msgpack))
+    else:
+        print("未安装 msgpack，只测试纯Python后端")
+
+    failed = False
+    decoded = {}
+    print(f"消息 {len(SAMPLE)} 字节，每项 {args.number} 次")
+    try:
+        for label, module in backends:
+            xianyu_utils.msgpack = module
+            samples = parity_samples(msgpack)
+            results = [xianyu_utils.decrypt_to_dict(data) for data in samples]
+            mismatches = sum(1 for data, result in zip(samples, results)
+                             if result != json.loads(xianyu_utils.decrypt(data)))
+            decoded[label] = results
+            failed = failed or bool(mismatches)
+
+            before = timeit.timeit(lambda: json.loads(xianyu_utils.decrypt(SAMPLE)), number=args.number)
+            after = timeit.timeit(lambda: xianyu_utils.decrypt_to_dict(SAMPLE), number=args.number)
+            print(f"{label}后端:")
+            print(f"  json.loads(decrypt(msg)) {before / args.number * 1e6:8.1f} us/次")
+            print(f"  decrypt_to_dict(msg)     {after / args.number * 1e6:8.1f} us/次")
+            print(f"  与 json.loads(decrypt(...)) 不一致: {mismatches}/{len(samples)} 条")
+    finally:
+        xianyu_utils.msgpack = msgpack
+
+    if len(decoded) == 2:
+        same = decoded['纯Python'] == decoded['msgpack']
+        failed = failed or not same
+        print(f"两种后端解码结果一致: {same}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import asyncio
 from typing import Dict, List, Tuple, Optional
 from loguru import logger
 from db_manager import db_manager
+from utils import cache_invalidation
 
 __all__ = ["CookieManager", "manager"]
 
@@ -17,6 +18,8 @@ class CookieManager:
         self.keywords: Dict[str, List[Tuple[str, str]]] = {}
         self.cookie_status: Dict[str, bool] = {}  # 账号启用状态
         self.auto_confirm_settings: Dict[str, bool] = {}  # 自动确认发货设置
+        # 多节点部署时由 Start.py 设置（见 utils/account_lease.py），只运行本节点持有租约的账号
+        self.lease_manager = None
         self._load_from_db()
 
     def _load_from_db(self):
@@ -48,6 +51,7 @@ class CookieManager:
 
         # 重新加载数据
         self._load_from_db()
+        cache_invalidation.invalidate('keywords')
 
         new_cookies_count = len(self.cookies)
         new_keywords_count = len(self.keywords)
@@ -92,6 +96,10 @@ class CookieManager:
             if cookie_info:
                 actual_user_id = cookie_info.get('user_id')
 
+        if not self._holds_lease(cookie_id):
+            logger.info(f"账号租约由其他节点持有，本节点不启动任务: {cookie_id}")
+            return
+
         task = self.loop.create_task(self._run_xianyu(cookie_id, cookie_value, actual_user_id))
         self.tasks[cookie_id] = task
         logger.info(f"已启动账号任务: {cookie_id} (用户ID: {actual_user_id})")
@@ -111,8 +119,10 @@ class CookieManager:
         
         self.cookies.pop(cookie_id, None)
         self.keywords.pop(cookie_id, None)
+        self._release_lease(cookie_id)
         # 从数据库删除
         db_manager.delete_cookie(cookie_id)
+        cache_invalidation.invalidate('keywords', cookie_id)
         logger.info(f"已移除账号: {cookie_id}")
 
     # ------------------------ 对外线程安全接口 ------------------------
@@ -195,6 +205,11 @@ class CookieManager:
             self.keywords[cookie_id] = original_keywords
             self.cookie_status[cookie_id] = original_status
 
+            if not self._holds_lease(cookie_id):
+                logger.info(f"已更新Cookie，账号租约由其他节点持有，本节点不启动任务: {cookie_id}")
+                cache_invalidation.account_changed(cookie_id)
+                return
+
             # 重新启动任务
             task = self.loop.create_task(self._run_xianyu(cookie_id, new_value, original_user_id))
             self.tasks[cookie_id] = task
@@ -217,6 +232,7 @@ class CookieManager:
         self.keywords[cookie_id] = kw_list
         # 保存到数据库
         db_manager.save_keywords(cookie_id, kw_list)
+        cache_invalidation.invalidate('keywords', cookie_id)
         logger.info(f"更新关键字: {cookie_id} -> {len(kw_list)} 条")
 
     # 查询接口
@@ -245,6 +261,7 @@ class CookieManager:
             else:
                 # 禁用账号：停止任务
                 self._stop_cookie_task(cookie_id)
+                self._release_lease(cookie_id)
 
     def get_cookie_status(self, cookie_id: str) -> bool:
         """获取Cookie的启用状态"""
@@ -255,6 +272,15 @@ class CookieManager:
         return {cid: value for cid, value in self.cookies.items()
                 if self.cookie_status.get(cid, True)}
 
+    def _holds_lease(self, cookie_id: str) -> bool:
+        """本节点是否可以运行该账号（未启用多节点租约时总是可以）"""
+        return self.lease_manager is None or self.lease_manager.acquire(cookie_id)
+
+    def _release_lease(self, cookie_id: str):
+        """账号删除或禁用后释放本节点持有的租约"""
+        if self.lease_manager is not None:
+            self.lease_manager.release(cookie_id)
+
     def _start_cookie_task(self, cookie_id: str):
         """启动指定Cookie的任务"""
         if cookie_id in self.tasks:
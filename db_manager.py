@@ -1,5 +1,10 @@
 import sqlite3
 import os
+import re
+import inspect
+import asyncio
+import functools
+import queue
 import threading
 import hashlib
 import time
@@ -11,13 +16,25 @@ import io
 import base64
 from PIL import Image, ImageDraw, ImageFont
 from typing import List, Tuple, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from loguru import logger
 
+from utils import metrics
+
 class DBManager:
     """SQLite数据库管理，持久化存储Cookie和关键字"""
+
+    # 是否为按用户分库的布局（见 TenantDBManager）
+    tenant_layout = False
     
-    def __init__(self, db_path: str = None):
-        """初始化数据库连接和表结构"""
+    def __init__(self, db_path: str = None, lock_label: str = 'main'):
+        """初始化数据库连接和表结构
+
+        Args:
+            db_path: 数据库文件路径，默认使用环境变量 DB_PATH
+            lock_label: 写锁等待、持有时间指标的 db 标签
+        """
         # 支持环境变量配置数据库路径
         if db_path is None:
             db_path = os.getenv('DB_PATH', 'xianyu_data.db')
@@ -47,8 +64,16 @@ class DBManager:
 
         self.db_path = db_path
         logger.info(f"数据库路径: {self.db_path}")
-        self.conn = None
-        self.lock = threading.RLock()  # 使用可重入锁保护数据库操作
+        self.conn = None  # 唯一的写连接
+        # 使用可重入锁保护写连接上的操作（记录等待和持有时间，见 /metrics）
+        self.lock = metrics.TimedRLock(metrics.db_lock_wait, metrics.db_lock_hold, lock_label)
+
+        # 读连接池（WAL模式下读操作不会被写操作阻塞）
+        self.read_pool_size = max(1, int(os.getenv('DB_READ_POOL_SIZE', '4')))
+        self.wal_enabled = False
+        self._read_pool = queue.Queue()
+        self._read_conns = []
+        self._read_pool_lock = threading.Lock()
 
         # SQL日志配置 - 默认启用
         self.sql_log_enabled = True  # 默认启用SQL日志
@@ -62,12 +87,13 @@ class DBManager:
 
         logger.info(f"SQL日志已启用，日志级别: {self.sql_log_level}")
 
-        self.init_db()
+        with self.lock:
+            self.init_db()
     
     def init_db(self):
         """初始化数据库表结构"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = self._create_connection()
             cursor = self.conn.cursor()
             
             # 创建用户表
@@ -115,6 +141,7 @@ class DBManager:
                 auto_confirm INTEGER DEFAULT 1,
                 remark TEXT DEFAULT '',
                 pause_duration INTEGER DEFAULT 10,
+                reply_debounce INTEGER DEFAULT 0,
                 username TEXT DEFAULT '',
                 password TEXT DEFAULT '',
                 show_browser INTEGER DEFAULT 0,
@@ -181,6 +208,13 @@ class DBManager:
                 FOREIGN KEY (cookie_id) REFERENCES cookies (id) ON DELETE CASCADE
             )
             ''')
+            # 按会话读取最近消息、统计议价次数
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_conversations_chat ON ai_conversations(chat_id, cookie_id, id)
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_conversations_intent ON ai_conversations(chat_id, cookie_id, intent, role)
+            ''')
 
             # 创建AI商品信息缓存表
             cursor.execute('''
@@ -192,6 +226,9 @@ class DBManager:
                 last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
             ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_item_cache_updated ON ai_item_cache(last_updated)
+            ''')
 
             # 创建卡券表
             cursor.execute('''
@@ -216,6 +253,22 @@ class DBManager:
             )
             ''')
 
+            # 创建批量数据卡券库存表（每条卡密一行，发货时只标记一行为已消费）
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS card_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                card_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                consumed INTEGER DEFAULT 0,
+                consumed_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (card_id) REFERENCES cards(id) ON DELETE CASCADE
+            )
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_card_items_stock ON card_items(card_id, consumed, id)
+            ''')
+
             # 创建订单表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS orders (
@@ -413,6 +466,62 @@ class DBManager:
             )
             ''')
 
+            # 创建通知重试队列表（发送失败的通知按退避时间重试，重启后继续）
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notification_retry_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cookie_id TEXT,
+                channel_name TEXT,
+                channel_type TEXT NOT NULL,
+                channel_config TEXT,
+                message TEXT NOT NULL,
+                message_json TEXT,
+                attempts INTEGER DEFAULT 0,
+                next_retry_at REAL NOT NULL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notification_retry_due ON notification_retry_queue(next_retry_at)
+            ''')
+
+            # 多节点部署：账号租约（每个账号同一时间只由持有租约的节点运行）和节点心跳
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS account_leases (
+                cookie_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at REAL NOT NULL
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cluster_nodes (
+                node_id TEXT PRIMARY KEY,
+                hostname TEXT,
+                pid INTEGER,
+                started_at REAL,
+                last_seen REAL NOT NULL
+            )
+            ''')
+            # 多节点部署时的缓存失效日志：各节点轮询其他节点写入的记录，清除本节点的进程内缓存
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cache_invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                cache TEXT NOT NULL,
+                args TEXT,
+                created_at REAL NOT NULL
+            )
+            ''')
+            # 周期性的全局任务（如清理历史数据）上次执行的时间：多个进程或节点中只有一个执行
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS periodic_runs (
+                name TEXT PRIMARY KEY,
+                last_run REAL NOT NULL DEFAULT 0
+            )
+            ''')
+
             # 创建用户设置表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_settings (
@@ -503,6 +612,12 @@ class DBManager:
                 cursor.execute("ALTER TABLE cookies ADD COLUMN pause_duration INTEGER DEFAULT 10")
                 logger.info("数据库迁移完成：添加pause_duration列")
 
+            # 检查cookies表是否存在reply_debounce列
+            if 'reply_debounce' not in cookie_columns:
+                logger.info("添加cookies表的reply_debounce列...")
+                cursor.execute("ALTER TABLE cookies ADD COLUMN reply_debounce INTEGER DEFAULT 0")
+                logger.info("数据库迁移完成：添加reply_debounce列")
+
         except Exception as e:
             logger.error(f"数据库迁移失败: {e}")
             # 迁移失败不应该阻止程序启动
@@ -626,6 +741,13 @@ class DBManager:
                 self.set_system_setting("db_version", "1.5", "数据库版本号")
                 logger.info("数据库升级到版本1.5完成")
 
+            # 升级到版本1.6 - 批量数据卡券迁移到card_items库存表
+            if current_version < "1.6":
+                logger.info("开始升级数据库到版本1.6...")
+                self.migrate_card_data_content_to_items(cursor)
+                self.set_system_setting("db_version", "1.6", "数据库版本号")
+                logger.info("数据库升级到版本1.6完成")
+
             # 迁移遗留数据（在所有版本升级完成后执行）
             self.migrate_legacy_data(cursor)
 
@@ -980,6 +1102,31 @@ class DBManager:
             logger.error(f"升级cookies表账号登录字段失败: {e}")
             raise
 
+    def migrate_card_data_content_to_items(self, cursor):
+        """把批量数据卡券的 data_content 文本导入 card_items 库存表
+
+        导入后清空 cards.data_content，库存以 card_items 为准。
+        对已经没有 data_content 的卡券不做任何处理，可重复执行。
+        """
+        try:
+            self._execute_sql(cursor, """
+            SELECT id, data_content FROM cards
+            WHERE type = 'data' AND data_content IS NOT NULL AND data_content != ''
+            """)
+            rows = cursor.fetchall()
+
+            total_items = 0
+            for card_id, data_content in rows:
+                total_items += self._add_card_items(cursor, card_id, data_content)
+                self._execute_sql(cursor, "UPDATE cards SET data_content = NULL WHERE id = ?", (card_id,))
+
+            if rows:
+                logger.info(f"批量数据迁移到card_items完成: {len(rows)} 个卡券，共 {total_items} 条数据")
+            return True
+        except Exception as e:
+            logger.error(f"迁移批量数据到card_items失败: {e}")
+            raise
+
     def migrate_legacy_data(self, cursor):
         """迁移遗留数据到新表结构"""
         try:
@@ -1119,17 +1266,135 @@ class DBManager:
             raise
 
     def close(self):
-        """关闭数据库连接"""
+        """关闭数据库连接（包括读连接池）"""
+        self._close_read_pool()
         if self.conn:
             self.conn.close()
             self.conn = None
     
     def get_connection(self):
-        """获取数据库连接，如果已关闭则重新连接"""
+        """获取数据库写连接，如果已关闭则重新连接"""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = self._create_connection()
         return self.conn
 
+    def _create_connection(self, readonly: bool = False):
+        """创建数据库连接并设置性能相关的PRAGMA
+
+        写连接负责开启WAL模式；读连接设置为只读，防止误写。
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        cursor = conn.cursor()
+        try:
+            if not readonly:
+                cursor.execute("PRAGMA journal_mode=WAL")
+                self.wal_enabled = (cursor.fetchone() or [''])[0].lower() == 'wal'
+                if not self.wal_enabled:
+                    logger.warning("数据库未能启用WAL模式，读操作将继续使用写连接")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=30000")
+            cursor.execute("PRAGMA cache_size=-16000")  # 16MB
+            cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            if readonly:
+                cursor.execute("PRAGMA query_only=ON")
+        except Exception as e:
+            logger.warning(f"设置数据库PRAGMA失败: {e}")
+        finally:
+            cursor.close()
+        return conn
+
+    def _acquire_read_conn(self):
+        """从读连接池借出一个连接，池未满时按需创建
+
+        等待时每秒重新读取一次连接池：恢复备份时连接池会被替换，旧池中借出的连接归还时直接关闭，
+        一直等待旧池的线程将永远不会被唤醒。
+        """
+        while True:
+            pool = self._read_pool
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._read_pool_lock:
+                if len(self._read_conns) < self.read_pool_size:
+                    conn = self._create_connection(readonly=True)
+                    self._read_conns.append(conn)
+                    return conn
+
+            try:
+                return pool.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _release_read_conn(self, conn):
+        """归还读连接"""
+        if conn in self._read_conns:
+            self._read_pool.put(conn)
+        else:
+            # 连接池已被关闭（如恢复备份后重新初始化），直接关闭旧连接
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _close_read_pool(self):
+        """关闭读连接池中的所有连接"""
+        with self._read_pool_lock:
+            conns = self._read_conns
+            self._read_conns = []
+            self._read_pool = queue.Queue()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def _read_cursor(self):
+        """获取只读游标
+
+        当前线程已持有写锁（处于写事务中）或未启用WAL时沿用写连接，
+        保证能读到本线程尚未提交的修改；否则从读连接池借用连接，不等待写锁。
+        """
+        if not self.wal_enabled or self.lock._is_owned():
+            with self.lock:
+                cursor = self.conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            return
+
+        conn = self._acquire_read_conn()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            # 关闭游标以结束读事务，避免连接归还后继续持有旧快照
+            cursor.close()
+            self._release_read_conn(conn)
+
+    def for_cookie(self, cookie_id: str) -> 'DBManager':
+        """账号数据所在的库（单库布局下就是本库）"""
+        return self
+
+    def for_user(self, user_id: int) -> 'DBManager':
+        """用户数据所在的库（单库布局下就是本库）"""
+        return self
+
+    def checkpoint(self):
+        """将WAL中的内容写回主数据库文件（用于直接复制数据库文件之前）"""
+        with self.lock:
+            try:
+                if self.wal_enabled:
+                    self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                return True
+            except Exception as e:
+                logger.error(f"WAL检查点执行失败: {e}")
+                return False
+
     def _log_sql(self, sql: str, params: tuple = None, operation: str = "EXECUTE"):
         """记录SQL执行日志"""
         if not self.sql_log_enabled:
@@ -1237,9 +1502,8 @@ class DBManager:
     
     def get_cookie(self, cookie_id: str) -> Optional[str]:
         """获取指定Cookie值"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT value FROM cookies WHERE id = ?", (cookie_id,))
                 result = cursor.fetchone()
                 return result[0] if result else None
@@ -1249,9 +1513,8 @@ class DBManager:
     
     def get_all_cookies(self, user_id: int = None) -> Dict[str, str]:
         """获取所有Cookie（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     self._execute_sql(cursor, "SELECT id, value FROM cookies WHERE user_id = ?", (user_id,))
                 else:
@@ -1272,9 +1535,8 @@ class DBManager:
         Returns:
             Dict包含cookie信息，包括cookies_str字段，如果不存在返回None
         """
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT id, value, created_at FROM cookies WHERE id = ?", (cookie_id,))
                 result = cursor.fetchone()
                 if result:
@@ -1291,9 +1553,8 @@ class DBManager:
 
     def get_cookie_details(self, cookie_id: str) -> Optional[Dict[str, any]]:
         """获取Cookie的详细信息，包括user_id、auto_confirm、remark、pause_duration、username、password和show_browser"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT id, value, user_id, auto_confirm, remark, pause_duration, username, password, show_browser, created_at FROM cookies WHERE id = ?", (cookie_id,))
                 result = cursor.fetchone()
                 if result:
@@ -1355,25 +1616,50 @@ class DBManager:
 
     def get_cookie_pause_duration(self, cookie_id: str) -> int:
         """获取Cookie的自动回复暂停时间"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
+        try:
+            with self._read_cursor() as cursor:
                 self._execute_sql(cursor, "SELECT pause_duration FROM cookies WHERE id = ?", (cookie_id,))
                 result = cursor.fetchone()
-                if result:
-                    if result[0] is None:
-                        logger.warning(f"账号 {cookie_id} 的pause_duration为NULL，使用默认值10分钟并修复数据库")
-                        # 修复数据库中的NULL值
+            if result:
+                if result[0] is None:
+                    logger.warning(f"账号 {cookie_id} 的pause_duration为NULL，使用默认值10分钟并修复数据库")
+                    # 修复数据库中的NULL值
+                    with self.lock:
+                        cursor = self.conn.cursor()
                         self._execute_sql(cursor, "UPDATE cookies SET pause_duration = 10 WHERE id = ?", (cookie_id,))
                         self.conn.commit()
-                        return 10
-                    return result[0]  # 返回实际值，包括0（0表示不暂停）
-                else:
-                    logger.warning(f"账号 {cookie_id} 未找到记录，使用默认值10分钟")
                     return 10
-            except Exception as e:
-                logger.error(f"获取账号自动回复暂停时间失败: {e}")
+                return result[0]  # 返回实际值，包括0（0表示不暂停）
+            else:
+                logger.warning(f"账号 {cookie_id} 未找到记录，使用默认值10分钟")
                 return 10
+        except Exception as e:
+            logger.error(f"获取账号自动回复暂停时间失败: {e}")
+            return 10
+
+    def update_cookie_reply_debounce(self, cookie_id: str, reply_debounce: int) -> bool:
+        """更新Cookie的连续消息合并回复窗口（秒，0表示不合并）"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "UPDATE cookies SET reply_debounce = ? WHERE id = ?", (reply_debounce, cookie_id))
+                self.conn.commit()
+                logger.info(f"更新账号 {cookie_id} 连续消息合并回复窗口: {reply_debounce}秒")
+                return True
+            except Exception as e:
+                logger.error(f"更新账号连续消息合并回复窗口失败: {e}")
+                return False
+
+    def get_cookie_reply_debounce(self, cookie_id: str) -> int:
+        """获取Cookie的连续消息合并回复窗口（秒，0表示不合并）"""
+        try:
+            with self._read_cursor() as cursor:
+                self._execute_sql(cursor, "SELECT reply_debounce FROM cookies WHERE id = ?", (cookie_id,))
+                result = cursor.fetchone()
+            return int(result[0]) if result and result[0] is not None else 0
+        except Exception as e:
+            logger.error(f"获取账号连续消息合并回复窗口失败: {e}")
+            return 0
 
     def update_cookie_account_info(self, cookie_id: str, cookie_value: str = None, username: str = None, password: str = None, show_browser: bool = None) -> bool:
         """更新Cookie的账号信息（包括cookie值、用户名、密码和显示浏览器设置）"""
@@ -1418,9 +1704,8 @@ class DBManager:
 
     def get_auto_confirm(self, cookie_id: str) -> bool:
         """获取Cookie的自动确认发货设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT auto_confirm FROM cookies WHERE id = ?", (cookie_id,))
                 result = cursor.fetchone()
                 if result:
@@ -1525,9 +1810,8 @@ class DBManager:
     
     def get_keywords(self, cookie_id: str) -> List[Tuple[str, str]]:
         """获取指定Cookie的关键字列表（向后兼容方法）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT keyword, reply FROM keywords WHERE cookie_id = ?", (cookie_id,))
                 return [(row[0], row[1]) for row in cursor.fetchall()]
             except Exception as e:
@@ -1536,9 +1820,8 @@ class DBManager:
 
     def get_keywords_with_item_id(self, cookie_id: str) -> List[Tuple[str, str, str]]:
         """获取指定Cookie的关键字列表（包含商品ID）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT keyword, reply, item_id FROM keywords WHERE cookie_id = ?", (cookie_id,))
                 return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
             except Exception as e:
@@ -1547,9 +1830,8 @@ class DBManager:
 
     def check_keyword_duplicate(self, cookie_id: str, keyword: str, item_id: str = None) -> bool:
         """检查关键词是否重复"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if item_id:
                     # 如果有商品ID，检查相同cookie_id、keyword、item_id的组合
                     self._execute_sql(cursor,
@@ -1591,9 +1873,8 @@ class DBManager:
 
     def get_keywords_with_type(self, cookie_id: str) -> List[Dict[str, any]]:
         """获取指定Cookie的关键字列表（包含类型信息）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor,
                     "SELECT keyword, reply, item_id, type, image_url FROM keywords WHERE cookie_id = ?",
                     (cookie_id,))
@@ -1670,9 +1951,8 @@ class DBManager:
 
     def get_all_keywords(self, user_id: int = None) -> Dict[str, List[Tuple[str, str]]]:
         """获取所有Cookie的关键字（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     cursor.execute("""
                     SELECT k.cookie_id, k.keyword, k.reply
@@ -1712,9 +1992,8 @@ class DBManager:
 
     def get_cookie_status(self, cookie_id: str) -> bool:
         """获取Cookie的启用状态"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('SELECT enabled FROM cookie_status WHERE cookie_id = ?', (cookie_id,))
                 result = cursor.fetchone()
                 return bool(result[0]) if result else True  # 默认启用
@@ -1724,9 +2003,8 @@ class DBManager:
 
     def get_all_cookie_status(self) -> Dict[str, bool]:
         """获取所有Cookie的启用状态"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('SELECT cookie_id, enabled FROM cookie_status')
 
                 result = {}
@@ -1772,9 +2050,8 @@ class DBManager:
 
     def get_ai_reply_settings(self, cookie_id: str) -> dict:
         """获取AI回复设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT ai_enabled, model_name, api_key, base_url,
                        max_discount_percent, max_discount_amount, max_bargain_rounds,
@@ -1821,9 +2098,8 @@ class DBManager:
 
     def get_all_ai_reply_settings(self) -> Dict[str, dict]:
         """获取所有账号的AI回复设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT cookie_id, ai_enabled, model_name, api_key, base_url,
                        max_discount_percent, max_discount_amount, max_bargain_rounds,
@@ -1850,6 +2126,86 @@ class DBManager:
                 logger.error(f"获取所有AI回复设置失败: {e}")
                 return {}
 
+    def get_ai_conversation_state(self, chat_id: str, cookie_id: str, limit: int = 20) -> tuple:
+        """获取会话最近limit条消息（按时间正序）和议价次数，返回 (context, bargain_count)"""
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+            SELECT role, content FROM ai_conversations
+            WHERE chat_id = ? AND cookie_id = ?
+            ORDER BY id DESC LIMIT ?
+            ''', (chat_id, cookie_id, limit))
+            context = [{"role": row[0], "content": row[1]} for row in reversed(cursor.fetchall())]
+
+            cursor.execute('''
+            SELECT COUNT(*) FROM ai_conversations
+            WHERE chat_id = ? AND cookie_id = ? AND intent = 'price' AND role = 'user'
+            ''', (chat_id, cookie_id))
+            bargain_count = cursor.fetchone()[0]
+            return context, bargain_count
+
+    def add_ai_conversations(self, records: List[tuple]) -> bool:
+        """在一个事务中批量保存对话记录
+
+        Args:
+            records: [(cookie_id, chat_id, user_id, item_id, role, content, intent), ...]
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._executemany_sql(cursor, '''
+                INSERT INTO ai_conversations
+                (cookie_id, chat_id, user_id, item_id, role, content, intent)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', records)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"保存对话记录失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def get_ai_item_cache(self, item_id: str, max_age: int) -> Optional[tuple]:
+        """获取max_age秒内缓存的商品详情，返回 (detail, 缓存时间戳)，不存在或已过期返回None"""
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+            SELECT data, CAST(strftime('%s', last_updated) AS INTEGER) FROM ai_item_cache
+            WHERE item_id = ? AND last_updated >= datetime('now', '-' || ? || ' seconds')
+            ''', (item_id, int(max_age)))
+            row = cursor.fetchone()
+            return (row[0], float(row[1])) if row else None
+
+    def get_recent_ai_item_cache(self, limit: int, max_age: int) -> List[tuple]:
+        """获取最近更新的limit条未过期商品详情缓存（按更新时间倒序），返回 [(item_id, detail, 缓存时间戳), ...]"""
+        with self._read_cursor() as cursor:
+            cursor.execute('''
+            SELECT item_id, data, CAST(strftime('%s', last_updated) AS INTEGER) FROM ai_item_cache
+            WHERE last_updated >= datetime('now', '-' || ? || ' seconds')
+            ORDER BY last_updated DESC LIMIT ?
+            ''', (int(max_age), limit))
+            return [(row[0], row[1], float(row[2])) for row in cursor.fetchall()]
+
+    def save_ai_item_cache(self, records: List[tuple]) -> bool:
+        """在一个事务中批量保存商品详情缓存
+
+        Args:
+            records: [(item_id, detail, 缓存时间戳), ...]
+        """
+        rows = [(item_id, detail, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp)))
+                for item_id, detail, timestamp in records]
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._executemany_sql(cursor, '''
+                INSERT OR REPLACE INTO ai_item_cache (item_id, data, last_updated)
+                VALUES (?, ?, ?)
+                ''', rows)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"保存商品详情缓存失败: {e}")
+                self.conn.rollback()
+                return False
+
     # -------------------- 默认回复操作 --------------------
     def save_default_reply(self, cookie_id: str, enabled: bool, reply_content: str = None, reply_once: bool = False):
         """保存默认回复设置"""
@@ -1868,9 +2224,8 @@ class DBManager:
 
     def get_default_reply(self, cookie_id: str) -> Optional[Dict[str, any]]:
         """获取指定账号的默认回复设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT enabled, reply_content, reply_once FROM default_replies WHERE cookie_id = ?
                 ''', (cookie_id,))
@@ -1889,9 +2244,8 @@ class DBManager:
 
     def get_all_default_replies(self) -> Dict[str, Dict[str, any]]:
         """获取所有账号的默认回复设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('SELECT cookie_id, enabled, reply_content, reply_once FROM default_replies')
 
                 result = {}
@@ -1924,9 +2278,8 @@ class DBManager:
 
     def has_default_reply_record(self, cookie_id: str, chat_id: str) -> bool:
         """检查是否已经回复过该chat_id"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT 1 FROM default_reply_records WHERE cookie_id = ? AND chat_id = ?
                 ''', (cookie_id, chat_id))
@@ -1982,9 +2335,8 @@ class DBManager:
 
     def get_notification_channels(self, user_id: int = None) -> List[Dict[str, any]]:
         """获取所有通知渠道"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     cursor.execute('''
                     SELECT id, name, type, config, enabled, created_at, updated_at
@@ -2018,9 +2370,8 @@ class DBManager:
 
     def get_notification_channel(self, channel_id: int) -> Optional[Dict[str, any]]:
         """获取指定通知渠道"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT id, name, type, config, enabled, created_at, updated_at
                 FROM notification_channels WHERE id = ?
@@ -2094,9 +2445,8 @@ class DBManager:
 
     def get_account_notifications(self, cookie_id: str) -> List[Dict[str, any]]:
         """获取账号的通知配置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT mn.id, mn.channel_id, mn.enabled, nc.name, nc.type, nc.config
                 FROM message_notifications mn
@@ -2118,76 +2468,398 @@ class DBManager:
 
                 return notifications
             except Exception as e:
-                logger.error(f"获取账号通知配置失败: {e}")
+                logger.error(f"获取账号通知配置失败: {e}")
+                return []
+
+    def get_all_message_notifications(self) -> Dict[str, List[Dict[str, any]]]:
+        """获取所有账号的通知配置"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute('''
+                SELECT mn.cookie_id, mn.id, mn.channel_id, mn.enabled, nc.name, nc.type, nc.config
+                FROM message_notifications mn
+                JOIN notification_channels nc ON mn.channel_id = nc.id
+                WHERE nc.enabled = 1
+                ORDER BY mn.cookie_id, mn.id
+                ''')
+
+                result = {}
+                for row in cursor.fetchall():
+                    cookie_id = row[0]
+                    if cookie_id not in result:
+                        result[cookie_id] = []
+
+                    result[cookie_id].append({
+                        'id': row[1],
+                        'channel_id': row[2],
+                        'enabled': bool(row[3]),
+                        'channel_name': row[4],
+                        'channel_type': row[5],
+                        'channel_config': row[6]
+                    })
+
+                return result
+            except Exception as e:
+                logger.error(f"获取所有消息通知配置失败: {e}")
+                return {}
+
+    def delete_message_notification(self, notification_id: int) -> bool:
+        """删除消息通知配置"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "DELETE FROM message_notifications WHERE id = ?", (notification_id,))
+                self.conn.commit()
+                logger.debug(f"删除消息通知配置: {notification_id}")
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"删除消息通知配置失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def delete_account_notifications(self, cookie_id: str) -> bool:
+        """删除账号的所有消息通知配置"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "DELETE FROM message_notifications WHERE cookie_id = ?", (cookie_id,))
+                self.conn.commit()
+                logger.debug(f"删除账号通知配置: {cookie_id}")
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"删除账号通知配置失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def add_notification_retry(self, cookie_id: str, channel_name: str, channel_type: str, channel_config: str,
+                               message: str, message_json: str, attempts: int, next_retry_at: float,
+                               last_error: str = None) -> Optional[int]:
+        """把发送失败的通知加入重试队列"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                INSERT INTO notification_retry_queue
+                (cookie_id, channel_name, channel_type, channel_config, message, message_json,
+                 attempts, next_retry_at, last_error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (cookie_id, channel_name, channel_type, channel_config, message, message_json,
+                      attempts, next_retry_at, last_error))
+                self.conn.commit()
+                return cursor.lastrowid
+            except Exception as e:
+                logger.error(f"加入通知重试队列失败: {e}")
+                self.conn.rollback()
+                return None
+
+    def claim_due_notification_retries(self, now: float, claim_until: float, limit: int = 50) -> List[Dict[str, any]]:
+        """领取已到重试时间的通知
+
+        领取时把 next_retry_at 推迟到 claim_until，其他进程或节点不会再领到同一条；
+        领取的进程发送后删除或重新排期，进程中途退出时该通知在 claim_until 后可以被重新领取。
+        每条记录用条件更新（next_retry_at 仍已到期）领取，多个进程同时领取时只有一个成功。
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                SELECT id, cookie_id, channel_name, channel_type, channel_config, message, message_json, attempts
+                FROM notification_retry_queue
+                WHERE next_retry_at <= ?
+                ORDER BY next_retry_at LIMIT ?
+                ''', (now, limit))
+                rows = cursor.fetchall()
+                claimed = []
+                for row in rows:
+                    self._execute_sql(cursor, '''
+                    UPDATE notification_retry_queue SET next_retry_at = ?
+                    WHERE id = ? AND next_retry_at <= ?
+                    ''', (claim_until, row[0], now))
+                    if cursor.rowcount > 0:
+                        claimed.append({
+                            'id': row[0],
+                            'cookie_id': row[1],
+                            'channel_name': row[2],
+                            'channel_type': row[3],
+                            'channel_config': row[4],
+                            'message': row[5],
+                            'message_json': row[6],
+                            'attempts': row[7]
+                        })
+                self.conn.commit()
+                return claimed
+            except Exception as e:
+                logger.error(f"领取通知重试队列失败: {e}")
+                self.conn.rollback()
+                return []
+
+    def reschedule_notification_retry(self, retry_id: int, attempts: int, next_retry_at: float,
+                                      last_error: str = None) -> bool:
+        """更新重试次数和下次重试时间"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                UPDATE notification_retry_queue SET attempts = ?, next_retry_at = ?, last_error = ?
+                WHERE id = ?
+                ''', (attempts, next_retry_at, last_error, retry_id))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"更新通知重试队列失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def delete_notification_retry(self, retry_id: int) -> bool:
+        """从重试队列中移除通知（发送成功或放弃重试）"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "DELETE FROM notification_retry_queue WHERE id = ?", (retry_id,))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"删除通知重试记录失败: {e}")
+                self.conn.rollback()
+                return False
+
+    # -------------------- 多节点账号租约 --------------------
+    def heartbeat_cluster_node(self, node_id: str, hostname: str, pid: int, started_at: float,
+                               ttl: float) -> List[str]:
+        """记录节点心跳，返回 ttl 秒内有心跳的节点ID（包括本节点）"""
+        now = time.time()
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                INSERT INTO cluster_nodes (node_id, hostname, pid, started_at, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(node_id) DO UPDATE SET
+                    hostname = excluded.hostname, pid = excluded.pid, last_seen = excluded.last_seen
+                ''', (node_id, hostname, pid, started_at, now))
+                # 清理早已停止心跳的节点记录
+                self._execute_sql(cursor, "DELETE FROM cluster_nodes WHERE last_seen < ?", (now - ttl * 10,))
+                self._execute_sql(cursor, "SELECT node_id FROM cluster_nodes WHERE last_seen >= ? ORDER BY node_id",
+                                  (now - ttl,))
+                nodes = [row[0] for row in cursor.fetchall()]
+                self.conn.commit()
+                return nodes
+            except Exception as e:
+                logger.error(f"记录节点心跳失败: {e}")
+                self.conn.rollback()
+                return [node_id]
+
+    def remove_cluster_node(self, node_id: str) -> bool:
+        """删除节点记录（节点正常退出时调用）"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "DELETE FROM cluster_nodes WHERE node_id = ?", (node_id,))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"删除节点记录失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def acquire_account_leases(self, owner: str, cookie_ids: List[str], ttl: float,
+                               limit: int = None) -> List[str]:
+        """获取账号租约
+
+        未被持有、已过期或已由本节点持有的账号获取成功（同时续约），其他节点持有且未过期的跳过。
+
+        Args:
+            owner: 节点ID
+            cookie_ids: 按优先顺序排列的账号ID
+            ttl: 租约有效期（秒）
+            limit: 最多获取多少个账号
+
+        Returns:
+            list: 获取成功的账号ID
+        """
+        now = time.time()
+        acquired = []
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                for cookie_id in cookie_ids:
+                    if limit is not None and len(acquired) >= limit:
+                        break
+                    self._execute_sql(cursor, '''
+                    INSERT INTO account_leases (cookie_id, owner, expires_at, acquired_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(cookie_id) DO UPDATE SET
+                        owner = excluded.owner,
+                        expires_at = excluded.expires_at,
+                        acquired_at = CASE WHEN account_leases.owner = excluded.owner
+                                           THEN account_leases.acquired_at ELSE excluded.acquired_at END
+                    WHERE account_leases.owner = excluded.owner OR account_leases.expires_at < ?
+                    ''', (cookie_id, owner, now + ttl, now, now))
+                    if cursor.rowcount > 0:
+                        acquired.append(cookie_id)
+                self.conn.commit()
+                return acquired
+            except Exception as e:
+                logger.error(f"获取账号租约失败: {e}")
+                self.conn.rollback()
+                return []
+
+    def renew_account_leases(self, owner: str, ttl: float) -> List[str]:
+        """续约节点持有的所有租约，返回仍由本节点持有的账号ID
+
+        已过期但还没有被其他节点接管的租约同样续约成功。
+        失败时抛出异常：返回空列表会被当作全部租约已被接管，导致停止本节点的全部账号。
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "UPDATE account_leases SET expires_at = ? WHERE owner = ?",
+                                  (time.time() + ttl, owner))
+                self._execute_sql(cursor, "SELECT cookie_id FROM account_leases WHERE owner = ?", (owner,))
+                cookie_ids = [row[0] for row in cursor.fetchall()]
+                self.conn.commit()
+                return cookie_ids
+            except Exception as e:
+                logger.error(f"续约账号租约失败: {e}")
+                self.conn.rollback()
+                raise
+
+    def release_account_leases(self, owner: str, cookie_ids: List[str] = None) -> int:
+        """释放节点持有的租约（不传 cookie_ids 时释放全部），返回释放数量"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                if cookie_ids is None:
+                    self._execute_sql(cursor, "DELETE FROM account_leases WHERE owner = ?", (owner,))
+                    released = cursor.rowcount
+                else:
+                    released = 0
+                    for cookie_id in cookie_ids:
+                        self._execute_sql(cursor, "DELETE FROM account_leases WHERE owner = ? AND cookie_id = ?",
+                                          (owner, cookie_id))
+                        released += cursor.rowcount
+                self.conn.commit()
+                return released
+            except Exception as e:
+                logger.error(f"释放账号租约失败: {e}")
+                self.conn.rollback()
+                return 0
+
+    def get_account_leases(self) -> List[Dict[str, any]]:
+        """获取所有账号租约"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute('''
+                SELECT cookie_id, owner, expires_at, acquired_at FROM account_leases ORDER BY owner, cookie_id
+                ''')
+                return [{
+                    'cookie_id': row[0],
+                    'owner': row[1],
+                    'expires_at': row[2],
+                    'acquired_at': row[3]
+                } for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取账号租约失败: {e}")
+                return []
+
+    def get_cluster_nodes(self) -> List[Dict[str, any]]:
+        """获取节点记录"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute('''
+                SELECT node_id, hostname, pid, started_at, last_seen FROM cluster_nodes ORDER BY node_id
+                ''')
+                return [{
+                    'node_id': row[0],
+                    'hostname': row[1],
+                    'pid': row[2],
+                    'started_at': row[3],
+                    'last_seen': row[4]
+                } for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取节点记录失败: {e}")
                 return []
 
-    def get_all_message_notifications(self) -> Dict[str, List[Dict[str, any]]]:
-        """获取所有账号的通知配置"""
+    def add_cache_invalidation(self, origin: str, cache: str, args: list) -> Optional[int]:
+        """记录一次缓存失效，供其他节点轮询"""
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-                cursor.execute('''
-                SELECT mn.cookie_id, mn.id, mn.channel_id, mn.enabled, nc.name, nc.type, nc.config
-                FROM message_notifications mn
-                JOIN notification_channels nc ON mn.channel_id = nc.id
-                WHERE nc.enabled = 1
-                ORDER BY mn.cookie_id, mn.id
-                ''')
-
-                result = {}
-                for row in cursor.fetchall():
-                    cookie_id = row[0]
-                    if cookie_id not in result:
-                        result[cookie_id] = []
+                self._execute_sql(cursor, '''
+                INSERT INTO cache_invalidations (origin, cache, args, created_at) VALUES (?, ?, ?, ?)
+                ''', (origin, cache, json.dumps(args, ensure_ascii=False), time.time()))
+                self.conn.commit()
+                return cursor.lastrowid
+            except Exception as e:
+                logger.error(f"记录缓存失效失败: {e}")
+                self.conn.rollback()
+                return None
 
-                    result[cookie_id].append({
-                        'id': row[1],
-                        'channel_id': row[2],
-                        'enabled': bool(row[3]),
-                        'channel_name': row[4],
-                        'channel_type': row[5],
-                        'channel_config': row[6]
-                    })
+    def get_cache_invalidations(self, after_id: int, limit: int = 500) -> List[Dict[str, any]]:
+        """获取ID大于 after_id 的缓存失效记录（按ID升序）"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute('''
+                SELECT id, origin, cache, args FROM cache_invalidations WHERE id > ? ORDER BY id LIMIT ?
+                ''', (after_id, limit))
+                return [{
+                    'id': row[0],
+                    'origin': row[1],
+                    'cache': row[2],
+                    'args': json.loads(row[3]) if row[3] else []
+                } for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取缓存失效记录失败: {e}")
+                return []
 
-                return result
+    def get_last_cache_invalidation_id(self) -> int:
+        """最新一条缓存失效记录的ID，没有记录时为0"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations")
+                return cursor.fetchone()[0]
             except Exception as e:
-                logger.error(f"获取所有消息通知配置失败: {e}")
-                return {}
+                logger.error(f"获取缓存失效记录失败: {e}")
+                return 0
 
-    def delete_message_notification(self, notification_id: int) -> bool:
-        """删除消息通知配置"""
+    def purge_cache_invalidations(self, before: float) -> int:
+        """删除 before 之前的缓存失效记录"""
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-                self._execute_sql(cursor, "DELETE FROM message_notifications WHERE id = ?", (notification_id,))
+                self._execute_sql(cursor, "DELETE FROM cache_invalidations WHERE created_at < ?", (before,))
                 self.conn.commit()
-                logger.debug(f"删除消息通知配置: {notification_id}")
-                return cursor.rowcount > 0
+                return cursor.rowcount
             except Exception as e:
-                logger.error(f"删除消息通知配置失败: {e}")
+                logger.error(f"清理缓存失效记录失败: {e}")
                 self.conn.rollback()
-                return False
+                return 0
 
-    def delete_account_notifications(self, cookie_id: str) -> bool:
-        """删除账号的所有消息通知配置"""
+    def claim_periodic_run(self, name: str, interval: float) -> bool:
+        """认领一次周期任务的执行：距上次执行超过 interval 秒时记录本次执行并返回True
+
+        多个进程（分片、节点）同时认领时只有一个成功，其余在下一个周期之前都返回False。
+        """
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-                self._execute_sql(cursor, "DELETE FROM message_notifications WHERE cookie_id = ?", (cookie_id,))
+                now = time.time()
+                self._execute_sql(cursor, "INSERT OR IGNORE INTO periodic_runs (name, last_run) VALUES (?, 0)", (name,))
+                self._execute_sql(cursor, "UPDATE periodic_runs SET last_run = ? WHERE name = ? AND last_run <= ?",
+                                  (now, name, now - interval))
+                claimed = cursor.rowcount == 1
                 self.conn.commit()
-                logger.debug(f"删除账号通知配置: {cookie_id}")
-                return cursor.rowcount > 0
+                return claimed
             except Exception as e:
-                logger.error(f"删除账号通知配置失败: {e}")
+                logger.error(f"认领周期任务失败: {name}, {e}")
                 self.conn.rollback()
                 return False
 
     # -------------------- 备份和恢复操作 --------------------
     def export_backup(self, user_id: int = None) -> Dict[str, any]:
         """导出系统备份数据（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 backup_data = {
                     'version': '1.0',
                     'timestamp': time.time(),
@@ -2236,7 +2908,7 @@ class DBManager:
                 else:
                     # 系统级备份：备份所有数据
                     tables = [
-                        'cookies', 'keywords', 'cookie_status', 'cards',
+                        'cookies', 'keywords', 'cookie_status', 'cards', 'card_items',
                         'delivery_rules', 'default_replies', 'notification_channels',
                         'message_notifications', 'system_settings', 'item_info',
                         'ai_reply_settings', 'ai_conversations', 'ai_item_cache'
@@ -2293,7 +2965,7 @@ class DBManager:
                     # 系统级导入：清空所有数据（除了用户和管理员密码）
                     tables = [
                         'message_notifications', 'notification_channels', 'default_replies',
-                        'delivery_rules', 'cards', 'item_info', 'cookie_status', 'keywords',
+                        'delivery_rules', 'card_items', 'cards', 'item_info', 'cookie_status', 'keywords',
                         'ai_conversations', 'ai_reply_settings', 'ai_item_cache', 'cookies'
                     ]
 
@@ -2306,7 +2978,7 @@ class DBManager:
                 # 导入数据
                 data = backup_data['data']
                 for table_name, table_data in data.items():
-                    if table_name not in ['cookies', 'keywords', 'cookie_status', 'cards',
+                    if table_name not in ['cookies', 'keywords', 'cookie_status', 'cards', 'card_items',
                                         'delivery_rules', 'default_replies', 'notification_channels',
                                         'message_notifications', 'system_settings', 'item_info',
                                         'ai_reply_settings', 'ai_conversations', 'ai_item_cache']:
@@ -2339,6 +3011,9 @@ class DBManager:
                     else:
                         cursor.executemany(f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({placeholders})", rows)
 
+                # 旧版本备份中的批量数据仍在data_content中，导入库存表
+                self.migrate_card_data_content_to_items(cursor)
+
                 # 提交事务
                 self.conn.commit()
                 logger.info("导入备份成功")
@@ -2352,9 +3027,8 @@ class DBManager:
     # -------------------- 系统设置操作 --------------------
     def get_system_setting(self, key: str) -> Optional[str]:
         """获取系统设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT value FROM system_settings WHERE key = ?", (key,))
                 result = cursor.fetchone()
                 return result[0] if result else None
@@ -2381,9 +3055,8 @@ class DBManager:
 
     def get_all_system_settings(self) -> Dict[str, str]:
         """获取所有系统设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 self._execute_sql(cursor, "SELECT key, value FROM system_settings")
 
                 settings = {}
@@ -2425,9 +3098,8 @@ class DBManager:
 
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """根据用户名获取用户信息"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT id, username, email, password_hash, is_active, created_at, updated_at
                 FROM users WHERE username = ?
@@ -2451,9 +3123,8 @@ class DBManager:
 
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """根据邮箱获取用户信息"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT id, username, email, password_hash, is_active, created_at, updated_at
                 FROM users WHERE email = ?
@@ -2851,16 +3522,20 @@ class DBManager:
                     else:
                         api_config_str = str(api_config)
 
+                # 批量数据写入card_items库存表，不再保存在data_content中
+                is_data_card = card_type == 'data'
                 cursor.execute('''
                 INSERT INTO cards (name, type, api_config, text_content, data_content, image_url,
                                  description, enabled, delay_seconds, is_multi_spec,
                                  spec_name, spec_value, user_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (name, card_type, api_config_str, text_content, data_content, image_url,
+                ''', (name, card_type, api_config_str, text_content, None if is_data_card else data_content, image_url,
                       description, enabled, delay_seconds, is_multi_spec,
                       spec_name, spec_value, user_id))
-                self.conn.commit()
                 card_id = cursor.lastrowid
+                if is_data_card:
+                    self._add_card_items(cursor, card_id, data_content)
+                self.conn.commit()
 
                 if is_multi_spec:
                     logger.info(f"创建多规格卡券成功: {name} - {spec_name}:{spec_value} (ID: {card_id})")
@@ -2873,14 +3548,14 @@ class DBManager:
 
     def get_all_cards(self, user_id: int = None):
         """获取所有卡券（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     cursor.execute('''
                     SELECT id, name, type, api_config, text_content, data_content, image_url,
                            description, enabled, delay_seconds, is_multi_spec,
-                           spec_name, spec_value, created_at, updated_at
+                           spec_name, spec_value, created_at, updated_at,
+                           (SELECT COUNT(*) FROM card_items ci WHERE ci.card_id = cards.id AND ci.consumed = 0)
                     FROM cards
                     WHERE user_id = ?
                     ORDER BY created_at DESC
@@ -2889,7 +3564,8 @@ class DBManager:
                     cursor.execute('''
                     SELECT id, name, type, api_config, text_content, data_content, image_url,
                            description, enabled, delay_seconds, is_multi_spec,
-                           spec_name, spec_value, created_at, updated_at
+                           spec_name, spec_value, created_at, updated_at,
+                           (SELECT COUNT(*) FROM card_items ci WHERE ci.card_id = cards.id AND ci.consumed = 0)
                     FROM cards
                     ORDER BY created_at DESC
                     ''')
@@ -2921,7 +3597,8 @@ class DBManager:
                         'spec_name': row[11],
                         'spec_value': row[12],
                         'created_at': row[13],
-                        'updated_at': row[14]
+                        'updated_at': row[14],
+                        'stock_count': row[15] if row[2] == 'data' else None
                     })
 
                 return cards
@@ -2931,9 +3608,8 @@ class DBManager:
 
     def get_card_by_id(self, card_id: int, user_id: int = None):
         """根据ID获取卡券（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     cursor.execute('''
                     SELECT id, name, type, api_config, text_content, data_content, image_url,
@@ -2961,13 +3637,26 @@ class DBManager:
                             # 如果解析失败，保持原始字符串
                             pass
 
+                    # 批量数据卡券从库存表还原为按行文本，供编辑使用
+                    data_content = row[5]
+                    stock_count = None
+                    if row[2] == 'data':
+                        cursor.execute('''
+                        SELECT content FROM card_items
+                        WHERE card_id = ? AND consumed = 0
+                        ORDER BY id
+                        ''', (row[0],))
+                        items = [item[0] for item in cursor.fetchall()]
+                        data_content = '\n'.join(items)
+                        stock_count = len(items)
+
                     return {
                         'id': row[0],
                         'name': row[1],
                         'type': row[2],
                         'api_config': api_config,
                         'text_content': row[4],
-                        'data_content': row[5],
+                        'data_content': data_content,
                         'image_url': row[6],
                         'description': row[7],
                         'enabled': bool(row[8]),
@@ -2976,7 +3665,8 @@ class DBManager:
                         'spec_name': row[11],
                         'spec_value': row[12],
                         'created_at': row[13],
-                        'updated_at': row[14]
+                        'updated_at': row[14],
+                        'stock_count': stock_count
                     }
                 return None
             except Exception as e:
@@ -3002,6 +3692,16 @@ class DBManager:
 
                 cursor = self.conn.cursor()
 
+                # 批量数据卡券的数据写入card_items库存表
+                replace_items = False
+                if data_content is not None:
+                    effective_type = card_type
+                    if effective_type is None:
+                        self._execute_sql(cursor, "SELECT type FROM cards WHERE id = ?", (card_id,))
+                        row = cursor.fetchone()
+                        effective_type = row[0] if row else None
+                    replace_items = effective_type == 'data'
+
                 # 构建更新语句
                 update_fields = []
                 params = []
@@ -3020,7 +3720,7 @@ class DBManager:
                     params.append(text_content)
                 if data_content is not None:
                     update_fields.append("data_content = ?")
-                    params.append(data_content)
+                    params.append(None if replace_items else data_content)
                 if image_url is not None:
                     update_fields.append("image_url = ?")
                     params.append(image_url)
@@ -3053,6 +3753,8 @@ class DBManager:
                 self._execute_sql(cursor, sql, params)
 
                 if cursor.rowcount > 0:
+                    if replace_items:
+                        self._replace_card_items(cursor, card_id, data_content)
                     self.conn.commit()
                     logger.info(f"更新卡券成功: ID {card_id}")
                     return True
@@ -3112,9 +3814,8 @@ class DBManager:
 
     def get_all_delivery_rules(self, user_id: int = None):
         """获取所有发货规则"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     cursor.execute('''
                     SELECT dr.id, dr.keyword, dr.card_id, dr.delivery_count, dr.enabled,
@@ -3163,9 +3864,8 @@ class DBManager:
 
     def get_delivery_rules_by_keyword(self, keyword: str):
         """根据关键字获取匹配的发货规则"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 # 使用更灵活的匹配方式：既支持商品内容包含关键字，也支持关键字包含在商品内容中
                 cursor.execute('''
                 SELECT dr.id, dr.keyword, dr.card_id, dr.delivery_count, dr.enabled,
@@ -3221,11 +3921,65 @@ class DBManager:
                 logger.error(f"根据关键字获取发货规则失败: {e}")
                 return []
 
+    def get_enabled_delivery_rules_with_cards(self) -> List[Dict[str, Any]]:
+        """获取所有启用的发货规则及其关联的启用卡券（用于构建发货规则索引）"""
+        with self._read_cursor() as cursor:
+            try:
+                cursor.execute('''
+                SELECT dr.id, dr.keyword, dr.card_id, dr.delivery_count, dr.enabled,
+                       dr.description, dr.delivery_times,
+                       c.name as card_name, c.type as card_type, c.api_config,
+                       c.text_content, c.data_content, c.image_url, c.enabled as card_enabled,
+                       c.description as card_description, c.delay_seconds as card_delay_seconds,
+                       c.is_multi_spec, c.spec_name, c.spec_value
+                FROM delivery_rules dr
+                JOIN cards c ON dr.card_id = c.id
+                WHERE dr.enabled = 1 AND c.enabled = 1
+                ORDER BY dr.id
+                ''')
+
+                rules = []
+                for row in cursor.fetchall():
+                    # 解析api_config JSON字符串
+                    api_config = row[9]
+                    if api_config:
+                        try:
+                            api_config = json.loads(api_config)
+                        except (json.JSONDecodeError, TypeError):
+                            # 如果解析失败，保持原始字符串
+                            pass
+
+                    rules.append({
+                        'id': row[0],
+                        'keyword': row[1],
+                        'card_id': row[2],
+                        'delivery_count': row[3],
+                        'enabled': bool(row[4]),
+                        'description': row[5],
+                        'delivery_times': row[6] or 0,
+                        'card_name': row[7],
+                        'card_type': row[8],
+                        'api_config': api_config,
+                        'text_content': row[10],
+                        'data_content': row[11],
+                        'image_url': row[12],
+                        'card_enabled': bool(row[13]),
+                        'card_description': row[14],
+                        'card_delay_seconds': row[15] or 0,
+                        'is_multi_spec': bool(row[16]) if row[16] is not None else False,
+                        'spec_name': row[17],
+                        'spec_value': row[18]
+                    })
+
+                return rules
+            except Exception as e:
+                logger.error(f"获取启用的发货规则失败: {e}")
+                raise
+
     def get_delivery_rule_by_id(self, rule_id: int, user_id: int = None):
         """根据ID获取发货规则（支持用户隔离）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 if user_id is not None:
                     self._execute_sql(cursor, '''
                     SELECT dr.id, dr.keyword, dr.card_id, dr.delivery_count, dr.enabled,
@@ -3336,9 +4090,8 @@ class DBManager:
 
     def get_delivery_rules_by_keyword_and_spec(self, keyword: str, spec_name: str = None, spec_value: str = None):
         """根据关键字和规格信息获取匹配的发货规则（支持多规格）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
 
                 # 优先匹配：卡券名称+规格名称+规格值
                 if spec_name and spec_value:
@@ -3472,6 +4225,7 @@ class DBManager:
                 self._execute_sql(cursor, "DELETE FROM cards WHERE id = ?", (card_id,))
 
                 if cursor.rowcount > 0:
+                    self._execute_sql(cursor, "DELETE FROM card_items WHERE card_id = ?", (card_id,))
                     self.conn.commit()
                     logger.info(f"删除卡券成功: ID {card_id}")
                     return True
@@ -3506,49 +4260,71 @@ class DBManager:
                 raise
 
     def consume_batch_data(self, card_id: int):
-        """消费批量数据的第一条记录（线程安全）"""
+        """消费批量数据的第一条记录（线程安全）
+
+        从card_items中取出最早的一条未消费数据并标记为已消费，
+        耗时与库存数量无关。
+        """
         with self.lock:
             try:
                 cursor = self.conn.cursor()
 
-                # 获取卡券的批量数据
-                self._execute_sql(cursor, "SELECT data_content FROM cards WHERE id = ? AND type = 'data'", (card_id,))
+                self._execute_sql(cursor, """
+                SELECT id, content FROM card_items
+                WHERE card_id = ? AND consumed = 0
+                ORDER BY id LIMIT 1
+                """, (card_id,))
                 result = cursor.fetchone()
 
-                if not result or not result[0]:
-                    logger.warning(f"卡券 {card_id} 没有批量数据")
-                    return None
-
-                data_content = result[0]
-                lines = [line.strip() for line in data_content.split('\n') if line.strip()]
-
-                if not lines:
+                if not result:
                     logger.warning(f"卡券 {card_id} 批量数据为空")
                     return None
 
-                # 获取第一条数据
-                first_line = lines[0]
+                item_id, content = result
 
-                # 移除第一条数据，更新数据库
-                remaining_lines = lines[1:]
-                new_data_content = '\n'.join(remaining_lines)
-
-                cursor.execute('''
-                UPDATE cards
-                SET data_content = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-                ''', (new_data_content, card_id))
+                # 带条件更新，保证同一条数据只会被领取一次
+                self._execute_sql(cursor, """
+                UPDATE card_items SET consumed = 1, consumed_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND consumed = 0
+                """, (item_id,))
+                if cursor.rowcount != 1:
+                    self.conn.rollback()
+                    logger.warning(f"卡券 {card_id} 数据 {item_id} 已被领取")
+                    return None
 
                 self.conn.commit()
 
-                logger.info(f"消费批量数据成功: 卡券ID={card_id}, 剩余={len(remaining_lines)}条")
-                return first_line
+                logger.info(f"消费批量数据成功: 卡券ID={card_id}, 数据ID={item_id}")
+                return content
 
             except Exception as e:
                 logger.error(f"消费批量数据失败: {e}")
                 self.conn.rollback()
                 return None
 
+    def get_card_stock(self, card_id: int) -> int:
+        """获取批量数据卡券的剩余库存数量"""
+        with self._read_cursor() as cursor:
+            try:
+                self._execute_sql(cursor, "SELECT COUNT(*) FROM card_items WHERE card_id = ? AND consumed = 0", (card_id,))
+                return cursor.fetchone()[0]
+            except Exception as e:
+                logger.error(f"获取卡券库存失败: {e}")
+                return 0
+
+    def _add_card_items(self, cursor, card_id: int, data_content: str) -> int:
+        """按行把批量数据写入card_items（调用方负责加锁和提交），返回写入条数"""
+        lines = [line.strip() for line in (data_content or '').split('\n') if line.strip()]
+        if lines:
+            self._executemany_sql(cursor, "INSERT INTO card_items (card_id, content) VALUES (?, ?)",
+                                  [(card_id, line) for line in lines])
+        return len(lines)
+
+    def _replace_card_items(self, cursor, card_id: int, data_content: str) -> int:
+        """用新的批量数据替换卡券的未消费库存，已消费记录保留"""
+        self._execute_sql(cursor, "DELETE FROM card_items WHERE card_id = ? AND consumed = 0", (card_id,))
+        return self._add_card_items(cursor, card_id, data_content)
+
     # ==================== 商品信息管理 ====================
 
     def save_item_basic_info(self, cookie_id: str, item_id: str, item_title: str = None,
@@ -3746,8 +4522,7 @@ class DBManager:
             Dict: 商品信息，如果不存在返回None
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT * FROM item_info
                 WHERE cookie_id = ? AND item_id = ?
@@ -3799,8 +4574,7 @@ class DBManager:
     def get_item_multi_spec_status(self, cookie_id: str, item_id: str) -> bool:
         """获取商品的多规格状态"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT is_multi_spec FROM item_info
                 WHERE cookie_id = ? AND item_id = ?
@@ -3842,8 +4616,7 @@ class DBManager:
     def get_item_multi_quantity_delivery_status(self, cookie_id: str, item_id: str) -> bool:
         """获取商品的多数量发货状态"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT multi_quantity_delivery FROM item_info
                 WHERE cookie_id = ? AND item_id = ?
@@ -3868,8 +4641,7 @@ class DBManager:
             List[Dict]: 商品信息列表
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT * FROM item_info
                 WHERE cookie_id = ?
@@ -3904,8 +4676,7 @@ class DBManager:
             List[Dict]: 所有商品信息列表
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT * FROM item_info
                 ORDER BY updated_at DESC
@@ -4174,9 +4945,8 @@ class DBManager:
 
     def get_user_settings(self, user_id: int):
         """获取用户的所有设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT key, value, description, updated_at
                 FROM user_settings
@@ -4199,9 +4969,8 @@ class DBManager:
 
     def get_user_setting(self, user_id: int, key: str):
         """获取用户的特定设置"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT value, description, updated_at
                 FROM user_settings
@@ -4243,9 +5012,8 @@ class DBManager:
 
     def get_all_users(self):
         """获取所有用户信息（管理员专用）"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT id, username, email, created_at, updated_at
                 FROM users
@@ -4269,9 +5037,8 @@ class DBManager:
 
     def get_user_by_id(self, user_id: int):
         """根据ID获取用户信息"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT id, username, email, created_at, updated_at
                 FROM users
@@ -4305,7 +5072,8 @@ class DBManager:
                 # 1. 删除用户设置
                 cursor.execute('DELETE FROM user_settings WHERE user_id = ?', (user_id,))
 
-                # 2. 删除用户的卡券
+                # 2. 删除用户的卡券及其库存
+                cursor.execute('DELETE FROM card_items WHERE card_id IN (SELECT id FROM cards WHERE user_id = ?)', (user_id,))
                 cursor.execute('DELETE FROM cards WHERE user_id = ?', (user_id,))
 
                 # 3. 删除用户的发货规则
@@ -4346,9 +5114,8 @@ class DBManager:
 
     def get_table_data(self, table_name: str):
         """获取指定表的所有数据"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
 
                 # 获取表结构
                 cursor.execute(f"PRAGMA table_info({table_name})")
@@ -4465,9 +5232,8 @@ class DBManager:
 
     def get_order_by_id(self, order_id: str):
         """根据订单ID获取订单信息"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT order_id, item_id, buyer_id, spec_name, spec_value,
                    quantity, amount, order_status, cookie_id, created_at, updated_at,
@@ -4502,9 +5268,8 @@ class DBManager:
 
     def get_orders_by_cookie(self, cookie_id: str, limit: int = 100):
         """根据Cookie ID获取订单列表"""
-        with self.lock:
+        with self._read_cursor() as cursor:
             try:
-                cursor = self.conn.cursor()
                 cursor.execute('''
                 SELECT order_id, item_id, buyer_id, spec_name, spec_value,
                        quantity, amount, order_status, created_at, updated_at,
@@ -4559,6 +5324,7 @@ class DBManager:
                     'item_info': 'id',
                     'message_notifications': 'id',
                     'cards': 'id',
+                    'card_items': 'id',
                     'delivery_rules': 'id',
                     'notification_channels': 'id',
                     'user_settings': 'id',
@@ -4574,6 +5340,9 @@ class DBManager:
                 cursor.execute(f"DELETE FROM {table_name} WHERE {primary_key} = ?", (record_id,))
 
                 if cursor.rowcount > 0:
+                    if table_name == 'cards':
+                        # 未启用外键约束，需手动删除卡券的库存卡密
+                        cursor.execute("DELETE FROM card_items WHERE card_id = ?", (record_id,))
                     self.conn.commit()
                     logger.info(f"删除表记录成功: {table_name}.{record_id}")
                     return True
@@ -4598,6 +5367,10 @@ class DBManager:
                 # 重置自增ID（如果有的话）
                 cursor.execute(f"DELETE FROM sqlite_sequence WHERE name = ?", (table_name,))
 
+                # 卡券ID会被重新使用，库存需要一起清空
+                if table_name == 'cards':
+                    cursor.execute("DELETE FROM card_items")
+
                 self.conn.commit()
                 logger.info(f"清空表数据成功: {table_name}")
                 return True
@@ -4644,8 +5417,7 @@ class DBManager:
             Optional[Dict[str, Any]]: 商品回复信息字典（统一格式），找不到返回 None
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                     SELECT reply_content FROM item_replay
                     WHERE item_id = ?
@@ -4674,8 +5446,7 @@ class DBManager:
             Dict: 包含回复内容的字典，如果不存在返回None
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                     SELECT reply_content, created_at, updated_at
                     FROM item_replay
@@ -4738,8 +5509,7 @@ class DBManager:
             List[Dict]: 商品信息列表
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
                 cursor.execute('''
                 SELECT r.item_id, r.cookie_id, r.reply_content, r.created_at, r.updated_at, i.item_title, i.item_detail
                     FROM item_replay r
@@ -4919,8 +5689,7 @@ class DBManager:
             List[Dict]: 风控日志列表
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
 
                 if cookie_id:
                     cursor.execute('''
@@ -4963,8 +5732,7 @@ class DBManager:
             int: 日志总数
         """
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._read_cursor() as cursor:
 
                 if cookie_id:
                     cursor.execute('SELECT COUNT(*) FROM risk_control_logs WHERE cookie_id = ?', (cookie_id,))
@@ -5095,9 +5863,573 @@ class DBManager:
             return {'error': str(e)}
 
 
-# 全局单例
-db_manager = DBManager()
+# -------------------- 按用户分库 --------------------
+
+# 按用户分库时存放在用户库中的表，其余表（用户、验证码、系统设置、用户设置、运行状态等）只在全局库中
+TENANT_TABLES = (
+    'cookies', 'keywords', 'cookie_status', 'ai_reply_settings', 'ai_conversations', 'cards', 'card_items',
+    'orders', 'item_info', 'delivery_rules', 'default_replies', 'item_replay', 'default_reply_records',
+    'notification_channels', 'message_notifications', 'risk_control_logs',
+)
+
+# 用户库中的自增ID从 user_id * TENANT_ID_SPAN 开始，按卡券、发货规则等记录的ID即可找到所在的库
+TENANT_ID_SPAN = 10 ** 9
+
+
+def _merge_results(results: list, mode: str = 'merge'):
+    """合并同一方法在多个库上的执行结果
+
+    merge：字典合并、列表拼接、数字相加、布尔值取或；first：第一个非空结果；
+    all / any：全部或任一成功；sum：统计字典按键相加。
+    """
+    if mode == 'all':
+        return all(results)
+    if mode == 'any':
+        return any(results)
+    if mode == 'first':
+        return next((result for result in results if result), results[0] if results else None)
+    values = [result for result in results if result is not None]
+    if not values:
+        return None
+    if mode == 'sum' or isinstance(values[0], dict):
+        merged = {}
+        for value in values:
+            for key, item in value.items():
+                if mode == 'sum' and isinstance(item, (int, float)) and not isinstance(item, bool):
+                    merged[key] = merged.get(key, 0) + item
+                elif mode == 'sum' and isinstance(item, bool):
+                    merged[key] = merged.get(key, False) or item
+                else:
+                    merged.setdefault(key, item)
+        return merged
+    if isinstance(values[0], bool):
+        return any(values)
+    if isinstance(values[0], (int, float)):
+        return sum(values)
+    merged = []
+    for value in values:
+        merged.extend(value)
+    return merged
+
+
+class TenantDBManager:
+    """按用户分库的数据库管理
+
+    单库布局下所有用户的数据共用一个库文件和一把写锁，一个用户导入大量关键词或清理历史数据时，
+    其他用户的消息处理都要等待。按用户分库后：
+    - 全局库保存用户、验证码、系统设置、用户设置和进程级的运行状态（通知重试队列、账号租约等）
+    - 每个用户一个库文件（tenant_dir/user_<id>.db），保存该用户的账号、关键词、卡券、发货规则、订单、
+      商品和AI对话等（见 TENANT_TABLES），各自有独立的写锁和读连接池
+    - 对外接口与 DBManager 相同：方法按参数中的 cookie_id、user_id 或记录ID路由到对应的库，
+      查询全部数据的方法在所有库上执行后合并结果
+    - 账号所属的用户记录在全局库的 tenant_cookies 表中，启动时加载到内存；
+      分片、多节点部署时其他进程可能新增账号和用户库，内存中找不到的账号会重新读取 tenant_cookies，
+      查询全部库时重新列出用户库目录
+
+    已有的单库数据需要先用 migrate_tenant_db.py 拆分。
+    """
+
+    tenant_layout = True
+
+    # 只在全局库中执行的方法（部分方法的参数中有 user_id / cookie_id，但数据属于全局库）
+    _GLOBAL_METHODS = frozenset({
+        'get_system_setting', 'set_system_setting', 'get_all_system_settings',
+        'create_user', 'get_user_by_username', 'get_user_by_email', 'verify_user_password', 'update_user_password',
+        'get_all_users', 'get_user_by_id', 'get_user_settings', 'get_user_setting', 'set_user_setting',
+        'generate_verification_code', 'generate_captcha', 'save_captcha', 'verify_captcha',
+        'save_verification_code', 'verify_email_code',
+        'get_ai_item_cache', 'get_recent_ai_item_cache', 'save_ai_item_cache',
+        'add_notification_retry', 'claim_due_notification_retries', 'reschedule_notification_retry',
+        'delete_notification_retry',
+        'heartbeat_cluster_node', 'remove_cluster_node', 'acquire_account_leases', 'renew_account_leases',
+        'release_account_leases', 'get_account_leases', 'get_cluster_nodes',
+        'add_cache_invalidation', 'get_cache_invalidations', 'get_last_cache_invalidation_id',
+        'purge_cache_invalidations', 'claim_periodic_run',
+        'get_connection',
+    })
+    # 按记录ID路由的方法：方法名 -> ID参数名
+    _ID_METHODS = {
+        'get_card_by_id': 'card_id', 'update_card': 'card_id', 'update_card_image_url': 'card_id',
+        'delete_card': 'card_id', 'consume_batch_data': 'card_id', 'get_card_stock': 'card_id',
+        'get_delivery_rule_by_id': 'rule_id', 'update_delivery_rule': 'rule_id',
+        'increment_delivery_times': 'rule_id', 'delete_delivery_rule': 'rule_id',
+        'get_notification_channel': 'channel_id', 'update_notification_channel': 'channel_id',
+        'delete_notification_channel': 'channel_id',
+        'delete_message_notification': 'notification_id',
+        'update_risk_control_log': 'log_id', 'delete_risk_control_log': 'log_id',
+    }
+    # 批量方法，记录按其中的 cookie_id 分组后在各自的库中执行：方法名 -> 合并方式
+    _BATCH_METHODS = {
+        'add_ai_conversations': 'all',
+        'batch_save_item_basic_info': 'merge',
+        'batch_delete_item_info': 'merge',
+        'batch_delete_item_replies': 'sum',
+    }
+    # 在所有库上执行并合并结果的方法：方法名 -> 合并方式
+    _FANOUT_METHODS = {
+        'get_all_cookie_status': 'merge',
+        'get_all_ai_reply_settings': 'merge',
+        'get_all_default_replies': 'merge',
+        'get_all_message_notifications': 'merge',
+        'get_all_items': 'merge',
+        'get_enabled_delivery_rules_with_cards': 'merge',
+        'get_delivery_rules_by_keyword': 'merge',
+        'get_delivery_rules_by_keyword_and_spec': 'merge',
+        'get_item_replay': 'first',
+        'get_order_by_id': 'first',
+        'cleanup_old_data': 'sum',
+        'checkpoint': 'all',
+    }
+
+    def __init__(self, db_path: str = None, tenant_dir: str = None):
+        """
+        Args:
+            db_path: 全局库路径，默认使用环境变量 DB_PATH
+            tenant_dir: 用户库目录，默认为全局库所在目录下的 tenants
+        """
+        self.global_db = DBManager(db_path)
+        self.tenant_dir = tenant_dir or os.path.join(os.path.dirname(self.global_db.db_path), 'tenants')
+        os.makedirs(self.tenant_dir, mode=0o755, exist_ok=True)
+        self._tenants: Dict[int, DBManager] = {}
+        self._tenants_lock = threading.Lock()
+        self._user_ids = set()
+        self._scan_tenant_dir()
+        # cookie_id -> user_id
+        self._cookie_owners: Dict[str, int] = {}
+        self._load_directory()
+        logger.info(f"按用户分库：全局库 {self.global_db.db_path}，用户库目录 {self.tenant_dir}，"
+                    f"{len(self._user_ids)} 个用户库，{len(self._cookie_owners)} 个账号")
+
+    # -------------------- 路由 --------------------
+
+    def for_user(self, user_id: int) -> DBManager:
+        """用户数据所在的库，首次访问时创建库文件"""
+        if user_id is None:
+            return self.global_db
+        user_id = int(user_id)
+        db = self._tenants.get(user_id)
+        if db is None:
+            with self._tenants_lock:
+                db = self._tenants.get(user_id)
+                if db is None:
+                    db = DBManager(self.tenant_path(user_id), lock_label='tenant')
+                    self._seed_id_range(db, user_id)
+                    self._tenants[user_id] = db
+                    self._user_ids.add(user_id)
+        return db
+
+    def for_cookie(self, cookie_id: str) -> DBManager:
+        """账号数据所在的库（未知账号返回全局库，其中的用户数据表为空）"""
+        return self.for_user(self._owner_of(cookie_id))
+
+    def for_record(self, record_id) -> DBManager:
+        """按自增ID找到记录所在的库"""
+        try:
+            user_id = int(record_id) // TENANT_ID_SPAN
+        except (TypeError, ValueError):
+            return self.global_db
+        return self.for_user(user_id) if user_id > 0 else self.global_db
+
+    def tenant_path(self, user_id: int) -> str:
+        return os.path.join(self.tenant_dir, f'user_{int(user_id)}.db')
+
+    def all_dbs(self) -> List[DBManager]:
+        """全局库和所有用户库（包括其他进程新建的用户库）"""
+        self._scan_tenant_dir()
+        with self._tenants_lock:
+            user_ids = sorted(self._user_ids)
+        return [self.global_db] + [self.for_user(user_id) for user_id in user_ids]
+
+    def get_cookie_owner(self, cookie_id: str) -> Optional[int]:
+        return self._owner_of(cookie_id)
+
+    def __getattr__(self, name):
+        """未显式实现的 DBManager 方法按路由规则转发，属性读取全局库的"""
+        if name == 'global_db':
+            raise AttributeError(name)
+        attr = getattr(self.global_db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        route = self._make_route(name)
+        # 缓存路由函数，之后的调用不再经过 __getattr__
+        self.__dict__[name] = route
+        return route
+
+    def _make_route(self, name: str):
+        if name in self._GLOBAL_METHODS:
+            return getattr(self.global_db, name)
+        params = list(inspect.signature(getattr(DBManager, name)).parameters)[1:]
+
+        def get_arg(args, kwargs, param):
+            if param in kwargs:
+                return kwargs[param]
+            index = params.index(param)
+            return args[index] if index < len(args) else None
+
+        if name in self._ID_METHODS:
+            param = self._ID_METHODS[name]
+
+            def call(*args, **kwargs):
+                return getattr(self.for_record(get_arg(args, kwargs, param)), name)(*args, **kwargs)
+        elif name in self._BATCH_METHODS:
+            def call(records, *args, **kwargs):
+                return self._run_batch(name, records, *args, **kwargs)
+        elif name in self._FANOUT_METHODS:
+            def call(*args, **kwargs):
+                return self._run_all(name, self._FANOUT_METHODS[name], *args, **kwargs)
+        elif 'cookie_id' in params or 'user_id' in params:
+            param = 'cookie_id' if 'cookie_id' in params else 'user_id'
+            locate = self.for_cookie if param == 'cookie_id' else self.for_user
+            fanout = name.startswith('get_')
+
+            def call(*args, **kwargs):
+                key = get_arg(args, kwargs, param)
+                if key is None and fanout:
+                    # 不指定账号或用户的查询返回所有库的数据
+                    return self._run_all(name, 'merge', *args, **kwargs)
+                return getattr(locate(key), name)(*args, **kwargs)
+        else:
+            return getattr(self.global_db, name)
+        call.__name__ = name
+        return call
+
+    def _run_all(self, name: str, mode: str, *args, **kwargs):
+        return _merge_results([getattr(db, name)(*args, **kwargs) for db in self.all_dbs()], mode)
+
+    def _run_batch(self, name: str, records: list, *args, **kwargs):
+        groups: Dict[int, list] = {}
+        for record in records or []:
+            cookie_id = record.get('cookie_id') if isinstance(record, dict) else record[0]
+            groups.setdefault(self._owner_of(cookie_id), []).append(record)
+        if not groups:
+            return getattr(self.global_db, name)(records, *args, **kwargs)
+        return _merge_results([getattr(self.for_user(user_id), name)(group, *args, **kwargs)
+                               for user_id, group in groups.items()], self._BATCH_METHODS[name])
+
+    # -------------------- 账号目录 --------------------
+
+    def _scan_tenant_dir(self):
+        """把用户库目录中的库文件加入已知用户（其他进程可能新建了用户库）"""
+        user_ids = set()
+        for filename in os.listdir(self.tenant_dir):
+            match = re.fullmatch(r'user_(\d+)\.db', filename)
+            if match:
+                user_ids.add(int(match.group(1)))
+        with self._tenants_lock:
+            self._user_ids.update(user_ids)
+
+    def _owner_of(self, cookie_id: str) -> Optional[int]:
+        """账号所属的用户，内存目录中没有时重新读取 tenant_cookies（其他进程可能刚添加了该账号）"""
+        if cookie_id is None:
+            return None
+        owner = self._cookie_owners.get(cookie_id)
+        if owner is None:
+            with self.global_db._read_cursor() as cursor:
+                cursor.execute("SELECT user_id FROM tenant_cookies WHERE cookie_id = ?", (cookie_id,))
+                row = cursor.fetchone()
+            if row is not None:
+                owner = self._cookie_owners[cookie_id] = row[0]
+        return owner
+
+    def _claim_cookie_owner(self, cookie_id: str, user_id: int) -> Optional[int]:
+        """为新账号登记所属用户，已被其他进程登记时沿用已有的用户，返回实际的所属用户（失败返回None）"""
+        db = self.global_db
+        with db.lock:
+            try:
+                cursor = db.conn.cursor()
+                db._execute_sql(cursor, "INSERT OR IGNORE INTO tenant_cookies (cookie_id, user_id) VALUES (?, ?)",
+                                (cookie_id, user_id))
+                db._execute_sql(cursor, "SELECT user_id FROM tenant_cookies WHERE cookie_id = ?", (cookie_id,))
+                owner = cursor.fetchone()[0]
+                db.conn.commit()
+            except Exception as e:
+                logger.error(f"更新账号目录失败: {e}")
+                db.conn.rollback()
+                return None
+        self._cookie_owners[cookie_id] = owner
+        return owner
+
+    def _load_directory(self):
+        db = self.global_db
+        with db.lock:
+            cursor = db.conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tenant_cookies (
+                cookie_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL
+            )
+            ''')
+            db.conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM cookies")
+            legacy = cursor.fetchone()[0]
+            cursor.execute("SELECT cookie_id, user_id FROM tenant_cookies")
+            self._cookie_owners = {row[0]: row[1] for row in cursor.fetchall()}
+        if legacy:
+            raise RuntimeError(f"全局库 {db.db_path} 中还有 {legacy} 个账号的数据，"
+                               f"请先运行 python migrate_tenant_db.py 拆分为按用户分库的布局")
+        if not self._cookie_owners and self._user_ids:
+            self.rebuild_directory()
+
+    def rebuild_directory(self) -> int:
+        """按各用户库中的账号重建账号目录，返回账号数量"""
+        owners = {}
+        for user_id in sorted(self._user_ids):
+            for cookie_id in self.for_user(user_id).get_all_cookies():
+                owners[cookie_id] = user_id
+        db = self.global_db
+        with db.lock:
+            try:
+                cursor = db.conn.cursor()
+                cursor.execute("DELETE FROM tenant_cookies")
+                cursor.executemany("INSERT INTO tenant_cookies (cookie_id, user_id) VALUES (?, ?)",
+                                   list(owners.items()))
+                db.conn.commit()
+            except Exception as e:
+                logger.error(f"重建账号目录失败: {e}")
+                db.conn.rollback()
+                raise
+        self._cookie_owners = owners
+        logger.info(f"账号目录已重建: {len(owners)} 个账号")
+        return len(owners)
+
+    def _set_cookie_owners(self, owners: Dict[str, int], removed: List[str] = ()) -> bool:
+        db = self.global_db
+        with db.lock:
+            try:
+                cursor = db.conn.cursor()
+                for cookie_id in removed:
+                    db._execute_sql(cursor, "DELETE FROM tenant_cookies WHERE cookie_id = ?", (cookie_id,))
+                for cookie_id, user_id in owners.items():
+                    db._execute_sql(cursor, "INSERT OR REPLACE INTO tenant_cookies (cookie_id, user_id) VALUES (?, ?)",
+                                    (cookie_id, user_id))
+                db.conn.commit()
+            except Exception as e:
+                logger.error(f"更新账号目录失败: {e}")
+                db.conn.rollback()
+                return False
+        for cookie_id in removed:
+            self._cookie_owners.pop(cookie_id, None)
+        self._cookie_owners.update(owners)
+        return True
+
+    def _sync_user_cookies(self, user_id: int):
+        """用户库中的账号有批量变化（导入备份、删除用户）后同步账号目录"""
+        current = set(self.for_user(user_id).get_all_cookies(user_id)) if user_id in self._user_ids else set()
+        removed = [cookie_id for cookie_id, owner in list(self._cookie_owners.items())
+                   if owner == user_id and cookie_id not in current]
+        self._set_cookie_owners({cookie_id: user_id for cookie_id in current}, removed)
+
+    @staticmethod
+    def _seed_id_range(db: DBManager, user_id: int):
+        """把用户库中各自增表的起始ID设置为 user_id * TENANT_ID_SPAN"""
+        base = user_id * TENANT_ID_SPAN
+        with db.lock:
+            try:
+                cursor = db.conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'")
+                tables = [row[0] for row in cursor.fetchall() if row[0] in TENANT_TABLES]
+                for table in tables:
+                    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+                    elif row[0] < base:
+                        cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (base, table))
+                db.conn.commit()
+            except Exception as e:
+                logger.error(f"设置用户库ID起始值失败: user_id={user_id}, {e}")
+                db.conn.rollback()
+                raise
+
+    # -------------------- 需要跨库处理的方法 --------------------
+
+    def save_cookie(self, cookie_id: str, cookie_value: str, user_id: int = None) -> bool:
+        """保存Cookie，新账号按 user_id（默认admin用户）放入对应的用户库
+
+        不指定 user_id 时保存到账号已登记的用户库，不会把其他用户的账号改登记到admin用户。
+        """
+        owner = self._owner_of(cookie_id)
+        if owner is None:
+            new_owner = user_id
+            if new_owner is None:
+                admin_user = self.global_db.get_user_by_username('admin')
+                new_owner = admin_user['id'] if admin_user else 1
+            owner = self._claim_cookie_owner(cookie_id, int(new_owner))
+            if owner is None:
+                return False
+        if user_id is not None and int(user_id) != owner:
+            logger.error(f"Cookie保存失败: {cookie_id} 属于用户 {owner}，按用户分库时不能直接转给用户 {user_id}")
+            return False
+        return self.for_user(owner).save_cookie(cookie_id, cookie_value, owner)
+
+    def delete_cookie(self, cookie_id: str) -> bool:
+        if not self.for_cookie(cookie_id).delete_cookie(cookie_id):
+            return False
+        return self._set_cookie_owners({}, [cookie_id])
+
+    def delete_user_and_data(self, user_id: int):
+        """删除用户（全局库）及其用户库中的所有数据"""
+        if not self.global_db.delete_user_and_data(user_id):
+            return False
+        if user_id in self._user_ids and not self.for_user(user_id).delete_user_and_data(user_id):
+            return False
+        self._sync_user_cookies(user_id)
+        return True
+
+    def export_backup(self, user_id: int = None) -> Dict[str, any]:
+        """导出备份：用户级备份只读该用户的库，系统级备份合并所有库中的用户数据"""
+        if user_id is not None:
+            return self.for_user(user_id).export_backup(user_id)
+        backup_data = self.global_db.export_backup()
+        for db in self.all_dbs()[1:]:
+            for table, content in db.export_backup()['data'].items():
+                if table in TENANT_TABLES and table in backup_data['data']:
+                    backup_data['data'][table]['rows'].extend(content['rows'])
+        return backup_data
+
+    def import_backup(self, backup_data: Dict[str, any], user_id: int = None) -> bool:
+        if user_id is None:
+            logger.error("按用户分库时只支持用户级备份导入")
+            return False
+        if not self.for_user(user_id).import_backup(backup_data, user_id):
+            return False
+        self._sync_user_cookies(int(user_id))
+        return True
+
+    def get_table_data(self, table_name: str):
+        if table_name not in TENANT_TABLES:
+            return self.global_db.get_table_data(table_name)
+        data, columns = [], []
+        for db in self.all_dbs():
+            rows, table_columns = db.get_table_data(table_name)
+            data.extend(rows)
+            columns = columns or table_columns
+        return data, columns
+
+    def delete_table_record(self, table_name: str, record_id: str):
+        if table_name not in TENANT_TABLES:
+            return self.global_db.delete_table_record(table_name, record_id)
+        for db in self.all_dbs():
+            if db.delete_table_record(table_name, record_id):
+                if table_name == 'cookies':
+                    self._set_cookie_owners({}, [record_id])
+                return True
+        return False
+
+    def clear_table_data(self, table_name: str):
+        if table_name not in TENANT_TABLES:
+            return self.global_db.clear_table_data(table_name)
+        success = True
+        for user_id, db in [(None, self.global_db)] + [(uid, self.for_user(uid)) for uid in sorted(self._user_ids)]:
+            success = db.clear_table_data(table_name) and success
+            if user_id is not None:
+                # 清空表会重置自增ID，重新设置用户库的ID起始值
+                self._seed_id_range(db, user_id)
+        if table_name == 'cookies':
+            self._set_cookie_owners({}, list(self._cookie_owners))
+        return success
+
+    def close(self):
+        for db in [self.global_db] + list(self._tenants.values()):
+            db.close()
+
+
+class AsyncDBManager:
+    """DBManager 的异步门面
+
+    事件循环中的热点路径通过本类调用数据库，查询在独立的数据库线程池中执行，
+    等待全局锁或磁盘IO时不会阻塞其他账号的 WebSocket 循环。
+    """
+
+    def __init__(self, db: DBManager, max_workers: int = None):
+        self.db = db
+        # 读连接池大小 + 1 个写线程，多余的线程只会在锁上排队
+        self.max_workers = max_workers or (db.read_pool_size + 1)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """在数据库线程池中执行同步函数并等待结果"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        """未显式声明的 DBManager 方法也可以直接 await 调用"""
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    # -------------------- 热点查询 --------------------
+
+    async def get_item_info(self, cookie_id: str, item_id: str) -> Optional[Dict]:
+        return await self.run(self.db.get_item_info, cookie_id, item_id)
+
+    async def get_cookie_pause_duration(self, cookie_id: str) -> int:
+        return await self.run(self.db.get_cookie_pause_duration, cookie_id)
+
+    async def get_cookie_reply_debounce(self, cookie_id: str) -> int:
+        return await self.run(self.db.get_cookie_reply_debounce, cookie_id)
+
+    async def get_delivery_rules_by_keyword_and_spec(self, keyword: str, spec_name: str = None, spec_value: str = None):
+        return await self.run(self.db.get_delivery_rules_by_keyword_and_spec, keyword, spec_name, spec_value)
+
+    async def get_delivery_rules_by_keyword(self, keyword: str):
+        return await self.run(self.db.get_delivery_rules_by_keyword, keyword)
+
+    async def consume_batch_data(self, card_id: int):
+        return await self.run(self.db.consume_batch_data, card_id)
+
+    async def increment_delivery_times(self, rule_id: int):
+        return await self.run(self.db.increment_delivery_times, rule_id)
+
+    async def get_account_notifications(self, cookie_id: str):
+        return await self.run(self.db.get_account_notifications, cookie_id)
+
+    async def get_default_reply(self, cookie_id: str):
+        return await self.run(self.db.get_default_reply, cookie_id)
+
+    async def has_default_reply_record(self, cookie_id: str, chat_id: str) -> bool:
+        return await self.run(self.db.has_default_reply_record, cookie_id, chat_id)
+
+    async def add_default_reply_record(self, cookie_id: str, chat_id: str):
+        return await self.run(self.db.add_default_reply_record, cookie_id, chat_id)
+
+    async def get_item_reply(self, cookie_id: str, item_id: str):
+        return await self.run(self.db.get_item_reply, cookie_id, item_id)
+
+    async def get_item_replay(self, item_id: str):
+        return await self.run(self.db.get_item_replay, item_id)
+
+    async def get_ai_reply_settings(self, cookie_id: str) -> dict:
+        return await self.run(self.db.get_ai_reply_settings, cookie_id)
+
+    def shutdown(self):
+        """关闭数据库线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 全局单例（环境变量 DB_LAYOUT=tenant 时按用户分库，用户库目录可用 DB_TENANT_DIR 指定）
+if os.getenv('DB_LAYOUT', 'single').lower() == 'tenant':
+    db_manager = TenantDBManager(tenant_dir=os.getenv('DB_TENANT_DIR') or None)
+else:
+    db_manager = DBManager()
+async_db_manager = AsyncDBManager(db_manager)
 
 # 确保进程结束时关闭数据库连接
 import atexit
 atexit.register(db_manager.close)
+atexit.register(async_db_manager.shutdown)
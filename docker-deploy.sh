@@ -212,6 +212,9 @@ backup_data() {
     # 备份数据库
     if [ -f "data/xianyu_data.db" ]; then
         cp data/xianyu_data.db "$backup_dir/"
+        # WAL模式下未合并的数据保存在-wal文件中，需要一并备份
+        cp data/xianyu_data.db-wal "$backup_dir/" 2>/dev/null || true
+        cp data/xianyu_data.db-shm "$backup_dir/" 2>/dev/null || true
         print_success "数据库备份完成"
     fi
     
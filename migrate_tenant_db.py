@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把单库布局的数据库拆分为按用户分库的布局（见 db_manager.TenantDBManager）
+
+- 源库不会被修改：先用 SQLite 在线备份把源库复制为新的全局库，再把各用户的数据移到 tenant_dir/user_<id>.db
+- 用户库中的自增ID加上 user_id * TENANT_ID_SPAN（卡券、发货规则、通知渠道的引用一起调整），按ID即可找到所在的库
+- 不属于任何用户的数据（如已删除账号遗留的记录）留在全局库中
+- 完成后核对每个表迁移前后的行数
+
+用法:
+    python migrate_tenant_db.py --source xianyu_data.db --target data/tenant/xianyu_data.db
+    然后以 DB_LAYOUT=tenant DB_PATH=data/tenant/xianyu_data.db 启动
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+
+# 引用其他用户库表ID的字段：表 -> {字段: 被引用的表}
+ID_REFERENCES = {
+    'card_items': {'card_id': 'cards'},
+    'delivery_rules': {'card_id': 'cards'},
+    'message_notifications': {'channel_id': 'notification_channels'},
+}
+
+# 直接按 user_id 归属的表，其余用户库表按 cookie_id（card_items 按 card_id）归属
+USER_OWNED_TABLES = ('cookies', 'cards', 'delivery_rules', 'notification_channels')
+
+
+def owner_filter(table: str) -> str:
+    """选出某个用户数据的 WHERE 条件（参数为 user_id）"""
+    if table in USER_OWNED_TABLES:
+        return "user_id = ?"
+    if table == 'card_items':
+        return "card_id IN (SELECT id FROM main.cards WHERE user_id = ?)"
+    return "cookie_id IN (SELECT id FROM main.cookies WHERE user_id = ?)"
+
+
+def table_columns(conn, schema: str, table: str):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def count_rows(path: str, tables) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in tables if table in existing}
+    finally:
+        conn.close()
+
+
+def migrate(source: str, target: str, tenant_dir: str):
+    # 先复制源库，再加载 db_manager（导入时按 DB_PATH 创建全局库实例，并把表结构升级到当前版本）
+    print(f"复制源库 {source} -> {target}")
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+
+    os.environ['DB_PATH'] = target
+    os.environ['DB_LAYOUT'] = 'single'
+    os.environ.setdefault('SQL_LOG_ENABLED', 'false')
+    from db_manager import DBManager, TenantDBManager, TENANT_TABLES, TENANT_ID_SPAN, db_manager
+
+    before = count_rows(target, TENANT_TABLES)
+    conn = db_manager.conn
+    autoincrement = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'")}
+    tables = [table for table in TENANT_TABLES if table in before]
+
+    user_ids = set()
+    for table in USER_OWNED_TABLES:
+        if table in before:
+            user_ids.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT user_id FROM {table} WHERE user_id IS NOT NULL"))
+    print(f"共 {len(user_ids)} 个用户有数据: {sorted(user_ids)}")
+
+    os.makedirs(tenant_dir, exist_ok=True)
+    with db_manager.lock:
+        for user_id in sorted(user_ids):
+            tenant_path = os.path.join(tenant_dir, f'user_{int(user_id)}.db')
+            if os.path.exists(tenant_path):
+                raise RuntimeError(f"用户库已存在: {tenant_path}")
+            # 用 DBManager 创建完整的表结构，并设置ID起始值
+            tenant = DBManager(tenant_path)
+            TenantDBManager._seed_id_range(tenant, int(user_id))
+            tenant.close()
+
+            offset = int(user_id) * TENANT_ID_SPAN
+            conn.execute("ATTACH DATABASE ? AS tenant", (tenant_path,))
+            try:
+                moved = {}
+                for table in tables:
+                    target_columns = set(table_columns(conn, 'tenant', table))
+                    columns = [column for column in table_columns(conn, 'main', table) if column in target_columns]
+                    shifted = dict(ID_REFERENCES.get(table, {}))
+                    if table in autoincrement and 'id' in columns:
+                        shifted['id'] = table
+                    select = ', '.join(
+                        f"{column} + {offset}" if column in shifted and shifted[column] in autoincrement
+                        else column for column in columns)
+                    cursor = conn.execute(
+                        f"INSERT INTO tenant.{table} ({', '.join(columns)}) "
+                        f"SELECT {select} FROM main.{table} WHERE {owner_filter(table)}", (user_id,))
+                    moved[table] = cursor.rowcount
+                # 依赖 cookies / cards 的表先删，cookies / cards 最后删
+                for table in sorted(tables, key=lambda name: name in ('cookies', 'cards')):
+                    conn.execute(f"DELETE FROM main.{table} WHERE {owner_filter(table)}", (user_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE tenant")
+            print(f"用户 {user_id}: " + ', '.join(f"{table} {count}" for table, count in moved.items() if count))
+
+    db_manager.checkpoint()
+    db_manager.close()
+
+    # 创建账号目录（全局库中已没有账号，按用户库中的账号重建）
+    router = TenantDBManager(target, tenant_dir)
+    router.close()
+
+    after = count_rows(target, tables)
+    for user_id in user_ids:
+        for table, count in count_rows(os.path.join(tenant_dir, f'user_{int(user_id)}.db'), tables).items():
+            after[table] = after.get(table, 0) + count
+    mismatched = {table: (before[table], after.get(table, 0)) for table in tables if before[table] != after.get(table, 0)}
+    if mismatched:
+        raise RuntimeError(f"迁移前后行数不一致: {mismatched}")
+    left = count_rows(target, tables)
+    print("行数核对通过，迁移前后一致")
+    print("留在全局库中的无主数据: " + (', '.join(f"{t} {c}" for t, c in left.items() if c) or '无'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把单库数据库拆分为按用户分库的布局")
+    parser.add_argument('--source', default=os.getenv('DB_PATH', 'xianyu_data.db'), help="现有的单库数据库文件")
+    parser.add_argument('--target', required=True, help="新的全局库文件路径（不能与源库相同）")
+    parser.add_argument('--tenant-dir', help="用户库目录，默认为全局库所在目录下的 tenants")
+    parser.add_argument('--force', action='store_true', help="目标已存在时删除后重新迁移")
+    args = parser.parse_args()
+
+    source, target = os.path.abspath(args.source), os.path.abspath(args.target)
+    tenant_dir = os.path.abspath(args.tenant_dir or os.path.join(os.path.dirname(target), 'tenants'))
+    if not os.path.exists(source):
+        print(f"✗ 源库不存在: {source}")
+        return 1
+    if source == target:
+        print("✗ 目标不能与源库相同，迁移不会修改源库")
+        return 1
+    if os.path.exists(target) or (os.path.isdir(tenant_dir) and os.listdir(tenant_dir)):
+        if not args.force:
+            print(f"✗ 目标已存在: {target} 或 {tenant_dir}，使用 --force 覆盖")
+            return 1
+        for path in (target, target + '-wal', target + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(tenant_dir, ignore_errors=True)
+
+    migrate(source, target, tenant_dir)
+    print(f"✓ 迁移完成。启动时设置环境变量: DB_LAYOUT=tenant DB_PATH={target} DB_TENANT_DIR={tenant_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
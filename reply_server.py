@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Tuple, Optional, Dict, Any
@@ -24,6 +24,11 @@ from ai_reply_engine import ai_reply_engine
 from utils.qr_login import qr_login_manager
 from utils.xianyu_utils import trans_cookies
 from utils.image_utils import image_manager
+from utils.conversation_cache import conversation_cache
+from utils.item_detail_cache import item_detail_cache
+from utils.ai_reply_cache import ai_reply_cache
+from utils.scheduler import scheduler
+from utils import cache_invalidation
 
 from loguru import logger
 
@@ -371,6 +376,25 @@ async def health_check():
         cpu_percent = psutil.cpu_percent(interval=1)
         memory_info = psutil.virtual_memory()
 
+        # 主事件循环延迟、浏览器池和通知分发状态（在API线程中读取，仅为统计快照）
+        from utils.loop_monitor import loop_monitor
+        from utils.browser_pool import browser_pool
+        from utils.notification_dispatcher import notification_dispatcher
+        from utils.single_flight import single_flight
+        from utils import sharding, account_lease
+        from XianyuAutoAsync import XianyuLive
+
+        instances = XianyuLive.get_all_instances()
+        inbound_queues = {cookie_id: instance.inbound_queue.get_stats() for cookie_id, instance in instances.items()}
+        reply_debounce = {cookie_id: instance.reply_debouncer.get_stats() for cookie_id, instance in instances.items()}
+        if sharding.supervisor is not None:
+            # 分片模式下账号实例在各分片进程中，合并各分片上报的队列和合并回复状态
+            details = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: sharding.supervisor.broadcast('stats', timeout=10))
+            for result in details.values():
+                inbound_queues.update(result.get('inbound_queues', {}))
+                reply_debounce.update(result.get('reply_debounce', {}))
+
         status = {
             "status": "healthy" if manager_status == "ok" and db_status == "ok" else "unhealthy",
             "timestamp": time.time(),
@@ -382,7 +406,19 @@ async def health_check():
                 "cpu_percent": cpu_percent,
                 "memory_percent": memory_info.percent,
                 "memory_available": memory_info.available
-            }
+            },
+            "event_loop": loop_monitor.get_stats(),
+            "browser_pool": browser_pool.get_stats(),
+            "conversation_cache": conversation_cache.get_stats(),
+            "item_detail_cache": item_detail_cache.get_stats(),
+            "ai_reply_cache": ai_reply_cache.get_stats(),
+            "notifications": notification_dispatcher.get_stats(),
+            "single_flight": single_flight.get_stats(),
+            "scheduler": scheduler.get_stats(),
+            "shards": sharding.supervisor.get_stats() if sharding.supervisor is not None else None,
+            "cluster": account_lease.lease_manager.get_stats() if account_lease.lease_manager is not None else None,
+            "inbound_queues": inbound_queues,
+            "reply_debounce": reply_debounce
         }
 
         if status["status"] == "unhealthy":
@@ -398,6 +434,26 @@ async def health_check():
         }
 
 
+# Prometheus 指标端点
+@app.get('/metrics')
+def get_metrics():
+    """Prometheus 文本格式的运行指标（与 /health 一样无需登录，供 Prometheus 抓取）
+
+    分片模式下同时收集各分片进程的指标，样本加上 shard 标签（API 进程为 shard="api"）。
+    """
+    from utils import metrics, sharding
+    families = metrics.registry.collect()
+    if sharding.supervisor is not None:
+        groups = {'api': families}
+        for shard_id, result in sharding.supervisor.broadcast('metrics', timeout=10).items():
+            if isinstance(result, list):
+                groups[str(shard_id)] = result
+            else:
+                logger.warning(f"收集分片 {shard_id} 的指标失败: {result.get('error')}")
+        families = metrics.merge_families(groups)
+    return PlainTextResponse(metrics.render(families), media_type='text/plain; version=0.0.4')
+
+
 # 重定向根路径到登录页面
 @app.get('/', response_class=HTMLResponse)
 async def root():
@@ -944,6 +1000,19 @@ async def send_message_api(request: SendMessageRequest):
                     message=f"参数 {param_name} 不能为空"
                 )
 
+        # 分片模式下账号实例在分片进程中，把发送请求转发给账号所在的分片
+        from utils import sharding
+        if sharding.supervisor is not None:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, sharding.supervisor.call, cleaned_cookie_id, 'send_message',
+                cleaned_chat_id, cleaned_to_user_id, cleaned_message
+            )
+            if result['success']:
+                logger.info(f"API成功发送消息（分片 {sharding.supervisor.shard_of(cleaned_cookie_id)}）: {cleaned_cookie_id} -> {cleaned_to_user_id}, 内容: {cleaned_message[:50]}{'...' if len(cleaned_message) > 50 else ''}")
+            else:
+                logger.warning(f"{result['message']}: {cleaned_cookie_id}")
+            return SendMessageResponse(**result)
+
         # 直接获取XianyuLive实例，跳过cookie_manager检查
         from XianyuAutoAsync import XianyuLive
         live_instance = XianyuLive.get_instance(cleaned_cookie_id)
@@ -2118,6 +2187,7 @@ def remove_cookie(cid: str, current_user: Dict[str, Any] = Depends(get_current_u
             raise HTTPException(status_code=403, detail="无权限操作该Cookie")
 
         cookie_manager.manager.remove_cookie(cid)
+        cache_invalidation.invalidate('conversations', cid)
         return {"msg": "removed"}
     except HTTPException:
         raise
@@ -2137,6 +2207,10 @@ class PauseDurationUpdate(BaseModel):
     pause_duration: int
 
 
+class ReplyDebounceUpdate(BaseModel):
+    reply_debounce: int
+
+
 @app.put("/cookies/{cid}/auto-confirm")
 def update_auto_confirm(cid: str, update_data: AutoConfirmUpdate, current_user: Dict[str, Any] = Depends(get_current_user)):
     """更新账号的自动确认发货设置"""
@@ -2316,6 +2390,64 @@ def get_cookie_pause_duration(cid: str, current_user: Dict[str, Any] = Depends(g
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.put("/cookies/{cid}/reply-debounce")
+def update_cookie_reply_debounce(cid: str, update_data: ReplyDebounceUpdate, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """更新账号连续消息合并回复窗口"""
+    if cookie_manager.manager is None:
+        raise HTTPException(status_code=500, detail="CookieManager 未就绪")
+    try:
+        # 检查cookie是否属于当前用户
+        user_id = current_user['user_id']
+        from db_manager import db_manager
+        user_cookies = db_manager.get_all_cookies(user_id)
+
+        if cid not in user_cookies:
+            raise HTTPException(status_code=403, detail="无权限操作该Cookie")
+
+        # 验证窗口范围（0-30秒，0表示不合并）
+        if not (0 <= update_data.reply_debounce <= 30):
+            raise HTTPException(status_code=400, detail="合并窗口必须在0-30秒之间（0表示不合并）")
+
+        success = db_manager.update_cookie_reply_debounce(cid, update_data.reply_debounce)
+        if success:
+            log_with_user('info', f"更新账号连续消息合并回复窗口: {cid} -> {update_data.reply_debounce}秒", current_user)
+            return {
+                "message": "合并窗口更新成功",
+                "reply_debounce": update_data.reply_debounce
+            }
+        else:
+            raise HTTPException(status_code=500, detail="合并窗口更新失败")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/cookies/{cid}/reply-debounce")
+def get_cookie_reply_debounce(cid: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """获取账号连续消息合并回复窗口"""
+    if cookie_manager.manager is None:
+        raise HTTPException(status_code=500, detail="CookieManager 未就绪")
+    try:
+        # 检查cookie是否属于当前用户
+        user_id = current_user['user_id']
+        from db_manager import db_manager
+        user_cookies = db_manager.get_all_cookies(user_id)
+
+        if cid not in user_cookies:
+            raise HTTPException(status_code=403, detail="无权限操作该Cookie")
+
+        reply_debounce = db_manager.get_cookie_reply_debounce(cid)
+        return {
+            "reply_debounce": reply_debounce,
+            "message": "获取合并窗口成功"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 
 
 class KeywordIn(BaseModel):
@@ -2488,6 +2620,7 @@ def update_keywords_with_item_id(cid: str, body: KeywordWithItemIdIn, current_us
             log_with_user('error', f"保存关键词时发生未知错误: {error_msg}", current_user)
             raise HTTPException(status_code=500, detail="保存关键词失败")
 
+    cache_invalidation.invalidate('keywords', cid)
     log_with_user('info', f"更新Cookie关键字(含商品ID): {cid}, 数量: {len(keywords_to_save)}", current_user)
     return {"msg": "updated", "count": len(keywords_to_save)}
 
@@ -2508,8 +2641,9 @@ def get_items_list(cid: str, current_user: Dict[str, Any] = Depends(get_current_
 
     try:
         # 获取该账号的所有商品
-        with db_manager.lock:
-            cursor = db_manager.conn.cursor()
+        db = db_manager.for_cookie(cid)
+        with db.lock:
+            cursor = db.conn.cursor()
             cursor.execute('''
             SELECT item_id, item_title, item_price, created_at
             FROM item_info
@@ -2693,6 +2827,7 @@ async def import_keywords(cid: str, file: UploadFile = File(...), current_user:
         if not success:
             raise HTTPException(status_code=500, detail="保存关键词到数据库失败")
 
+        cache_invalidation.invalidate('keywords', cid)
         log_with_user('info', f"导入关键词成功: {cid}, 新增: {add_count}, 更新: {update_count}", current_user)
 
         return {
@@ -2775,6 +2910,7 @@ async def add_image_keyword(
             image_manager.delete_image(image_url)
             raise HTTPException(status_code=400, detail="图片关键词保存失败，请稍后重试")
 
+        cache_invalidation.invalidate('keywords', cid)
         log_with_user('info', f"添加图片关键词成功: {cid}, 关键词: {keyword}", current_user)
 
         return {
@@ -2869,6 +3005,7 @@ def delete_keyword_by_index(cid: str, index: int, current_user: Dict[str, Any] =
             success = db_manager.delete_keyword_by_index(cid, index)
             if not success:
                 raise HTTPException(status_code=400, detail="删除关键词失败")
+            cache_invalidation.invalidate('keywords', cid)
 
             # 如果是图片关键词，删除对应的图片文件
             if keyword_data.get('type') == 'image' and keyword_data.get('image_url'):
@@ -2960,6 +3097,7 @@ def create_card(card_data: dict, current_user: Dict[str, Any] = Depends(get_curr
             user_id=user_id
         )
 
+        cache_invalidation.invalidate('delivery_rules')
         log_with_user('info', f"卡券创建成功: {card_name} (ID: {card_id})", current_user)
         return {"id": card_id, "message": "卡券创建成功"}
     except Exception as e:
@@ -3009,6 +3147,7 @@ def update_card(card_id: int, card_data: dict, _: None = Depends(require_auth)):
             spec_value=card_data.get('spec_value')
         )
         if success:
+            cache_invalidation.invalidate('delivery_rules')
             return {"message": "卡券更新成功"}
         else:
             raise HTTPException(status_code=404, detail="卡券不存在")
@@ -3072,6 +3211,7 @@ async def update_card_with_image(
         )
 
         if success:
+            cache_invalidation.invalidate('delivery_rules')
             logger.info(f"卡券更新成功: {name} (ID: {card_id})")
             return {"message": "卡券更新成功", "image_url": image_url}
         else:
@@ -3113,6 +3253,7 @@ def create_delivery_rule(rule_data: dict, current_user: Dict[str, Any] = Depends
             description=rule_data.get('description'),
             user_id=user_id
         )
+        cache_invalidation.invalidate('delivery_rules')
         return {"id": rule_id, "message": "发货规则创建成功"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3149,6 +3290,7 @@ def update_delivery_rule(rule_id: int, rule_data: dict, current_user: Dict[str,
             user_id=user_id
         )
         if success:
+            cache_invalidation.invalidate('delivery_rules')
             return {"message": "发货规则更新成功"}
         else:
             raise HTTPException(status_code=404, detail="发货规则不存在")
@@ -3163,6 +3305,7 @@ def delete_card(card_id: int, _: None = Depends(require_auth)):
         from db_manager import db_manager
         success = db_manager.delete_card(card_id)
         if success:
+            cache_invalidation.invalidate('delivery_rules')
             return {"message": "卡券删除成功"}
         else:
             raise HTTPException(status_code=404, detail="卡券不存在")
@@ -3178,6 +3321,7 @@ def delete_delivery_rule(rule_id: int, current_user: Dict[str, Any] = Depends(ge
         user_id = current_user['user_id']
         success = db_manager.delete_delivery_rule(rule_id, user_id)
         if success:
+            cache_invalidation.invalidate('delivery_rules')
             return {"message": "发货规则删除成功"}
         else:
             raise HTTPException(status_code=404, detail="发货规则不存在")
@@ -3231,6 +3375,8 @@ def import_backup(file: UploadFile = File(...), current_user: Dict[str, Any] = D
         success = db_manager.import_backup(backup_data, user_id)
 
         if success:
+            cache_invalidation.invalidate('delivery_rules')
+            cache_invalidation.invalidate('conversations')
             # 备份导入成功后，刷新 CookieManager 的内存缓存
             import cookie_manager
             if cookie_manager.manager:
@@ -3513,6 +3659,7 @@ def update_item_detail(
 
         success = db_manager.update_item_detail(cookie_id, item_id, update_data.item_detail)
         if success:
+            cache_invalidation.invalidate('ai_replies', cookie_id, item_id)
             return {"message": "商品详情更新成功"}
         else:
             raise HTTPException(status_code=400, detail="更新失败")
@@ -3540,6 +3687,7 @@ def delete_item_info(
 
         success = db_manager.delete_item_info(cookie_id, item_id)
         if success:
+            cache_invalidation.invalidate('ai_replies', cookie_id, item_id)
             return {"message": "商品信息删除成功"}
         else:
             raise HTTPException(status_code=404, detail="商品信息不存在")
@@ -3577,6 +3725,9 @@ def batch_delete_items(
 
         success_count = db_manager.batch_delete_item_info(request.items)
         total_count = len(request.items)
+        for item in request.items:
+            if item.get('cookie_id') and item.get('item_id'):
+                cache_invalidation.invalidate('ai_replies', item['cookie_id'], item['item_id'])
 
         return {
             "message": f"批量删除完成",
@@ -3635,6 +3786,7 @@ def update_ai_reply_settings(cookie_id: str, settings: AIReplySettings, current_
         if success:
             # 清理客户端缓存，强制重新创建
             ai_reply_engine.clear_client_cache(cookie_id)
+            cache_invalidation.invalidate('ai_replies', cookie_id)
 
             # 如果启用了AI回复，记录日志
             if settings.ai_enabled:
@@ -4032,6 +4184,9 @@ def delete_user(user_id: int, admin_user: Dict[str, Any] = Depends(require_admin
         success = db_manager.delete_user_and_data(user_id)
 
         if success:
+            cache_invalidation.invalidate('keywords')
+            cache_invalidation.invalidate('delivery_rules')
+            cache_invalidation.invalidate('conversations')
             log_with_user('info', f"用户删除成功: {user_to_delete['username']} (ID: {user_id})", admin_user)
             return {"message": f"用户 {user_to_delete['username']} 删除成功"}
         else:
@@ -4122,6 +4277,105 @@ def get_admin_cookies(admin_user: Dict[str, Any] = Depends(require_admin)):
         }
 
 
+@app.get('/admin/scheduler')
+def get_scheduler_jobs(admin_user: Dict[str, Any] = Depends(require_admin),
+                       cookie_id: str = None,
+                       limit: int = 200):
+    """查看周期任务调度器中即将执行和逾期的任务（管理员专用）"""
+    try:
+        log_with_user('info', f"查询周期任务调度器状态: {cookie_id or '全部账号'}", admin_user)
+
+        from utils import sharding
+        limit = max(1, min(limit, 1000))
+        if sharding.supervisor is not None:
+            # 分片模式下账号任务在各分片的调度器中，API进程的调度器只有全局任务
+            jobs = [dict(job, shard='api') for job in scheduler.get_jobs(owner=cookie_id)]
+            shard_stats = {'api': scheduler.get_stats()}
+            for shard_id, result in sharding.supervisor.broadcast('scheduler', cookie_id, timeout=10).items():
+                if 'error' in result:
+                    shard_stats[str(shard_id)] = result
+                    continue
+                shard_stats[str(shard_id)] = result['stats']
+                jobs.extend(dict(job, shard=shard_id) for job in result['jobs'])
+            jobs.sort(key=lambda job: (job['state'] != 'running', job['due_in']))
+            return {
+                "success": True,
+                "stats": shard_stats,
+                "overdue": [job for job in jobs if job['overdue']],
+                "jobs": jobs[:limit],
+                "total": len(jobs)
+            }
+
+        # 调度器在主事件循环中运行，这里读取的是快照
+        jobs = scheduler.get_jobs(owner=cookie_id) if cookie_id else scheduler.get_jobs()
+        return {
+            "success": True,
+            "stats": scheduler.get_stats(),
+            "overdue": [job for job in jobs if job['overdue']],
+            "jobs": jobs[:limit],
+            "total": len(jobs)
+        }
+
+    except Exception as e:
+        log_with_user('error', f"获取周期任务调度器状态失败: {str(e)}", admin_user)
+        return {
+            "success": False,
+            "jobs": [],
+            "message": f"获取失败: {str(e)}"
+        }
+
+
+@app.get('/admin/shards')
+def get_shard_status(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """查看各账号分片进程的状态（管理员专用，仅分片模式）"""
+    from utils import sharding
+    try:
+        log_with_user('info', "查询账号分片状态", admin_user)
+
+        if sharding.supervisor is None:
+            return {"success": True, "sharded": False, "shards": []}
+
+        # 向每个分片查询其账号、连接和事件循环状态
+        details = sharding.supervisor.broadcast('stats', timeout=10)
+        stats = sharding.supervisor.get_stats()
+        for shard in stats['shards']:
+            shard['details'] = details.get(shard['shard'])
+        return {"success": True, "sharded": True, **stats}
+
+    except Exception as e:
+        log_with_user('error', f"获取账号分片状态失败: {str(e)}", admin_user)
+        return {"success": False, "shards": [], "message": f"获取失败: {str(e)}"}
+
+
+@app.get('/admin/leases')
+def get_account_leases(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """查看多节点部署的节点和账号租约（管理员专用）"""
+    import time
+    from utils import account_lease
+    try:
+        log_with_user('info', "查询账号租约", admin_user)
+
+        now = time.time()
+        leases = db_manager.get_account_leases()
+        for lease in leases:
+            lease['expired'] = lease['expires_at'] < now
+        nodes = db_manager.get_cluster_nodes()
+        for node in nodes:
+            node['accounts'] = sum(1 for lease in leases if lease['owner'] == node['node_id'] and not lease['expired'])
+        lease_manager = account_lease.lease_manager
+        return {
+            "success": True,
+            "enabled": lease_manager is not None,
+            "node": lease_manager.get_stats() if lease_manager is not None else None,
+            "nodes": nodes,
+            "leases": leases
+        }
+
+    except Exception as e:
+        log_with_user('error', f"获取账号租约失败: {str(e)}", admin_user)
+        return {"success": False, "nodes": [], "leases": [], "message": f"获取失败: {str(e)}"}
+
+
 @app.get('/admin/logs')
 def get_system_logs(admin_user: Dict[str, Any] = Depends(require_admin),
                    lines: int = 100,
@@ -4398,8 +4652,13 @@ def download_database_backup(admin_user: Dict[str, Any] = Depends(require_admin)
 
         # 使用db_manager的实际数据库路径
         from db_manager import db_manager
+        if db_manager.tenant_layout:
+            raise HTTPException(status_code=400, detail="按用户分库时不支持下载单个数据库文件，请使用JSON备份导出")
         db_file_path = db_manager.db_path
 
+        # WAL模式下最新数据可能还在-wal文件中，先合并到主库文件
+        db_manager.checkpoint()
+
         # 检查数据库文件是否存在
         if not os.path.exists(db_file_path):
             log_with_user('error', f"数据库文件不存在: {db_file_path}", admin_user)
@@ -4435,6 +4694,14 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
     try:
         log_with_user('info', f"开始上传数据库备份: {backup_file.filename}", admin_user)
 
+        from db_manager import db_manager
+        from utils import sharding, account_lease
+        if db_manager.tenant_layout:
+            raise HTTPException(status_code=400, detail="按用户分库时不支持上传数据库文件，请使用JSON备份导入")
+        if sharding.supervisor is not None or account_lease.lease_manager is not None:
+            # 分片进程和其他节点仍打开着原数据库文件，替换文件后它们会继续读写已被替换的旧文件
+            raise HTTPException(status_code=400, detail="分片或多节点部署时不支持上传数据库文件，请使用JSON备份导入")
+
         # 验证文件类型
         if not backup_file.filename.endswith('.db'):
             log_with_user('warning', f"无效的备份文件类型: {backup_file.filename}", admin_user)
@@ -4487,13 +4754,14 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
         backup_filename = f"xianyu_data_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
         backup_current_path = os.path.join(db_dir, backup_filename)
 
+        db_manager.checkpoint()
         if os.path.exists(current_db_path):
             shutil.copy2(current_db_path, backup_current_path)
             log_with_user('info', f"当前数据库已备份为: {backup_current_path}", admin_user)
 
-        # 关闭当前数据库连接
+        # 关闭当前数据库连接（包括读连接池，确保WAL文件被合并）
         if hasattr(db_manager, 'conn') and db_manager.conn:
-            db_manager.conn.close()
+            db_manager.close()
             log_with_user('info', "已关闭当前数据库连接", admin_user)
 
         # 替换数据库文件
@@ -4502,6 +4770,11 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
 
         # 重新初始化数据库连接（使用原有的db_path）
         db_manager.__init__(db_manager.db_path)
+        cache_invalidation.invalidate('keywords')
+        cache_invalidation.invalidate('delivery_rules')
+        cache_invalidation.invalidate('conversations')
+        cache_invalidation.invalidate('item_details')
+        cache_invalidation.invalidate('ai_replies')
         log_with_user('info', "数据库连接已重新初始化", admin_user)
 
         # 验证新数据库
@@ -4588,7 +4861,7 @@ def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require
         allowed_tables = [
             'users', 'cookies', 'cookie_status', 'keywords', 'default_replies', 'default_reply_records',
             'ai_reply_settings', 'ai_conversations', 'ai_item_cache', 'item_info',
-            'message_notifications', 'cards', 'delivery_rules', 'notification_channels',
+            'message_notifications', 'cards', 'card_items', 'delivery_rules', 'notification_channels',
             'user_settings', 'system_settings', 'email_verifications', 'captcha_codes', 'orders', "item_replay"
         ]
 
@@ -4625,7 +4898,7 @@ def delete_table_record(table_name: str, record_id: str, admin_user: Dict[str, A
         allowed_tables = [
             'users', 'cookies', 'cookie_status', 'keywords', 'default_replies', 'default_reply_records',
             'ai_reply_settings', 'ai_conversations', 'ai_item_cache', 'item_info',
-            'message_notifications', 'cards', 'delivery_rules', 'notification_channels',
+            'message_notifications', 'cards', 'card_items', 'delivery_rules', 'notification_channels',
             'user_settings', 'system_settings', 'email_verifications', 'captcha_codes', 'orders','item_replay'
         ]
 
@@ -4642,6 +4915,16 @@ def delete_table_record(table_name: str, record_id: str, admin_user: Dict[str, A
         success = db_manager.delete_table_record(table_name, record_id)
 
         if success:
+            if table_name in ('keywords', 'cookies'):
+                cache_invalidation.invalidate('keywords')
+            if table_name in ('delivery_rules', 'cards'):
+                cache_invalidation.invalidate('delivery_rules')
+            if table_name in ('ai_conversations', 'cookies'):
+                cache_invalidation.invalidate('conversations')
+            if table_name == 'ai_item_cache':
+                cache_invalidation.invalidate('item_details')
+            if table_name in ('ai_reply_settings', 'item_info', 'cookies'):
+                cache_invalidation.invalidate('ai_replies')
             log_with_user('info', f"表记录删除成功: {table_name}.{record_id}", admin_user)
             return {"success": True, "message": "删除成功"}
         else:
@@ -4693,7 +4976,7 @@ def clear_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(requi
         allowed_tables = [
             'cookies', 'cookie_status', 'keywords', 'default_replies', 'default_reply_records',
             'ai_reply_settings', 'ai_conversations', 'ai_item_cache', 'item_info',
-            'message_notifications', 'cards', 'delivery_rules', 'notification_channels',
+            'message_notifications', 'cards', 'card_items', 'delivery_rules', 'notification_channels',
             'user_settings', 'system_settings', 'email_verifications', 'captcha_codes', 'orders', 'item_replay',
             'risk_control_logs'
         ]
@@ -4711,6 +4994,16 @@ def clear_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(requi
         success = db_manager.clear_table_data(table_name)
 
         if success:
+            if table_name in ('keywords', 'cookies'):
+                cache_invalidation.invalidate('keywords')
+            if table_name in ('delivery_rules', 'cards'):
+                cache_invalidation.invalidate('delivery_rules')
+            if table_name in ('ai_conversations', 'cookies'):
+                cache_invalidation.invalidate('conversations')
+            if table_name == 'ai_item_cache':
+                cache_invalidation.invalidate('item_details')
+            if table_name in ('ai_reply_settings', 'item_info', 'cookies'):
+                cache_invalidation.invalidate('ai_replies')
             log_with_user('info', f"表数据清空成功: {table_name}", admin_user)
             return {"success": True, "message": "清空成功"}
         else:
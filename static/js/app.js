@@ -3797,7 +3797,9 @@ function renderCardsList(cards) {
 
     // 数据量显示
     let dataCount = '-';
-    if (card.type === 'data' && card.data_content) {
+    if (card.type === 'data' && card.stock_count != null) {
+      dataCount = card.stock_count;
+    } else if (card.type === 'data' && card.data_content) {
       const lines = card.data_content.split('\n').filter((line) => line.trim());
       dataCount = lines.length;
     } else if (card.type === 'api') {
@@ -0,0 +1,265 @@
+"""多节点账号租约
+
+多个节点（容器、主机或进程）共用同一个数据库时，同一个账号只能由一个节点运行，否则会重复回复、重复发货。
+每个账号在数据库中有一条租约（持有节点、过期时间），节点只运行自己持有租约的账号：
+- 每个节点每隔 renew_interval 秒记录一次节点心跳并续约自己持有的全部租约
+- 账号按存活节点数平分：持有数少于平均数时获取未被持有或已过期的租约，多于平均数时每次释放一批多出的账号
+- 节点宕机后它的租约在 ttl 秒后过期，由其他节点在下一次续约时接管
+- 节点正常退出（SIGTERM）时先停止账号任务，再释放租约和节点记录，其他节点在下一次续约时立即接管，
+  逐个重启节点时账号最多中断一个续约间隔
+- 节点异常退出后以相同的节点ID重启时，先释放上次运行遗留的租约，再按平均数重新获取
+- 续约时发现租约已被其他节点接管（本节点曾长时间卡住），立即停止该账号
+- 各节点的进程内缓存通过数据库中的失效日志同步（见 utils/cache_invalidation.py），
+  在任意节点修改关键词、发货规则或 Cookie 后，运行该账号的节点在 invalidation_interval 秒内生效
+
+账号任务的启停通过 CookieManager 的 _start_cookie_task / _stop_cookie_task 进行，单进程和分片模式都适用。
+"""
+
+import asyncio
+import math
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+from db_manager import db_manager, async_db_manager
+
+
+class AccountLeaseManager:
+    """本节点的账号租约（续约任务在主事件循环中运行）"""
+
+    def __init__(self, node_id: str, ttl: float = 30, renew_interval: float = 10, rebalance_batch: int = 10,
+                 invalidation_interval: float = 2):
+        """
+        Args:
+            node_id: 节点ID，各节点必须不同
+            ttl: 租约有效期（秒），节点宕机后其账号最多在该时间加一个续约间隔后被接管
+            renew_interval: 续约和重新分配账号的间隔（秒），应明显小于 ttl
+            rebalance_batch: 每次续约最多释放多少个多出的账号（新节点加入时逐批迁移，避免大量账号同时重连）
+            invalidation_interval: 读取其他节点缓存失效记录的间隔（秒）
+        """
+        self.node_id = node_id
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.rebalance_batch = rebalance_batch
+        self.invalidation_interval = invalidation_interval
+        self.manager = None
+        # 本节点持有租约的账号，续约任务和API线程都会读写
+        self.held: Set[str] = set()
+        self.live_nodes: List[str] = []
+        self.target = 0
+        self.started_at = time.time()
+        self.last_renew = 0.0
+        self._lock = threading.Lock()
+        self.stats = {
+            'renewals': 0,
+            'acquired': 0,
+            'released': 0,
+            'lost': 0,
+            'errors': 0,
+        }
+
+    # -------------------- 对外接口 --------------------
+
+    def start(self, manager):
+        """接管 CookieManager 的账号启停，注册续约任务（立即执行一次）并启动缓存失效同步
+
+        同一节点ID的上一个进程异常退出（kill -9、OOM）时没有释放租约，新进程中这些账号没有运行的任务，
+        续约会把它们当作仍在运行而一直占住。启动时先释放本节点ID名下的全部租约，再重新获取。
+        """
+        from utils import cache_invalidation
+        from utils.scheduler import scheduler
+        self.manager = manager
+        manager.lease_manager = self
+        released = db_manager.release_account_leases(self.node_id)
+        if released:
+            logger.warning(f"释放了节点 {self.node_id} 上次运行遗留的 {released} 个账号租约")
+        scheduler.add(None, 'account_lease', self._renew, self.renew_interval, first_delay=0, jitter=0)
+        cache_invalidation.cluster_sync = cache_invalidation.ClusterSync(self.node_id, self.invalidation_interval)
+        cache_invalidation.cluster_sync.start()
+        logger.info(f"多节点账号租约已启用，节点: {self.node_id}，租约有效期: {self.ttl}秒，续约间隔: {self.renew_interval}秒")
+
+    async def stop(self):
+        """节点退出：停止本节点运行的账号，释放全部租约和节点记录"""
+        from utils import cache_invalidation
+        from utils.scheduler import scheduler
+        if cache_invalidation.cluster_sync is not None:
+            cache_invalidation.cluster_sync.stop()
+        for task in scheduler.remove(None, 'account_lease'):
+            try:
+                await task
+            except BaseException:
+                pass
+        with self._lock:
+            held, self.held = self.held, set()
+        if held:
+            logger.info(f"节点退出，停止 {len(held)} 个账号并释放租约...")
+            await asyncio.gather(*(self._stop_account(cookie_id) for cookie_id in held), return_exceptions=True)
+        released = await async_db_manager.run(db_manager.release_account_leases, self.node_id)
+        await async_db_manager.run(db_manager.remove_cluster_node, self.node_id)
+        logger.info(f"已释放 {released} 个账号租约，节点记录已删除: {self.node_id}")
+
+    def acquire(self, cookie_id: str) -> bool:
+        """获取（或续约）单个账号的租约，新增、启用账号时调用"""
+        acquired = bool(db_manager.acquire_account_leases(self.node_id, [cookie_id], self.ttl))
+        if acquired:
+            with self._lock:
+                if cookie_id not in self.held:
+                    self.held.add(cookie_id)
+                    self.stats['acquired'] += 1
+        return acquired
+
+    def release(self, cookie_id: str):
+        """释放单个账号的租约，删除、禁用账号时调用"""
+        with self._lock:
+            if cookie_id not in self.held:
+                return
+            self.held.discard(cookie_id)
+            self.stats['released'] += 1
+        db_manager.release_account_leases(self.node_id, [cookie_id])
+
+    async def reload_account(self, cookie_id: str):
+        """其他节点修改了账号的 Cookie：本节点持有该账号时从数据库读取新值并重启任务"""
+        with self._lock:
+            if cookie_id not in self.held:
+                return
+        details = await async_db_manager.run(db_manager.get_cookie_details, cookie_id)
+        if not details:
+            return
+        logger.info(f"其他节点修改了账号的Cookie，重启本节点的任务: {cookie_id}")
+        await self._stop_account(cookie_id)
+        await self._start_account(cookie_id, details['value'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        from utils import cache_invalidation
+        with self._lock:
+            held = len(self.held)
+        cache_sync = cache_invalidation.cluster_sync
+        return {
+            'node_id': self.node_id,
+            'held': held,
+            'target': self.target,
+            'live_nodes': len(self.live_nodes),
+            'ttl': self.ttl,
+            'renew_interval': self.renew_interval,
+            'last_renew': round(self.last_renew, 3) if self.last_renew else None,
+            'cache_sync': cache_sync.get_stats() if cache_sync is not None else None,
+            **self.stats,
+        }
+
+    # -------------------- 内部实现 --------------------
+
+    async def _renew(self):
+        # 续约失败时保持当前状态，等下一次续约
+        try:
+            await self._rebalance()
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"账号租约续约失败: {e}")
+
+    async def _rebalance(self):
+        """续约、清理、按平均数释放或获取账号"""
+        run = async_db_manager.run
+
+        self.live_nodes = await run(db_manager.heartbeat_cluster_node, self.node_id, socket.gethostname(),
+                                    os.getpid(), self.started_at, self.ttl)
+        held = set(await run(db_manager.renew_account_leases, self.node_id, self.ttl))
+        self.stats['renewals'] += 1
+        self.last_renew = time.time()
+
+        with self._lock:
+            lost = self.held - held
+            self.held = held
+        for cookie_id in lost:
+            # 租约已被其他节点接管，只停止任务，不能释放
+            self.stats['lost'] += 1
+            logger.warning(f"账号租约已被其他节点接管，停止本节点的任务: {cookie_id}")
+            await self._stop_account(cookie_id)
+
+        cookies = await run(db_manager.get_all_cookies)
+        statuses = await run(db_manager.get_all_cookie_status)
+        enabled = sorted(cid for cid in cookies if statuses.get(cid, True))
+        enabled_set = set(enabled)
+
+        # 其他节点删除或禁用了账号
+        for cookie_id in sorted(held - enabled_set):
+            logger.info(f"账号已删除或禁用，释放租约: {cookie_id}")
+            await self._release_account(cookie_id)
+
+        with self._lock:
+            held = set(self.held)
+        self.target = math.ceil(len(enabled) / max(1, len(self.live_nodes)))
+        surplus = len(held) - self.target
+        if surplus > 0:
+            # 有新节点加入：每次释放一批多出的账号，由新节点获取
+            surplus_ids = sorted(held)[-min(surplus, self.rebalance_batch):]
+            logger.info(f"存活节点 {len(self.live_nodes)} 个，本节点持有 {len(held)} 个账号（平均 {self.target} 个），"
+                        f"释放 {len(surplus_ids)} 个")
+            for cookie_id in surplus_ids:
+                await self._release_account(cookie_id)
+        elif surplus < 0:
+            candidates = [cid for cid in enabled if cid not in held]
+            if candidates:
+                acquired = await run(db_manager.acquire_account_leases, self.node_id, candidates, self.ttl,
+                                     limit=-surplus)
+                for cookie_id in acquired:
+                    with self._lock:
+                        self.held.add(cookie_id)
+                    self.stats['acquired'] += 1
+                    await self._start_account(cookie_id, cookies[cookie_id])
+                if acquired:
+                    logger.info(f"本节点获取了 {len(acquired)} 个账号租约，当前持有 {len(self.held)} 个")
+
+    async def _start_account(self, cookie_id: str, cookie_value: str):
+        """启动获取到租约的账号（其他节点可能修改过账号数据，先同步到内存）"""
+        manager = self.manager
+        manager.cookies[cookie_id] = cookie_value
+        manager.cookie_status[cookie_id] = True
+        if cookie_id not in manager.keywords:
+            manager.keywords[cookie_id] = await async_db_manager.run(db_manager.get_keywords, cookie_id)
+        # 启停方法会阻塞等待事件循环中的任务，需要在线程中调用
+        await asyncio.get_running_loop().run_in_executor(None, manager._start_cookie_task, cookie_id)
+
+    async def _stop_account(self, cookie_id: str):
+        await asyncio.get_running_loop().run_in_executor(None, self.manager._stop_cookie_task, cookie_id)
+
+    async def _release_account(self, cookie_id: str):
+        """先停止任务再释放租约，避免两个节点同时运行同一个账号"""
+        await self._stop_account(cookie_id)
+        with self._lock:
+            self.held.discard(cookie_id)
+        self.stats['released'] += 1
+        await async_db_manager.run(db_manager.release_account_leases, self.node_id, [cookie_id])
+
+
+def create_lease_manager() -> Optional[AccountLeaseManager]:
+    """按配置创建账号租约管理器，未启用多节点部署时返回None
+
+    环境变量 CLUSTER_ENABLED / NODE_ID 优先于配置文件的 CLUSTER.enabled / CLUSTER.node_id，
+    设置了 NODE_ID 即视为启用。
+    """
+    from config import config
+    cluster_config = config.get('CLUSTER', {}) or {}
+    node_id = os.getenv('NODE_ID') or cluster_config.get('node_id') or ''
+    enabled = os.getenv('CLUSTER_ENABLED')
+    if enabled is None:
+        enabled = bool(os.getenv('NODE_ID')) or bool(cluster_config.get('enabled', False))
+    else:
+        enabled = enabled.strip().lower() in ('1', 'true', 'yes', 'on')
+    if not enabled:
+        return None
+    ttl = float(cluster_config.get('lease_ttl', 30))
+    return AccountLeaseManager(
+        node_id=node_id or f"{socket.gethostname()}-{os.getpid()}",
+        ttl=ttl,
+        renew_interval=min(float(cluster_config.get('renew_interval', 10)), ttl / 2),
+        rebalance_batch=max(1, int(cluster_config.get('rebalance_batch', 10))),
+        invalidation_interval=max(0.5, float(cluster_config.get('invalidation_interval', 2))),
+    )
+
+
+# 多节点部署时由 Start.py 赋值，否则为 None
+lease_manager: Optional[AccountLeaseManager] = None
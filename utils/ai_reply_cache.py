@@ -0,0 +1,165 @@
+"""AI回复缓存
+
+买家对同一商品反复问的问题（"还在吗"、"包邮吗"、"能便宜吗"）意图和答案基本相同，
+缓存命中时直接复用之前的回复，省掉意图识别和回复生成的大模型请求。
+
+缓存键为 (账号, 商品, 版本, 规范化后的消息, 议价次数)：
+- 版本是商品信息和AI设置（模型、提示词、议价设置）的指纹，商品信息或AI设置变化后旧回复自然失效
+- 议价（price）意图的回复依赖当前议价次数，只在议价次数相同时命中；其他意图的回复与议价次数无关
+- 只缓存较短的消息，长消息很少重复
+
+回复在主事件循环中读写，管理接口在API线程中清除缓存，因此使用线程锁。
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+# 规范化时去掉的字符：空白、标点、符号（保留汉字、字母、数字）
+_STRIP_PATTERN = re.compile(r'[\W_]+')
+
+
+def normalize_message(message: str) -> str:
+    """规范化买家消息：全角转半角、小写、去掉空白和标点"""
+    return _STRIP_PATTERN.sub('', unicodedata.normalize('NFKC', message or '').lower())
+
+
+class AIReplyCache:
+    """AI回复缓存（线程安全）"""
+
+    def __init__(self, enabled: bool = True, max_size: int = 5000, ttl: float = 3600,
+                 max_message_length: int = 50):
+        """
+        Args:
+            enabled: 是否启用
+            max_size: 最多缓存的回复数量
+            ttl: 回复有效期（秒）
+            max_message_length: 规范化后超过此长度的消息不缓存
+        """
+        self.enabled = enabled
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_message_length = max_message_length
+        # (cookie_id, item_id, version, 规范化消息, 议价次数或None) -> (intent, reply, tokens, 缓存时间)
+        self._entries: "OrderedDict[tuple, Tuple[str, str, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'evictions': 0, 'expired': 0, 'invalidated': 0}
+        # misses 为未命中后由大模型生成并写入缓存的次数
+        self.account_stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'saved_tokens': 0})
+
+    @staticmethod
+    def version(settings: dict, item_info: dict) -> int:
+        """商品信息和AI设置的指纹"""
+        return hash((
+            settings.get('model_name'), settings.get('base_url'), settings.get('custom_prompts'),
+            settings.get('max_discount_percent'), settings.get('max_discount_amount'),
+            settings.get('max_bargain_rounds'),
+            str(item_info.get('title')), str(item_info.get('price')), str(item_info.get('desc')),
+        ))
+
+    def _key(self, cookie_id: str, item_id: str, message: str, version: int) -> Optional[tuple]:
+        if not self.enabled:
+            return None
+        normalized = normalize_message(message)
+        if not normalized or len(normalized) > self.max_message_length:
+            return None
+        return cookie_id, str(item_id or ''), version, normalized
+
+    def get(self, cookie_id: str, item_id: str, message: str, version: int,
+            bargain_count: int = None) -> Optional[Tuple[str, str]]:
+        """查找缓存的回复，返回 (intent, reply)
+
+        不传议价次数时只查找非议价意图的回复。
+        """
+        key = self._key(cookie_id, item_id, message, version)
+        if key is None:
+            return None
+        candidates = [key + (None,)]
+        if bargain_count is not None:
+            candidates.append(key + (bargain_count,))
+
+        now = time.time()
+        with self._lock:
+            for candidate in candidates:
+                entry = self._entries.get(candidate)
+                if entry is None:
+                    continue
+                if now - entry[3] >= self.ttl:
+                    del self._entries[candidate]
+                    self.stats['expired'] += 1
+                    continue
+                self._entries.move_to_end(candidate)
+                stats = self.account_stats[cookie_id]
+                stats['hits'] += 1
+                stats['saved_tokens'] += entry[2]
+                return entry[0], entry[1]
+        return None
+
+    def put(self, cookie_id: str, item_id: str, message: str, version: int, intent: str,
+            bargain_count: int, reply: str, tokens: int = 0):
+        """缓存一条由大模型生成的回复，tokens 为生成它消耗的token数"""
+        key = self._key(cookie_id, item_id, message, version)
+        if key is None or not reply:
+            return
+        key += (bargain_count if intent == 'price' else None,)
+        with self._lock:
+            self._entries[key] = (intent, reply, int(tokens or 0), time.time())
+            self._entries.move_to_end(key)
+            self.account_stats[cookie_id]['misses'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, cookie_id: str, item_id: str = None) -> int:
+        """清除账号（或账号下某个商品）的缓存，返回清除数量"""
+        item_id = None if item_id is None else str(item_id)
+        with self._lock:
+            keys = [key for key in self._entries
+                    if key[0] == cookie_id and (item_id is None or key[1] == item_id)]
+            for key in keys:
+                del self._entries[key]
+            self.stats['invalidated'] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """清空缓存（数据库导入或AI设置表被清空后调用）"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存大小和各账号的命中率、节省的token数"""
+        with self._lock:
+            accounts = {}
+            for cookie_id, stats in self.account_stats.items():
+                lookups = stats['hits'] + stats['misses']
+                accounts[cookie_id] = {
+                    **stats,
+                    'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+                }
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                **self.stats,
+                'accounts': accounts,
+            }
+
+
+def _create_ai_reply_cache() -> AIReplyCache:
+    from config import config
+    ai_config = (config.get('AUTO_REPLY', {}) or {}).get('ai', {}) or {}
+    cache_config = ai_config.get('reply_cache', {}) or {}
+    return AIReplyCache(
+        enabled=bool(cache_config.get('enabled', True)),
+        max_size=max(1, int(cache_config.get('max_size', 5000))),
+        ttl=float(cache_config.get('ttl', 3600)),
+        max_message_length=int(cache_config.get('max_message_length', 50)),
+    )
+
+
+# 全局AI回复缓存
+ai_reply_cache = _create_ai_reply_cache()
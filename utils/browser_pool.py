@@ -0,0 +1,341 @@
+"""共享浏览器池
+
+进程内只启动一个 Chromium，每个账号缓存一个带 Cookie 的 BrowserContext，
+页面并发数受 ITEM_DETAIL.auto_fetch.max_concurrent 限制。
+浏览器断开时自动重启，使用次数达到上限后在空闲时回收重建，长时间空闲则关闭以释放内存。
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+
+BROWSER_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-features=TranslateUI',
+    '--disable-ipc-flooding-protection',
+    '--disable-extensions',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--hide-scrollbars',
+    '--mute-audio',
+    '--no-default-browser-check',
+    '--no-pings'
+]
+
+DOCKER_BROWSER_ARGS = [
+    '--disable-background-networking',
+    '--disable-client-side-phishing-detection',
+    '--disable-hang-monitor',
+    '--disable-popup-blocking',
+    '--disable-prompt-on-repost',
+    '--disable-web-resources',
+    '--metrics-recording-only',
+    '--safebrowsing-disable-auto-update',
+    '--enable-automation',
+    '--password-store=basic',
+    '--use-mock-keychain'
+]
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+
+
+def _cookies_for_browser(cookies_str: str, domain: str = '.goofish.com'):
+    """把 cookie 字符串转换为 Playwright 的 cookie 列表"""
+    cookies = []
+    for cookie_pair in (cookies_str or '').split('; '):
+        if '=' in cookie_pair:
+            name, value = cookie_pair.split('=', 1)
+            cookies.append({
+                'name': name.strip(),
+                'value': value.strip(),
+                'domain': domain,
+                'path': '/'
+            })
+    return cookies
+
+
+class BrowserPool:
+    """进程级共享浏览器池（只能在主事件循环中使用）"""
+
+    def __init__(self, max_concurrent: int = 3, browser_max_uses: int = 500, context_max_uses: int = 100,
+                 max_contexts: int = 20, idle_timeout: int = 300):
+        """
+        Args:
+            max_concurrent: 同时打开的页面数上限
+            browser_max_uses: 浏览器累计打开多少个页面后回收重启
+            context_max_uses: 单个账号上下文累计打开多少个页面后重建
+            max_contexts: 缓存的账号上下文数量上限（超出时淘汰最久未使用的空闲上下文）
+            idle_timeout: 浏览器空闲多少秒后关闭，0 表示不关闭
+        """
+        self.max_concurrent = max_concurrent
+        self.browser_max_uses = browser_max_uses
+        self.context_max_uses = context_max_uses
+        self.max_contexts = max_contexts
+        self.idle_timeout = idle_timeout
+
+        self._playwright = None
+        self._browser = None
+        self._browser_uses = 0
+        # cookie_id -> {'context', 'cookies_str', 'uses', 'in_use'}
+        self._contexts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._in_use = 0
+        self._last_used = time.time()
+
+        # asyncio 原语在首次使用时创建，绑定到主事件循环
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._idle_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'launch_count': 0,
+            'recycle_count': 0,
+            'health_check_failures': 0,
+            'context_created': 0,
+            'acquire_count': 0,
+            'acquire_errors': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _ensure_primitives(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._lock = asyncio.Lock()
+
+    # -------------------- 浏览器生命周期 --------------------
+
+    async def _launch(self):
+        from playwright.async_api import async_playwright
+
+        if self._playwright is None:
+            self._playwright = await asyncio.wait_for(async_playwright().start(), timeout=30.0)
+
+        browser_args = list(BROWSER_ARGS)
+        if os.getenv('DOCKER_ENV'):
+            browser_args.extend(DOCKER_BROWSER_ARGS)
+
+        self._browser = await self._playwright.chromium.launch(headless=True, args=browser_args)
+        self._browser_uses = 0
+        self.stats['launch_count'] += 1
+        logger.info(f"共享浏览器已启动（第 {self.stats['launch_count']} 次）")
+
+        if self.idle_timeout and (self._idle_task is None or self._idle_task.done()):
+            self._idle_task = asyncio.create_task(self._idle_watch())
+
+    async def _close_browser(self):
+        """关闭浏览器及全部上下文（调用方需持有 self._lock）"""
+        for entry in self._contexts.values():
+            try:
+                await entry['context'].close()
+            except Exception:
+                pass
+        self._contexts.clear()
+
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.warning(f"关闭共享浏览器时出错: {e}")
+            self._browser = None
+
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logger.warning(f"停止Playwright时出错: {e}")
+            self._playwright = None
+
+    async def _ensure_browser(self):
+        """健康检查：浏览器不存在或已断开时重启，达到使用上限且空闲时回收"""
+        if self._browser is not None and not self._browser.is_connected():
+            self.stats['health_check_failures'] += 1
+            logger.warning("共享浏览器连接已断开，准备重启")
+            await self._close_browser()
+
+        if (self._browser is not None and self._browser_uses >= self.browser_max_uses
+                and self._in_use == 0):
+            self.stats['recycle_count'] += 1
+            logger.info(f"共享浏览器已使用 {self._browser_uses} 次，回收重启")
+            await self._close_browser()
+
+        if self._browser is None:
+            await self._launch()
+
+    async def _idle_watch(self):
+        """空闲超时后关闭浏览器，下次使用时再启动"""
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            if self._browser is None:
+                return
+            if self._in_use == 0 and time.time() - self._last_used >= self.idle_timeout:
+                async with self._lock:
+                    if self._in_use == 0 and self._browser is not None:
+                        logger.info(f"共享浏览器空闲超过 {self.idle_timeout} 秒，关闭以释放内存")
+                        await self._close_browser()
+                return
+
+    # -------------------- 账号上下文 --------------------
+
+    async def _get_context(self, cookie_id: str, cookies_str: str, user_agent: str = None):
+        """获取账号上下文，Cookie 变化或使用次数达到上限时重建（调用方需持有 self._lock）"""
+        entry = self._contexts.get(cookie_id)
+        if entry is not None:
+            stale = entry['cookies_str'] != cookies_str or entry['uses'] >= self.context_max_uses
+            if stale and entry['in_use'] == 0:
+                await self._drop_context(cookie_id)
+                entry = None
+            else:
+                self._contexts.move_to_end(cookie_id)
+
+        if entry is None:
+            await self._evict_contexts()
+            context = await self._browser.new_context(
+                viewport={'width': 1920, 'height': 1080},
+                user_agent=user_agent or DEFAULT_USER_AGENT
+            )
+            await context.add_cookies(_cookies_for_browser(cookies_str))
+            entry = {'context': context, 'cookies_str': cookies_str, 'uses': 0, 'in_use': 0}
+            self._contexts[cookie_id] = entry
+            self.stats['context_created'] += 1
+            logger.debug(f"【{cookie_id}】创建浏览器上下文，当前上下文数: {len(self._contexts)}")
+
+        return entry
+
+    async def _drop_context(self, cookie_id: str):
+        entry = self._contexts.pop(cookie_id, None)
+        if entry is not None:
+            try:
+                await entry['context'].close()
+            except Exception:
+                pass
+
+    async def _evict_contexts(self):
+        """上下文数量达到上限时淘汰最久未使用的空闲上下文"""
+        while len(self._contexts) >= self.max_contexts:
+            idle_id = next((cid for cid, entry in self._contexts.items() if entry['in_use'] == 0), None)
+            if idle_id is None:
+                break
+            await self._drop_context(idle_id)
+
+    async def invalidate_context(self, cookie_id: str):
+        """丢弃账号的上下文（账号任务退出时调用，例如Cookie已更新、账号已删除或迁移）"""
+        if self._lock is None:
+            return
+        async with self._lock:
+            entry = self._contexts.get(cookie_id)
+            if entry is not None and entry['in_use'] == 0:
+                await self._drop_context(cookie_id)
+
+    # -------------------- 对外接口 --------------------
+
+    @asynccontextmanager
+    async def page(self, cookie_id: str, cookies_str: str, user_agent: str = None):
+        """借出一个带账号Cookie的页面，退出时自动关闭
+
+        用法:
+            async with browser_pool.page(cookie_id, cookies_str) as page:
+                await page.goto(url)
+        """
+        self._ensure_primitives()
+
+        wait_start = time.perf_counter()
+        async with self._semaphore:
+            wait_time = time.perf_counter() - wait_start
+            self.stats['acquire_count'] += 1
+            self.stats['wait_time_total'] += wait_time
+            if wait_time > self.stats['wait_time_max']:
+                self.stats['wait_time_max'] = wait_time
+
+            async with self._lock:
+                try:
+                    await self._ensure_browser()
+                    entry = await self._get_context(cookie_id, cookies_str, user_agent)
+                    page = await entry['context'].new_page()
+                except Exception:
+                    self.stats['acquire_errors'] += 1
+                    raise
+                entry['uses'] += 1
+                entry['in_use'] += 1
+                self._browser_uses += 1
+                self._in_use += 1
+
+            failed = False
+            try:
+                yield page
+            except Exception:
+                failed = True
+                raise
+            finally:
+                try:
+                    await page.close()
+                except Exception:
+                    failed = True
+                entry['in_use'] -= 1
+                self._in_use -= 1
+                self._last_used = time.time()
+                # 页面异常时丢弃该上下文，下次重建
+                if failed and entry['in_use'] == 0 and self._contexts.get(cookie_id) is entry:
+                    async with self._lock:
+                        await self._drop_context(cookie_id)
+
+    async def close(self):
+        """关闭浏览器池"""
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        if self._lock is None:
+            return
+        async with self._lock:
+            await self._close_browser()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取浏览器池统计信息"""
+        acquire_count = self.stats['acquire_count']
+        return {
+            'browser_running': self._browser is not None,
+            'browser_uses': self._browser_uses,
+            'contexts': len(self._contexts),
+            'pages_in_use': self._in_use,
+            'max_concurrent': self.max_concurrent,
+            'launch_count': self.stats['launch_count'],
+            'recycle_count': self.stats['recycle_count'],
+            'health_check_failures': self.stats['health_check_failures'],
+            'context_created': self.stats['context_created'],
+            'acquire_count': acquire_count,
+            'acquire_errors': self.stats['acquire_errors'],
+            'wait_time_avg_ms': round(self.stats['wait_time_total'] / acquire_count * 1000, 2) if acquire_count else 0.0,
+            'wait_time_max_ms': round(self.stats['wait_time_max'] * 1000, 2),
+        }
+
+
+def _create_browser_pool() -> BrowserPool:
+    from config import config
+    auto_fetch_config = config.get('ITEM_DETAIL', {}).get('auto_fetch', {})
+    pool_config = config.get('ITEM_DETAIL', {}).get('browser_pool', {}) or {}
+    return BrowserPool(
+        max_concurrent=max(1, int(auto_fetch_config.get('max_concurrent', 3))),
+        browser_max_uses=int(pool_config.get('browser_max_uses', 500)),
+        context_max_uses=int(pool_config.get('context_max_uses', 100)),
+        max_contexts=int(pool_config.get('max_contexts', 20)),
+        idle_timeout=int(pool_config.get('idle_timeout', 300)),
+    )
+
+
+# 全局共享浏览器池
+browser_pool = _create_browser_pool()
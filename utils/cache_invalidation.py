@@ -0,0 +1,160 @@
+"""进程本地缓存的失效
+
+关键词匹配器、发货规则索引、AI对话上下文、AI回复缓存和商品详情缓存都缓存在进程内存中，写入数据库后需要使其失效。
+单进程模式下直接清除即可；分片模式下实际回复和发货的是各分片进程，只清除API进程的缓存不起作用：
+- API进程中的修改：清除本进程的缓存，并向所有分片发送 invalidate 命令（不等待结果）
+- 分片中的修改（例如分片上传卡券图片后更新图片URL）：分片清除自己的缓存，上报给API进程，由API进程转发给其他分片
+- 多节点部署（CLUSTER）时，节点主进程还把失效写入数据库的 cache_invalidations 表；各节点每隔
+  CLUSTER.invalidation_interval 秒读取其他节点写入的新记录，清除本节点（及其分片）的缓存。
+  在任意节点修改数据后，其他节点最多经过一个轮询间隔不再使用旧缓存
+
+其他节点修改了本节点运行的账号的 Cookie 时（account_changed），持有租约的节点重新读取并重启该账号。
+缓存失效都是幂等的，重复执行只会多一次重新加载。
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+# 缓存名称 -> 说明
+CACHES = {
+    'keywords': "关键词匹配器（参数: [账号ID]）",
+    'delivery_rules': "发货规则索引",
+    'conversations': "AI对话上下文（参数: [账号ID]）",
+    'ai_replies': "AI回复缓存（参数: [账号ID, [商品ID]]）",
+    'item_details': "商品详情缓存",
+}
+
+
+def apply(cache: str, *args):
+    """只清除本进程中的缓存，不传参数时清除该缓存的全部内容"""
+    if cache == 'keywords':
+        from utils.keyword_matcher import keyword_matcher_cache
+        keyword_matcher_cache.invalidate(*args)
+    elif cache == 'delivery_rules':
+        from utils.delivery_rule_index import delivery_rule_index
+        delivery_rule_index.invalidate()
+    elif cache == 'conversations':
+        from utils.conversation_cache import conversation_cache
+        if args:
+            conversation_cache.invalidate_account(*args)
+        else:
+            conversation_cache.clear()
+    elif cache == 'ai_replies':
+        from utils.ai_reply_cache import ai_reply_cache
+        if args:
+            ai_reply_cache.invalidate(*args)
+        else:
+            ai_reply_cache.clear()
+    elif cache == 'item_details':
+        from utils.item_detail_cache import item_detail_cache
+        item_detail_cache.clear()
+    else:
+        raise ValueError(f"未知的缓存: {cache}")
+
+
+def invalidate(cache: str, *args):
+    """清除本进程的缓存，并让分片中的同一缓存失效（可以在API线程或事件循环中调用）"""
+    apply(cache, *args)
+    _propagate(cache, args)
+
+
+def propagate_from_shard(shard_id: int, cache: str, *args):
+    """（API进程）分片上报的缓存失效：清除本进程的缓存并转发给其他分片"""
+    apply(cache, *args)
+    _propagate(cache, args, exclude_shard=shard_id)
+
+
+def account_changed(cookie_id: str):
+    """（多节点部署）账号的 Cookie 在本节点修改，但账号可能由其他节点运行：通知持有租约的节点重新加载"""
+    if cluster_sync is not None:
+        cluster_sync.publish('account', (cookie_id,))
+
+
+def _propagate(cache: str, args: tuple, exclude_shard: Optional[int] = None, remote: bool = True):
+    from utils import sharding
+    try:
+        if sharding.publish is not None:
+            # 分片进程：交给API进程转发
+            sharding.publish('invalidate', (cache,) + tuple(args))
+            return
+        if sharding.supervisor is not None:
+            sharding.supervisor.notify('invalidate', cache, *args, exclude=exclude_shard)
+    except Exception as e:
+        logger.warning(f"转发缓存失效失败: {cache}{list(args)}, {e}")
+    if remote and cluster_sync is not None:
+        cluster_sync.publish(cache, args)
+
+
+class ClusterSync:
+    """多节点部署时通过数据库中的失效日志同步各节点的缓存（在节点主进程中运行）"""
+
+    def __init__(self, node_id: str, interval: float = 2, retention: float = 3600):
+        """
+        Args:
+            node_id: 本节点ID（与账号租约的节点ID相同），轮询时跳过本节点写入的记录
+            interval: 轮询间隔（秒），即其他节点的缓存最长的过期时间
+            retention: 失效记录的保留时间（秒），停机超过该时间的节点重启后缓存本来就是空的
+        """
+        self.node_id = node_id
+        self.interval = interval
+        self.retention = retention
+        self.last_id = 0
+        self._last_purge = 0.0
+        self.stats = {'published': 0, 'applied': 0, 'errors': 0}
+
+    def start(self):
+        """从当前最新的记录开始轮询（只处理启动之后的修改）"""
+        from db_manager import db_manager
+        from utils.scheduler import scheduler
+        self.last_id = db_manager.get_last_cache_invalidation_id()
+        self._last_purge = time.time()
+        scheduler.add(None, 'cache_invalidation_sync', self._poll, self.interval, first_delay=self.interval, jitter=0)
+        logger.info(f"多节点缓存失效同步已启动，轮询间隔: {self.interval}秒")
+
+    def stop(self):
+        from utils.scheduler import scheduler
+        scheduler.remove(None, 'cache_invalidation_sync')
+
+    def publish(self, cache: str, args: tuple):
+        """记录本节点的缓存失效（在API线程或事件循环中调用）"""
+        from db_manager import db_manager
+        if db_manager.add_cache_invalidation(self.node_id, cache, list(args)) is not None:
+            self.stats['published'] += 1
+        else:
+            self.stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'interval': self.interval, 'last_id': self.last_id, **self.stats}
+
+    async def _poll(self):
+        from db_manager import async_db_manager, db_manager
+        from utils import account_lease
+
+        rows = await async_db_manager.run(db_manager.get_cache_invalidations, self.last_id)
+        for row in rows:
+            self.last_id = row['id']
+            if row['origin'] == self.node_id:
+                continue
+            cache, args = row['cache'], tuple(row['args'])
+            try:
+                if cache == 'account':
+                    if account_lease.lease_manager is not None:
+                        await account_lease.lease_manager.reload_account(*args)
+                else:
+                    apply(cache, *args)
+                    _propagate(cache, args, remote=False)
+                self.stats['applied'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"处理其他节点的缓存失效失败: {cache}{list(args)}, {e}")
+
+        now = time.time()
+        if now - self._last_purge > self.retention / 10:
+            self._last_purge = now
+            await async_db_manager.run(db_manager.purge_cache_invalidations, now - self.retention)
+
+
+# 多节点部署时由账号租约管理器启动，否则为 None
+cluster_sync: Optional[ClusterSync] = None
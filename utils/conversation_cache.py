@@ -0,0 +1,114 @@
+"""AI对话上下文缓存
+
+按 (cookie_id, chat_id) 缓存每个会话最近的若干条消息（环形缓冲）和议价次数，
+生成AI回复时不再每次查询 ai_conversations 表。
+
+写入时先落库再追加到缓存（write-through）；未缓存的会话在首次读取时从数据库加载。
+缓存的会话数量有上限，超出时淘汰最久未使用的会话。
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Tuple
+
+# 每个会话缓存的消息条数，与 AIReplyEngine.get_conversation_context 的默认条数一致
+DEFAULT_HISTORY_SIZE = 20
+
+
+class _ChatState:
+    __slots__ = ('turns', 'bargain_count')
+
+    def __init__(self, turns: List[Dict[str, str]], bargain_count: int, history_size: int):
+        self.turns = deque(turns, maxlen=history_size)
+        self.bargain_count = bargain_count
+
+
+class ConversationCache:
+    """会话上下文缓存（线程安全）"""
+
+    def __init__(self, max_chats: int = 2000, history_size: int = DEFAULT_HISTORY_SIZE):
+        """
+        Args:
+            max_chats: 最多缓存的会话数量
+            history_size: 每个会话缓存的最近消息条数
+        """
+        self.max_chats = max_chats
+        self.history_size = history_size
+        self._chats: "OrderedDict[Tuple[str, str], _ChatState]" = OrderedDict()
+        # 正在从数据库加载的会话 {key: token}，加载期间有新写入时作废本次加载结果
+        self._loading: Dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def load(self, cookie_id: str, chat_id: str,
+             loader: Callable[[], Tuple[List[Dict[str, str]], int]]) -> Tuple[List[Dict[str, str]], int]:
+        """返回 (最近消息列表, 议价次数)，未命中时调用 loader 从数据库加载并缓存"""
+        key = (cookie_id, chat_id)
+        with self._lock:
+            state = self._chats.get(key)
+            if state is not None:
+                self._chats.move_to_end(key)
+                self.stats['hits'] += 1
+                return list(state.turns), state.bargain_count
+            self.stats['misses'] += 1
+            token = object()
+            self._loading[key] = token
+
+        try:
+            turns, bargain_count = loader()
+        except Exception:
+            with self._lock:
+                if self._loading.get(key) is token:
+                    del self._loading[key]
+            raise
+
+        with self._lock:
+            if self._loading.get(key) is token:
+                del self._loading[key]
+                self._chats[key] = _ChatState(turns, bargain_count, self.history_size)
+                while len(self._chats) > self.max_chats:
+                    self._chats.popitem(last=False)
+                    self.stats['evictions'] += 1
+        return list(turns), bargain_count
+
+    def append(self, cookie_id: str, chat_id: str, turns: List[Dict[str, str]], bargain_delta: int = 0):
+        """消息落库后追加到缓存（未缓存的会话不处理，下次读取时从数据库加载）"""
+        key = (cookie_id, chat_id)
+        with self._lock:
+            state = self._chats.get(key)
+            if state is None:
+                self._loading.pop(key, None)
+                return
+            state.turns.extend(turns)
+            state.bargain_count += bargain_delta
+
+    def invalidate_account(self, cookie_id: str):
+        """清除某个账号的全部会话缓存"""
+        with self._lock:
+            for key in [key for key in self._chats if key[0] == cookie_id]:
+                del self._chats[key]
+            for key in [key for key in self._loading if key[0] == cookie_id]:
+                del self._loading[key]
+
+    def clear(self):
+        """清空缓存（对话记录被批量删除或导入后调用）"""
+        with self._lock:
+            self._chats.clear()
+            self._loading.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                'chats': len(self._chats),
+                'max_chats': self.max_chats,
+                'history_size': self.history_size,
+                **self.stats,
+            }
+
+
+# 全局AI对话上下文缓存
+conversation_cache = ConversationCache(
+    max_chats=max(1, int(os.getenv('AI_CONTEXT_CACHE_CHATS', '2000'))),
+)
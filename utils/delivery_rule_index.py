@@ -0,0 +1,143 @@
+"""发货规则索引
+
+把所有启用的发货规则及其卡券预加载到内存，api_config 预先解析，规则关键词编译为
+Aho-Corasick 自动机，替代每次发货时对 delivery_rules 表做双向 LIKE '%kw%' 扫描。
+
+匹配与排序语义与原 SQL 保持一致：
+1. 商品文本包含关键词，或关键词包含商品文本，均视为命中（英文字母不区分大小写）；
+2. 商品文本包含关键词时得分为关键词长度，否则为关键词长度的一半（整除），得分高者优先；
+3. 按规格匹配时同分按发货次数升序，按关键词匹配时同分按规则ID升序。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from utils.keyword_matcher import AhoCorasick
+
+# SQLite 的 LIKE 只对 ASCII 字母忽略大小写
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+# 按关键词匹配（get_delivery_rules_by_keyword）返回的字段
+_KEYWORD_RULE_FIELDS = (
+    'id', 'keyword', 'card_id', 'delivery_count', 'enabled', 'description', 'delivery_times',
+    'card_name', 'card_type', 'api_config', 'text_content', 'data_content', 'image_url',
+    'card_enabled', 'card_description', 'card_delay_seconds'
+)
+
+
+class DeliveryRuleIndex:
+    """发货规则内存索引（构建后只读，发货次数除外）"""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        Args:
+            rules: db_manager.get_enabled_delivery_rules_with_cards 返回的规则列表
+        """
+        self.rules = [rule for rule in rules if rule.get('keyword') is not None]
+        self._keywords = [rule['keyword'].translate(_ASCII_LOWER) for rule in self.rules]
+        self._automaton = AhoCorasick([(keyword, i) for i, keyword in enumerate(self._keywords)])
+        # 按关键词长度降序，用于"关键词包含商品文本"的反向匹配
+        self._by_length = sorted(range(len(self.rules)), key=lambda i: len(self._keywords[i]), reverse=True)
+        self._position = {rule['id']: i for i, rule in enumerate(self.rules)}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _candidates(self, keyword: str) -> Dict[int, int]:
+        """返回 {规则下标: 得分}"""
+        text = (keyword or '').translate(_ASCII_LOWER)
+        scores = {i: len(self._keywords[i]) for i in self._automaton.search_all(text)}
+
+        text_len = len(text)
+        for i in self._by_length:
+            rule_keyword = self._keywords[i]
+            if len(rule_keyword) < text_len:
+                break
+            if i not in scores and text in rule_keyword:
+                scores[i] = len(rule_keyword) // 2
+        return scores
+
+    def match_by_keyword_and_spec(self, keyword: str, spec_name: str = None,
+                                  spec_value: str = None) -> List[Dict[str, Any]]:
+        """等价于 db_manager.get_delivery_rules_by_keyword_and_spec"""
+        scores = self._candidates(keyword)
+
+        if spec_name and spec_value:
+            matched = [i for i in scores
+                       if self.rules[i]['is_multi_spec']
+                       and self.rules[i]['spec_name'] == spec_name
+                       and self.rules[i]['spec_value'] == spec_value]
+            if matched:
+                logger.info(f"找到多规格匹配规则: {keyword} - {spec_name}:{spec_value}")
+                return self._sorted(matched, scores, 'delivery_times')
+
+        matched = [i for i in scores if not self.rules[i]['is_multi_spec']]
+        if matched:
+            logger.info(f"找到兜底匹配规则: {keyword}")
+        else:
+            logger.info(f"未找到匹配规则: {keyword}")
+        return self._sorted(matched, scores, 'delivery_times')
+
+    def match_by_keyword(self, keyword: str) -> List[Dict[str, Any]]:
+        """等价于 db_manager.get_delivery_rules_by_keyword"""
+        scores = self._candidates(keyword)
+        return [{field: rule[field] for field in _KEYWORD_RULE_FIELDS}
+                for rule in self._sorted(list(scores), scores, 'id')]
+
+    def _sorted(self, indexes: List[int], scores: Dict[int, int], tiebreak: str) -> List[Dict[str, Any]]:
+        indexes.sort(key=lambda i: (-scores[i], self.rules[i][tiebreak], self.rules[i]['id']))
+        return [dict(self.rules[i]) for i in indexes]
+
+    def record_delivery(self, rule_id: int):
+        """同步内存中的发货次数，保持"同分按发货次数"排序与数据库一致"""
+        i = self._position.get(rule_id)
+        if i is not None:
+            self.rules[i]['delivery_times'] += 1
+
+
+class DeliveryRuleIndexCache:
+    """全局发货规则索引，规则或卡券写入后失效，下次匹配时重新构建"""
+
+    def __init__(self):
+        self._index: Optional[DeliveryRuleIndex] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_cached(self) -> Optional[DeliveryRuleIndex]:
+        """返回已构建的索引，未构建时返回 None（不访问数据库）"""
+        return self._index
+
+    def get(self) -> DeliveryRuleIndex:
+        """获取索引，不存在或已失效时从数据库加载并构建"""
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            generation = self._generation
+
+        from db_manager import db_manager
+        index = DeliveryRuleIndex(db_manager.get_enabled_delivery_rules_with_cards())
+
+        with self._lock:
+            # 构建期间如果规则又被修改，则不缓存本次结果
+            if self._generation == generation:
+                self._index = index
+        logger.debug(f"发货规则索引已构建，规则数量: {len(index)}")
+        return index
+
+    def invalidate(self):
+        """使索引失效"""
+        with self._lock:
+            self._generation += 1
+            self._index = None
+
+    def record_delivery(self, rule_id: int):
+        """发货次数 +1 后同步到当前索引"""
+        index = self._index
+        if index is not None:
+            index.record_delivery(rule_id)
+
+
+# 全局发货规则索引
+delivery_rule_index = DeliveryRuleIndexCache()
@@ -0,0 +1,115 @@
+"""WebSocket 帧的 JSON 编解码
+
+所有收发的 WebSocket 帧统一经过这里编码和解码：
+- 安装了 orjson 时使用 orjson，否则使用标准库 json；可以通过环境变量 FRAME_JSON_BACKEND=json 强制使用标准库
+- 编码结果统一为紧凑格式的 str（orjson 输出的 bytes 会解码为 str，保证 WebSocket 发送的是文本帧）
+- 心跳、确认（ack）这类结构固定的帧使用预先拼好的模板，只填入变化的字段
+"""
+
+import base64
+import json
+import os
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库
+    orjson = None
+
+from utils.xianyu_utils import generate_mid
+
+if orjson is not None and os.getenv('FRAME_JSON_BACKEND', 'auto').lower() != 'json':
+    JSON_BACKEND = 'orjson'
+else:
+    JSON_BACKEND = 'json'
+
+# 标准库的C实现字符串转义（不转义非ASCII字符），用于模板中的字符串字段
+_encode_str = json.encoder.encode_basestring
+
+if JSON_BACKEND == 'orjson':
+    def loads(data: Any) -> Any:
+        """解析JSON（支持 str 和 bytes）
+
+        注意：orjson 会把超出64位范围的整数解析为浮点数，闲鱼的帧中没有这样的字段。
+        """
+        return orjson.loads(data)
+
+    def _dumps_bytes(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # 非字符串键、超大整数等 orjson 不支持的内容交给标准库
+            return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def dumps(obj: Any) -> str:
+        """序列化为紧凑的JSON字符串"""
+        return _dumps_bytes(obj).decode('utf-8')
+else:
+    _decoder = json.JSONDecoder()
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def loads(data: Any) -> Any:
+        """解析JSON（支持 str 和 bytes）"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        return _decoder.decode(data)
+
+    def _dumps_bytes(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
+
+    def dumps(obj: Any) -> str:
+        """序列化为紧凑的JSON字符串"""
+        return _encoder.encode(obj)
+
+
+def _dumps_value(value: Any) -> str:
+    return _encode_str(value) if type(value) is str else dumps(value)
+
+
+# -------------------- 固定帧模板 --------------------
+
+_HEARTBEAT_PREFIX = '{"lwp":"/!","headers":{"mid":"'
+_HEARTBEAT_SUFFIX = '"}}'
+_ACK_PREFIX = '{"code":200,"headers":{"mid":'
+# ack 中按顺序回传的可选请求头
+_ACK_OPTIONAL_HEADERS = (('app-key', ',"app-key":'), ('ua', ',"ua":'), ('dt', ',"dt":'))
+_TEXT_CONTENT_PREFIX = '{"contentType":1,"text":{"text":'
+
+
+def encode_heartbeat(mid: str = None) -> str:
+    """心跳帧：{"lwp":"/!","headers":{"mid":...}}
+
+    mid 由 generate_mid 生成（数字加空格），不需要转义。
+    """
+    return _HEARTBEAT_PREFIX + (mid or generate_mid()) + _HEARTBEAT_SUFFIX
+
+
+def encode_ack(headers: Dict[str, Any]) -> str:
+    """收到服务端推送后的确认帧
+
+    回传 mid（缺失时生成新的）、sid（缺失时为空字符串），以及存在的 app-key、ua、dt。
+    """
+    parts = [
+        _ACK_PREFIX,
+        _dumps_value(headers["mid"]) if "mid" in headers else '"' + generate_mid() + '"',
+        ',"sid":',
+        _dumps_value(headers["sid"]) if "sid" in headers else '""',
+    ]
+    for key, prefix in _ACK_OPTIONAL_HEADERS:
+        if key in headers:
+            parts.append(prefix)
+            parts.append(_dumps_value(headers[key]))
+    parts.append('}}')
+    return ''.join(parts)
+
+
+def encode_text_content(text: str) -> str:
+    """文本消息的 custom.data 字段：{"contentType":1,"text":{"text":...}} 的Base64"""
+    content = _TEXT_CONTENT_PREFIX + _dumps_value(text) + '}}'
+    return base64.b64encode(content.encode('utf-8')).decode('ascii')
+
+
+def encode_content(content: Any) -> str:
+    """任意消息内容（如图片）的 custom.data 字段：JSON的Base64"""
+    return base64.b64encode(_dumps_bytes(content)).decode('ascii')
+
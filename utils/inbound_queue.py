@@ -0,0 +1,208 @@
+"""账号级入站消息队列
+
+接收循环把解码后的消息放入队列，由固定数量的工作任务处理：
+- 同一会话（chat_id）的消息按到达顺序串行处理，不同会话之间并发
+- 没有会话ID的消息（系统通知等）不需要保序，任意空闲的工作任务都可以处理
+- 队列总长度有上限，满了以后按丢弃策略（shed_policy）处理：
+  - drop_oldest（默认）：先丢弃最早的非会话消息，没有的话丢弃最早的会话消息
+  - drop_newest：先丢弃最早的非会话消息，没有的话丢弃新到的消息，已排队的会话消息都会被处理
+  - reject：不丢弃已排队的消息，直接拒绝新到的消息
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+# 就绪队列中代表"非会话消息"的标记
+_OTHER = object()
+
+SHED_POLICIES = ('drop_oldest', 'drop_newest', 'reject')
+
+
+class InboundQueue:
+    """有界入站队列（只能在主事件循环中使用）"""
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[Any]],
+                 max_size: int = 1000, workers: int = 50, shed_policy: str = 'drop_oldest'):
+        """
+        Args:
+            name: 队列名称（账号ID），用于日志
+            handler: 处理单条消息的协程函数
+            max_size: 排队中的消息总数上限（不含正在处理的）
+            workers: 工作任务数量，即最多同时处理的消息数
+            shed_policy: 队列满时的丢弃策略，drop_oldest / drop_newest / reject（见模块说明）
+        """
+        if shed_policy not in SHED_POLICIES:
+            logger.warning(f"【{name}】未知的入站队列丢弃策略: {shed_policy}，使用 drop_oldest")
+            shed_policy = 'drop_oldest'
+        self.name = name
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.shed_policy = shed_policy
+
+        # chat_id -> [(序号, 消息)]，同一会话的消息按到达顺序排列
+        self._chats: Dict[Hashable, Deque[Tuple[int, Any]]] = {}
+        # 序号 -> chat_id，按到达顺序记录所有排队中的会话消息，用于丢弃最早的消息
+        self._order: "OrderedDict[int, Hashable]" = OrderedDict()
+        # 排队中的非会话消息
+        self._others: Deque[Any] = deque()
+        # 已在就绪队列中或正在处理的会话，保证同一会话同时只有一个工作任务
+        self._scheduled = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        self.active = 0
+        self._last_shed_log = 0.0
+        self.stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'errors': 0,
+            'shed_other': 0,
+            'shed_oldest': 0,
+            'shed_newest': 0,
+            'shed_rejected': 0,
+            'max_depth': 0,
+        }
+
+    @property
+    def depth(self) -> int:
+        """排队中的消息数"""
+        return len(self._order) + len(self._others)
+
+    def put(self, item: Any, chat_id: Hashable = None) -> bool:
+        """放入一条消息，chat_id 为空表示不需要保序的非会话消息
+
+        Returns:
+            bool: 是否因为队列已满丢弃了消息（可能是这条新消息）
+        """
+        self._start()
+        shed = False
+        if self.depth >= self.max_size:
+            if not self._shed():
+                return True
+            shed = True
+
+        if chat_id is None:
+            self._others.append(item)
+            self._ready.put_nowait(_OTHER)
+        else:
+            seq = next(self._seq)
+            self._chats.setdefault(chat_id, deque()).append((seq, item))
+            self._order[seq] = chat_id
+            if chat_id not in self._scheduled:
+                self._scheduled.add(chat_id)
+                self._ready.put_nowait(chat_id)
+
+        self.stats['enqueued'] += 1
+        depth = self.depth
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+        return shed
+
+    async def close(self):
+        """停止工作任务，丢弃排队中的消息"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._chats.clear()
+        self._order.clear()
+        self._others.clear()
+        self._scheduled.clear()
+        self._ready = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'depth': self.depth,
+            'chats': len(self._chats),
+            'active': self.active,
+            'max_size': self.max_size,
+            'workers': self.workers,
+            'overload_policy': self.shed_policy,
+            **self.stats,
+        }
+
+    # -------------------- 内部实现 --------------------
+
+    def _start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _shed(self) -> bool:
+        """队列已满时按丢弃策略腾出一个位置，返回False表示应丢弃新到的消息"""
+        if self.shed_policy == 'reject':
+            self._count_shed('shed_rejected', "拒绝新消息")
+            return False
+        if self._others:
+            # 就绪队列中对应的标记由工作任务取出时跳过
+            self._others.popleft()
+            self.stats['shed_other'] += 1
+            return True
+        if self.shed_policy == 'drop_newest':
+            self._count_shed('shed_newest', "丢弃新到的消息")
+            return False
+        seq, chat_id = self._order.popitem(last=False)
+        # 同一会话按到达顺序排列，最早的消息一定在队首
+        self._chats[chat_id].popleft()
+        self._count_shed('shed_oldest', "丢弃最早的会话消息")
+        return True
+
+    def _count_shed(self, key: str, action: str):
+        """记录丢弃的会话消息（日志每10秒最多一条）"""
+        self.stats[key] += 1
+        now = time.monotonic()
+        if now - self._last_shed_log >= 10:
+            self._last_shed_log = now
+            logger.warning(f"【{self.name}】入站队列已满（{self.max_size}），{action}，"
+                           f"累计 {self.stats[key]} 条")
+
+    def _take(self, key) -> Tuple[bool, Any]:
+        """取出就绪项对应的下一条消息"""
+        if key is _OTHER:
+            if not self._others:
+                return False, None
+            return True, self._others.popleft()
+        items = self._chats.get(key)
+        if not items:
+            self._release(key)
+            return False, None
+        seq, item = items.popleft()
+        del self._order[seq]
+        return True, item
+
+    def _release(self, chat_id):
+        """会话处理完一条消息后：还有排队的就重新排入就绪队列（排到末尾，保证公平），否则释放"""
+        if self._chats.get(chat_id):
+            self._ready.put_nowait(chat_id)
+        else:
+            self._chats.pop(chat_id, None)
+            self._scheduled.discard(chat_id)
+
+    async def _worker(self):
+        ready = self._ready
+        while True:
+            key = await ready.get()
+            found, item = self._take(key)
+            if not found:
+                continue
+            self.active += 1
+            try:
+                await self.handler(item)
+                self.stats['processed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"【{self.name}】处理入站消息出错: {e}")
+            finally:
+                self.active -= 1
+                if key is not _OTHER and self._ready is ready:
+                    self._release(key)
@@ -0,0 +1,226 @@
+"""商品详情两级缓存
+
+L1：内存中的 LRU（OrderedDict），带TTL，读写均为 O(1)。
+L2：SQLite 的 ai_item_cache 表。新写入的详情先放入内存，由后台任务定期批量落库（write-behind），
+启动时从 L2 预热最近更新的商品，重启后不必再通过浏览器重新获取。
+
+L1 和 L2 使用同一个缓存时间戳判断过期，从 L2 读回的详情不会延长有效期。
+读写在主事件循环中进行，管理接口可以在 API 线程中清空缓存。
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+
+class ItemDetailCache:
+    """商品详情两级缓存（线程安全）"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 24 * 60 * 60, persist: bool = True,
+                 flush_interval: float = 5.0, warm_size: int = 500):
+        """
+        Args:
+            max_size: 内存中最多缓存的商品数量
+            ttl: 缓存有效期（秒）
+            persist: 是否使用数据库作为二级缓存
+            flush_interval: 新写入的详情批量落库的间隔（秒）
+            warm_size: 启动时从数据库预热的商品数量，0表示不预热
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self.flush_interval = flush_interval
+        self.warm_size = warm_size
+        # item_id -> (detail, 缓存时间戳)，按访问顺序排列，最久未访问的在最前
+        self._items: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # 尚未落库的写入
+        self._dirty: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'l1_hits': 0,
+            'l1_misses': 0,
+            'l2_hits': 0,
+            'l2_misses': 0,
+            'evictions': 0,
+            'expired': 0,
+            'warmed': 0,
+            'flushed': 0,
+            'flush_errors': 0,
+        }
+
+    # -------------------- 对外接口 --------------------
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """启动后台任务：从数据库预热，之后定期落库"""
+        if not self.persist or (self._task is not None and not self._task.done()):
+            return
+        loop = loop or asyncio.get_event_loop()
+        self._task = loop.create_task(self._run())
+
+    async def get(self, item_id: str) -> str:
+        """获取缓存的商品详情，两级均未命中返回空字符串"""
+        with self._lock:
+            cached = self._items.get(item_id)
+            if cached is not None:
+                if time.time() - cached[1] < self.ttl:
+                    self._items.move_to_end(item_id)
+                    self.stats['l1_hits'] += 1
+                    return cached[0]
+                del self._items[item_id]
+                self.stats['expired'] += 1
+            self.stats['l1_misses'] += 1
+
+            if not self.persist:
+                return ""
+
+            # 已被淘汰出内存但还没落库的写入
+            cached = self._dirty.get(item_id)
+        if cached is None:
+            try:
+                from db_manager import async_db_manager, db_manager
+                cached = await async_db_manager.run(db_manager.get_ai_item_cache, item_id, self.ttl)
+            except Exception as e:
+                logger.warning(f"读取商品详情二级缓存失败: {item_id}, 错误: {e}")
+                cached = None
+
+        with self._lock:
+            if cached is None or time.time() - cached[1] >= self.ttl:
+                self.stats['l2_misses'] += 1
+                return ""
+            self.stats['l2_hits'] += 1
+            # 查询数据库期间可能已经写入了更新的详情
+            if item_id not in self._items:
+                self._store(item_id, cached[0], cached[1])
+            return cached[0]
+
+    def put(self, item_id: str, detail: str):
+        """写入商品详情（立即进入内存，稍后批量落库）"""
+        timestamp = time.time()
+        with self._lock:
+            self._store(item_id, detail, timestamp)
+            if self.persist:
+                self._dirty[item_id] = (detail, timestamp)
+        if self.persist:
+            self.start()
+
+    def cleanup_expired(self) -> int:
+        """清理内存中过期的缓存，返回清理数量"""
+        now = time.time()
+        with self._lock:
+            expired = [item_id for item_id, (_, timestamp) in self._items.items() if now - timestamp >= self.ttl]
+            for item_id in expired:
+                del self._items[item_id]
+            self.stats['expired'] += len(expired)
+        return len(expired)
+
+    async def flush(self):
+        """把尚未落库的写入批量保存到数据库"""
+        with self._lock:
+            if not self._dirty:
+                return
+            pending, self._dirty = self._dirty, {}
+        records = [(item_id, detail, timestamp) for item_id, (detail, timestamp) in pending.items()]
+        try:
+            from db_manager import async_db_manager, db_manager
+            saved = await async_db_manager.run(db_manager.save_ai_item_cache, records)
+        except Exception as e:
+            logger.error(f"保存商品详情缓存失败: {e}")
+            saved = False
+
+        if saved:
+            self.stats['flushed'] += len(records)
+            logger.debug(f"商品详情缓存落库: {len(records)} 条")
+        else:
+            # 放回待落库队列，不覆盖期间的新写入
+            with self._lock:
+                self.stats['flush_errors'] += 1
+                for item_id, value in pending.items():
+                    self._dirty.setdefault(item_id, value)
+
+    async def close(self):
+        """停止后台任务并落库剩余的写入"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def clear(self):
+        """清空内存缓存（数据库中的缓存被删除或导入后调用）"""
+        with self._lock:
+            self._items.clear()
+            self._dirty.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取两级缓存的命中统计"""
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'persist': self.persist,
+                'pending_writes': len(self._dirty),
+                **self.stats,
+            }
+
+    # -------------------- 内部实现 --------------------
+
+    def _store(self, item_id: str, detail: str, timestamp: float):
+        """写入L1并淘汰超出容量的最久未访问项（调用方需持有锁）"""
+        self._items[item_id] = (detail, timestamp)
+        self._items.move_to_end(item_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    async def _warm(self):
+        if self.warm_size <= 0:
+            return
+        from db_manager import async_db_manager, db_manager
+        rows = await async_db_manager.run(db_manager.get_recent_ai_item_cache,
+                                          min(self.warm_size, self.max_size), self.ttl)
+        # 结果按更新时间倒序，倒着插入使最新的商品排在LRU末尾；已有的（更新的）条目不覆盖
+        with self._lock:
+            for item_id, detail, timestamp in reversed(rows):
+                if item_id not in self._items:
+                    self._store(item_id, detail, timestamp)
+                    self.stats['warmed'] += 1
+        if rows:
+            logger.info(f"从数据库预热商品详情缓存: {self.stats['warmed']} 条")
+
+    async def _run(self):
+        try:
+            await self._warm()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"预热商品详情缓存失败: {e}")
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"商品详情缓存落库任务异常: {e}")
+
+
+def _create_item_detail_cache() -> ItemDetailCache:
+    from config import config
+    cache_config = (config.get('ITEM_DETAIL', {}) or {}).get('cache', {}) or {}
+    return ItemDetailCache(
+        max_size=max(1, int(cache_config.get('max_size', 1000))),
+        ttl=float(cache_config.get('ttl', 24 * 60 * 60)),
+        persist=bool(cache_config.get('persist', True)),
+        flush_interval=float(cache_config.get('flush_interval', 5)),
+        warm_size=int(cache_config.get('warm_size', 500)),
+    )
+
+
+# 全局商品详情缓存
+item_detail_cache = _create_item_detail_cache()
@@ -0,0 +1,209 @@
+"""关键词匹配引擎
+
+把账号的关键词列表预编译为 Aho-Corasick 自动机，按"商品专属关键词"和
+"通用关键词"两个分区分别构建，单条消息的匹配耗时只与消息长度相关，
+与关键词数量无关。
+
+匹配语义与原有逐条扫描完全一致：
+1. 有商品ID时，先在该商品的关键词中匹配；
+2. 再在没有商品ID的通用关键词中匹配；
+3. 同一分区内多个关键词命中时，返回数据库顺序中最靠前的那一个；
+4. 匹配不区分大小写（keyword.lower() in message.lower()）。
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+
+class AhoCorasick:
+    """多模式子串匹配自动机，可返回命中模式中序号最小的一个或全部命中"""
+
+    def __init__(self, patterns: List[tuple]):
+        """构建自动机
+
+        Args:
+            patterns: [(pattern, order), ...]，order 越小优先级越高
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态（含失败链）可命中的最小序号，None 表示无命中
+        self._best: List[Optional[int]] = [None]
+        # 在该状态结束的模式序号，以及失败链上下一个有输出的状态
+        self._out: Dict[int, List[int]] = {}
+        self._dict_link: List[int] = [0]
+        # 空关键词对任意消息都成立，单独记录
+        self._empty_best: Optional[int] = None
+        self._empty_orders: List[int] = []
+
+        for pattern, order in patterns:
+            if not pattern:
+                self._empty_orders.append(order)
+                if self._empty_best is None or order < self._empty_best:
+                    self._empty_best = order
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                    self._dict_link.append(0)
+                state = nxt
+            self._out.setdefault(state, []).append(order)
+            if self._best[state] is None or order < self._best[state]:
+                self._best[state] = order
+
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        """BFS 计算失败指针，并沿失败链合并最小序号"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            current = queue.popleft()
+            for ch, nxt in self._goto[current].items():
+                fail = self._fail[current]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                fail_state = self._fail[nxt]
+                self._dict_link[nxt] = fail_state if fail_state in self._out else self._dict_link[fail_state]
+
+                inherited = self._best[self._fail[nxt]]
+                if inherited is not None and (self._best[nxt] is None or inherited < self._best[nxt]):
+                    self._best[nxt] = inherited
+                queue.append(nxt)
+
+    def search_first(self, text: str) -> Optional[int]:
+        """返回 text 中出现的模式里序号最小的一个，没有命中返回 None"""
+        goto = self._goto
+        fail = self._fail
+        best_of = self._best
+        best = self._empty_best
+
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = best_of[state]
+            if hit is not None and (best is None or hit < best):
+                best = hit
+                if best == 0:
+                    break
+        return best
+
+    def search_all(self, text: str) -> set:
+        """返回 text 中出现的全部模式序号"""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        dict_link = self._dict_link
+        found = set(self._empty_orders)
+
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = state if state in out else dict_link[state]
+            while hit:
+                found.update(out[hit])
+                hit = dict_link[hit]
+        return found
+
+
+class KeywordMatcher:
+    """单个账号的预编译关键词匹配器（构建后只读，可跨线程共享）"""
+
+    def __init__(self, keywords: List[Dict[str, Any]]):
+        """
+        Args:
+            keywords: db_manager.get_keywords_with_type 返回的关键词列表
+        """
+        self.keywords = keywords
+
+        generic_patterns = []
+        item_patterns: Dict[str, List[tuple]] = {}
+        for order, keyword_data in enumerate(keywords):
+            pattern = (keyword_data.get('keyword') or '').lower()
+            keyword_item_id = keyword_data.get('item_id')
+            if keyword_item_id:
+                item_patterns.setdefault(keyword_item_id, []).append((pattern, order))
+            else:
+                generic_patterns.append((pattern, order))
+
+        self._generic = AhoCorasick(generic_patterns) if generic_patterns else None
+        self._by_item = {item_id: AhoCorasick(patterns) for item_id, patterns in item_patterns.items()}
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def match(self, send_message: str, item_id: str = None) -> Optional[Dict[str, Any]]:
+        """匹配消息，返回命中的关键词数据，未命中返回 None"""
+        text = send_message.lower()
+
+        if item_id:
+            automaton = self._by_item.get(item_id)
+            if automaton is not None:
+                order = automaton.search_first(text)
+                if order is not None:
+                    return self.keywords[order]
+
+        if self._generic is not None:
+            order = self._generic.search_first(text)
+            if order is not None:
+                return self.keywords[order]
+
+        return None
+
+
+class KeywordMatcherCache:
+    """按账号缓存关键词匹配器，关键词写入后失效，下次匹配时重新构建"""
+
+    def __init__(self):
+        self._matchers: Dict[str, KeywordMatcher] = {}
+        self._versions: Dict[str, int] = {}
+        self._generation = 0  # 全量失效计数
+        self._lock = threading.Lock()
+
+    def get(self, cookie_id: str) -> KeywordMatcher:
+        """获取账号的匹配器，不存在或已失效时从数据库加载并构建"""
+        with self._lock:
+            matcher = self._matchers.get(cookie_id)
+            if matcher is not None:
+                return matcher
+            version = (self._generation, self._versions.get(cookie_id, 0))
+
+        from db_manager import db_manager
+        matcher = KeywordMatcher(db_manager.get_keywords_with_type(cookie_id))
+
+        with self._lock:
+            # 构建期间如果关键词又被修改，则不缓存本次结果
+            if (self._generation, self._versions.get(cookie_id, 0)) == version:
+                self._matchers[cookie_id] = matcher
+        logger.debug(f"【{cookie_id}】关键词匹配器已构建，关键词数量: {len(matcher)}")
+        return matcher
+
+    def invalidate(self, cookie_id: str = None):
+        """使指定账号（不传则为全部账号）的匹配器失效"""
+        with self._lock:
+            if cookie_id is None:
+                self._generation += 1
+                self._matchers.clear()
+            else:
+                self._versions[cookie_id] = self._versions.get(cookie_id, 0) + 1
+                self._matchers.pop(cookie_id, None)
+
+
+# 全局关键词匹配器缓存
+keyword_matcher_cache = KeywordMatcherCache()
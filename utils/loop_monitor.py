@@ -0,0 +1,89 @@
+"""事件循环延迟监控
+
+在事件循环中周期性地 sleep 固定时长，实际唤醒时间与预期时间之差即为循环延迟。
+任何在协程里执行的同步阻塞调用（数据库锁等待、同步网络请求等）都会直接体现在延迟上。
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+
+class LoopLagMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.1, window: int = 120):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            warn_threshold: 单次延迟超过该值（秒）时输出警告日志
+            window: 保留最近多少个采样用于计算统计值
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples = deque(maxlen=window)
+        self._max_lag = 0.0
+        self._total_samples = 0
+        self._slow_samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop = None) -> asyncio.Task:
+        """在指定（默认当前）事件循环中启动监控任务"""
+        if self._task is not None and not self._task.done():
+            return self._task
+        loop = loop or asyncio.get_event_loop()
+        self._task = loop.create_task(self._run())
+        logger.info(f"事件循环延迟监控已启动，采样间隔: {self.interval}s，告警阈值: {self.warn_threshold * 1000:.0f}ms")
+        return self._task
+
+    def stop(self):
+        """停止监控任务"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, time.perf_counter() - expected))
+
+    def record(self, lag: float):
+        """记录一次延迟采样（秒）"""
+        self._samples.append(lag)
+        self._total_samples += 1
+        if lag > self._max_lag:
+            self._max_lag = lag
+        if lag > self.warn_threshold:
+            self._slow_samples += 1
+            logger.warning(f"事件循环阻塞: {lag * 1000:.1f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取延迟统计（毫秒）"""
+        samples = sorted(self._samples)
+        if samples:
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            avg = sum(samples) / len(samples)
+            last = self._samples[-1]
+        else:
+            p99 = avg = last = 0.0
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'last_ms': round(last * 1000, 2),
+            'avg_ms': round(avg * 1000, 2),
+            'p99_ms': round(p99 * 1000, 2),
+            'max_ms': round(self._max_lag * 1000, 2),
+            'samples': self._total_samples,
+            'slow_samples': self._slow_samples,
+        }
+
+
+# 全局事件循环延迟监控器
+loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv('LOOP_LAG_INTERVAL', '0.5')),
+    warn_threshold=float(os.getenv('LOOP_LAG_WARN_MS', '100')) / 1000,
+)
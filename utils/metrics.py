@@ -0,0 +1,395 @@
+"""Prometheus 文本格式的运行指标
+
+/health 只给出某一时刻的快照，看不出变化趋势，也没有延迟分布。这里维护常驻的计数器和直方图，
+由 GET /metrics 以 Prometheus 文本格式（0.0.4）输出，供 Prometheus 定期抓取：
+- 热路径上只做加法：每次记录是一次线程锁内的字典更新（直方图多一次二分查找），约 1 微秒，
+  因此始终开启，不需要开关
+- 已有 get_stats() 的组件（缓存、浏览器池、信号量、入站队列、事件循环等）不在热路径上重复计数，
+  由采集函数在抓取时读取并转换为指标
+- 分片模式下各分片进程有自己的指标，API 进程通过 'metrics' 命令收集后加上 shard 标签一起输出
+
+不依赖 prometheus_client：需要的只是计数器、仪表和直方图三种类型，以及可以通过分片管道传递的采集结果。
+"""
+
+import bisect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+_perf_counter = time.perf_counter
+
+# 采集结果中的一个指标族：(名称, 类型, 说明, [(样本名, {标签: 值}, 数值), ...])，可以直接 pickle
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+# 秒级延迟的默认分桶（回复延迟等）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 锁等待、持有时间的分桶（通常在毫秒以下）
+LOCK_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class _Metric:
+    """带标签的指标，标签值按声明顺序以位置参数传入"""
+
+    type = ''
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # 标签值元组 -> 数值（直方图为 [各桶计数, 总和, 次数]）
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def remove(self, *labels: str):
+        """删除一组标签的数据（例如账号被删除后）"""
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> Family:
+        with self._lock:
+            items = list(self._values.items())
+        return self.name, self.type, self.help, [(self.name, self._labels(k), v) for k, v in items]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    type = 'gauge'
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> Family:
+        with self._lock:
+            items = list(self._values.items())
+        return self.name, self.type, self.help, [(self.name, self._labels(k), v) for k, v in items]
+
+
+class Histogram(_Metric):
+    """分桶直方图（各桶分别计数，输出时再累加为 Prometheus 的 le 桶）"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        # 第一个不小于 value 的桶，即 value <= le；超出最大桶时落在 +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self) -> Family:
+        with self._lock:
+            items = [(k, list(counts), total, count) for k, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+        return self.name, self.type, self.help, samples
+
+
+class MetricsRegistry:
+    """进程内的指标注册表"""
+
+    def __init__(self, prefix: str = 'xianyu_'):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], List[Family]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], List[Family]]):
+        """注册抓取时调用的采集函数，返回指标族列表（名称不带前缀）"""
+        self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        """当前进程的全部指标（采集函数出错时跳过，不影响其他指标）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = [metric.collect() for metric in metrics]
+        for collector in self._collectors:
+            try:
+                families.extend((self.prefix + name, kind, help, [(self.prefix + sample, labels, value)
+                                                                 for sample, labels, value in samples])
+                                for name, kind, help, samples in collector())
+            except Exception as e:
+                logger.warning(f"采集运行指标失败: {getattr(collector, '__name__', collector)}, {e}")
+        return families
+
+    def _register(self, cls, name: str, help: str, labelnames: Tuple[str, ...], **kwargs) -> _Metric:
+        """同名指标只创建一次（模块重新导入时返回已有的实例）"""
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type}")
+            return metric
+
+
+class TimedRLock:
+    """记录等待时间和持有时间的可重入锁（用于数据库写锁）
+
+    只有最外层的获取和释放计时，重入不计入；持有时间在释放锁之后才记录，不延长持有时间。
+    """
+
+    __slots__ = ('_lock', '_depth', '_acquired_at', '_wait', '_hold', '_label')
+
+    def __init__(self, wait: Histogram, hold: Histogram, label: str):
+        self._lock = threading.RLock()
+        self._depth = 0  # 只由持有锁的线程修改
+        self._acquired_at = 0.0
+        self._wait = wait
+        self._hold = hold
+        self._label = label
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock._is_owned():
+            self._lock.acquire()
+            self._depth += 1
+            return True
+        started = _perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        now = _perf_counter()
+        self._depth = 1
+        self._acquired_at = now
+        self._wait.observe(now - started, self._label)
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            self._lock.release()
+            return
+        held = _perf_counter() - self._acquired_at
+        self._lock.release()
+        self._hold.observe(held, self._label)
+
+    def _is_owned(self) -> bool:
+        return self._lock._is_owned()
+
+    # with 语句是最常见的用法，展开 acquire / release 省去一层调用
+    def __enter__(self) -> bool:
+        lock = self._lock
+        if lock._is_owned():
+            lock.acquire()
+            self._depth += 1
+            return True
+        started = _perf_counter()
+        lock.acquire()
+        now = _perf_counter()
+        self._depth = 1
+        self._acquired_at = now
+        self._wait.observe(now - started, self._label)
+        return True
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth:
+            self._lock.release()
+            return
+        held = _perf_counter() - self._acquired_at
+        self._lock.release()
+        self._hold.observe(held, self._label)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value)) + '.0'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def merge_families(groups: Dict[str, List[Family]], label: str = 'shard') -> List[Family]:
+    """合并多个进程的采集结果：每个样本加上来源标签，同名指标族合并为一个"""
+    merged: Dict[str, Family] = {}
+    for source, families in groups.items():
+        for name, kind, help, samples in families:
+            family = merged.get(name)
+            if family is None:
+                family = merged[name] = (name, kind, help, [])
+            family[3].extend((sample, {label: source, **labels}, value) for sample, labels, value in samples)
+    return list(merged.values())
+
+
+def render(families: List[Family]) -> str:
+    """输出 Prometheus 文本格式（0.0.4）"""
+    lines = []
+    for name, kind, help, samples in families:
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {_escape(help)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample, labels, value in samples:
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{sample}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# -------------------- 抓取时从已有统计中读取的指标 --------------------
+
+def _semaphore_usage(semaphore, limit: int) -> Tuple[int, int]:
+    """asyncio.Semaphore 的（占用数, 等待数），尚未创建时为 (0, 0)"""
+    if semaphore is None:
+        return 0, 0
+    return max(0, limit - semaphore._value), len(semaphore._waiters or ())
+
+
+def _collect_runtime() -> List[Family]:
+    from XianyuAutoAsync import XianyuLive, ConnectionState
+    from ai_reply_engine import ai_reply_engine
+    from utils.ai_reply_cache import ai_reply_cache
+    from utils.browser_pool import browser_pool
+    from utils.conversation_cache import conversation_cache
+    from utils.item_detail_cache import item_detail_cache
+    from utils.loop_monitor import loop_monitor
+    from utils.notification_dispatcher import notification_dispatcher
+    from utils.scheduler import scheduler
+    from utils.single_flight import single_flight
+
+    instances = XianyuLive.get_all_instances()
+    states = [state.value for state in ConnectionState]
+    connection_state, connection_failures, queue_depth, queue_shed = [], [], [], []
+    for cookie_id, instance in instances.items():
+        current = instance.connection_state.value
+        connection_state.extend(('connection_state', {'account': cookie_id, 'state': state}, int(state == current))
+                                for state in states)
+        connection_failures.append(('connection_failures', {'account': cookie_id}, instance.connection_failures))
+        queue_stats = instance.inbound_queue.get_stats()
+        queue_depth.append(('inbound_queue_depth', {'account': cookie_id}, queue_stats['depth']))
+        queue_shed.append(('inbound_queue_shed_total', {'account': cookie_id},
+                           sum(value for key, value in queue_stats.items() if key.startswith('shed'))))
+
+    # 信号量：(名称, 占用, 等待, 上限)
+    semaphores = [
+        ('browser_pool', *_semaphore_usage(browser_pool._semaphore, browser_pool.max_concurrent),
+         browser_pool.max_concurrent),
+        ('notification', *_semaphore_usage(notification_dispatcher._semaphore, notification_dispatcher.max_concurrent),
+         notification_dispatcher.max_concurrent),
+        ('scheduler_heavy', *_semaphore_usage(scheduler._heavy, scheduler.heavy_concurrency),
+         scheduler.heavy_concurrency),
+    ]
+    ai_in_use = ai_waiting = 0
+    for semaphore in list(ai_reply_engine.account_semaphores.values()):
+        in_use, waiting = _semaphore_usage(semaphore, ai_reply_engine.max_concurrent_per_account)
+        ai_in_use += in_use
+        ai_waiting += waiting
+    semaphores.append(('ai_reply', ai_in_use, ai_waiting,
+                       ai_reply_engine.max_concurrent_per_account * len(ai_reply_engine.account_semaphores)))
+
+    # 缓存：(名称, 命中, 未命中)
+    caches = []
+    stats = conversation_cache.get_stats()
+    caches.append(('conversation', stats['hits'], stats['misses']))
+    stats = item_detail_cache.get_stats()
+    caches.append(('item_detail_l1', stats['l1_hits'], stats['l1_misses']))
+    caches.append(('item_detail_l2', stats['l2_hits'], stats['l2_misses']))
+    stats = ai_reply_cache.get_stats()
+    caches.append(('ai_reply', sum(s['hits'] for s in stats['accounts'].values()),
+                   sum(s['misses'] for s in stats['accounts'].values())))
+    for kind, stats in single_flight.get_stats()['kinds'].items():
+        caches.append((f'single_flight_{kind}', stats['hits'] + stats['coalesced'], stats['misses']))
+
+    browser = browser_pool.get_stats()
+    loop = loop_monitor.get_stats()
+    return [
+        ('connection_state', 'gauge', "账号WebSocket当前连接状态（当前状态为1）", connection_state),
+        ('connection_failures', 'gauge', "账号当前连续连接失败次数", connection_failures),
+        ('inbound_queue_depth', 'gauge', "账号入站消息队列中等待处理的消息数", queue_depth),
+        ('inbound_queue_shed_total', 'counter', "入站队列已满时丢弃的消息数", queue_shed),
+        ('semaphore_in_use', 'gauge', "并发上限的当前占用数",
+         [('semaphore_in_use', {'name': name}, in_use) for name, in_use, _, _ in semaphores]),
+        ('semaphore_waiters', 'gauge', "等待并发名额的任务数",
+         [('semaphore_waiters', {'name': name}, waiting) for name, _, waiting, _ in semaphores]),
+        ('semaphore_limit', 'gauge', "并发上限",
+         [('semaphore_limit', {'name': name}, limit) for name, _, _, limit in semaphores]),
+        ('cache_hits_total', 'counter', "缓存命中次数",
+         [('cache_hits_total', {'cache': name}, hits) for name, hits, _ in caches]),
+        ('cache_misses_total', 'counter', "缓存未命中次数",
+         [('cache_misses_total', {'cache': name}, misses) for name, _, misses in caches]),
+        ('cache_hit_ratio', 'gauge', "缓存启动以来的命中率",
+         [('cache_hit_ratio', {'cache': name}, round(hits / (hits + misses), 4) if hits + misses else 0)
+          for name, hits, misses in caches]),
+        ('browser_launches_total', 'counter', "浏览器启动次数",
+         [('browser_launches_total', {}, browser['launch_count'])]),
+        ('browser_recycles_total', 'counter', "浏览器回收重启次数",
+         [('browser_recycles_total', {}, browser['recycle_count'])]),
+        ('browser_contexts', 'gauge', "浏览器池中的账号上下文数",
+         [('browser_contexts', {}, browser['contexts'])]),
+        ('event_loop_lag_p99_seconds', 'gauge', "主事件循环最近一段时间的 p99 调度延迟",
+         [('event_loop_lag_p99_seconds', {}, loop['p99_ms'] / 1000)]),
+        ('event_loop_lag_max_seconds', 'gauge', "主事件循环启动以来的最大调度延迟",
+         [('event_loop_lag_max_seconds', {}, loop['max_ms'] / 1000)]),
+        ('scheduler_jobs', 'gauge', "周期任务调度器中的任务数",
+         [('scheduler_jobs', {}, scheduler.get_stats()['jobs'])]),
+    ]
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+registry.register_collector(_collect_runtime)
+
+# 热路径上直接记录的指标
+ws_frames_received = registry.counter('ws_frames_received_total', "收到的WebSocket帧数", ('account',))
+ws_acks_sent = registry.counter('ws_acks_sent_total', "发送的同步确认帧数", ('account',))
+replies = registry.counter('replies_total', "自动回复条数（按回复来源）", ('account', 'source'))
+reply_latency = registry.histogram('reply_latency_seconds', "从开始生成回复到发送完成的耗时（按回复来源）",
+                                   ('source',))
+connection_transitions = registry.counter('connection_state_transitions_total', "账号连接状态切换次数（按新状态）",
+                                          ('account', 'state'))
+reconnects = registry.counter('reconnects_total', "账号WebSocket连接异常后重连的次数", ('account',))
+db_lock_wait = registry.histogram('db_lock_wait_seconds', "等待数据库写锁的时间", ('db',), buckets=LOCK_BUCKETS)
+db_lock_hold = registry.histogram('db_lock_hold_seconds', "持有数据库写锁的时间", ('db',), buckets=LOCK_BUCKETS)
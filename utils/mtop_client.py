@@ -0,0 +1,278 @@
+"""闲鱼 mtop 接口客户端（h5api.m.goofish.com）
+
+每个账号一个 MtopClient，统一处理：
+- Cookie：解析后的 Cookie 字典和字符串只在变化时重建，_m_h5_tk 签名token随之缓存
+- 签名：每次请求（包括重试）使用当前时间戳和最新token重新签名
+- 连接：复用同一个 aiohttp 会话（长连接），Cookie 由客户端自己管理，不使用会话的 cookie jar
+- 重试：网络错误、超时、5xx 和令牌失效（FAIL_SYS_TOKEN_*）按指数退避加随机抖动重试，
+  令牌失效时服务端通过 set-cookie 下发新的 _m_h5_tk，重试会直接使用新token
+- Cookie 持久化：set-cookie 带来的变化合并后延迟写库，连续多次请求只写一次
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+from loguru import logger
+
+from utils.xianyu_utils import generate_sign
+
+MTOP_BASE_URL = 'https://h5api.m.goofish.com/h5'
+MTOP_APP_KEY = '34839810'
+
+
+class MtopError(Exception):
+    """mtop 请求失败（重试后仍然网络错误、超时或服务端错误）"""
+
+
+def parse_cookies(cookies_str: str) -> Dict[str, str]:
+    """将Cookie字符串解析为字典（与 trans_cookies 规则一致，空字符串返回空字典）"""
+    cookies = {}
+    for cookie in (cookies_str or '').split('; '):
+        if '=' in cookie:
+            key, value = cookie.split('=', 1)
+            cookies[key] = value
+    return cookies
+
+
+def is_success(res_json: Any) -> bool:
+    """mtop 响应的 ret 是否包含成功信息"""
+    return isinstance(res_json, dict) and any('SUCCESS::' in ret for ret in res_json.get('ret') or [])
+
+
+def _is_token_error(res_json: Any) -> bool:
+    return isinstance(res_json, dict) and any(ret.startswith('FAIL_SYS_TOKEN') for ret in res_json.get('ret') or [])
+
+
+class MtopClient:
+    """账号级 mtop 客户端"""
+
+    def __init__(self, cookie_id: Optional[str], cookies_str: str = '',
+                 on_cookies_changed: Callable[[str], Awaitable[Any]] = None,
+                 timeout: float = 20, connect_timeout: float = 5, max_retries: int = 3,
+                 retry_base_delay: float = 0.5, retry_max_delay: float = 5, persist_delay: float = 3):
+        """
+        Args:
+            cookie_id: 账号ID，None 表示临时客户端（不持久化Cookie）
+            cookies_str: Cookie字符串
+            on_cookies_changed: set-cookie 更新Cookie后的持久化回调（参数为新的Cookie字符串），
+                不传时直接更新数据库中的账号Cookie
+            timeout: 单次请求总超时（秒）
+            connect_timeout: 建立连接超时（秒）
+            max_retries: 可重试错误的最大重试次数
+            retry_base_delay: 第一次重试的基础延迟（秒），之后每次翻倍并加随机抖动
+            retry_max_delay: 重试延迟上限（秒）
+            persist_delay: Cookie 变化后延迟多少秒写库（期间的多次变化只写一次）
+        """
+        self.cookie_id = cookie_id
+        self.on_cookies_changed = on_cookies_changed
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.persist_delay = persist_delay
+
+        self._cookies: Dict[str, str] = {}
+        self._cookies_str = ''
+        self._token = ''
+        self.set_cookies_str(cookies_str)
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._persist_handle: Optional[asyncio.TimerHandle] = None
+        self._persist_task: Optional[asyncio.Task] = None
+        self.stats = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'token_errors': 0,
+            'cookie_updates': 0,
+            'cookie_persists': 0,
+        }
+
+    # -------------------- Cookie --------------------
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        return self._cookies
+
+    @property
+    def cookies_str(self) -> str:
+        return self._cookies_str
+
+    @property
+    def token(self) -> str:
+        """当前的签名token（_m_h5_tk 的前半部分）"""
+        return self._token
+
+    def set_cookies_str(self, cookies_str: str):
+        """替换Cookie（账号Cookie刷新、滑块验证或扫码登录后调用）"""
+        self._cookies_str = cookies_str or ''
+        self._cookies = parse_cookies(self._cookies_str)
+        self._token = self._cookies.get('_m_h5_tk', '').split('_')[0]
+
+    def set_cookies(self, cookies: Dict[str, str]):
+        """用Cookie字典替换Cookie"""
+        self._cookies = dict(cookies)
+        self._cookies_str = '; '.join(f"{k}={v}" for k, v in self._cookies.items())
+        self._token = self._cookies.get('_m_h5_tk', '').split('_')[0]
+
+    def _merge_set_cookie(self, response: aiohttp.ClientResponse) -> bool:
+        """合并响应中的 set-cookie，Cookie有变化时返回True"""
+        changed = False
+        for cookie in response.headers.getall('set-cookie', []):
+            if '=' not in cookie:
+                continue
+            name, value = cookie.split(';')[0].split('=', 1)
+            name, value = name.strip(), value.strip()
+            if self._cookies.get(name) != value:
+                self._cookies[name] = value
+                changed = True
+        if changed:
+            self.set_cookies(self._cookies)
+            self.stats['cookie_updates'] += 1
+            self._schedule_persist()
+        return changed
+
+    def _schedule_persist(self):
+        if self.cookie_id is None or self._persist_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._persist_handle = loop.call_later(self.persist_delay, self._start_persist)
+
+    def _start_persist(self):
+        self._persist_handle = None
+        self._persist_task = asyncio.ensure_future(self.flush_cookies())
+
+    async def flush_cookies(self):
+        """立即把Cookie写入数据库"""
+        if self._persist_handle is not None:
+            self._persist_handle.cancel()
+            self._persist_handle = None
+        cookies_str = self._cookies_str
+        try:
+            if self.on_cookies_changed is not None:
+                await self.on_cookies_changed(cookies_str)
+            else:
+                from db_manager import async_db_manager, db_manager
+                await async_db_manager.run(db_manager.update_cookie_account_info, self.cookie_id,
+                                           cookie_value=cookies_str)
+            self.stats['cookie_persists'] += 1
+            logger.debug(f"【{self.cookie_id}】已更新Cookie到数据库")
+        except Exception as e:
+            logger.error(f"【{self.cookie_id}】保存Cookie失败: {e}")
+
+    # -------------------- 请求 --------------------
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的 aiohttp 会话（长连接）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60, ttl_dns_cache=300),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    def _retry_delay(self, attempt: int) -> float:
+        return min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+    async def call(self, api: str, data: Any, version: str = '1.0', params: Dict[str, str] = None,
+                   url: str = None, headers: Dict[str, str] = None, timeout: float = None,
+                   max_retries: int = None) -> Dict[str, Any]:
+        """调用 mtop 接口
+
+        Args:
+            api: 接口名，如 mtop.taobao.idle.pc.detail
+            data: 业务参数（字典会被序列化为紧凑JSON，字符串原样使用）
+            version: 接口版本
+            params: 额外的查询参数（如 spm_cnt），覆盖默认值
+            url: 接口地址，默认 {MTOP_BASE_URL}/{api}/{version}/
+            headers: 额外的请求头，覆盖默认请求头
+            timeout: 本次请求的总超时（秒）
+            max_retries: 本次请求的最大重试次数
+
+        Returns:
+            dict: 响应JSON（业务失败时同样返回，由调用方检查 ret）
+
+        Raises:
+            MtopError: 重试后仍然网络错误、超时、5xx 或响应不是JSON
+        """
+        from config import DEFAULT_HEADERS
+
+        data_val = data if isinstance(data, str) else json.dumps(data, separators=(',', ':'))
+        url = url or f"{MTOP_BASE_URL}/{api}/{version}/"
+        max_retries = self.max_retries if max_retries is None else max_retries
+        request_timeout = aiohttp.ClientTimeout(total=timeout, connect=self.connect_timeout) if timeout else None
+
+        res_json = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                delay = self._retry_delay(attempt - 1)
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+
+            # 每次请求（包括重试）重新生成时间戳和签名，使用最新的token
+            t = str(int(time.time() * 1000))
+            query = {
+                'jsv': '2.7.2',
+                'appKey': MTOP_APP_KEY,
+                't': t,
+                'sign': generate_sign(t, self._token, data_val),
+                'v': version,
+                'type': 'originaljson',
+                'accountSite': 'xianyu',
+                'dataType': 'json',
+                'timeout': '20000',
+                'api': api,
+                'sessionOption': 'AutoLoginOnly',
+            }
+            if params:
+                query.update(params)
+            request_headers = dict(DEFAULT_HEADERS)
+            if headers:
+                request_headers.update(headers)
+            request_headers['cookie'] = self._cookies_str
+
+            self.stats['requests'] += 1
+            try:
+                async with self._get_session().post(url, params=query, data={'data': data_val},
+                                                    headers=request_headers, timeout=request_timeout) as response:
+                    self._merge_set_cookie(response)
+                    if response.status >= 500:
+                        raise MtopError(f"HTTP {response.status}")
+                    text = await response.text()
+                try:
+                    res_json = json.loads(text)
+                except json.JSONDecodeError:
+                    raise MtopError(f"响应不是JSON (HTTP {response.status}): {text[:200]}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, MtopError) as e:
+                error = e if isinstance(e, MtopError) else MtopError(f"{type(e).__name__}: {e}")
+                if attempt >= max_retries:
+                    self.stats['failures'] += 1
+                    raise error from e
+                logger.warning(f"【{self.cookie_id}】{api} 请求失败: {error}，准备第 {attempt + 1} 次重试")
+                continue
+
+            if not _is_token_error(res_json):
+                return res_json
+            self.stats['token_errors'] += 1
+            if attempt < max_retries:
+                logger.warning(f"【{self.cookie_id}】{api} 令牌失效: {res_json.get('ret')}，使用新token重试")
+
+        self.stats['failures'] += 1
+        return res_json
+
+    async def close(self):
+        """关闭连接池并写入尚未持久化的Cookie"""
+        if self._persist_handle is not None:
+            await self.flush_cookies()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
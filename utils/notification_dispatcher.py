@@ -0,0 +1,592 @@
+"""通知分发器
+
+消息通知不再在消息处理流程中逐个渠道串行发送，而是交给分发器在后台完成：
+1. 同一条通知的各个渠道并发发送，每个渠道有独立超时；
+2. 每种渠道复用一个 aiohttp 会话（连接池）；
+3. 发送失败的通知写入 notification_retry_queue 表，按指数退避重试，程序重启后继续；
+   重试队列只由主进程（start）处理，分片进程只发送不重试；多节点共用数据库时各节点先领取再发送，同一条通知只会被一个节点重试；
+4. 同一会话短时间内的多条消息通知合并为一条发送。
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+from loguru import logger
+
+
+class NotificationError(Exception):
+    """通知渠道返回失败"""
+
+
+def parse_notification_config(config: str) -> dict:
+    """解析通知配置数据"""
+    try:
+        # 尝试解析JSON格式的配置
+        return json.loads(config)
+    except (json.JSONDecodeError, TypeError):
+        # 兼容旧格式（直接字符串）
+        return {"config": config}
+
+
+# -------------------- 各渠道发送实现（失败时抛出异常） --------------------
+
+async def _send_qq(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送QQ通知"""
+    qq_number = config_data.get('qq_number') or config_data.get('config', '')
+    qq_number = qq_number.strip() if qq_number else ''
+    if not qq_number:
+        logger.warning("📱 QQ通知 - QQ号码配置为空，无法发送通知")
+        return
+
+    api_url = "http://notice.zhinianblog.cn/sendPrivateMsg"
+    params = {
+        'qq': qq_number,
+        'msg': message
+    }
+    async with session.get(api_url, params=params) as response:
+        response_text = await response.text()
+        # 502 视为成功，且不打印返回内容
+        if response.status == 502:
+            logger.info(f"📱 QQ通知发送成功: {qq_number} (状态码: {response.status})")
+        elif response.status == 200:
+            logger.info(f"📱 QQ通知发送成功: {qq_number} (状态码: {response.status})")
+            logger.debug(f"📱 QQ通知 - 响应内容: {response_text}")
+        else:
+            logger.debug(f"📱 QQ通知 - 响应内容: {response_text}")
+            raise NotificationError(f"HTTP {response.status}")
+
+
+async def _send_dingtalk(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送钉钉通知"""
+    webhook_url = config_data.get('webhook_url') or config_data.get('config', '')
+    secret = config_data.get('secret', '')
+
+    webhook_url = webhook_url.strip() if webhook_url else ''
+    if not webhook_url:
+        logger.warning("钉钉通知配置为空")
+        return
+
+    # 如果有加签密钥，生成签名
+    if secret:
+        timestamp = str(round(time.time() * 1000))
+        string_to_sign = f'{timestamp}\n{secret}'
+        hmac_code = hmac.new(secret.encode('utf-8'), string_to_sign.encode('utf-8'), digestmod=hashlib.sha256).digest()
+        sign = base64.b64encode(hmac_code).decode('utf-8')
+        webhook_url += f'&timestamp={timestamp}&sign={sign}'
+
+    data = {
+        "msgtype": "markdown",
+        "markdown": {
+            "title": "闲鱼自动回复通知",
+            "text": message
+        }
+    }
+    async with session.post(webhook_url, json=data) as response:
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}")
+        logger.info("钉钉通知发送成功")
+
+
+async def _send_feishu(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送飞书通知"""
+    webhook_url = config_data.get('webhook_url', '')
+    secret = config_data.get('secret', '')
+    if not webhook_url:
+        logger.warning("📱 飞书通知 - Webhook URL配置为空，无法发送通知")
+        return
+
+    timestamp = str(int(time.time()))
+    data = {
+        "msg_type": "text",
+        "content": {
+            "text": message
+        },
+        "timestamp": timestamp
+    }
+    # 如果有加签密钥，生成签名
+    if secret:
+        string_to_sign = f'{timestamp}\n{secret}'
+        hmac_code = hmac.new(
+            secret.encode('utf-8'),
+            string_to_sign.encode('utf-8'),
+            digestmod=hashlib.sha256
+        ).digest()
+        data["sign"] = base64.b64encode(hmac_code).decode('utf-8')
+
+    async with session.post(webhook_url, json=data) as response:
+        response_text = await response.text()
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}, 响应: {response_text}")
+        try:
+            response_json = json.loads(response_text)
+        except json.JSONDecodeError:
+            logger.info("📱 飞书通知发送成功（响应格式异常）")
+            return
+        if response_json.get('code') not in (0, None):
+            raise NotificationError(response_json.get('msg', '未知错误'))
+        logger.info("📱 飞书通知发送成功")
+
+
+async def _send_email(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict,
+                      timeout: float = 10):
+    """发送邮件通知（smtplib 为同步库，放到线程中执行）"""
+    smtp_server = config_data.get('smtp_server', '')
+    smtp_port = int(config_data.get('smtp_port', 587))
+    email_user = config_data.get('email_user', '')
+    email_password = config_data.get('email_password', '')
+    recipient_email = config_data.get('recipient_email', '')
+
+    if not all([smtp_server, email_user, email_password, recipient_email]):
+        logger.warning("邮件通知配置不完整")
+        return
+
+    def send():
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        msg = MIMEMultipart()
+        msg['From'] = email_user
+        msg['To'] = recipient_email
+        msg['Subject'] = "闲鱼自动回复通知"
+        msg.attach(MIMEText(message, 'plain', 'utf-8'))
+
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=timeout)
+        try:
+            server.starttls()
+            server.login(email_user, email_password)
+            server.send_message(msg)
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+    await asyncio.to_thread(send)
+    logger.info(f"邮件通知发送成功: {recipient_email}")
+
+
+async def _send_webhook(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送Webhook通知"""
+    webhook_url = config_data.get('webhook_url', '')
+    http_method = config_data.get('http_method', 'POST').upper()
+    headers_str = config_data.get('headers', '{}')
+
+    if not webhook_url:
+        logger.warning("Webhook通知配置为空")
+        return
+    if http_method not in ('POST', 'PUT'):
+        logger.warning(f"不支持的HTTP方法: {http_method}")
+        return
+
+    # 解析自定义请求头
+    try:
+        custom_headers = json.loads(headers_str) if headers_str else {}
+    except json.JSONDecodeError:
+        custom_headers = {}
+    headers = {'Content-Type': 'application/json'}
+    headers.update(custom_headers)
+
+    data = {
+        'message': message,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': 'xianyu-auto-reply'
+    }
+    async with session.request(http_method, webhook_url, json=data, headers=headers) as response:
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}")
+        logger.info("Webhook通知发送成功")
+
+
+async def _send_wechat(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送微信通知"""
+    webhook_url = config_data.get('webhook_url', '')
+    if not webhook_url:
+        logger.warning("微信通知配置为空")
+        return
+
+    data = {
+        "msgtype": "text",
+        "text": {
+            "content": message
+        }
+    }
+    async with session.post(webhook_url, json=data) as response:
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}")
+        logger.info("微信通知发送成功")
+
+
+async def _send_bark(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送Bark通知"""
+    webhook_url = config_data.get('webhook_url', '')
+    if not webhook_url:
+        logger.warning("Bark通知配置为空")
+        return
+
+    account = message_json.get('account', '')
+    buyer = message_json.get('buyer', {})
+    buyer_name = buyer.get('name', '')
+    text = message_json.get('message', '')
+    result = message_json.get('result', '')
+    error = message_json.get('error', '')
+    send_time = message_json.get('time', '')
+    scheme = message_json.get('scheme', '')
+    image = message_json.get('image', '')
+    money = message_json.get('money', '')
+
+    # 空消息或系统消息不推送
+    if (error == '' and text == '') or text == '发来一条新消息':
+        return
+    if re.search(r'快给ta一个评价吧', buyer_name):
+        return
+
+    data = {
+        'body': f"💬{buyer_name or '程序消息'}：{text or result or error} {money}\n📆时间：{send_time}",
+        'title': f"闲鱼推送 账号：{account}",
+        'badge': 1,
+        'sound': 'shake',
+        'group': '闲鱼',
+        'icon': 'https://img.alicdn.com/tfs/TB19WObTNv1gK0jSZFFXXb0sXXa-144-144.png',
+        'url': scheme,
+    }
+    if image:
+        data['image'] = image
+    if error and re.search(r'Token刷新失败', error):
+        data['level'] = 'critical'
+        data['volume'] = 5
+
+    async with session.post(webhook_url, json=data) as response:
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}")
+        logger.info("Bark通知发送成功")
+
+
+async def _send_telegram(session: aiohttp.ClientSession, config_data: dict, message: str, message_json: dict):
+    """发送Telegram通知"""
+    bot_token = config_data.get('bot_token', '')
+    chat_id = config_data.get('chat_id', '')
+    if not all([bot_token, chat_id]):
+        logger.warning("Telegram通知配置不完整")
+        return
+
+    api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    data = {
+        'chat_id': chat_id,
+        'text': message,
+        'parse_mode': 'HTML'
+    }
+    async with session.post(api_url, json=data) as response:
+        if response.status != 200:
+            raise NotificationError(f"HTTP {response.status}")
+        logger.info("Telegram通知发送成功")
+
+
+# 渠道类型 -> (会话名, 发送函数)
+CHANNEL_SENDERS: Dict[str, tuple] = {
+    'qq': ('qq', _send_qq),
+    'ding_talk': ('dingtalk', _send_dingtalk),
+    'dingtalk': ('dingtalk', _send_dingtalk),
+    'feishu': ('feishu', _send_feishu),
+    'lark': ('feishu', _send_feishu),
+    'email': ('email', _send_email),
+    'webhook': ('webhook', _send_webhook),
+    'wechat': ('wechat', _send_wechat),
+    'bark': ('bark', _send_bark),
+    'telegram': ('telegram', _send_telegram),
+}
+
+
+class NotificationDispatcher:
+    """通知分发器（只能在主事件循环中使用）"""
+
+    def __init__(self, channel_timeout: float = 10, max_concurrent: int = 20, max_retries: int = 5,
+                 retry_base_delay: float = 30, retry_max_delay: float = 3600, retry_interval: float = 10,
+                 coalesce_window: float = 3, coalesce_max: int = 20):
+        """
+        Args:
+            channel_timeout: 单个渠道发送超时（秒）
+            max_concurrent: 同时进行的发送数量上限
+            max_retries: 发送失败后最多重试次数，0 表示不重试
+            retry_base_delay: 第一次重试的延迟（秒），之后每次翻倍
+            retry_max_delay: 重试延迟上限（秒）
+            retry_interval: 检查重试队列的间隔（秒）
+            coalesce_window: 同一会话的消息通知在该时间窗口（秒）内合并发送，0 表示不合并
+            coalesce_max: 单次合并的最多消息条数，达到后立即发送
+        """
+        self.channel_timeout = channel_timeout
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.retry_interval = retry_interval
+        # 领取的待重试通知在该时间内不会被其他进程、节点领取（足够发送完一批）
+        self.claim_timeout = max(120.0, channel_timeout * 10)
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = coalesce_max
+
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}  # coalesce_key -> 待合并的通知
+        self._tasks = set()
+
+        # asyncio 原语在首次使用时创建，绑定到主事件循环
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._retry_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'dispatched': 0,
+            'sent': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'retried': 0,
+            'dropped': 0,
+            'coalesced': 0,
+        }
+
+    # -------------------- 对外接口 --------------------
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """启动重试队列处理任务（处理上次运行遗留的待重试通知）
+
+        只在主进程中调用，分片进程中的发送失败同样写入重试队列，由主进程重试。
+        """
+        if self._retry_task is not None and not self._retry_task.done():
+            return
+        loop = loop or asyncio.get_event_loop()
+        self._retry_task = loop.create_task(self._retry_loop())
+
+    def dispatch(self, cookie_id: str, notifications: List[Dict[str, Any]], message: str,
+                 message_json: dict, coalesce_key: str = None) -> int:
+        """提交通知，立即返回，发送在后台进行
+
+        Args:
+            cookie_id: 账号ID
+            notifications: db_manager.get_account_notifications 返回的渠道列表
+            message: 普通文本格式的通知内容
+            message_json: JSON格式的通知内容(用于部分通知渠道)
+            coalesce_key: 合并键，相同合并键的通知在时间窗口内合并为一条
+
+        Returns:
+            int: 提交发送的通知渠道数量
+        """
+        channels = []
+        for notification in notifications:
+            if not notification.get('enabled', True):
+                logger.warning(f"📱 通知渠道 {notification.get('channel_name')} 已禁用，跳过")
+                continue
+            if notification.get('channel_type') not in CHANNEL_SENDERS:
+                logger.warning(f"📱 不支持的通知渠道类型: {notification.get('channel_type')}")
+                continue
+            channels.append(notification)
+        if not channels:
+            return 0
+
+        self.stats['dispatched'] += 1
+
+        if coalesce_key and self.coalesce_window > 0:
+            pending = self._pending.get(coalesce_key)
+            if pending is not None:
+                pending['messages'].append(message)
+                pending['message_jsons'].append(message_json)
+                pending['channels'] = channels
+                self.stats['coalesced'] += 1
+                if len(pending['messages']) >= self.coalesce_max:
+                    self._flush(coalesce_key)
+                return len(channels)
+            self._pending[coalesce_key] = {
+                'cookie_id': cookie_id,
+                'channels': channels,
+                'messages': [message],
+                'message_jsons': [message_json],
+                'handle': asyncio.get_running_loop().call_later(self.coalesce_window, self._flush, coalesce_key),
+            }
+            return len(channels)
+
+        self._spawn(self._fan_out(cookie_id, channels, message, message_json))
+        return len(channels)
+
+    async def close(self):
+        """发送所有待合并的通知并关闭连接池"""
+        for key in list(self._pending):
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            self._retry_task = None
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分发统计信息"""
+        return {
+            **self.stats,
+            'in_flight': len(self._tasks),
+            'coalescing': len(self._pending),
+            'retry_running': self._retry_task is not None and not self._retry_task.done(),
+        }
+
+    # -------------------- 合并与并发发送 --------------------
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _flush(self, coalesce_key: str):
+        pending = self._pending.pop(coalesce_key, None)
+        if pending is None:
+            return
+        pending['handle'].cancel()
+        message, message_json = self._merge(pending['messages'], pending['message_jsons'])
+        self._spawn(self._fan_out(pending['cookie_id'], pending['channels'], message, message_json))
+
+    @staticmethod
+    def _merge(messages: List[str], message_jsons: List[dict]) -> tuple:
+        """合并多条通知：文本依次拼接，JSON取最后一条并拼接消息内容"""
+        if len(messages) == 1:
+            return messages[0], message_jsons[0]
+        message = f"📨 以下 {len(messages)} 条消息已合并发送\n\n" + "\n".join(messages)
+        message_json = dict(message_jsons[-1])
+        texts = [item.get('message') for item in message_jsons if item.get('message')]
+        if texts:
+            message_json['message'] = " / ".join(texts)
+        message_json['count'] = len(messages)
+        return message, message_json
+
+    async def _fan_out(self, cookie_id: str, channels: List[Dict[str, Any]], message: str, message_json: dict):
+        await asyncio.gather(*[
+            self._deliver_new(cookie_id, notification, message, message_json)
+            for notification in channels
+        ])
+
+    async def _deliver_new(self, cookie_id: str, notification: Dict[str, Any], message: str, message_json: dict):
+        """首次发送，失败时加入重试队列"""
+        channel_name = notification.get('channel_name', 'Unknown')
+        error = await self._send(notification['channel_type'], notification.get('channel_config'),
+                                 message, message_json)
+        if error is None:
+            return
+        logger.error(f"📱 发送通知失败 ({channel_name}): {error}")
+        if self.max_retries <= 0:
+            self.stats['dropped'] += 1
+            return
+
+        from db_manager import async_db_manager, db_manager
+        await async_db_manager.run(
+            db_manager.add_notification_retry, cookie_id, channel_name, notification['channel_type'],
+            notification.get('channel_config'), message, json.dumps(message_json, ensure_ascii=False),
+            0, time.time() + self._retry_delay(0), error
+        )
+
+    async def _send(self, channel_type: str, channel_config: str, message: str, message_json: dict) -> Optional[str]:
+        """发送到单个渠道，成功返回None，失败返回错误描述"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        session_name, sender = CHANNEL_SENDERS[channel_type]
+        config_data = parse_notification_config(channel_config)
+        async with self._semaphore:
+            try:
+                await asyncio.wait_for(
+                    self._call_sender(sender, session_name, config_data, message, message_json or {}),
+                    timeout=self.channel_timeout
+                )
+                self.stats['sent'] += 1
+                return None
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                self.stats['failed'] += 1
+                return f"超时（{self.channel_timeout}秒）"
+            except Exception as e:
+                self.stats['failed'] += 1
+                return str(e) or type(e).__name__
+
+    async def _call_sender(self, sender: Callable, session_name: str, config_data: dict,
+                           message: str, message_json: dict):
+        if sender is _send_email:
+            return await sender(None, config_data, message, message_json, timeout=self.channel_timeout)
+        return await sender(self._get_session(session_name), config_data, message, message_json)
+
+    def _get_session(self, name: str) -> aiohttp.ClientSession:
+        """每种渠道复用一个连接池"""
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.channel_timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrent, ttl_dns_cache=300),
+            )
+            self._sessions[name] = session
+        return session
+
+    # -------------------- 重试队列 --------------------
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max_delay, self.retry_base_delay * (2 ** attempts))
+
+    async def _retry_loop(self):
+        from db_manager import async_db_manager, db_manager
+
+        while True:
+            try:
+                # 领取后其他进程、节点不会重复发送；本进程中途退出时，超过领取时限的通知会被重新领取
+                now = time.time()
+                due = await async_db_manager.run(db_manager.claim_due_notification_retries, now,
+                                                 now + self.claim_timeout)
+                if due:
+                    await asyncio.gather(*[self._retry(item) for item in due])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"📱 处理通知重试队列失败: {e}")
+            await asyncio.sleep(self.retry_interval)
+
+    async def _retry(self, item: Dict[str, Any]):
+        from db_manager import async_db_manager, db_manager
+
+        try:
+            message_json = json.loads(item['message_json']) if item['message_json'] else {}
+        except json.JSONDecodeError:
+            message_json = {}
+
+        self.stats['retried'] += 1
+        attempts = item['attempts'] + 1
+        error = await self._send(item['channel_type'], item['channel_config'], item['message'], message_json)
+        if error is None:
+            logger.info(f"📱 通知重试成功 ({item['channel_name']})，第 {attempts} 次重试")
+            await async_db_manager.run(db_manager.delete_notification_retry, item['id'])
+        elif attempts >= self.max_retries:
+            self.stats['dropped'] += 1
+            logger.error(f"📱 通知重试 {attempts} 次仍失败，放弃发送 ({item['channel_name']}): {error}")
+            await async_db_manager.run(db_manager.delete_notification_retry, item['id'])
+        else:
+            delay = self._retry_delay(attempts)
+            logger.warning(f"📱 通知第 {attempts} 次重试失败 ({item['channel_name']})，{delay:.0f}秒后再试: {error}")
+            await async_db_manager.run(db_manager.reschedule_notification_retry, item['id'],
+                                       attempts, time.time() + delay, error)
+
+
+def _create_notification_dispatcher() -> NotificationDispatcher:
+    from config import config
+    dispatcher_config = config.get('NOTIFICATION', {}) or {}
+    return NotificationDispatcher(
+        channel_timeout=float(dispatcher_config.get('channel_timeout', 10)),
+        max_concurrent=max(1, int(dispatcher_config.get('max_concurrent', 20))),
+        max_retries=int(dispatcher_config.get('max_retries', 5)),
+        retry_base_delay=float(dispatcher_config.get('retry_base_delay', 30)),
+        retry_max_delay=float(dispatcher_config.get('retry_max_delay', 3600)),
+        coalesce_window=float(dispatcher_config.get('coalesce_window', 3)),
+    )
+
+
+# 全局通知分发器
+notification_dispatcher = _create_notification_dispatcher()
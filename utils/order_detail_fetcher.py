@@ -1,33 +1,50 @@
 """
 闲鱼订单详情获取工具 - API版本
 使用HTTP请求替代Playwright，更加可靠和高效
+
+异步获取通过账号的 MtopClient 发送（复用长连接、缓存签名token，
+网络错误、超时、5xx 和令牌失效时按带抖动的指数退避重试）；同步获取使用 requests，供脚本使用。
 """
 
 import time
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import requests
 from loguru import logger
 import re
 import urllib3
 
 from config import DEFAULT_HEADERS
-from utils.xianyu_utils import generate_sign, trans_cookies
+from utils.mtop_client import MtopClient, MtopError
+from utils.xianyu_utils import generate_sign
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+ORDER_DETAIL_API = "mtop.idle.web.trade.order.detail"
+
 
 class OrderDetailAPIFetcher:
     """闲鱼订单详情获取器 - API版本"""
     
-    def __init__(self, cookie_string: str = None):
-        self.session = requests.Session()
-        self.cookie_string = cookie_string
+    def __init__(self, cookie_string: str = None, mtop_client: MtopClient = None, timeout: float = 20,
+                 max_retries: int = 2):
+        """
+        Args:
+            cookie_string: Cookie字符串（未传入 mtop_client 时使用）
+            mtop_client: 账号的 MtopClient，传入时复用其连接池和Cookie
+            timeout: 单次请求总超时（秒）
+            max_retries: 网络错误/超时/5xx/令牌失效时的最大重试次数
+        """
+        self._owns_mtop = mtop_client is None
+        self.mtop = mtop_client or MtopClient(None, cookie_string, timeout=timeout, max_retries=max_retries)
+        self.cookie_string = self.mtop.cookies_str
         self.base_url = "https://h5api.m.goofish.com/h5"
-        
-        # 禁用SSL证书验证以解决证书问题
-        self.session.verify = False
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # 同步请求使用的 requests 会话（首次使用时创建）
+        self._session: Optional[requests.Session] = None
         
         headers = DEFAULT_HEADERS.copy()
 
@@ -47,30 +64,41 @@ class OrderDetailAPIFetcher:
             "user-agent": headers['user-agent'] or  "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
         }
         
-        if self.cookie_string:
-            self.headers["cookie"] = self.cookie_string
-        
-        self.session.headers.update(self.headers)
-        
         # API相关配置
         self.app_key = "34839810"  # 从HAR文件中获得的appKey
         self.api_version = "1.0"
+
+        self.stats = {'requests': 0, 'failures': 0}
+
+    @property
+    def session(self) -> requests.Session:
+        """同步请求使用的 requests 会话"""
+        if self._session is None:
+            self._session = requests.Session()
+            # 禁用SSL证书验证以解决证书问题
+            self._session.verify = False
+            self._session.headers.update(self.headers)
+        return self._session
+
+    def update_cookies(self, cookie_string: str):
+        """更新Cookie（连接池保持不变）"""
+        self.cookie_string = cookie_string
+        if self._owns_mtop:
+            self.mtop.set_cookies_str(cookie_string)
+
+    def _request_headers(self) -> Dict[str, str]:
+        headers = dict(self.headers)
+        if self.cookie_string:
+            headers["cookie"] = self.cookie_string
+        return headers
         
     def _generate_sign(self, api_name: str, data: str, t: str, app_key: str) -> str:
         """
         生成API签名 - 使用xianyu_utils中的generate_sign函数
         """
         try:
-            # 从cookie中提取token
-            token = ""
-            if self.cookie_string:
-                cookies = trans_cookies(self.cookie_string)
-                m_h5_tk = cookies.get('_m_h5_tk', '')
-                if m_h5_tk:
-                    token = m_h5_tk.split('_')[0]
-            
-            # 使用xianyu_utils的generate_sign函数
-            sign = generate_sign(t, token, data)
+            # 使用mtop客户端缓存的 _m_h5_tk token
+            sign = generate_sign(t, self.mtop.token, data)
             return sign
         except Exception as e:
             logger.error(f"生成签名失败: {e}")
@@ -104,13 +132,87 @@ class OrderDetailAPIFetcher:
         return {
             "tid": order_id  # HAR文件中使用的是tid，不是orderId
         }
+
+    def _build_request(self, order_id: str) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+        """构建请求URL、查询参数和POST数据（每次请求重新签名）"""
+        timestamp = str(int(time.time() * 1000))
+
+        # 构建请求数据
+        request_data = self._build_request_data(order_id)
+        data_json = json.dumps(request_data, separators=(',', ':'))
+
+        # 生成签名
+        sign = self._generate_sign(ORDER_DETAIL_API, data_json, timestamp, self.app_key)
+
+        params = {
+            "jsv": "2.7.2",
+            "appKey": self.app_key,
+            "t": timestamp,
+            "sign": sign,
+            "v": self.api_version,
+            "type": "originaljson",
+            "accountSite": "xianyu",
+            "dataType": "json",
+            "timeout": "20000",
+            "api": ORDER_DETAIL_API,
+            "sessionOption": "AutoLoginOnly",
+            "spm_cntl": "a21ybx.order-detail.0.0"
+        }
+        post_data = {
+            "data": data_json
+        }
+        url = f"{self.base_url}/{ORDER_DETAIL_API}/{self.api_version}/"
+
+        logger.info(f"请求URL: {url}")
+        logger.info(f"请求参数: {params}")
+        logger.info(f"POST数据: {post_data}")
+        return url, params, post_data
+
+    def _handle_response(self, status: int, response_text: str, order_id: str) -> Optional[Dict[str, Any]]:
+        """检查同步请求的响应并解析订单数据，失败时返回None"""
+        if status != 200:
+            logger.error(f"API请求失败，状态码: {status}")
+            logger.error(f"响应内容: {response_text[:200]}")
+            return None
+
+        logger.info(f"API响应: {response_text[:500]}...")  # 只打印前500字符
+
+        # 处理JSON响应（不是JSONP）
+        try:
+            response_data = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON解析失败: {e}")
+            logger.error(f"响应内容: {response_text[:200]}")
+            return None
+
+        return self._parse_response(response_data, order_id)
+
+    def _parse_response(self, response_data: Dict[str, Any], order_id: str) -> Optional[Dict[str, Any]]:
+        """检查 ret 并解析订单数据，失败时返回None"""
+        ret_list = response_data.get('ret', [])
+        if not ret_list or not ret_list[0].startswith('SUCCESS'):
+            logger.error(f"API调用失败: {ret_list}")
+            return None
+
+        # 解析订单数据
+        order_data = response_data.get('data', {})
+        return self._parse_order_data(order_data, order_id)
+
+    async def close(self):
+        """关闭自己创建的连接池（共享的 mtop_client 由账号负责关闭）"""
+        if self._owns_mtop:
+            await self.mtop.close()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
     
-    async def fetch_order_detail(self, order_id: str) -> Optional[Dict[str, Any]]:
+    async def fetch_order_detail(self, order_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
         获取订单详情
         
         Args:
             order_id: 订单ID
+            use_cache: 是否使用数据库缓存
             
         Returns:
             包含订单详情的字典，失败时返回None
@@ -119,125 +221,39 @@ class OrderDetailAPIFetcher:
             logger.info(f"开始获取订单详情: {order_id}")
             
             # 检查数据库缓存
-            try:
-                from db_manager import db_manager
-                existing_order = db_manager.get_order_by_id(order_id)
-                
-                if existing_order:
-                    # 检查金额字段是否有效
-                    amount = existing_order.get('amount', '')
-                    amount_valid = False
-                    
-                    if amount:
-                        amount_clean = str(amount).replace('¥', '').replace('￥', '').replace('$', '').strip()
-                        try:
-                            amount_value = float(amount_clean)
-                            amount_valid = amount_value > 0
-                        except (ValueError, TypeError):
-                            amount_valid = False
-                    
-                    if amount_valid:
-                        logger.info(f"📋 订单 {order_id} 已存在于数据库中且金额有效({amount})，直接返回缓存数据")
-                        
-                        result = {
-                            'order_id': existing_order['order_id'],
-                            'url': f"https://www.goofish.com/order-detail?orderId={order_id}&role=seller",
-                            'title': f"订单详情 - {order_id}",
-                            'sku_info': {
-                                'spec_name': existing_order.get('spec_name', ''),
-                                'spec_value': existing_order.get('spec_value', ''),
-                                'quantity': existing_order.get('quantity', ''),
-                                'amount': existing_order.get('amount', '')
-                            },
-                            'spec_name': existing_order.get('spec_name', ''),
-                            'spec_value': existing_order.get('spec_value', ''),
-                            'quantity': existing_order.get('quantity', ''),
-                            'amount': existing_order.get('amount', ''),
-                            'buyer_nickName': existing_order.get('buyer_nickName', ''),
-                            'buyer_name': existing_order.get('buyer_name', ''),
-                            'buyer_phone': existing_order.get('buyer_phone', ''),
-                            'buyer_address': existing_order.get('buyer_address', ''),
-                            'timestamp': time.time(),
-                            'from_cache': True
-                        }
-                        return result
-            except Exception as e:
-                logger.warning(f"检查数据库缓存失败: {e}")
-            
-            # 准备API请求
-            api_name = "mtop.idle.web.trade.order.detail"
-            timestamp = str(int(time.time() * 1000))
-            
-            # 构建请求数据
-            request_data = self._build_request_data(order_id)
-            data_json = json.dumps(request_data, separators=(',', ':'))
-            
-            # 获取token信息
-            token, session = self._get_token_and_session()
-            
-            # 生成签名
-            sign = self._generate_sign(api_name, data_json, timestamp, self.app_key)
-            
-            # 构建请求URL和参数
-            params = {
-                "jsv": "2.7.2",
-                "appKey": self.app_key,
-                "t": timestamp,
-                "sign": sign,
-                "v": self.api_version,
-                "type": "originaljson",
-                "accountSite": "xianyu",
-                "dataType": "json",
-                "timeout": "20000",
-                "api": api_name,
-                "sessionOption": "AutoLoginOnly"
-            }
+            if use_cache:
+                from db_manager import async_db_manager
+                cached = await async_db_manager.run(get_cached_order_detail, order_id)
+                if cached:
+                    return cached
             
-            # 构建POST数据
-            post_data = {
-                "data": data_json
-            }
-            
-            # 发送请求
-            url = f"{self.base_url}/{api_name}/{self.api_version}/"
-            
-            logger.info(f"请求URL: {url}")
-            logger.info(f"请求参数: {params}")
-            logger.info(f"POST数据: {post_data}")
-            
-            response = self.session.post(url, params=params, data=post_data, timeout=30)
-            
-            if response.status_code != 200:
-                logger.error(f"API请求失败，状态码: {response.status_code}")
-                logger.error(f"响应内容: {response.text[:200]}")
-                return None
-            
-            # 解析响应
-            response_text = response.text
-            logger.info(f"API响应: {response_text[:500]}...")  # 只打印前500字符
-            
-            # 处理JSON响应（不是JSONP）
+            self.stats['requests'] += 1
             try:
-                response_data = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON解析失败: {e}")
-                logger.error(f"响应内容: {response_text[:200]}")
-                return None
-            
-            # 检查响应状态
-            ret_list = response_data.get('ret', [])
-            if not ret_list or not ret_list[0].startswith('SUCCESS'):
-                logger.error(f"API调用失败: {ret_list}")
+                response_data = await self.mtop.call(
+                    ORDER_DETAIL_API,
+                    self._build_request_data(order_id),
+                    version=self.api_version,
+                    params={"spm_cntl": "a21ybx.order-detail.0.0"},
+                    headers=self.headers,
+                    max_retries=self.max_retries,
+                )
+            except MtopError as e:
+                self.stats['failures'] += 1
+                logger.error(f"获取订单详情失败: {e}")
                 return None
-            
-            # 解析订单数据
-            order_data = response_data.get('data', {})
-            return self._parse_order_data(order_data, order_id)
+            return self._parse_response(response_data, order_id)
             
         except Exception as e:
             logger.error(f"获取订单详情失败: {e}")
             return None
-    
+
+    def fetch_order_detail_sync(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """同步获取订单详情（不检查缓存，供脚本和非异步环境使用）"""
+        url, params, post_data = self._build_request(order_id)
+        response = self.session.post(url, params=params, data=post_data,
+                                     headers=self._request_headers(), timeout=self.timeout)
+        return self._handle_response(response.status_code, response.text, order_id)
+
     def _parse_order_data(self, order_data: Dict[str, Any], order_id: str) -> Dict[str, Any]:
         """
         解析订单数据 - 基于HAR文件中的真实响应结构
@@ -328,8 +344,60 @@ class OrderDetailAPIFetcher:
             return None
 
 
+def get_cached_order_detail(order_id: str) -> Optional[Dict[str, Any]]:
+    """从数据库读取已保存的订单详情（金额有效时才视为命中），未命中返回None"""
+    try:
+        from db_manager import db_manager
+        existing_order = db_manager.get_order_by_id(order_id)
+        
+        if not existing_order:
+            return None
+
+        # 检查金额字段是否有效
+        amount = existing_order.get('amount', '')
+        amount_valid = False
+        
+        if amount:
+            amount_clean = str(amount).replace('¥', '').replace('￥', '').replace('$', '').strip()
+            try:
+                amount_value = float(amount_clean)
+                amount_valid = amount_value > 0
+            except (ValueError, TypeError):
+                amount_valid = False
+        
+        if not amount_valid:
+            return None
+
+        logger.info(f"📋 订单 {order_id} 已存在于数据库中且金额有效({amount})，直接返回缓存数据")
+        return {
+            'order_id': existing_order['order_id'],
+            'url': f"https://www.goofish.com/order-detail?orderId={order_id}&role=seller",
+            'title': f"订单详情 - {order_id}",
+            'sku_info': {
+                'spec_name': existing_order.get('spec_name', ''),
+                'spec_value': existing_order.get('spec_value', ''),
+                'quantity': existing_order.get('quantity', ''),
+                'amount': existing_order.get('amount', '')
+            },
+            'spec_name': existing_order.get('spec_name', ''),
+            'spec_value': existing_order.get('spec_value', ''),
+            'quantity': existing_order.get('quantity', ''),
+            'amount': existing_order.get('amount', ''),
+            'buyer_nickName': existing_order.get('buyer_nickName', ''),
+            'buyer_name': existing_order.get('buyer_name', ''),
+            'buyer_phone': existing_order.get('buyer_phone', ''),
+            'buyer_address': existing_order.get('buyer_address', ''),
+            'timestamp': time.time(),
+            'from_cache': True
+        }
+    except Exception as e:
+        logger.warning(f"检查数据库缓存失败: {e}")
+        return None
+
+
 # 便捷函数
-async def fetch_order_detail_api(order_id: str, cookie_string: str = None, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+async def fetch_order_detail_api(order_id: str, cookie_string: str = None, use_cache: bool = True,
+                                 mtop_client: MtopClient = None) -> Optional[Dict[str, Any]]:
     """
     使用API方式获取订单详情的便捷函数
     
@@ -337,68 +405,29 @@ async def fetch_order_detail_api(order_id: str, cookie_string: str = None, use_c
         order_id: 订单ID
         cookie_string: Cookie字符串
         use_cache: 是否使用数据库缓存，默认True。设为False时强制从API获取
+        mtop_client: 账号的 MtopClient，传入时复用该账号的连接池和Cookie
         
     Returns:
         订单详情字典，失败时返回None
     """
-    # 检查数据库缓存（仅在use_cache为True时）
-    if use_cache:
-        try:
-            from db_manager import db_manager
-            existing_order = db_manager.get_order_by_id(order_id)
-            
-            if existing_order:
-                # 检查金额字段是否有效
-                amount = existing_order.get('amount', '')
-                amount_valid = False
-                
-                if amount:
-                    amount_clean = str(amount).replace('¥', '').replace('￥', '').replace('$', '').strip()
-                    try:
-                        amount_value = float(amount_clean)
-                        amount_valid = amount_value > 0
-                    except (ValueError, TypeError):
-                        amount_valid = False
-                
-                if amount_valid:
-                    logger.info(f"📋 订单 {order_id} 已存在于数据库中且金额有效({amount})，直接返回缓存数据")
-                    
-                    result = {
-                        'order_id': existing_order['order_id'],
-                        'url': f"https://www.goofish.com/order-detail?orderId={order_id}&role=seller",
-                        'title': f"订单详情 - {order_id}",
-                        'sku_info': {
-                            'spec_name': existing_order.get('spec_name', ''),
-                            'spec_value': existing_order.get('spec_value', ''),
-                            'quantity': existing_order.get('quantity', ''),
-                            'amount': existing_order.get('amount', '')
-                        },
-                        'spec_name': existing_order.get('spec_name', ''),
-                        'spec_value': existing_order.get('spec_value', ''),
-                        'quantity': existing_order.get('quantity', ''),
-                        'amount': existing_order.get('amount', ''),
-                        'buyer_nickName': existing_order.get('buyer_nickName', ''),
-                        'buyer_name': existing_order.get('buyer_name', ''),
-                        'buyer_phone': existing_order.get('buyer_phone', ''),
-                        'buyer_address': existing_order.get('buyer_address', ''),
-                        'timestamp': time.time(),
-                        'from_cache': True
-                    }
-                    return result
-        except Exception as e:
-            logger.warning(f"检查数据库缓存失败: {e}")
-    else:
+    if not use_cache:
         logger.info(f"跳过缓存检查，直接从API获取订单详情: {order_id}")
-    
-    # 创建fetcher并获取数据
+
+    if mtop_client is not None:
+        return await OrderDetailAPIFetcher(mtop_client=mtop_client).fetch_order_detail(order_id, use_cache=use_cache)
+
+    # 未指定账号时使用临时fetcher
     fetcher = OrderDetailAPIFetcher(cookie_string)
-    return await fetcher.fetch_order_detail(order_id)
+    try:
+        return await fetcher.fetch_order_detail(order_id, use_cache=use_cache)
+    finally:
+        await fetcher.close()
 
 
 # 同步版本的便捷函数
 def fetch_order_detail_api_sync(order_id: str, cookie_string: str = None, use_cache: bool = True) -> Optional[Dict[str, Any]]:
     """
-    使用API方式获取订单详情的同步便捷函数
+    使用API方式获取订单详情的同步便捷函数（会阻塞调用线程，不要在事件循环中使用）
     
     Args:
         order_id: 订单ID
@@ -411,129 +440,19 @@ def fetch_order_detail_api_sync(order_id: str, cookie_string: str = None, use_ca
     try:
         # 检查数据库缓存（仅在use_cache为True时）
         if use_cache:
-            try:
-                from db_manager import db_manager
-                existing_order = db_manager.get_order_by_id(order_id)
-                
-                if existing_order:
-                    # 检查金额字段是否有效
-                    amount = existing_order.get('amount', '')
-                    amount_valid = False
-                    
-                    if amount:
-                        amount_clean = str(amount).replace('¥', '').replace('￥', '').replace('$', '').strip()
-                        try:
-                            amount_value = float(amount_clean)
-                            amount_valid = amount_value > 0
-                        except (ValueError, TypeError):
-                            amount_valid = False
-                    
-                    if amount_valid:
-                        logger.info(f"📋 订单 {order_id} 已存在于数据库中且金额有效({amount})，直接返回缓存数据")
-                        
-                        result = {
-                            'order_id': existing_order['order_id'],
-                            'url': f"https://www.goofish.com/order-detail?orderId={order_id}&role=seller",
-                            'title': f"订单详情 - {order_id}",
-                            'sku_info': {
-                                'spec_name': existing_order.get('spec_name', ''),
-                                'spec_value': existing_order.get('spec_value', ''),
-                                'quantity': existing_order.get('quantity', ''),
-                                'amount': existing_order.get('amount', '')
-                            },
-                            'spec_name': existing_order.get('spec_name', ''),
-                            'spec_value': existing_order.get('spec_value', ''),
-                            'quantity': existing_order.get('quantity', ''),
-                            'amount': existing_order.get('amount', ''),
-                            'buyer_nickName': existing_order.get('buyer_nickName', ''),
-                            'buyer_name': existing_order.get('buyer_name', ''),
-                            'buyer_phone': existing_order.get('buyer_phone', ''),
-                            'buyer_address': existing_order.get('buyer_address', ''),
-                            'timestamp': time.time(),
-                            'from_cache': True
-                        }
-                        return result
-            except Exception as e:
-                logger.warning(f"检查数据库缓存失败: {e}")
+            cached = get_cached_order_detail(order_id)
+            if cached:
+                return cached
         else:
             logger.info(f"跳过缓存检查，直接从API获取订单详情: {order_id}")
         
-        # 创建fetcher并获取数据
-        fetcher = OrderDetailAPIFetcher(cookie_string)
-        
-        # 同步调用（去掉async/await）
         logger.info(f"开始API获取订单详情: {order_id}")
-        
-        # 准备API请求
-        api_name = "mtop.idle.web.trade.order.detail"
-        timestamp = str(int(time.time() * 1000))
-        
-        # 构建请求数据
-        request_data = fetcher._build_request_data(order_id)
-        data_json = json.dumps(request_data, separators=(',', ':'))
-        
-        # 获取token信息
-        token, session = fetcher._get_token_and_session()
-        
-        # 生成签名
-        sign = fetcher._generate_sign(api_name, data_json, timestamp, fetcher.app_key)
-        
-        # 构建请求URL和参数
-        params = {
-            "jsv": "2.7.2",
-            "appKey": fetcher.app_key,
-            "t": timestamp,
-            "sign": sign,
-            "v": fetcher.api_version,
-            "type": "originaljson",
-            "accountSite": "xianyu", 
-            "dataType": "json",
-            "timeout": "20000",
-            "api": api_name,
-            "sessionOption": "AutoLoginOnly",
-            "spm_cntl": "a21ybx.order-detail.0.0"
-        }
-        
-        # 构建POST数据
-        post_data = {
-            "data": data_json
-        }
-        
-        # 发送请求
-        url = f"{fetcher.base_url}/{api_name}/{fetcher.api_version}/"
-        
-        logger.info(f"请求URL: {url}")
-        logger.info(f"请求参数: {params}")
-        logger.info(f"POST数据: {post_data}")
-        
-        response = fetcher.session.post(url, params=params, data=post_data, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"API请求失败，状态码: {response.status_code}")
-            logger.error(f"响应内容: {response.text[:200]}")
-            return None
-        
-        # 解析响应
-        response_text = response.text
-        logger.info(f"API响应: {response_text[:500]}...")  # 只打印前500字符
-        
-        # 处理JSON响应（不是JSONP）
+        fetcher = OrderDetailAPIFetcher(cookie_string)
         try:
-            response_data = json.loads(response_text)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析失败: {e}")
-            logger.error(f"响应内容: {response_text[:200]}")
-            return None
-        
-        # 检查响应状态
-        ret_list = response_data.get('ret', [])
-        if not ret_list or not ret_list[0].startswith('SUCCESS'):
-            logger.error(f"API调用失败: {ret_list}")
-            return None
-        
-        # 解析订单数据
-        order_data = response_data.get('data', {})
-        return fetcher._parse_order_data(order_data, order_id)
+            return fetcher.fetch_order_detail_sync(order_id)
+        finally:
+            if fetcher._session is not None:
+                fetcher._session.close()
         
     except Exception as e:
         logger.error(f"API获取订单详情失败: {e}")
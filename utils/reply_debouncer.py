@@ -0,0 +1,92 @@
+"""连续消息合并回复
+
+买家经常在几秒内连发多条短消息（"在吗"、"还有吗"、"能便宜点吗"），逐条回复会重复调用AI并刷屏。
+开启合并后，同一会话的买家消息先进入缓冲区，在窗口时间内没有新消息（或达到最长等待时间、条数上限）时
+一次性交给回调，由回调合并成一次回复。
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from loguru import logger
+
+
+class _Burst:
+    """一个会话中等待合并的消息"""
+
+    __slots__ = ('entries', 'first_at', 'handle')
+
+    def __init__(self, first_at: float):
+        self.entries: List[Any] = []
+        self.first_at = first_at
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class ReplyDebouncer:
+    """按会话合并连续消息（只能在主事件循环中使用）"""
+
+    def __init__(self, on_flush: Callable[[Hashable, List[Any]], Any],
+                 max_wait: float = 10.0, max_messages: int = 5):
+        """
+        Args:
+            on_flush: 一组消息凑齐后的回调（参数为会话键和按到达顺序排列的消息），在事件循环中同步调用
+            max_wait: 从第一条消息开始最多等待多少秒，持续发消息也会在此时间后回复
+            max_messages: 缓冲的消息达到此条数时立即回复
+        """
+        self.on_flush = on_flush
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self._bursts: Dict[Hashable, _Burst] = {}
+        self.stats = {
+            'messages': 0,
+            'flushed': 0,
+            'merged': 0,
+            'cancelled': 0,
+        }
+
+    def add(self, key: Hashable, entry: Any, window: float):
+        """缓冲一条消息，window 秒内没有新消息时回调"""
+        now = time.monotonic()
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(first_at=now)
+        elif burst.handle is not None:
+            burst.handle.cancel()
+        burst.entries.append(entry)
+        self.stats['messages'] += 1
+
+        if len(burst.entries) >= self.max_messages:
+            self._flush(key)
+            return
+        delay = max(0.0, min(window, burst.first_at + self.max_wait - now))
+        burst.handle = asyncio.get_running_loop().call_later(delay, self._flush, key)
+
+    def cancel(self, key: Hashable) -> int:
+        """丢弃会话中尚未回复的消息（如卖家已手动回复），返回丢弃条数"""
+        burst = self._bursts.pop(key, None)
+        if burst is None:
+            return 0
+        if burst.handle is not None:
+            burst.handle.cancel()
+        self.stats['cancelled'] += len(burst.entries)
+        return len(burst.entries)
+
+    def close(self):
+        """取消所有等待中的回复"""
+        for key in list(self._bursts):
+            self.cancel(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'pending': len(self._bursts), **self.stats}
+
+    def _flush(self, key: Hashable):
+        burst = self._bursts.pop(key, None)
+        if burst is None:
+            return
+        self.stats['flushed'] += 1
+        self.stats['merged'] += len(burst.entries) - 1
+        try:
+            self.on_flush(key, burst.entries)
+        except Exception as e:
+            logger.error(f"合并消息回调出错: {key}, 错误: {e}")
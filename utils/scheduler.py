@@ -0,0 +1,304 @@
+"""进程级周期任务调度器
+
+原来每个账号各自运行心跳、Token刷新、清理、Cookie刷新等 while True + sleep 循环，批量重启后
+所有账号的循环同时开始，之后一直同步触发（例如几十个账号同时打开浏览器刷新Cookie）。
+现在所有周期任务由一个调度任务统一管理：
+- 任务按下次执行时间放在最小堆中，调度任务只在最早的任务到期时醒来
+- 首次执行时间默认在一个周期内随机分散，之后每次的间隔加上随机抖动，避免同时触发
+- 重型任务（heavy，如浏览器刷新Cookie）共享全局并发上限，超出的排队等待
+- 同一任务不会并发执行，下次执行时间从本次执行结束时开始计算
+- 任务函数返回数字时用它作为下次执行的延迟（秒），例如未到期时返回剩余时间、失败后返回重试间隔
+
+任务的增删在主事件循环中进行，管理接口在API线程中读取任务列表，因此使用线程锁。
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+
+class _Job:
+    """一个周期任务"""
+
+    __slots__ = ('owner', 'name', 'func', 'interval', 'jitter', 'heavy', 'state', 'next_run', 'seq',
+                 'task', 'runs', 'errors', 'last_run', 'last_duration', 'last_error')
+
+    def __init__(self, owner: Hashable, name: str, func: Callable[[], Awaitable[Any]],
+                 interval: float, jitter: float, heavy: bool):
+        self.owner = owner
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.heavy = heavy
+        # scheduled：等待到期；waiting：已到期，等待重型任务并发名额；running：执行中
+        self.state = 'scheduled'
+        self.next_run = 0.0  # 下次执行的到期时间（time.monotonic）
+        self.seq = 0  # 堆中有效条目的序号，旧条目出堆时跳过
+        self.task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_run = 0.0  # 上次开始执行的时间（time.time）
+        self.last_duration = 0.0
+        self.last_error = ''
+
+    @property
+    def key(self) -> Tuple[Hashable, str]:
+        return self.owner, self.name
+
+
+class Scheduler:
+    """周期任务调度器（只能在主事件循环中增删任务）"""
+
+    def __init__(self, heavy_concurrency: int = 2, jitter: float = 0.1, overdue_threshold: float = 60):
+        """
+        Args:
+            heavy_concurrency: 同时执行的重型任务数量上限
+            jitter: 默认的间隔抖动比例，0.1 表示实际间隔在 interval 的 ±10% 内随机
+            overdue_threshold: 到期后超过多少秒仍未开始执行的任务视为逾期
+        """
+        self.heavy_concurrency = heavy_concurrency
+        self.jitter = jitter
+        self.overdue_threshold = overdue_threshold
+        self._jobs: Dict[Tuple[Hashable, str], _Job] = {}
+        # (到期时间, 序号, 任务)，任务被删除或重新排期后旧条目留在堆中，出堆时跳过
+        self._heap: List[Tuple[float, int, _Job]] = []
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._heavy: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'runs': 0,
+            'errors': 0,
+            'max_start_delay_ms': 0.0,
+        }
+
+    # -------------------- 对外接口 --------------------
+
+    def start(self, loop: asyncio.AbstractEventLoop = None) -> asyncio.Task:
+        """在指定（默认当前）事件循环中启动调度任务"""
+        if self._task is not None and not self._task.done():
+            return self._task
+        self._loop = loop or asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        self._heavy = asyncio.Semaphore(self.heavy_concurrency)
+        self._task = self._loop.create_task(self._run())
+        logger.info(f"周期任务调度器已启动，重型任务并发上限: {self.heavy_concurrency}，间隔抖动: ±{self.jitter:.0%}")
+        return self._task
+
+    def add(self, owner: Hashable, name: str, func: Callable[[], Awaitable[Any]], interval: float,
+            first_delay: float = None, jitter: float = None, heavy: bool = False,
+            replace: bool = True) -> bool:
+        """注册周期任务
+
+        Args:
+            owner: 任务所属的账号ID，None 表示进程级任务
+            name: 任务名称，同一 owner 下唯一
+            func: 无参数的协程函数，返回数字时作为下次执行的延迟（秒）
+            interval: 执行间隔（秒）
+            first_delay: 首次执行的延迟（秒），默认在 [0, interval) 内随机
+            jitter: 间隔抖动比例，默认使用调度器的设置
+            heavy: 是否为重型任务（受全局并发上限限制）
+            replace: 已存在同名任务时是否替换
+
+        Returns:
+            bool: 是否注册成功（replace=False 且任务已存在时返回False）
+        """
+        if self._task is None or self._task.done():
+            self.start(asyncio.get_running_loop())
+        jitter = self.jitter if jitter is None else jitter
+        if first_delay is None:
+            first_delay = random.uniform(0, interval)
+        else:
+            first_delay = self._jittered(first_delay, jitter)
+
+        with self._lock:
+            if not replace and (owner, name) in self._jobs:
+                return False
+            job = _Job(owner, name, func, interval, jitter, heavy)
+            self._jobs[job.key] = job
+            self._push(job, time.monotonic() + first_delay)
+        self._wakeup.set()
+        return True
+
+    def remove(self, owner: Hashable, name: str = None, cancel: bool = True) -> List[asyncio.Task]:
+        """删除账号的任务（不传 name 时删除该账号的全部任务）
+
+        Args:
+            cancel: 是否取消正在执行的任务（不会取消调用方自己所在的任务）
+
+        Returns:
+            list: 被取消的执行中任务，调用方可以等待它们结束
+        """
+        with self._lock:
+            jobs = [job for key, job in self._jobs.items()
+                    if key[0] == owner and (name is None or key[1] == name)]
+            for job in jobs:
+                del self._jobs[job.key]
+
+        cancelled = []
+        if cancel:
+            current = asyncio.current_task()
+            for job in jobs:
+                if job.task is not None and not job.task.done() and job.task is not current:
+                    job.task.cancel()
+                    cancelled.append(job.task)
+        return cancelled
+
+    def has(self, owner: Hashable, name: str) -> bool:
+        """任务是否已注册"""
+        return (owner, name) in self._jobs
+
+    def get_jobs(self, owner: Hashable = None, limit: int = None) -> List[Dict[str, Any]]:
+        """按下次执行时间排列的任务列表（执行中的任务排在最前）
+
+        due_in 为距离到期的秒数，负数表示已到期（等待执行或正在执行）。
+        """
+        now, wall_now = time.monotonic(), time.time()
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if owner is None or job.owner == owner]
+        jobs.sort(key=lambda job: (job.state != 'running', job.next_run))
+        if limit is not None:
+            jobs = jobs[:limit]
+        return [self._describe(job, now, wall_now) for job in jobs]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """任务数量、各状态数量和逾期数量"""
+        now = time.monotonic()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        states = {'scheduled': 0, 'waiting': 0, 'running': 0}
+        overdue = 0
+        for job in jobs:
+            states[job.state] += 1
+            if self._is_overdue(job, now):
+                overdue += 1
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'jobs': len(jobs),
+            'accounts': len({job.owner for job in jobs if job.owner is not None}),
+            **states,
+            'overdue': overdue,
+            'heavy_concurrency': self.heavy_concurrency,
+            **self.stats,
+        }
+
+    # -------------------- 内部实现 --------------------
+
+    @staticmethod
+    def _jittered(delay: float, jitter: float) -> float:
+        if delay <= 0 or jitter <= 0:
+            return max(0.0, delay)
+        return delay * random.uniform(1 - jitter, 1 + jitter)
+
+    def _push(self, job: _Job, when: float):
+        """（持有锁时调用）安排任务的下次执行"""
+        job.state = 'scheduled'
+        job.next_run = when
+        job.seq = next(self._seq)
+        heapq.heappush(self._heap, (when, job.seq, job))
+
+    def _is_overdue(self, job: _Job, now: float) -> bool:
+        return job.state != 'running' and now - job.next_run > self.overdue_threshold
+
+    def _describe(self, job: _Job, now: float, wall_now: float) -> Dict[str, Any]:
+        due_in = job.next_run - now
+        return {
+            'owner': job.owner,
+            'name': job.name,
+            'state': job.state,
+            'heavy': job.heavy,
+            'interval': job.interval,
+            'next_run': round(wall_now + due_in, 3),
+            'due_in': round(due_in, 3),
+            'overdue': self._is_overdue(job, now),
+            'runs': job.runs,
+            'errors': job.errors,
+            'last_run': round(job.last_run, 3) if job.last_run else None,
+            'last_duration_ms': round(job.last_duration * 1000, 2),
+            'last_error': job.last_error,
+        }
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = []
+            timeout = None
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now:
+                    _, seq, job = heapq.heappop(self._heap)
+                    # 已删除或重新排期的任务留下的旧条目
+                    if job.seq == seq and self._jobs.get(job.key) is job:
+                        due.append(job)
+                if self._heap:
+                    timeout = self._heap[0][0] - now
+            for job in due:
+                job.state = 'waiting'
+                job.task = asyncio.create_task(self._execute(job))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: _Job):
+        result = None
+        try:
+            if job.heavy:
+                async with self._heavy:
+                    result = await self._call(job)
+            else:
+                result = await self._call(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.errors += 1
+            job.last_error = str(e)
+            self.stats['errors'] += 1
+            logger.error(f"周期任务执行出错: {job.owner}/{job.name}, 错误: {e}")
+
+        delay = job.interval
+        if isinstance(result, (int, float)) and not isinstance(result, bool):
+            delay = max(0.0, float(result))
+        with self._lock:
+            # 执行期间任务可能已被删除或替换
+            if self._jobs.get(job.key) is not job:
+                return
+            self._push(job, time.monotonic() + self._jittered(delay, job.jitter))
+        self._wakeup.set()
+
+    async def _call(self, job: _Job) -> Any:
+        started = time.monotonic()
+        start_delay_ms = (started - job.next_run) * 1000
+        if start_delay_ms > self.stats['max_start_delay_ms']:
+            self.stats['max_start_delay_ms'] = round(start_delay_ms, 2)
+        job.state = 'running'
+        job.last_run = time.time()
+        job.runs += 1
+        self.stats['runs'] += 1
+        try:
+            return await job.func()
+        finally:
+            job.last_duration = time.monotonic() - started
+
+
+def _create_scheduler() -> Scheduler:
+    from config import config
+    scheduler_config = config.get('SCHEDULER', {}) or {}
+    return Scheduler(
+        heavy_concurrency=max(1, int(scheduler_config.get('heavy_concurrency', 2))),
+        jitter=min(0.5, max(0.0, float(scheduler_config.get('jitter', 0.1)))),
+        overdue_threshold=float(scheduler_config.get('overdue_threshold', 60)),
+    )
+
+
+# 全局周期任务调度器
+scheduler = _create_scheduler()
@@ -0,0 +1,765 @@
+"""多进程账号分片
+
+单进程模式下所有账号的 XianyuLive 和 FastAPI 服务共用一个进程，受GIL限制只能使用一个CPU核心，
+账号多了以后解密、JSON解析和关键词匹配会占满这个核心。分片模式（SHARDING.processes > 1）下：
+- 主进程只运行 API 服务和分片管理器（ShardSupervisor），不运行账号任务
+- 账号按一致性哈希分配到 N 个工作进程，每个工作进程有自己的事件循环、CookieManager 和周期任务调度器
+- 工作进程崩溃后自动重启（带退避）；短时间内反复崩溃的分片被下线，只有它的账号迁移到其他分片
+- 新增、删除、启停账号只向对应的分片发送命令，其他账号不受影响
+- API 进程通过管道（multiprocessing.Pipe）向分片发送命令：启停账号、重启账号、重新加载设置、发送消息、缓存失效等
+- 分片也可以通过同一管道向 API 进程上报事件（请求ID为 None）：把分片中发生的缓存失效转发给其他分片，
+  以及把账号任务中修改的 Cookie 和启用状态同步到 API 进程的 ShardedCookieManager
+
+所有进程共用同一个 SQLite 数据库（WAL 模式）。账号数据仍由 API 进程写入数据库，分片收到命令后从数据库读取。
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from cookie_manager import CookieManager
+
+
+class ShardError(Exception):
+    """分片不可用、命令执行失败或超时"""
+
+
+# 工作进程中由命令线程设置：向API进程上报事件 publish(事件, 参数元组)；API进程和单进程模式下为 None
+publish: Optional[Callable[[str, tuple], None]] = None
+
+
+class HashRing:
+    """一致性哈希环（每个分片对应多个虚拟节点）
+
+    增删分片时只有落在该分片上的账号需要迁移。
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._nodes: List[int] = []
+        self._members = set()
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    @property
+    def nodes(self) -> List[int]:
+        return sorted(self._members)
+
+    def add(self, node: int):
+        if node in self._members:
+            return
+        self._members.add(node)
+        for i in range(self.vnodes):
+            key = self._hash(f"shard-{node}#{i}")
+            index = bisect.bisect(self._keys, key)
+            self._keys.insert(index, key)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: int):
+        if node not in self._members:
+            return
+        self._members.discard(node)
+        points = [(key, n) for key, n in zip(self._keys, self._nodes) if n != node]
+        self._keys = [key for key, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def get(self, key: str) -> Optional[int]:
+        """账号所属的分片，环为空时返回None"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+# -------------------- 工作进程 --------------------
+
+def _worker_main(shard_id: int, conn, cookie_ids: List[str]):
+    """工作进程入口（以 spawn 方式启动，必须是模块级函数）"""
+    try:
+        asyncio.run(_worker_async(shard_id, conn, cookie_ids))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_async(shard_id: int, conn, cookie_ids: List[str]):
+    import cookie_manager as cm
+    from utils.item_detail_cache import item_detail_cache
+    from utils.loop_monitor import loop_monitor
+    from utils.scheduler import scheduler
+
+    loop = asyncio.get_running_loop()
+    cm.manager = _ShardCookieManager(loop)
+    manager = cm.manager
+
+    # 通知重试队列由API进程统一处理，这里不启动，避免多个进程重复重试同一条通知
+    loop_monitor.start(loop)
+    item_detail_cache.start(loop)
+    scheduler.start(loop)
+
+    handlers = _worker_handlers(shard_id, manager)
+    for cookie_id in cookie_ids:
+        try:
+            await handlers['start'](cookie_id)
+        except Exception as e:
+            logger.error(f"分片 {shard_id} 启动账号失败: {cookie_id}, {e}")
+    logger.info(f"分片 {shard_id} 已启动，负责 {len(manager.tasks)} 个账号")
+
+    closed = asyncio.Event()
+    threading.Thread(target=_serve_commands, args=(shard_id, conn, loop, handlers, closed),
+                     name=f"shard-{shard_id}-commands", daemon=True).start()
+    await closed.wait()
+
+    # 管道断开说明API进程已退出或要求本分片停止
+    logger.info(f"分片 {shard_id} 正在停止 {len(manager.tasks)} 个账号任务...")
+    tasks = list(manager.tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _serve_commands(shard_id: int, conn, loop: asyncio.AbstractEventLoop,
+                    handlers: Dict[str, Callable], closed: asyncio.Event):
+    """命令线程：从管道读取 (请求ID, 命令, 参数)，交给事件循环执行，结果写回 (请求ID, 是否成功, 结果)"""
+    global publish
+    send_lock = threading.Lock()
+
+    def reply(req_id: int, ok: bool, result: Any):
+        with send_lock:
+            try:
+                conn.send((req_id, ok, result))
+            except (OSError, ValueError):
+                pass
+
+    def send_event(event: str, args: tuple):
+        reply(None, event, args)
+
+    publish = send_event
+
+    def on_done(req_id: int, fut: Future):
+        try:
+            reply(req_id, True, fut.result())
+        except Exception as e:
+            reply(req_id, False, str(e))
+
+    while True:
+        try:
+            req_id, op, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        handler = handlers.get(op)
+        if handler is None:
+            reply(req_id, False, f"未知的分片命令: {op}")
+            continue
+        fut = asyncio.run_coroutine_threadsafe(handler(*args), loop)
+        fut.add_done_callback(lambda f, req_id=req_id: on_done(req_id, f))
+    loop.call_soon_threadsafe(closed.set)
+
+
+class _ShardCookieManager(CookieManager):
+    """工作进程中的 CookieManager：账号任务中修改的 Cookie 和启用状态上报给API进程"""
+
+    def update_cookie(self, cookie_id: str, new_value: str, save_to_db: bool = True):
+        result = super().update_cookie(cookie_id, new_value, save_to_db)
+        self._report(cookie_id, new_value)
+        return result
+
+    def update_cookie_status(self, cookie_id: str, enabled: bool):
+        super().update_cookie_status(cookie_id, enabled)
+        self._report(cookie_id, self.cookies.get(cookie_id))
+
+    def _report(self, cookie_id: str, cookie_value: Optional[str]):
+        if publish is not None:
+            publish('account', (cookie_id, cookie_value, self.get_cookie_status(cookie_id)))
+
+
+def _worker_handlers(shard_id: int, manager: CookieManager) -> Dict[str, Callable]:
+    """工作进程支持的命令"""
+    from db_manager import async_db_manager, db_manager
+    from utils.keyword_matcher import keyword_matcher_cache
+
+    async def load_account(cookie_id: str) -> Optional[dict]:
+        """从数据库读取账号的Cookie、关键词、启用状态和自动确认发货设置"""
+        details = await async_db_manager.run(db_manager.get_cookie_details, cookie_id)
+        if not details:
+            return None
+        manager.cookies[cookie_id] = details['value']
+        manager.keywords[cookie_id] = await async_db_manager.run(db_manager.get_keywords, cookie_id)
+        manager.cookie_status[cookie_id] = await async_db_manager.run(db_manager.get_cookie_status, cookie_id)
+        manager.auto_confirm_settings[cookie_id] = bool(details.get('auto_confirm', True))
+        keyword_matcher_cache.invalidate(cookie_id)
+        return details
+
+    async def start(cookie_id: str) -> bool:
+        details = await load_account(cookie_id)
+        if details is None or not manager.get_cookie_status(cookie_id):
+            return False
+        task = manager.tasks.get(cookie_id)
+        if task is not None and not task.done():
+            return False
+        manager.tasks[cookie_id] = asyncio.create_task(
+            manager._run_xianyu(cookie_id, details['value'], details.get('user_id')))
+        logger.info(f"分片 {shard_id} 已启动账号任务: {cookie_id}")
+        return True
+
+    async def stop(cookie_id: str) -> bool:
+        task = manager.tasks.pop(cookie_id, None)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info(f"分片 {shard_id} 已停止账号任务: {cookie_id}")
+        return True
+
+    async def restart(cookie_id: str) -> bool:
+        await stop(cookie_id)
+        return await start(cookie_id)
+
+    async def reload_account(cookie_id: str) -> bool:
+        return await load_account(cookie_id) is not None
+
+    async def reload() -> bool:
+        return await async_db_manager.run(manager.reload_from_db)
+
+    async def send_message(cookie_id: str, chat_id: str, to_user_id: str, message: str) -> Dict[str, Any]:
+        from XianyuAutoAsync import XianyuLive
+        live_instance = XianyuLive.get_instance(cookie_id)
+        if not live_instance:
+            return {'success': False, 'message': "账号实例不存在或未连接，请检查账号状态"}
+        if not live_instance.ws or live_instance.ws.closed:
+            return {'success': False, 'message': "账号WebSocket连接已断开，请等待重连"}
+        await live_instance.send_msg(live_instance.ws, chat_id, to_user_id, message)
+        return {'success': True, 'message': "消息发送成功"}
+
+    async def stats() -> Dict[str, Any]:
+        import os
+        from XianyuAutoAsync import XianyuLive
+        from utils.loop_monitor import loop_monitor
+        from utils.scheduler import scheduler
+        instances = XianyuLive.get_all_instances()
+        return {
+            'shard': shard_id,
+            'pid': os.getpid(),
+            'accounts': sorted(manager.tasks),
+            'connected': sorted(cookie_id for cookie_id, instance in instances.items()
+                                if instance.ws is not None and not instance.ws.closed),
+            'event_loop': loop_monitor.get_stats(),
+            'scheduler': scheduler.get_stats(),
+            'inbound_queues': {cookie_id: instance.inbound_queue.get_stats()
+                               for cookie_id, instance in instances.items()},
+            'reply_debounce': {cookie_id: instance.reply_debouncer.get_stats()
+                               for cookie_id, instance in instances.items()},
+        }
+
+    async def scheduler_jobs(owner: str = None, limit: int = None) -> Dict[str, Any]:
+        from utils.scheduler import scheduler
+        return {'stats': scheduler.get_stats(), 'jobs': scheduler.get_jobs(owner=owner, limit=limit)}
+
+    async def invalidate(cache: str, *args) -> bool:
+        from utils import cache_invalidation
+        cache_invalidation.apply(cache, *args)
+        return True
+
+    async def collect_metrics() -> list:
+        from utils.metrics import registry
+        return registry.collect()
+
+    async def ping() -> bool:
+        return True
+
+    return {
+        'start': start,
+        'stop': stop,
+        'restart': restart,
+        'reload_account': reload_account,
+        'reload': reload,
+        'send_message': send_message,
+        'stats': stats,
+        'scheduler': scheduler_jobs,
+        'invalidate': invalidate,
+        'metrics': collect_metrics,
+        'ping': ping,
+    }
+
+
+# -------------------- API 进程 --------------------
+
+class _Shard:
+    """API进程中的一个工作进程句柄"""
+
+    def __init__(self, shard_id: int, on_event: Callable[[int, str, tuple], None] = None):
+        self.shard_id = shard_id
+        self.on_event = on_event  # 分片上报的事件 on_event(分片ID, 事件, 参数)
+        self.process = None
+        self.conn = None
+        self.down = False  # 反复崩溃后被下线
+        self.started_at = 0.0
+        self.next_restart_at = 0.0
+        self.restarts: deque = deque()  # 最近的重启时间
+        self.total_restarts = 0
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self, ctx, cookie_ids: List[str]):
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=_worker_main, args=(self.shard_id, child_conn, cookie_ids),
+                              name=f"xianyu-shard-{self.shard_id}", daemon=True)
+        process.start()
+        child_conn.close()
+        pending: Dict[int, Future] = {}
+        with self._send_lock:
+            self.process, self.conn, self._pending = process, parent_conn, pending
+        self.started_at = time.time()
+        threading.Thread(target=self._read_replies, args=(parent_conn, pending),
+                         name=f"shard-{self.shard_id}-replies", daemon=True).start()
+
+    def request(self, op: str, args: tuple, timeout: float) -> Any:
+        fut, pending, req_id = self.send(op, args)
+        try:
+            return fut.result(timeout)
+        except FutureTimeoutError:
+            pending.pop(req_id, None)
+            raise ShardError(f"分片 {self.shard_id} 执行 {op} 超时")
+
+    def send(self, op: str, args: tuple) -> Tuple[Future, Dict[int, Future], int]:
+        """发送命令但不等待结果，返回 (结果Future, 所在的等待表, 请求ID)"""
+        fut: Future = Future()
+        with self._send_lock:
+            if self.conn is None or not self.alive:
+                raise ShardError(f"分片 {self.shard_id} 未运行")
+            req_id = next(self._ids)
+            pending = self._pending
+            pending[req_id] = fut
+            try:
+                self.conn.send((req_id, op, args))
+            except (OSError, ValueError) as e:
+                pending.pop(req_id, None)
+                raise ShardError(f"分片 {self.shard_id} 通信失败: {e}")
+        return fut, pending, req_id
+
+    def _read_replies(self, conn, pending: Dict[int, Future]):
+        while True:
+            try:
+                req_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            if req_id is None:
+                # 分片主动上报的事件：(None, 事件, 参数)
+                if self.on_event is not None:
+                    try:
+                        self.on_event(self.shard_id, ok, result)
+                    except Exception as e:
+                        logger.error(f"处理分片 {self.shard_id} 上报的事件失败: {ok}, {e}")
+                continue
+            fut = pending.pop(req_id, None)
+            if fut is None:
+                continue
+            if ok:
+                fut.set_result(result)
+            else:
+                fut.set_exception(ShardError(result))
+        # 进程已退出，等待中的请求全部失败
+        for req_id in list(pending):
+            fut = pending.pop(req_id, None)
+            if fut is not None and not fut.done():
+                fut.set_exception(ShardError(f"分片 {self.shard_id} 进程已退出"))
+
+    def stop(self, timeout: float = 10):
+        with self._send_lock:
+            conn, process = self.conn, self.process
+            self.conn = None
+        if conn is not None:
+            conn.close()
+        if process is not None:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+class ShardSupervisor:
+    """分片管理器：分配账号、转发命令、重启崩溃的分片（线程安全）"""
+
+    def __init__(self, processes: int, vnodes: int = 64, max_restarts: int = 5,
+                 restart_window: float = 300, call_timeout: float = 30, check_interval: float = 2):
+        """
+        Args:
+            processes: 工作进程数量
+            vnodes: 每个分片在哈希环上的虚拟节点数
+            max_restarts: 分片在 restart_window 秒内崩溃超过该次数后下线，账号迁移到其他分片
+            restart_window: 统计崩溃次数的时间窗口（秒）
+            call_timeout: 命令默认超时（秒）
+            check_interval: 检查工作进程存活的间隔（秒）
+        """
+        self.processes = processes
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.call_timeout = call_timeout
+        self.check_interval = check_interval
+        self._ring = HashRing(range(processes), vnodes)
+        self._shards = [_Shard(i, self._on_event) for i in range(processes)]
+        # 应该运行的账号 -> 分片
+        self._assignments: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._ctx = multiprocessing.get_context('spawn')
+        self._stopped = threading.Event()
+        self.stats = {'crashes': 0, 'migrated': 0}
+
+    # -------------------- 对外接口 --------------------
+
+    def start(self, cookie_ids: Iterable[str]):
+        """按一致性哈希分配账号并启动所有工作进程"""
+        with self._lock:
+            for cookie_id in cookie_ids:
+                self._assignments[cookie_id] = self._ring.get(cookie_id)
+            for shard in self._shards:
+                shard.start(self._ctx, self._accounts_of(shard.shard_id))
+        threading.Thread(target=self._monitor, name="shard-supervisor", daemon=True).start()
+        counts = [len(self._accounts_of(shard.shard_id)) for shard in self._shards]
+        logger.info(f"已启动 {self.processes} 个分片进程，账号分布: {counts}")
+
+    def stop(self):
+        self._stopped.set()
+        for shard in self._shards:
+            shard.stop()
+
+    def is_assigned(self, cookie_id: str) -> bool:
+        """账号任务是否已分配到分片上运行"""
+        with self._lock:
+            return cookie_id in self._assignments
+
+    def shard_of(self, cookie_id: str) -> Optional[int]:
+        """账号所在（或应该在）的分片"""
+        with self._lock:
+            shard_id = self._assignments.get(cookie_id)
+            return self._ring.get(cookie_id) if shard_id is None else shard_id
+
+    def assign(self, cookie_id: str) -> bool:
+        """在账号所属的分片上启动账号任务（新增账号、启用账号时调用）"""
+        with self._lock:
+            shard_id = self._assignments.get(cookie_id)
+            if shard_id is None:
+                shard_id = self._ring.get(cookie_id)
+                if shard_id is None:
+                    raise ShardError("没有可用的分片")
+                self._assignments[cookie_id] = shard_id
+        return self._shards[shard_id].request('start', (cookie_id,), self.call_timeout)
+
+    def unassign(self, cookie_id: str) -> bool:
+        """停止账号任务（删除账号、禁用账号时调用）"""
+        with self._lock:
+            shard_id = self._assignments.pop(cookie_id, None)
+        if shard_id is None:
+            return False
+        try:
+            return self._shards[shard_id].request('stop', (cookie_id,), self.call_timeout)
+        except ShardError as e:
+            # 分片已退出时账号任务也随之停止，重启后不会再分配给它
+            logger.warning(f"停止账号任务失败: {cookie_id}, {e}")
+            return False
+
+    def call(self, cookie_id: str, op: str, *args, timeout: float = None) -> Any:
+        """在账号所在的分片上执行命令"""
+        shard_id = self.shard_of(cookie_id)
+        if shard_id is None:
+            raise ShardError("没有可用的分片")
+        return self._shards[shard_id].request(op, (cookie_id,) + args, timeout or self.call_timeout)
+
+    def broadcast(self, op: str, *args, timeout: float = None) -> Dict[int, Any]:
+        """在所有在线分片上执行命令，失败的分片返回 {'error': 原因}"""
+        results = {}
+        for shard in self._shards:
+            if shard.down:
+                continue
+            try:
+                results[shard.shard_id] = shard.request(op, args, timeout or self.call_timeout)
+            except ShardError as e:
+                results[shard.shard_id] = {'error': str(e)}
+        return results
+
+    def notify(self, op: str, *args, exclude: int = None):
+        """向所有在线分片发送命令，不等待结果（失败只记录日志），可以在事件循环中调用"""
+        def on_done(shard_id: int, fut: Future):
+            error = fut.exception()
+            if error is not None:
+                logger.warning(f"分片 {shard_id} 执行 {op} 失败: {error}")
+
+        for shard in self._shards:
+            if shard.down or shard.shard_id == exclude:
+                continue
+            try:
+                fut, _, _ = shard.send(op, args)
+            except ShardError as e:
+                logger.warning(f"向分片 {shard.shard_id} 发送 {op} 失败: {e}")
+                continue
+            fut.add_done_callback(lambda f, shard_id=shard.shard_id: on_done(shard_id, f))
+
+    def sync(self, cookie_ids: Iterable[str]):
+        """把应该运行的账号同步为 cookie_ids（数据库导入后调用）：多余的停止，缺少的启动"""
+        wanted = set(cookie_ids)
+        with self._lock:
+            current = set(self._assignments)
+        for cookie_id in current - wanted:
+            self.unassign(cookie_id)
+        for cookie_id in wanted - current:
+            try:
+                self.assign(cookie_id)
+            except ShardError as e:
+                logger.error(f"启动账号任务失败: {cookie_id}, {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """分片进程状态（只读取本进程记录的信息，不与分片通信）"""
+        with self._lock:
+            shards = [{
+                'shard': shard.shard_id,
+                'pid': shard.process.pid if shard.process is not None else None,
+                'alive': shard.alive,
+                'down': shard.down,
+                'accounts': len(self._accounts_of(shard.shard_id)),
+                'restarts': shard.total_restarts,
+                'started_at': shard.started_at,
+            } for shard in self._shards]
+            accounts = len(self._assignments)
+        return {
+            'processes': self.processes,
+            'alive': sum(1 for shard in shards if shard['alive']),
+            'accounts': accounts,
+            **self.stats,
+            'shards': shards,
+        }
+
+    # -------------------- 内部实现 --------------------
+
+    def _on_event(self, shard_id: int, event: str, args: tuple):
+        """（回复读取线程中调用）分片上报的事件"""
+        if event == 'invalidate':
+            from utils import cache_invalidation
+            cache_invalidation.propagate_from_shard(shard_id, *args)
+        elif event == 'account':
+            self._account_changed(shard_id, *args)
+        else:
+            logger.warning(f"未知的分片事件: {event}")
+
+    def _account_changed(self, shard_id: int, cookie_id: str, cookie_value: Optional[str], enabled: bool):
+        """分片中修改了账号的 Cookie 或启用状态（已写入数据库），同步到API进程"""
+        import cookie_manager as cm
+        if not enabled:
+            # 分片已停止账号任务，这里不能发送 stop 命令（回复读取线程中不能等待回复）
+            with self._lock:
+                if self._assignments.get(cookie_id) == shard_id:
+                    del self._assignments[cookie_id]
+        if isinstance(cm.manager, ShardedCookieManager):
+            cm.manager.apply_shard_update(cookie_id, cookie_value, enabled)
+
+    def _accounts_of(self, shard_id: int) -> List[str]:
+        return [cookie_id for cookie_id, sid in self._assignments.items() if sid == shard_id]
+
+    def _monitor(self):
+        while not self._stopped.wait(self.check_interval):
+            for shard in self._shards:
+                if shard.down or shard.alive or self._stopped.is_set():
+                    continue
+                try:
+                    self._handle_crash(shard)
+                except Exception as e:
+                    logger.error(f"处理分片 {shard.shard_id} 退出时出错: {e}")
+
+    def _handle_crash(self, shard: _Shard):
+        now = time.time()
+        if shard.next_restart_at == 0:
+            # 第一次发现退出：记录并按最近的崩溃次数退避
+            self.stats['crashes'] += 1
+            exitcode = shard.process.exitcode if shard.process is not None else None
+            while shard.restarts and now - shard.restarts[0] > self.restart_window:
+                shard.restarts.popleft()
+            if len(shard.restarts) >= self.max_restarts:
+                self._take_down(shard)
+                return
+            delay = min(60, 2 ** len(shard.restarts))
+            shard.next_restart_at = now + delay
+            logger.error(f"分片 {shard.shard_id} 进程已退出（exitcode={exitcode}），{delay} 秒后重启")
+            return
+        if now < shard.next_restart_at:
+            return
+
+        shard.next_restart_at = 0
+        shard.restarts.append(now)
+        shard.total_restarts += 1
+        with self._lock:
+            cookie_ids = self._accounts_of(shard.shard_id)
+        shard.start(self._ctx, cookie_ids)
+        logger.warning(f"分片 {shard.shard_id} 已重启，恢复 {len(cookie_ids)} 个账号")
+
+    def _take_down(self, shard: _Shard):
+        """分片反复崩溃：从哈希环移除，把它的账号迁移到其他分片"""
+        shard.down = True
+        with self._lock:
+            self._ring.remove(shard.shard_id)
+            moved: List[Tuple[str, Optional[int]]] = []
+            for cookie_id in self._accounts_of(shard.shard_id):
+                target = self._ring.get(cookie_id)
+                if target is None:
+                    del self._assignments[cookie_id]
+                else:
+                    self._assignments[cookie_id] = target
+                moved.append((cookie_id, target))
+        logger.error(f"分片 {shard.shard_id} 在 {self.restart_window:.0f} 秒内崩溃超过 {self.max_restarts} 次，"
+                     f"已下线，迁移 {len(moved)} 个账号")
+        for cookie_id, target in moved:
+            if target is None:
+                logger.error(f"没有可用的分片，账号任务未启动: {cookie_id}")
+                continue
+            try:
+                self._shards[target].request('start', (cookie_id,), self.call_timeout)
+                self.stats['migrated'] += 1
+            except ShardError as e:
+                logger.error(f"迁移账号失败: {cookie_id} -> 分片 {target}, {e}")
+
+
+class ShardedCookieManager(CookieManager):
+    """分片模式下API进程中的 CookieManager
+
+    账号数据（Cookie、关键词、状态）仍在这里维护并写入数据库，账号任务交给分片运行。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, supervisor: ShardSupervisor):
+        self.supervisor = supervisor
+        super().__init__(loop)
+
+    def add_cookie(self, cookie_id: str, cookie_value: str, kw_list: Optional[List[Tuple[str, str]]] = None, user_id: int = None):
+        """新增 Cookie 并在所属分片上启动任务"""
+        from db_manager import db_manager
+        if self.supervisor.is_assigned(cookie_id):
+            raise ValueError("Cookie ID already exists")
+        if kw_list is not None:
+            self.keywords[cookie_id] = kw_list
+        else:
+            self.keywords.setdefault(cookie_id, [])
+        self.cookies[cookie_id] = cookie_value
+        db_manager.save_cookie(cookie_id, cookie_value, user_id)
+        if not self._holds_lease(cookie_id):
+            logger.info(f"账号租约由其他节点持有，本节点不启动任务: {cookie_id}")
+            return
+        self.supervisor.assign(cookie_id)
+        logger.info(f"已在分片 {self.supervisor.shard_of(cookie_id)} 启动账号任务: {cookie_id}")
+
+    def remove_cookie(self, cookie_id: str):
+        from db_manager import db_manager
+        from utils import cache_invalidation
+        self.supervisor.unassign(cookie_id)
+        self.cookies.pop(cookie_id, None)
+        self.keywords.pop(cookie_id, None)
+        self._release_lease(cookie_id)
+        db_manager.delete_cookie(cookie_id)
+        cache_invalidation.invalidate('keywords', cookie_id)
+        logger.info(f"已移除账号: {cookie_id}")
+
+    def update_cookie(self, cookie_id: str, new_value: str, save_to_db: bool = True):
+        """替换指定账号的 Cookie 并在分片上重启任务"""
+        from db_manager import db_manager
+        from utils import cache_invalidation
+        if save_to_db:
+            cookie_info = db_manager.get_cookie_details(cookie_id)
+            db_manager.save_cookie(cookie_id, new_value, cookie_info.get('user_id') if cookie_info else None)
+        self.cookies[cookie_id] = new_value
+        if self.supervisor.is_assigned(cookie_id):
+            self.supervisor.call(cookie_id, 'restart')
+        elif self.get_cookie_status(cookie_id):
+            if not self._holds_lease(cookie_id):
+                logger.info(f"已更新Cookie，账号租约由其他节点持有，本节点不启动任务: {cookie_id}")
+                cache_invalidation.account_changed(cookie_id)
+                return
+            self.supervisor.assign(cookie_id)
+        logger.info(f"已更新Cookie并在分片 {self.supervisor.shard_of(cookie_id)} 重启任务: {cookie_id}")
+
+    def update_keywords(self, cookie_id: str, kw_list: List[Tuple[str, str]]):
+        super().update_keywords(cookie_id, kw_list)
+        self._reload_account(cookie_id)
+
+    def update_auto_confirm_setting(self, cookie_id: str, auto_confirm: bool):
+        super().update_auto_confirm_setting(cookie_id, auto_confirm)
+        self._reload_account(cookie_id)
+
+    def reload_from_db(self):
+        """重新从数据库加载（备份导入后调用），并同步各分片"""
+        super().reload_from_db()
+        self.supervisor.broadcast('reload')
+        enabled = self.get_enabled_cookies()
+        if self.lease_manager is not None:
+            # 多节点部署时只运行本节点持有租约的账号，其余由租约续约时重新分配
+            enabled = {cid: value for cid, value in enabled.items() if cid in self.lease_manager.held}
+        self.supervisor.sync(enabled)
+        return True
+
+    def apply_shard_update(self, cookie_id: str, cookie_value: Optional[str], enabled: bool):
+        """（回复读取线程中调用）分片上报的 Cookie 和启用状态，数据库已由分片写入"""
+        if cookie_id not in self.cookies:
+            return
+        if cookie_value is not None:
+            self.cookies[cookie_id] = cookie_value
+        old_status = self.cookie_status.get(cookie_id, True)
+        self.cookie_status[cookie_id] = enabled
+        if old_status and not enabled:
+            self._release_lease(cookie_id)
+        logger.info(f"已同步分片中的账号变更: {cookie_id}（{'启用' if enabled else '禁用'}）")
+
+    def _start_cookie_task(self, cookie_id: str):
+        if not self._holds_lease(cookie_id):
+            logger.info(f"账号租约由其他节点持有，本节点不启动任务: {cookie_id}")
+            return
+        try:
+            self.supervisor.assign(cookie_id)
+            logger.info(f"成功启动Cookie任务: {cookie_id}")
+        except ShardError as e:
+            logger.error(f"启动Cookie任务失败: {cookie_id}, {e}")
+
+    def _stop_cookie_task(self, cookie_id: str):
+        if self.supervisor.unassign(cookie_id):
+            logger.info(f"成功停止Cookie任务: {cookie_id}")
+
+    def _reload_account(self, cookie_id: str):
+        """让分片重新读取账号设置（关键词、自动确认发货等）"""
+        try:
+            self.supervisor.call(cookie_id, 'reload_account')
+        except ShardError as e:
+            logger.warning(f"通知分片重新加载账号设置失败: {cookie_id}, {e}")
+
+
+def create_supervisor() -> Optional[ShardSupervisor]:
+    """按配置创建分片管理器，进程数不大于1时返回None（单进程模式）
+
+    进程数优先使用环境变量 SHARD_PROCESSES，其次是配置文件的 SHARDING.processes。
+    """
+    import os
+    from config import config
+    sharding_config = config.get('SHARDING', {}) or {}
+    processes = int(os.getenv('SHARD_PROCESSES', sharding_config.get('processes', 0)) or 0)
+    if processes <= 1:
+        return None
+    return ShardSupervisor(
+        processes=processes,
+        max_restarts=int(sharding_config.get('max_restarts', 5)),
+        restart_window=float(sharding_config.get('restart_window', 300)),
+        call_timeout=float(sharding_config.get('call_timeout', 30)),
+    )
+
+
+# 分片模式下由 Start.py 赋值，单进程模式为 None
+supervisor: Optional[ShardSupervisor] = None
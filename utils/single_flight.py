@@ -0,0 +1,108 @@
+"""单飞（single-flight）请求合并
+
+同一个 (kind, key) 同时只执行一次获取，其余并发调用者等待并共享同一个结果。
+获取失败（结果为空或抛出异常）时在短时间内缓存失败结果，避免订单消息突发时反复请求。
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from loguru import logger
+
+
+class SingleFlight:
+    """并发请求合并器（只能在主事件循环中使用）"""
+
+    def __init__(self, negative_ttl: float = 5.0, max_negative_entries: int = 1000):
+        """
+        Args:
+            negative_ttl: 失败结果的缓存时间（秒），0 表示不缓存
+            max_negative_entries: 失败结果缓存的最大条数
+        """
+        self.negative_ttl = negative_ttl
+        self.max_negative_entries = max_negative_entries
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # (kind, key) -> (过期时间, 结果, 异常)
+        self._negative: Dict[Tuple[str, str], tuple] = {}
+        self.stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'coalesced': 0, 'failures': 0})
+
+    async def do(self, kind: str, key: str, func: Callable[[], Awaitable[Any]],
+                 is_failure: Callable[[Any], bool] = lambda result: not result) -> Any:
+        """执行或加入一次获取
+
+        Args:
+            kind: 请求类型（如 order_detail、item_detail），用于区分键空间和统计
+            key: 请求对象ID
+            func: 实际执行获取的协程函数
+            is_failure: 判断结果是否为失败（失败结果会被短暂缓存）
+        """
+        flight_key = (kind, key)
+        stats = self.stats[kind]
+
+        negative = self._negative.get(flight_key)
+        if negative is not None:
+            expires_at, result, error = negative
+            if time.monotonic() < expires_at:
+                stats['hits'] += 1
+                logger.debug(f"single-flight 命中失败缓存: {kind}:{key}")
+                if error is not None:
+                    raise error
+                return result
+            del self._negative[flight_key]
+
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            stats['coalesced'] += 1
+            logger.debug(f"single-flight 合并并发请求: {kind}:{key}")
+        else:
+            stats['misses'] += 1
+            task = asyncio.ensure_future(self._run(flight_key, func, is_failure))
+            self._inflight[flight_key] = task
+
+        # shield：某个调用者被取消时不影响其他等待者和正在进行的获取
+        return await asyncio.shield(task)
+
+    async def _run(self, flight_key: Tuple[str, str], func: Callable[[], Awaitable[Any]],
+                   is_failure: Callable[[Any], bool]) -> Any:
+        try:
+            result = await func()
+        except Exception as e:
+            self._remember_failure(flight_key, None, e)
+            raise
+        else:
+            if is_failure(result):
+                self._remember_failure(flight_key, result, None)
+            return result
+        finally:
+            self._inflight.pop(flight_key, None)
+
+    def _remember_failure(self, flight_key: Tuple[str, str], result: Any, error: Exception = None):
+        self.stats[flight_key[0]]['failures'] += 1
+        if self.negative_ttl <= 0:
+            return
+        if len(self._negative) >= self.max_negative_entries:
+            now = time.monotonic()
+            for expired in [k for k, v in self._negative.items() if v[0] <= now]:
+                del self._negative[expired]
+            while len(self._negative) >= self.max_negative_entries:
+                self._negative.pop(next(iter(self._negative)))
+        self._negative[flight_key] = (time.monotonic() + self.negative_ttl, result, error)
+
+    def forget(self, kind: str, key: str):
+        """清除某个请求的失败缓存"""
+        self._negative.pop((kind, key), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各类请求的命中/未命中/合并统计"""
+        return {
+            'inflight': len(self._inflight),
+            'negative_entries': len(self._negative),
+            'kinds': {kind: dict(values) for kind, values in list(self.stats.items())},
+        }
+
+
+# 全局请求合并器
+single_flight = SingleFlight(negative_ttl=float(os.getenv('SINGLE_FLIGHT_NEGATIVE_TTL', '5')))
@@ -118,13 +118,81 @@ def generate_sign(t: str, token: str, data: str) -> str:
     return md5_hash.hexdigest()
 
 
+# MessagePack 解码后端：优先使用 msgpack 的C扩展，未安装时使用下面的纯Python实现
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_BACKEND = 'msgpack' if msgpack is not None else 'python'
+
+_unpack_uint16 = struct.Struct('>H').unpack_from
+_unpack_uint32 = struct.Struct('>I').unpack_from
+_unpack_uint64 = struct.Struct('>Q').unpack_from
+_unpack_int8 = struct.Struct('>b').unpack_from
+_unpack_int16 = struct.Struct('>h').unpack_from
+_unpack_int32 = struct.Struct('>i').unpack_from
+_unpack_int64 = struct.Struct('>q').unpack_from
+_unpack_float32 = struct.Struct('>f').unpack_from
+_unpack_float64 = struct.Struct('>d').unpack_from
+
+
+def _json_key(key: Any) -> str:
+    """按 json.dumps 的规则把字典键转换为字符串"""
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return json.dumps(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+_JSON_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+def _to_json_compatible(value: Any) -> Any:
+    """转换为 json.loads(json.dumps(value)) 的结果（键转为字符串，bytes 按UTF-8解码）"""
+    value_type = type(value)
+    if value_type is dict:
+        return {
+            k if type(k) is str else _json_key(k): v if type(v) in _JSON_SCALARS else _to_json_compatible(v)
+            for k, v in value.items()
+        }
+    if value_type is list or value_type is tuple:
+        return [v if type(v) in _JSON_SCALARS else _to_json_compatible(v) for v in value]
+    if value_type is bytes:
+        return value.decode('utf-8', errors='ignore')
+    return value
+
+
 class MessagePackDecoder:
-    """MessagePack解码器的纯Python实现"""
+    """MessagePack解码器的纯Python实现
+
+    基于 memoryview 读取，解码过程中不复制输入数据（只有 bin 类型的结果会生成 bytes）。
+    json_compatible=True 时直接生成与 json.loads(json.dumps(...)) 相同的结构：
+    字典键转换为字符串，bin 按UTF-8解码为字符串。
+    """
     
-    def __init__(self, data: bytes):
-        self.data = data
+    def __init__(self, data: bytes, json_compatible: bool = False):
+        self.data = memoryview(data)
         self.pos = 0
-        self.length = len(data)
+        self.length = len(self.data)
+        self.json_compatible = json_compatible
+    
+    def _advance(self, count: int) -> int:
+        """前进count个字节，返回起始位置"""
+        pos = self.pos
+        if pos + count > self.length:
+            raise ValueError("Unexpected end of data")
+        self.pos = pos + count
+        return pos
     
     def read_byte(self) -> int:
         if self.pos >= self.length:
@@ -134,70 +202,72 @@ class MessagePackDecoder:
         return byte
     
     def read_bytes(self, count: int) -> bytes:
-        if self.pos + count > self.length:
-            raise ValueError("Unexpected end of data")
-        result = self.data[self.pos:self.pos + count]
-        self.pos += count
-        return result
+        pos = self._advance(count)
+        return self.data[pos:pos + count].tobytes()
     
     def read_uint8(self) -> int:
         return self.read_byte()
     
     def read_uint16(self) -> int:
-        return struct.unpack('>H', self.read_bytes(2))[0]
+        return _unpack_uint16(self.data, self._advance(2))[0]
     
     def read_uint32(self) -> int:
-        return struct.unpack('>I', self.read_bytes(4))[0]
+        return _unpack_uint32(self.data, self._advance(4))[0]
     
     def read_uint64(self) -> int:
-        return struct.unpack('>Q', self.read_bytes(8))[0]
+        return _unpack_uint64(self.data, self._advance(8))[0]
     
     def read_int8(self) -> int:
-        return struct.unpack('>b', self.read_bytes(1))[0]
+        return _unpack_int8(self.data, self._advance(1))[0]
     
     def read_int16(self) -> int:
-        return struct.unpack('>h', self.read_bytes(2))[0]
+        return _unpack_int16(self.data, self._advance(2))[0]
     
     def read_int32(self) -> int:
-        return struct.unpack('>i', self.read_bytes(4))[0]
+        return _unpack_int32(self.data, self._advance(4))[0]
     
     def read_int64(self) -> int:
-        return struct.unpack('>q', self.read_bytes(8))[0]
+        return _unpack_int64(self.data, self._advance(8))[0]
     
     def read_float32(self) -> float:
-        return struct.unpack('>f', self.read_bytes(4))[0]
+        return _unpack_float32(self.data, self._advance(4))[0]
     
     def read_float64(self) -> float:
-        return struct.unpack('>d', self.read_bytes(8))[0]
+        return _unpack_float64(self.data, self._advance(8))[0]
     
     def read_string(self, length: int) -> str:
-        return self.read_bytes(length).decode('utf-8')
+        pos = self._advance(length)
+        return str(self.data[pos:pos + length], 'utf-8')
+
+    def read_bin(self, length: int) -> Any:
+        if self.json_compatible:
+            pos = self._advance(length)
+            return str(self.data[pos:pos + length], 'utf-8', 'ignore')
+        return self.read_bytes(length)
     
     def decode_value(self) -> Any:
         """解码单个MessagePack值"""
-        if self.pos >= self.length:
-            raise ValueError("Unexpected end of data")
-            
         format_byte = self.read_byte()
         
         # Positive fixint (0xxxxxxx)
         if format_byte <= 0x7f:
             return format_byte
         
+        # Fixstr (101xxxxx)
+        elif 0xa0 <= format_byte <= 0xbf:
+            return self.read_string(format_byte & 0x1f)
+        
         # Fixmap (1000xxxx)
-        elif 0x80 <= format_byte <= 0x8f:
-            size = format_byte & 0x0f
-            return self.decode_map(size)
+        elif format_byte <= 0x8f:
+            return self.decode_map(format_byte & 0x0f)
         
         # Fixarray (1001xxxx)
-        elif 0x90 <= format_byte <= 0x9f:
-            size = format_byte & 0x0f
-            return self.decode_array(size)
+        elif format_byte <= 0x9f:
+            return self.decode_array(format_byte & 0x0f)
         
-        # Fixstr (101xxxxx)
-        elif 0xa0 <= format_byte <= 0xbf:
-            size = format_byte & 0x1f
-            return self.read_string(size)
+        # Negative fixint (111xxxxx)
+        elif format_byte >= 0xe0:
+            return format_byte - 0x100
         
         # nil
         elif format_byte == 0xc0:
@@ -213,18 +283,15 @@ class MessagePackDecoder:
         
         # bin 8
         elif format_byte == 0xc4:
-            size = self.read_uint8()
-            return self.read_bytes(size)
+            return self.read_bin(self.read_uint8())
         
         # bin 16
         elif format_byte == 0xc5:
-            size = self.read_uint16()
-            return self.read_bytes(size)
+            return self.read_bin(self.read_uint16())
         
         # bin 32
         elif format_byte == 0xc6:
-            size = self.read_uint32()
-            return self.read_bytes(size)
+            return self.read_bin(self.read_uint32())
         
         # float 32
         elif format_byte == 0xca:
@@ -268,42 +335,31 @@ class MessagePackDecoder:
         
         # str 8
         elif format_byte == 0xd9:
-            size = self.read_uint8()
-            return self.read_string(size)
+            return self.read_string(self.read_uint8())
         
         # str 16
         elif format_byte == 0xda:
-            size = self.read_uint16()
-            return self.read_string(size)
+            return self.read_string(self.read_uint16())
         
         # str 32
         elif format_byte == 0xdb:
-            size = self.read_uint32()
-            return self.read_string(size)
+            return self.read_string(self.read_uint32())
         
         # array 16
         elif format_byte == 0xdc:
-            size = self.read_uint16()
-            return self.decode_array(size)
+            return self.decode_array(self.read_uint16())
         
         # array 32
         elif format_byte == 0xdd:
-            size = self.read_uint32()
-            return self.decode_array(size)
+            return self.decode_array(self.read_uint32())
         
         # map 16
         elif format_byte == 0xde:
-            size = self.read_uint16()
-            return self.decode_map(size)
+            return self.decode_map(self.read_uint16())
         
         # map 32
         elif format_byte == 0xdf:
-            size = self.read_uint32()
-            return self.decode_map(size)
-        
-        # Negative fixint (111xxxxx)
-        elif format_byte >= 0xe0:
-            return format_byte - 0x100
+            return self.decode_map(self.read_uint32())
         
         raise ValueError(f"Unknown format byte: {format_byte:02x}")
 
@@ -314,10 +370,15 @@ class MessagePackDecoder:
     def decode_map(self, size: int) -> Dict[Any, Any]:
         """解码字典"""
         result = {}
-        for _ in range(size):
-            key = self.decode_value()
-            value = self.decode_value()
-            result[key] = value
+        decode_value = self.decode_value
+        if self.json_compatible:
+            for _ in range(size):
+                key = _json_key(decode_value())
+                result[key] = decode_value()
+        else:
+            for _ in range(size):
+                key = decode_value()
+                result[key] = decode_value()
         return result
 
     def decode(self) -> Any:
@@ -325,36 +386,52 @@ class MessagePackDecoder:
         return self.decode_value()
 
 
-def decrypt(data: str) -> str:
-    """解密消息数据"""
-    import json as json_module  # 使用别名避免作用域冲突
+def unpack_msgpack(data: bytes, json_compatible: bool = False) -> Any:
+    """解码MessagePack数据（只解码第一个对象，忽略其后的多余数据）
+
+    Args:
+        data: MessagePack字节数据
+        json_compatible: 为True时返回与 json.loads(json.dumps(...)) 相同的结构
+    """
+    if msgpack is None:
+        return MessagePackDecoder(data, json_compatible=json_compatible).decode()
 
     try:
-        # 确保输入数据是字符串类型
-        if not isinstance(data, str):
-            data = str(data)
+        value = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except msgpack.ExtraData as e:
+        value = e.unpacked
+    return _to_json_compatible(value) if json_compatible else value
 
-        # 清理数据，移除可能的非ASCII字符
-        try:
-            # 尝试编码为ASCII，如果失败则使用UTF-8编码后再解码
-            data.encode('ascii')
-        except UnicodeEncodeError:
-            # 如果包含非ASCII字符，先编码为UTF-8字节，再解码为ASCII兼容的字符串
-            data = data.encode('utf-8', errors='ignore').decode('ascii', errors='ignore')
 
-        # Base64解码
-        try:
-            decoded_data = base64.b64decode(data)
-        except Exception as decode_error:
-            # 如果base64解码失败，尝试添加填充
-            missing_padding = len(data) % 4
-            if missing_padding:
-                data += '=' * (4 - missing_padding)
-            decoded_data = base64.b64decode(data)
+def _b64decode_message(data: str) -> bytes:
+    """清理并Base64解码消息数据"""
+    # 确保输入数据是字符串类型
+    if not isinstance(data, str):
+        data = str(data)
+
+    # 清理数据，移除可能的非ASCII字符
+    if not data.isascii():
+        # 如果包含非ASCII字符，先编码为UTF-8字节，再解码为ASCII兼容的字符串
+        data = data.encode('utf-8', errors='ignore').decode('ascii', errors='ignore')
+
+    # Base64解码
+    try:
+        return base64.b64decode(data)
+    except Exception:
+        # 如果base64解码失败，尝试添加填充
+        missing_padding = len(data) % 4
+        if missing_padding:
+            data += '=' * (4 - missing_padding)
+        return base64.b64decode(data)
+
 
+def decrypt(data: str) -> str:
+    """解密消息数据"""
+    import json as json_module  # 使用别名避免作用域冲突
+
+    try:
         # 使用MessagePack解码器解码数据
-        decoder = MessagePackDecoder(decoded_data)
-        decoded_value = decoder.decode()
+        decoded_value = unpack_msgpack(_b64decode_message(data))
 
         # 如果解码后的值是字典，转换为JSON字符串
         if isinstance(decoded_value, dict):
@@ -371,9 +448,21 @@ def decrypt(data: str) -> str:
     except Exception as e:
         raise Exception(f"解密失败: {str(e)}")
 
+
+def decrypt_to_dict(data: str) -> Any:
+    """解密消息数据，直接返回解码后的对象
+
+    结果与 json.loads(decrypt(data)) 相同（字典键为字符串，bytes 解码为字符串），
+    但不经过JSON序列化和反序列化。
+    """
+    try:
+        return unpack_msgpack(_b64decode_message(data), json_compatible=True)
+    except Exception as e:
+        raise Exception(f"解密失败: {str(e)}")
+
 if __name__ == '__main__':
     msg = "ggGLAYEBsjMxNDk2MzcwNjNAZ29vZmlzaAKzNDc5ODMzODkwOTZAZ29vZmlzaAOxMzQxNjU2NTI3NDU0Mi5QTk0EAAXPAAABlbKji20GggFlA4UBoAK6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl0DoAQaBdoEKnsiY29udGVudFR5cGUiOjI2LCJkeENhcmQiOnsiaXRlbSI6eyJtYWluIjp7ImNsaWNrUGFyYW0iOnsiYXJnMSI6Ik1zZ0NhcmQiLCJhcmdzIjp7InNvdXJjZSI6ImltIiwidGFza19pZCI6IjNleFFKSE9UbVBVMSIsIm1zZ19pZCI6ImNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczIn19LCJleENvbnRlbnQiOnsiYmdDb2xvciI6IiNGRkZGRkYiLCJidXR0b24iOnsiYmdDb2xvciI6IiNGRkU2MEYiLCJib3JkZXJDb2xvciI6IiNGRkU2MEYiLCJjbGlja1BhcmFtIjp7ImFyZzEiOiJNc2dDYXJkQWN0aW9uIiwiYXJncyI6eyJzb3VyY2UiOiJpbSIsInRhc2tfaWQiOiIzZXhRSkhPVG1QVTEiLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9fSwiZm9udENvbG9yIjoiIzMzMzMzMyIsInRhcmdldFVybCI6ImZsZWFtYXJrZXQ6Ly9hZGp1c3RfcHJpY2U/Zmx1dHRlcj10cnVlJmJpek9yZGVySWQ9MjUwMzY4ODEyNjM1NjYzNjM3MCIsInRleHQiOiLkv67mlLnku7fmoLwifSwiZGVzYyI6Iuivt+WPjOaWueayn+mAmuWPiuaXtuehruiupOS7t+agvCIsImRlc2NDb2xvciI6IiNBM0EzQTMiLCJ0aXRsZSI6IuaIkeW3suaLjeS4i++8jOW+heS7mOasviIsInVwZ3JhZGUiOnsidGFyZ2V0VXJsIjoiaHR0cHM6Ly9oNS5tLmdvb2Zpc2guY29tL2FwcC9pZGxlRmlzaC1GMmUvZm0tZG93bmxhb2QvaG9tZS5odG1sP25vUmVkcmllY3Q9dHJ1ZSZjYW5CYWNrPXRydWUmY2hlY2tWZXJzaW9uPXRydWUiLCJ2ZXJzaW9uIjoiNy43LjkwIn19LCJ0YXJnZXRVcmwiOiJmbGVhbWFya2V0Oi8vb3JkZXJfZGV0YWlsP2lkPTI1MDM2ODgxMjYzNTY2MzYzNzAmcm9sZT1zZWxsZXIifX0sInRlbXBsYXRlIjp7Im5hbWUiOiJpZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZCIsInVybCI6Imh0dHBzOi8vZGluYW1pY3guYWxpYmFiYXVzZXJjb250ZW50LmNvbS9wdWIvaWRsZWZpc2hfbWVzc2FnZV90cmFkZV9jaGF0X2NhcmQvMTY2NzIyMjA1Mjc2Ny9pZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZC56aXAiLCJ2ZXJzaW9uIjoiMTY2NzIyMjA1Mjc2NyJ9fX0HAQgBCQAK3gAQpmJpelRhZ9oAe3sic291cmNlSWQiOiJDMkM6M2V4UUpIT1RtUFUxIiwidGFza05hbWUiOiLlt7Lmi43kuItf5pyq5LuY5qy+X+WNluWutiIsIm1hdGVyaWFsSWQiOiIzZXhRSkhPVG1QVTEiLCJ0YXNrSWQiOiIzZXhRSkhPVG1QVTEifbFjbG9zZVB1c2hSZWNlaXZlcqVmYWxzZbFjbG9zZVVucmVhZE51bWJlcqVmYWxzZaxkZXRhaWxOb3RpY2W6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2nZXh0SnNvbtoBr3sibXNnQXJncyI6eyJ0YXNrX2lkIjoiM2V4UUpIT1RtUFUxIiwic291cmNlIjoiaW0iLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9LCJxdWlja1JlcGx5IjoiMSIsIm1zZ0FyZzEiOiJNc2dDYXJkIiwidXBkYXRlS2V5IjoiNDc5ODMzODkwOTY6MjUwMzY4ODEyNjM1NjYzNjM3MDoxX25vdF9wYXlfc2VsbGVyIiwibWVzc2FnZUlkIjoiY2M4YmMyZGY3YzkzNGRmMDg2ZTA1NjdjYjY5ZjE1NzMiLCJtdWx0aUNoYW5uZWwiOnsiaHVhd2VpIjoiRVhQUkVTUyIsInhpYW9taSI6IjEwODAwMCIsIm9wcG8iOiJFWFBSRVNTIiwiaG9ub3IiOiJOT1JNQUwiLCJhZ29vIjoicHJvZHVjdCIsInZpdm8iOiJPUkRFUiJ9LCJjb250ZW50VHlwZSI6IjI2IiwiY29ycmVsYXRpb25Hcm91cElkIjoiM2V4UUpIT1RtUFUxX0ZGcjRHT1NuOE9RbyJ9qHJlY2VpdmVyrTIyMDI2NDA5MTgwNzmrcmVkUmVtaW5kZXKy562J5b6F5Lmw5a625LuY5qy+sHJlZFJlbWluZGVyU3R5bGWhMa9yZW1pbmRlckNvbnRlbnS6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2ucmVtaW5kZXJOb3RpY2W75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+rXJlbWluZGVyVGl0bGW75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+q3JlbWluZGVyVXJs2gCaZmxlYW1hcmtldDovL21lc3NhZ2VfY2hhdD9pdGVtSWQ9OTAwMDUyNjQ0Mjc3JnBlZXJVc2VySWQ9MzE0OTYzNzA2MyZwZWVyVXNlck5pY2s955S3KioqeSZzaWQ9NDc5ODMzODkwOTYmbWVzc2FnZUlkPWNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczJmFkdj1ub6xzZW5kZXJVc2VySWSqMzE0OTYzNzA2M65zZW5kZXJVc2VyVHlwZaEwq3Nlc3Npb25UeXBloTGqdXBkYXRlSGVhZKR0cnVlDAEDgahuZWVkUHVzaKR0cnVl"
     msg = "ggGLAYEBsjMxNDk2MzcwNjNAZ29vZmlzaAKzNDc5ODMzODkwOTZAZ29vZmlzaAOxMzQxNjU2NTI3NDU0Mi5QTk0EAAXPAAABlbKji20GggFlA4UBoAK6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl0DoAQaBdoEKnsiY29udGVudFR5cGUiOjI2LCJkeENhcmQiOnsiaXRlbSI6eyJtYWluIjp7ImNsaWNrUGFyYW0iOnsiYXJnMSI6Ik1zZ0NhcmQiLCJhcmdzIjp7InNvdXJjZSI6ImltIiwidGFza19pZCI6IjNleFFKSE9UbVBVMSIsIm1zZ19pZCI6ImNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczIn19LCJleENvbnRlbnQiOnsiYmdDb2xvciI6IiNGRkZGRkYiLCJidXR0b24iOnsiYmdDb2xvciI6IiNGRkU2MEYiLCJib3JkZXJDb2xvciI6IiNGRkU2MEYiLCJjbGlja1BhcmFtIjp7ImFyZzEiOiJNc2dDYXJkQWN0aW9uIiwiYXJncyI6eyJzb3VyY2UiOiJpbSIsInRhc2tfaWQiOiIzZXhRSkhPVG1QVTEiLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9fSwiZm9udENvbG9yIjoiIzMzMzMzMyIsInRhcmdldFVybCI6ImZsZWFtYXJrZXQ6Ly9hZGp1c3RfcHJpY2U/Zmx1dHRlcj10cnVlJmJpek9yZGVySWQ9MjUwMzY4ODEyNjM1NjYzNjM3MCIsInRleHQiOiLkv67mlLnku7fmoLwifSwiZGVzYyI6Iuivt+WPjOaWueayn+mAmuWPiuaXtuehruiupOS7t+agvCIsImRlc2NDb2xvciI6IiNBM0EzQTMiLCJ0aXRsZSI6IuaIkeW3suaLjeS4i++8jOW+heS7mOasviIsInVwZ3JhZGUiOnsidGFyZ2V0VXJsIjoiaHR0cHM6Ly9oNS5tLmdvb2Zpc2guY29tL2FwcC9pZGxlRmlzaC1GMmUvZm0tZG93bmxhb2QvaG9tZS5odG1sP25vUmVkcmllY3Q9dHJ1ZSZjYW5CYWNrPXRydWUmY2hlY2tWZXJzaW9uPXRydWUiLCJ2ZXJzaW9uIjoiNy43LjkwIn19LCJ0YXJnZXRVcmwiOiJmbGVhbWFya2V0Oi8vb3JkZXJfZGV0YWlsP2lkPTI1MDM2ODgxMjYzNTY2MzYzNzAmcm9sZT1zZWxsZXIifX0sInRlbXBsYXRlIjp7Im5hbWUiOiJpZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZCIsInVybCI6Imh0dHBzOi8vZGluYW1pY3guYWxpYmFiYXVzZXJjb250ZW50LmNvbS9wdWIvaWRsZWZpc2hfbWVzc2FnZV90cmFkZV9jaGF0X2NhcmQvMTY2NzIyMjA1Mjc2Ny9pZGxlZmlzaF9tZXNzYWdlX3RyYWRlX2NoYXRfY2FyZC56aXAiLCJ2ZXJzaW9uIjoiMTY2NzIyMjA1Mjc2NyJ9fX0HAQgBCQAK3gAQpmJpelRhZ9oAe3sic291cmNlSWQiOiJDMkM6M2V4UUpIT1RtUFUxIiwidGFza05hbWUiOiLlt7Lmi43kuItf5pyq5LuY5qy+X+WNluWutiIsIm1hdGVyaWFsSWQiOiIzZXhRSkhPVG1QVTEiLCJ0YXNrSWQiOiIzZXhRSkhPVG1QVTEifbFjbG9zZVB1c2hSZWNlaXZlcqVmYWxzZbFjbG9zZVVucmVhZE51bWJlcqVmYWxzZaxkZXRhaWxOb3RpY2W6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2nZXh0SnNvbtoBr3sibXNnQXJncyI6eyJ0YXNrX2lkIjoiM2V4UUpIT1RtUFUxIiwic291cmNlIjoiaW0iLCJtc2dfaWQiOiJjYzhiYzJkZjdjOTM0ZGYwODZlMDU2N2NiNjlmMTU3MyJ9LCJxdWlja1JlcGx5IjoiMSIsIm1zZ0FyZzEiOiJNc2dDYXJkIiwidXBkYXRlS2V5IjoiNDc5ODMzODkwOTY6MjUwMzY4ODEyNjM1NjYzNjM3MDoxX25vdF9wYXlfc2VsbGVyIiwibWVzc2FnZUlkIjoiY2M4YmMyZGY3YzkzNGRmMDg2ZTA1NjdjYjY5ZjE1NzMiLCJtdWx0aUNoYW5uZWwiOnsiaHVhd2VpIjoiRVhQUkVTUyIsInhpYW9taSI6IjEwODAwMCIsIm9wcG8iOiJFWFBSRVNTIiwiaG9ub3IiOiJOT1JNQUwiLCJhZ29vIjoicHJvZHVjdCIsInZpdm8iOiJPUkRFUiJ9LCJjb250ZW50VHlwZSI6IjI2IiwiY29ycmVsYXRpb25Hcm91cElkIjoiM2V4UUpIT1RtUFUxX0ZGcjRHT1NuOE9RbyJ9qHJlY2VpdmVyrTIyMDI2NDA5MTgwNzmrcmVkUmVtaW5kZXKy562J5b6F5Lmw5a625LuY5qy+sHJlZFJlbWluZGVyU3R5bGWhMa9yZW1pbmRlckNvbnRlbnS6W+aIkeW3suaLjeS4i++8jOW+heS7mOasvl2ucmVtaW5kZXJOb3RpY2W75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+rXJlbWluZGVyVGl0bGW75Lmw5a625bey5ouN5LiL77yM5b6F5LuY5qy+q3JlbWluZGVyVXJs2gCaZmxlYW1hcmtldDovL21lc3NhZ2VfY2hhdD9pdGVtSWQ9OTAwMDUyNjQ0Mjc3JnBlZXJVc2VySWQ9MzE0OTYzNzA2MyZwZWVyVXNlck5pY2s955S3KioqeSZzaWQ9NDc5ODMzODkwOTYmbWVzc2FnZUlkPWNjOGJjMmRmN2M5MzRkZjA4NmUwNTY3Y2I2OWYxNTczJmFkdj1ub6xzZW5kZXJVc2VySWSqMzE0OTYzNzA2M65zZW5kZXJVc2VyVHlwZaEwq3Nlc3Npb25UeXBloTGqdXBkYXRlSGVhZKR0cnVlDAEDgahuZWVkUHVzaKR0cnVl"
 
     res = decrypt(msg)
-    print(res)
\ No newline at end of file
+    print(res)